@@ -3,12 +3,20 @@ Core embeddings functionality for recommendation system.
 """
 
 from .preprocessing import preprocess_candidates
-from .computation import compute_embeddings
-from .storage import process_for_storage, validate_embeddings
+from .computation import compute_embeddings, compute_query_embedding_table
+from .storage import (
+    process_for_storage,
+    validate_embeddings,
+    save_embeddings_snapshot,
+    save_query_embeddings_snapshot,
+)
 
 __all__ = [
     "preprocess_candidates",
     "compute_embeddings",
+    "compute_query_embedding_table",
     "process_for_storage",
     "validate_embeddings",
+    "save_embeddings_snapshot",
+    "save_query_embeddings_snapshot",
 ]
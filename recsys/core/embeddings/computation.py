@@ -2,10 +2,15 @@
 Core functionality for computing embeddings.
 """
 
+import numpy as np
 import polars as pl
 import pandas as pd
 import tensorflow as tf
-from typing import Any
+from typing import Any, Tuple
+from recsys.core.features.transaction_features import month_cos, month_sin
+
+# Distinct values of the month encoding used by the query tower
+MONTHS = 12
 
 
 def compute_embeddings(df: pl.DataFrame, model: Any) -> pl.DataFrame:
@@ -41,3 +46,58 @@ def compute_embeddings(df: pl.DataFrame, model: Any) -> pl.DataFrame:
     )
 
     return embeddings_df
+
+
+def compute_query_embedding_table(
+    customers_df: pl.DataFrame, model: Any, batch_size: int = 4096
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the query embedding of every customer for every month.
+
+    The query tower depends only on customer_id, age, month_sin and month_cos,
+    and the month encoding takes 12 values. Each block of batch_size customers
+    is repeated for the 12 months and evaluated in one model call.
+
+    Args:
+        customers_df: DataFrame with customer_id and age, one row per customer
+        model: Query tower, called with a dictionary of customer_id, age,
+            month_sin and month_cos tensors
+        batch_size: Customers per model call
+
+    Returns:
+        Tuple of (customer IDs, float32 embeddings of shape
+        (n_customers, 12, dim) with months January to December)
+    """
+    customer_ids = np.asarray([str(c) for c in customers_df["customer_id"].to_list()])
+    ages = customers_df["age"].cast(pl.Float64).to_numpy()
+
+    months = np.arange(1, MONTHS + 1)
+    months_sin = np.asarray(month_sin(months), dtype=np.float64)
+    months_cos = np.asarray(month_cos(months), dtype=np.float64)
+
+    embeddings = None
+    for start in range(0, len(customer_ids), batch_size):
+        end = min(start + batch_size, len(customer_ids))
+        n_block = end - start
+
+        instances = {
+            "customer_id": tf.constant(np.repeat(customer_ids[start:end], MONTHS)),
+            "age": tf.constant(np.repeat(ages[start:end], MONTHS)),
+            "month_sin": tf.constant(np.tile(months_sin, n_block)),
+            "month_cos": tf.constant(np.tile(months_cos, n_block)),
+        }
+        block = model(instances)
+        if isinstance(block, dict):
+            block = block["query_emb"]
+        block = np.asarray(block, dtype=np.float32).reshape(n_block, MONTHS, -1)
+
+        if embeddings is None:
+            embeddings = np.empty(
+                (len(customer_ids), MONTHS, block.shape[2]), dtype=np.float32
+            )
+        embeddings[start:end] = block
+
+    if embeddings is None:
+        raise ValueError("No customers to compute query embeddings for")
+
+    return customer_ids, embeddings
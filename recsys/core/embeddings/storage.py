@@ -2,12 +2,22 @@
 Utilities for processing and storing embeddings.
 """
 
+import os
 import numpy as np
 import pandas as pd
+import polars as pl
 import tensorflow as tf
 from typing import List
 from loguru import logger
 
+# File names of the candidate snapshot read by the ranking container
+SNAPSHOT_ARTICLE_IDS_FILE = "article_ids.npy"
+SNAPSHOT_EMBEDDINGS_FILE = "embeddings.npy"
+
+# File names of the query embedding snapshot read by the ranking container
+QUERY_SNAPSHOT_CUSTOMER_IDS_FILE = "customer_ids.npy"
+QUERY_SNAPSHOT_EMBEDDINGS_FILE = "query_embeddings.npy"
+
 
 def process_for_storage(df: pd.DataFrame, embedding_column: str) -> pd.DataFrame:
     """
@@ -61,3 +71,72 @@ def validate_embeddings(
         return False
 
     return True
+
+
+def save_embeddings_snapshot(df: pl.DataFrame, output_dir: str) -> str:
+    """
+    Save embeddings as a memory-mappable snapshot for in-process retrieval.
+
+    Writes the article IDs and a contiguous float32 embedding matrix as .npy
+    files, in the layout loaded by the ranking container's ExactRetriever.
+
+    Args:
+        df: DataFrame with article_id and embeddings columns
+            (as returned by compute_embeddings)
+        output_dir: Directory to write the snapshot to
+
+    Returns:
+        Path of the snapshot directory
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    article_ids = np.asarray([str(a) for a in df["article_id"].to_list()])
+    embeddings = np.ascontiguousarray(
+        np.asarray(df["embeddings"].to_list(), dtype=np.float32)
+    )
+
+    np.save(os.path.join(output_dir, SNAPSHOT_ARTICLE_IDS_FILE), article_ids)
+    np.save(os.path.join(output_dir, SNAPSHOT_EMBEDDINGS_FILE), embeddings)
+
+    logger.info(
+        f"Saved snapshot of {embeddings.shape[0]} embeddings "
+        f"(dim={embeddings.shape[1]}) to {output_dir}"
+    )
+    return output_dir
+
+
+def save_query_embeddings_snapshot(
+    customer_ids: np.ndarray, embeddings: np.ndarray, output_dir: str
+) -> str:
+    """
+    Save precomputed query embeddings as a memory-mappable snapshot.
+
+    Writes the customer IDs and a contiguous float32 array of shape
+    (n_customers, 12, dim) as .npy files, in the layout loaded by the ranking
+    container's QueryEmbeddingTable.
+
+    Args:
+        customer_ids: Customer IDs, one per embedding row
+        embeddings: Query embeddings by customer and month
+            (as returned by compute_query_embedding_table)
+        output_dir: Directory to write the snapshot to
+
+    Returns:
+        Path of the snapshot directory
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    np.save(
+        os.path.join(output_dir, QUERY_SNAPSHOT_CUSTOMER_IDS_FILE),
+        np.asarray(customer_ids, dtype=str),
+    )
+    np.save(
+        os.path.join(output_dir, QUERY_SNAPSHOT_EMBEDDINGS_FILE),
+        np.ascontiguousarray(embeddings, dtype=np.float32),
+    )
+
+    logger.info(
+        f"Saved query embeddings of {embeddings.shape[0]} customers for "
+        f"{embeddings.shape[1]} months (dim={embeddings.shape[2]}) to {output_dir}"
+    )
+    return output_dir
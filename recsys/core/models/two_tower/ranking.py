@@ -1,5 +1,7 @@
+import json
 import numpy as np
 import polars as pl
+from typing import Dict, List
 from loguru import logger
 from xgboost import XGBClassifier
 from sklearn.metrics import classification_report, precision_recall_fscore_support
@@ -7,6 +9,115 @@ from sklearn.metrics import classification_report, precision_recall_fscore_suppo
 from recsys.config import settings
 
 
+# File name of the fitted encoder, saved next to model.bst
+CATEGORICAL_ENCODER_FILE = "categorical_encoder.json"
+
+# Code for values not seen in training
+UNKNOWN_CATEGORY_CODE = -1
+
+
+class CategoricalEncoder:
+    """Maps categorical feature values to integer codes.
+
+    Codes follow training frequency (the most frequent value gets 0) and values
+    not seen in training map to UNKNOWN_CATEGORY_CODE. The fitted vocabularies are
+    saved next to model.bst and loaded by the ranking container's predictor.
+    """
+
+    def __init__(self, vocabularies: Dict[str, List[str]]):
+        """
+        Args:
+            vocabularies: Values of each column, in code order
+        """
+        self.vocabularies = vocabularies
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.vocabularies.keys())
+
+    @classmethod
+    def fit(cls, df: pl.DataFrame) -> "CategoricalEncoder":
+        """Fit vocabularies on every column of the frame.
+
+        Args:
+            df: Training frame with the categorical columns
+
+        Returns:
+            Fitted encoder
+        """
+        vocabularies = {}
+        for col in df.columns:
+            value_counts = (
+                df.select(pl.col(col).cast(pl.Utf8))
+                .drop_nulls()
+                .to_series()
+                .value_counts()
+            )
+
+            # Higher frequency = lower integer, ties broken by value
+            sorted_values = value_counts.sort(["count", col], descending=[True, False])
+            vocabularies[col] = sorted_values[col].to_list()
+
+        return cls(vocabularies)
+
+    def transform(self, df: pl.DataFrame) -> pl.DataFrame:
+        """Replace the encoded columns of a frame with their codes.
+
+        Args:
+            df: Frame containing the encoded columns
+
+        Returns:
+            Frame with Int32 codes in place of the categorical values
+        """
+        return df.with_columns(
+            [
+                pl.col(col)
+                .cast(pl.Utf8)
+                .replace_strict(
+                    vocabulary,
+                    list(range(len(vocabulary))),
+                    default=UNKNOWN_CATEGORY_CODE,
+                    return_dtype=pl.Int32,
+                )
+                .fill_null(UNKNOWN_CATEGORY_CODE)
+                .alias(col)
+                for col, vocabulary in self.vocabularies.items()
+            ]
+        )
+
+    def save(self, path: str) -> str:
+        """Write the encoder as JSON.
+
+        Args:
+            path: Output file path
+
+        Returns:
+            Path the encoder was written to
+        """
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "unknown_code": UNKNOWN_CATEGORY_CODE,
+                    "vocabularies": self.vocabularies,
+                },
+                f,
+            )
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "CategoricalEncoder":
+        """Load an encoder written by save().
+
+        Args:
+            path: Encoder file path
+
+        Returns:
+            Loaded encoder
+        """
+        with open(path) as f:
+            return cls(json.load(f)["vocabularies"])
+
+
 class RankingModelFactory:
     @classmethod
     def build(cls) -> XGBClassifier:
@@ -32,6 +143,7 @@ class RankingModelTrainer:
         self._model = model
         self._x_train, self._y_train = train_dataset
         self._x_val, self._y_val = eval_dataset
+        self._categorical_encoder = None
 
         # Convert and store the preprocessed datasets
         self._train_dataset, self._eval_dataset = self._initialize_dataset(
@@ -41,6 +153,9 @@ class RankingModelTrainer:
     def get_model(self):
         return self._model
 
+    def get_categorical_encoder(self) -> CategoricalEncoder:
+        return self._categorical_encoder
+
     def _initialize_dataset(self, train_dataset, eval_dataset):
         """Initialize datasets for XGBoost training and evaluation.
 
@@ -65,37 +180,10 @@ class RankingModelTrainer:
             f"Detected {len(cat_features)} categorical features: {cat_features}"
         )
 
-        # Process each categorical column
-        for col in cat_features:
-            value_counts = x_train[col].value_counts()
-
-            # Create a mapping based on frequency (higher frequency = lower integer)
-            # This helps the model prioritize common categories
-            sorted_values = value_counts.sort("count", descending=True)
-
-            sorted_values_list = sorted_values[col].to_list()
-
-            value_to_int = {val: idx for idx, val in enumerate(sorted_values_list)}
-
-            # Create the mapping expression for train data
-            x_train = x_train.with_columns(
-                [
-                    pl.when(pl.col(col).is_in(list(value_to_int.keys())))
-                    .then(pl.col(col).replace(value_to_int))
-                    .otherwise(pl.lit(-1))
-                    .alias(col)
-                ]
-            )
-
-            # Create the mapping expression for validation data
-            x_val = x_val.with_columns(
-                [
-                    pl.when(pl.col(col).is_in(list(value_to_int.keys())))
-                    .then(pl.col(col).replace(value_to_int))
-                    .otherwise(pl.lit(-1))
-                    .alias(col)
-                ]
-            )
+        # Fit the encoder on training data; serving loads the same vocabularies
+        self._categorical_encoder = CategoricalEncoder.fit(x_train.select(cat_features))
+        x_train = self._categorical_encoder.transform(x_train)
+        x_val = self._categorical_encoder.transform(x_val)
 
         # Convert to numpy arrays for XGBoost
         x_train_np = x_train.to_numpy()
@@ -0,0 +1,347 @@
+"""
+Resident article feature table for the ranking container.
+
+The article catalog is held in memory as columns keyed by a dense article
+index. String columns are dictionary-encoded (int32 codes plus a vocabulary),
+so assembling features for a request is an index gather with no network I/O.
+
+A running container follows new catalogs through ARTICLES_SNAPSHOT_POINTER_URI:
+a small GCS object naming the dated snapshot prefix to serve. Each refresh
+re-reads it and, when it names a new prefix, fetches that prefix's snapshot
+through the artifact cache and links it at the snapshot path.
+
+Export a snapshot from BigQuery (from the container directory):
+    python article_store.py --output /app/snapshots/articles.npz
+"""
+
+import os
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, Iterable, List, Optional
+from artifact_cache import ArtifactCache, link_file
+from config import (
+    ARTICLES_SNAPSHOT_PATH,
+    ARTICLES_SNAPSHOT_POINTER_URI,
+    ARTICLES_REFRESH_SECONDS,
+    ARTICLES_TABLE,
+    PROJECT_ID,
+)
+from logger import logger
+
+# Columns of recsys_articles that are not needed for ranking
+EXCLUDED_COLUMNS = ["embeddings", "image_url", "article_description"]
+
+# Key prefixes inside the snapshot file
+_CODES_PREFIX = "codes__"
+_VOCAB_PREFIX = "vocab__"
+_VALUES_PREFIX = "values__"
+
+
+class ArticleTable:
+    """
+    Immutable columnar article table.
+
+    Attributes:
+        article_ids: Article IDs indexed by dense article index
+        codes: Dictionary-encoded columns as int32 codes
+        vocabularies: Vocabulary of each dictionary-encoded column
+        values: Numeric columns
+    """
+
+    def __init__(
+        self,
+        article_ids: np.ndarray,
+        codes: Dict[str, np.ndarray],
+        vocabularies: Dict[str, np.ndarray],
+        values: Dict[str, np.ndarray],
+    ):
+        self.article_ids = article_ids
+        self.codes = codes
+        self.vocabularies = vocabularies
+        self.values = values
+
+        # Categorical dtypes are built once and shared by every gather
+        self._dtypes = {
+            col: pd.CategoricalDtype(vocabulary)
+            for col, vocabulary in vocabularies.items()
+        }
+
+        # Sorted view of the IDs for vectorized lookups
+        self._order = np.argsort(article_ids, kind="stable")
+        self._sorted_ids = article_ids[self._order]
+
+    def __len__(self) -> int:
+        return len(self.article_ids)
+
+    @property
+    def columns(self) -> List[str]:
+        """Names of all feature columns."""
+        return [*self.codes.keys(), *self.values.keys()]
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> "ArticleTable":
+        """
+        Build a table from an articles DataFrame.
+
+        Args:
+            df: DataFrame with an article_id column and feature columns
+
+        Returns:
+            Table with string columns dictionary-encoded
+        """
+        df = df.drop(columns=[c for c in EXCLUDED_COLUMNS if c in df.columns])
+        article_ids = df["article_id"].astype(str).to_numpy(dtype=str)
+
+        codes, vocabularies, values = {}, {}, {}
+        for col in df.columns:
+            if col == "article_id":
+                continue
+            if pd.api.types.is_numeric_dtype(df[col]):
+                values[col] = df[col].to_numpy()
+            else:
+                column_codes, vocabulary = pd.factorize(df[col].astype(str))
+                codes[col] = column_codes.astype(np.int32)
+                vocabularies[col] = np.asarray(vocabulary, dtype=str)
+
+        return cls(article_ids, codes, vocabularies, values)
+
+    def save(self, path: str) -> str:
+        """
+        Write the table to a single .npz snapshot, replacing it atomically.
+
+        Args:
+            path: Snapshot file path
+
+        Returns:
+            Path the snapshot was written to
+        """
+        arrays = {"article_ids": self.article_ids}
+        for col, column_codes in self.codes.items():
+            arrays[_CODES_PREFIX + col] = column_codes
+            arrays[_VOCAB_PREFIX + col] = self.vocabularies[col]
+        for col, column_values in self.values.items():
+            arrays[_VALUES_PREFIX + col] = column_values
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+        logger.info(f"💾 Saved {len(self)} articles to {path}")
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "ArticleTable":
+        """
+        Load a table written by save().
+
+        Args:
+            path: Snapshot file path
+
+        Returns:
+            Loaded table
+        """
+        codes, vocabularies, values = {}, {}, {}
+        with np.load(path, allow_pickle=False) as data:
+            article_ids = data["article_ids"]
+            for key in data.files:
+                if key.startswith(_CODES_PREFIX):
+                    codes[key[len(_CODES_PREFIX) :]] = data[key]
+                elif key.startswith(_VOCAB_PREFIX):
+                    vocabularies[key[len(_VOCAB_PREFIX) :]] = data[key]
+                elif key.startswith(_VALUES_PREFIX):
+                    values[key[len(_VALUES_PREFIX) :]] = data[key]
+
+        return cls(article_ids, codes, vocabularies, values)
+
+    def lookup(self, article_ids: Iterable[str]) -> np.ndarray:
+        """
+        Map article IDs to dense article indices.
+
+        Args:
+            article_ids: Article IDs to look up
+
+        Returns:
+            int64 array of dense indices, -1 for unknown articles
+        """
+        if not isinstance(article_ids, np.ndarray):
+            article_ids = list(article_ids)
+        ids = np.asarray(article_ids, dtype=str)
+        if len(ids) == 0 or len(self) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+
+        positions = np.searchsorted(self._sorted_ids, ids)
+        positions = np.minimum(positions, len(self) - 1)
+        found = self._sorted_ids[positions] == ids
+        return np.where(found, self._order[positions], -1).astype(np.int64)
+
+    def gather(self, indices: np.ndarray) -> pd.DataFrame:
+        """
+        Gather feature rows by dense article index.
+
+        Dictionary-encoded columns are returned as pandas categoricals that
+        share the table's vocabulary, so no object columns are created.
+
+        Args:
+            indices: Dense article indices
+
+        Returns:
+            DataFrame with one row per index
+        """
+        columns = {}
+        for col, column_codes in self.codes.items():
+            columns[col] = pd.Categorical.from_codes(
+                column_codes[indices], dtype=self._dtypes[col]
+            )
+        for col, column_values in self.values.items():
+            columns[col] = column_values[indices]
+        return pd.DataFrame(columns)
+
+
+class ArticleStore:
+    """
+    Holds the current ArticleTable and refreshes it in the background.
+
+    Readers take `store.table` once per request; a refresh builds a new table
+    and swaps the reference, so readers never see a partially loaded table.
+    Listeners added with add_listener() are called with each new table. The
+    refresh thread runs once start() is called.
+    """
+
+    def __init__(
+        self,
+        snapshot_path: str = ARTICLES_SNAPSHOT_PATH,
+        refresh_seconds: float = ARTICLES_REFRESH_SECONDS,
+        pointer_uri: str = ARTICLES_SNAPSHOT_POINTER_URI,
+        artifact_cache: Optional[ArtifactCache] = None,
+    ):
+        """
+        Load the snapshot, first fetching the one the pointer names if set.
+
+        Args:
+            snapshot_path: Path of the article snapshot file
+            refresh_seconds: Interval between snapshot checks (0 disables refresh)
+            pointer_uri: gs:// object naming the snapshot prefix to serve
+                (empty: only the local file is checked)
+            artifact_cache: Cache of GCS artifacts, by default in ARTIFACT_CACHE_DIR
+        """
+        self.snapshot_path = snapshot_path
+        self.refresh_seconds = refresh_seconds
+        self.pointer_uri = pointer_uri
+        self.artifact_cache = artifact_cache
+        self.snapshot_prefix: Optional[str] = None
+        self._loaded_mtime: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._listeners: List[Callable[[ArticleTable], None]] = []
+
+        if self.pointer_uri:
+            self._fetch_pointed_snapshot()
+        self.table: ArticleTable = self._load()
+
+    def add_listener(self, listener: Callable[[ArticleTable], None]) -> None:
+        """
+        Call a function with every table swapped in by a refresh.
+
+        Args:
+            listener: Function taking the new table, run on the refresh thread
+        """
+        self._listeners.append(listener)
+
+    def start(self) -> None:
+        """Start the background refresh thread, unless refresh is disabled."""
+        if self.refresh_seconds > 0 and self._thread is None:
+            self._thread = threading.Thread(
+                target=self._refresh_loop, name="article-store-refresh", daemon=True
+            )
+            self._thread.start()
+
+    def _fetch_pointed_snapshot(self) -> None:
+        """Link the snapshot of the prefix the pointer names, if it moved."""
+        artifact_cache = self._artifact_cache()
+        prefix = artifact_cache.read_text(self.pointer_uri).strip().rstrip("/")
+        if prefix == self.snapshot_prefix:
+            return
+        path = artifact_cache.fetch(f"{prefix}/{os.path.basename(self.snapshot_path)}")
+        link_file(path, self.snapshot_path)
+        self.snapshot_prefix = prefix
+        logger.info(f"📥 Article snapshot now from {prefix}")
+
+    def _artifact_cache(self) -> ArtifactCache:
+        if self.artifact_cache is None:
+            self.artifact_cache = ArtifactCache()
+        return self.artifact_cache
+
+    def _load(self) -> ArticleTable:
+        logger.timer_start("articles_snapshot_load")
+        mtime = os.path.getmtime(self.snapshot_path)
+        table = ArticleTable.load(self.snapshot_path)
+        self._loaded_mtime = mtime
+        logger.timer_end("articles_snapshot_load")
+        logger.data(
+            f"Loaded {len(table)} articles with {len(table.columns)} columns "
+            f"from {self.snapshot_path}"
+        )
+        return table
+
+    def refresh(self) -> bool:
+        """
+        Reload the snapshot if it changed on disk, after fetching the one the
+        pointer names if set.
+
+        Returns:
+            True if a new table was swapped in
+        """
+        try:
+            if self.pointer_uri:
+                self._fetch_pointed_snapshot()
+            if os.path.getmtime(self.snapshot_path) == self._loaded_mtime:
+                return False
+            self.table = self._load()
+            for listener in self._listeners:
+                listener(self.table)
+            logger.success("Article table refreshed")
+            return True
+        except Exception as e:
+            logger.error(
+                f"❌ Error refreshing article table: {type(e).__name__}: {str(e)}",
+                exc_info=True,
+            )
+            return False
+
+    def _refresh_loop(self) -> None:
+        while not self._stop.wait(self.refresh_seconds):
+            self.refresh()
+
+    def close(self) -> None:
+        """Stop the background refresh thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the article snapshot")
+    parser.add_argument("--output", default=ARTICLES_SNAPSHOT_PATH)
+    parser.add_argument("--table", default=ARTICLES_TABLE)
+    args = parser.parse_args()
+
+    from google.cloud import bigquery
+
+    client = bigquery.Client(project=PROJECT_ID)
+    query = f"""
+        SELECT
+            * EXCEPT ({", ".join(EXCLUDED_COLUMNS)})
+        FROM
+            {args.table}
+    """
+    logger.query(query)
+    df = client.query(query).result().to_dataframe()
+
+    ArticleTable.from_dataframe(df).save(args.output)
+
+
+if __name__ == "__main__":
+    main()
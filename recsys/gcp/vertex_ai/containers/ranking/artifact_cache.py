@@ -0,0 +1,422 @@
+"""
+Local content-addressed cache of GCS artifacts for the ranking container.
+
+Files are stored once under objects/<sha256 of content>. Refs record what a
+name resolved to: a GCS object to the hash of its content (or to its absence),
+a GCS prefix to the hashes of the files under it, and a model version ID to
+its artifact URI. With a warm cache, startup reads local files only and
+makes no network call; a miss downloads from GCS and records the ref.
+
+Refs are never revalidated, so cached names must be immutable: model version
+IDs and dated snapshot prefixes rather than "latest" paths. A model version
+alias such as "default" can move, so it is resolved to a version ID in the
+registry on every start; only that ID's artifact URI is cached.
+
+Warm the cache ahead of startup, e.g. when building the image (from the
+container directory):
+    python artifact_cache.py
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Callable, Dict, Optional, Tuple
+from google.api_core.exceptions import NotFound
+from categorical_encoder import ENCODER_FILE
+from clients import get_storage_client, init_aiplatform
+from config import (
+    ARTIFACT_CACHE_DIR,
+    LOCATION,
+    MODEL_ID,
+    MODEL_VERSION,
+    PROJECT_ID,
+    SNAPSHOT_DIR,
+    SNAPSHOT_GCS_URI,
+)
+from logger import logger
+
+OBJECTS_DIR = "objects"
+REFS_DIR = "refs"
+MODEL_FILE = "model.bst"
+
+
+def split_gcs_uri(uri: str) -> Tuple[str, str]:
+    """
+    Split a gs:// URI into bucket name and object path.
+
+    Args:
+        uri: URI like gs://bucket/path/to/object
+
+    Returns:
+        Tuple of (bucket name, object path)
+
+    Raises:
+        ValueError: If the URI is not a gs:// URI
+    """
+    if not uri.startswith("gs://"):
+        raise ValueError(f"Not a GCS URI: {uri}")
+    bucket_name, _, path = uri[len("gs://") :].partition("/")
+    return bucket_name, path
+
+
+def link_file(source: str, target: str) -> None:
+    """
+    Point target at source with a symlink, swapped in atomically.
+
+    Args:
+        source: Path to link to
+        target: Path of the link, replaced if it exists
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    link_path = f"{target}.link-{os.getpid()}"
+    if os.path.lexists(link_path):
+        os.remove(link_path)
+    os.symlink(source, link_path)
+    os.replace(link_path, target)
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    """
+    Cache of GCS objects in a local directory.
+
+    Attributes:
+        cache_dir: Root directory of the cache
+        hits: Names served from the cache
+        misses: Names fetched from GCS
+    """
+
+    def __init__(self, cache_dir: str = ARTIFACT_CACHE_DIR, storage_client=None):
+        """
+        Args:
+            cache_dir: Root directory of the cache, created if missing
+            storage_client: Cloud Storage client; the shared client is created
+                on the first miss if not given
+        """
+        self.cache_dir = cache_dir
+        self._storage_client = storage_client
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.join(cache_dir, OBJECTS_DIR), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, REFS_DIR), exist_ok=True)
+
+    @property
+    def storage_client(self):
+        if self._storage_client is None:
+            self._storage_client = get_storage_client()
+        return self._storage_client
+
+    def object_path(self, digest: str) -> str:
+        """Path of the cached object with the given content hash."""
+        return os.path.join(self.cache_dir, OBJECTS_DIR, digest)
+
+    def _ref_path(self, name: str) -> str:
+        key = hashlib.sha256(name.encode()).hexdigest()
+        return os.path.join(self.cache_dir, REFS_DIR, f"{key}.json")
+
+    def _read_ref(self, name: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._ref_path(name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_ref(self, name: str, ref: Dict[str, Any]) -> None:
+        # Write then rename, so concurrent readers see the old or the new ref
+        path = self._ref_path(name)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".ref-")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"name": name, **ref}, f)
+        os.replace(tmp_path, path)
+
+    def _store(self, download: Callable[[str], None]) -> str:
+        """
+        Download a file into the object store.
+
+        Args:
+            download: Function writing the file to the path it is given
+
+        Returns:
+            Content hash of the file
+        """
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.join(self.cache_dir, OBJECTS_DIR), prefix=".download-"
+        )
+        os.close(fd)
+        try:
+            download(tmp_path)
+            digest = _sha256_file(tmp_path)
+            os.replace(tmp_path, self.object_path(digest))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return digest
+
+    def _has_objects(self, *digests: Optional[str]) -> bool:
+        return all(
+            digest is None or os.path.exists(self.object_path(digest))
+            for digest in digests
+        )
+
+    def fetch(self, uri: str) -> str:
+        """
+        Get a local path for a GCS object, downloading it on a miss.
+
+        Args:
+            uri: gs:// URI of the object
+
+        Returns:
+            Path of the cached file, which must not be modified
+
+        Raises:
+            FileNotFoundError: If the object does not exist
+        """
+        path = self.fetch_optional(uri)
+        if path is None:
+            raise FileNotFoundError(f"{uri} does not exist")
+        return path
+
+    def fetch_optional(self, uri: str) -> Optional[str]:
+        """
+        Like fetch(), but return None if the object does not exist.
+
+        Absence is cached too, so an optional artifact that was never uploaded
+        costs no request on later starts.
+
+        Args:
+            uri: gs:// URI of the object
+
+        Returns:
+            Path of the cached file, or None
+        """
+        ref = self._read_ref(uri)
+        if ref is not None and self._has_objects(ref["sha256"]):
+            self.hits += 1
+        else:
+            self.misses += 1
+            bucket_name, path = split_gcs_uri(uri)
+            blob = self.storage_client.bucket(bucket_name).blob(path)
+            logger.info(f"📥 Downloading {uri} into the artifact cache")
+            try:
+                digest = self._store(blob.download_to_filename)
+            except NotFound:
+                digest = None
+            ref = {"sha256": digest}
+            self._write_ref(uri, ref)
+
+        if ref["sha256"] is None:
+            return None
+        return self.object_path(ref["sha256"])
+
+    def fetch_tree(self, prefix_uri: str, local_dir: str) -> str:
+        """
+        Mirror the objects under a GCS prefix into a local directory.
+
+        Files are linked from the object store, so the directory costs no copy
+        and every link is swapped atomically.
+
+        Args:
+            prefix_uri: gs:// URI of the prefix
+            local_dir: Directory to mirror into
+
+        Returns:
+            local_dir
+        """
+        ref = self._read_ref(prefix_uri)
+        if ref is not None and self._has_objects(*ref["files"].values()):
+            self.hits += 1
+        else:
+            self.misses += 1
+            bucket_name, prefix = split_gcs_uri(prefix_uri)
+            prefix = prefix.rstrip("/") + "/"
+            logger.info(f"📥 Downloading {prefix_uri} into the artifact cache")
+            files = {}
+            for blob in self.storage_client.list_blobs(bucket_name, prefix=prefix):
+                relative_path = blob.name[len(prefix) :]
+                if relative_path and not relative_path.endswith("/"):
+                    files[relative_path] = self._store(blob.download_to_filename)
+            ref = {"files": files}
+            self._write_ref(prefix_uri, ref)
+
+        for relative_path, digest in ref["files"].items():
+            link_file(self.object_path(digest), os.path.join(local_dir, relative_path))
+
+        logger.data(f"Linked {len(ref['files'])} files from {prefix_uri}")
+        return local_dir
+
+    def read_text(self, uri: str) -> str:
+        """
+        Read a small GCS object, bypassing the cache.
+
+        For pointers that are rewritten in place, such as the object naming
+        the snapshot prefix currently served.
+
+        Args:
+            uri: gs:// URI of the object
+
+        Returns:
+            Content of the object
+        """
+        bucket_name, path = split_gcs_uri(uri)
+        return self.storage_client.bucket(bucket_name).blob(path).download_as_text()
+
+    def lookup(self, name: str) -> Optional[str]:
+        """
+        Get a cached string value without computing it.
+
+        Args:
+            name: Name of the value
+
+        Returns:
+            Value, or None if not cached
+        """
+        ref = self._read_ref(name)
+        return None if ref is None else ref["value"]
+
+    def record(self, name: str, value: str) -> None:
+        """
+        Cache a string value, replacing any previous one.
+
+        Args:
+            name: Name of the value
+            value: Value
+        """
+        self._write_ref(name, {"value": value})
+
+    def resolve(self, name: str, compute: Callable[[], str]) -> str:
+        """
+        Get a cached string value, computing it on a miss.
+
+        Args:
+            name: Name of the value
+            compute: Function computing the value, e.g. a registry lookup
+
+        Returns:
+            Value
+        """
+        ref = self._read_ref(name)
+        if ref is not None:
+            self.hits += 1
+            return ref["value"]
+
+        self.misses += 1
+        value = compute()
+        self._write_ref(name, {"value": value})
+        return value
+
+
+def model_resource_name(model_id: str = MODEL_ID) -> str:
+    """Resource name of a model in the Vertex AI Model Registry."""
+    return f"projects/{PROJECT_ID}/locations/{LOCATION}/models/{model_id}"
+
+
+def model_ref_name(model_id: str = MODEL_ID, version: str = MODEL_VERSION) -> str:
+    """Name under which the artifact URI of a model version ID is cached."""
+    return f"model:{model_resource_name(model_id)}@{version}"
+
+
+def alias_ref_name(model_id: str = MODEL_ID, alias: str = MODEL_VERSION) -> str:
+    """Name under which the version ID an alias last pointed to is cached."""
+    return f"alias:{model_resource_name(model_id)}@{alias}"
+
+
+def is_version_id(version: str) -> bool:
+    """Whether a version reference is a version ID rather than an alias."""
+    return version.isdigit()
+
+
+def registry_version(
+    alias: str = MODEL_VERSION, model_id: str = MODEL_ID
+) -> Tuple[str, str]:
+    """
+    Ask the Model Registry which version an alias points to.
+
+    Args:
+        alias: Version alias, e.g. "default", or a version ID
+        model_id: Model ID in the registry
+
+    Returns:
+        Tuple of (version ID, gs:// URI of its model files)
+    """
+    init_aiplatform()
+    from google.cloud import aiplatform
+
+    model = aiplatform.Model(model_name=model_resource_name(model_id), version=alias)
+    return model.version_id, model.uri
+
+
+def resolve_model_version(
+    cache: ArtifactCache, model_id: str = MODEL_ID, version: str = MODEL_VERSION
+) -> Tuple[str, str]:
+    """
+    Look up the version ID and artifact URI of a model version.
+
+    The artifact URI of a version ID never changes, so it is cached and the
+    Vertex AI SDK is imported only on a miss. An alias is asked of the
+    registry on every call; if the registry cannot be reached, the version
+    it last pointed to is used with a warning.
+
+    Args:
+        cache: Cache holding the answers
+        model_id: Model ID in the registry
+        version: Model version ID or alias
+
+    Returns:
+        Tuple of (version ID, gs:// URI of the directory with the model files)
+    """
+    if is_version_id(version):
+        model_uri = cache.resolve(
+            model_ref_name(model_id, version),
+            lambda: registry_version(version, model_id)[1],
+        )
+        return version, model_uri
+
+    try:
+        version_id, model_uri = registry_version(version, model_id)
+    except Exception as e:
+        version_id = cache.lookup(alias_ref_name(model_id, version))
+        model_uri = version_id and cache.lookup(model_ref_name(model_id, version_id))
+        if not model_uri:
+            raise
+        logger.warning(
+            f"⚠️ Registry unreachable ({type(e).__name__}), using version "
+            f"{version_id} that {version} last pointed to"
+        )
+        return version_id, model_uri
+
+    cache.record(model_ref_name(model_id, version_id), model_uri)
+    cache.record(alias_ref_name(model_id, version), version_id)
+    return version_id, model_uri
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm the artifact cache")
+    parser.add_argument("--cache-dir", default=ARTIFACT_CACHE_DIR)
+    parser.add_argument("--snapshots", default=SNAPSHOT_GCS_URI)
+    parser.add_argument("--snapshot-dir", default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    cache = ArtifactCache(args.cache_dir)
+    _, model_uri = resolve_model_version(cache)
+    model_uri = model_uri.rstrip("/")
+    cache.fetch(f"{model_uri}/{MODEL_FILE}")
+    cache.fetch_optional(f"{model_uri}/{ENCODER_FILE}")
+    if args.snapshots:
+        cache.fetch_tree(args.snapshots, args.snapshot_dir)
+    logger.success(
+        f"Artifact cache ready in {args.cache_dir} "
+        f"({cache.hits} cached, {cache.misses} fetched)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Cross-request micro-batching for model predictions.
+
+Request threads submit feature matrices to a queue. A single worker thread
+takes the first waiting matrix, gathers more until the batch window closes or
+the row limit is reached, runs one prediction over the stacked matrix and
+hands each request its slice of the scores.
+"""
+
+import time
+import queue
+import threading
+import numpy as np
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+from config import PREDICT_BATCH_WINDOW_MS, PREDICT_BATCH_MAX_ROWS
+from logger import logger
+from metrics import Histogram, exponential_buckets
+
+
+class _Pending:
+    """A submitted feature matrix waiting for its scores."""
+
+    __slots__ = ("features", "future", "enqueued_at")
+
+    def __init__(self, features: np.ndarray):
+        self.features = features
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class PredictionBatcher:
+    """
+    Coalesces predictions from concurrent requests into shared model calls.
+
+    Attributes:
+        window_seconds: Longest time a batch waits for more requests
+        max_rows: Row count at which a batch is dispatched immediately
+        batch_rows: Histogram of rows per model call
+        batch_requests: Histogram of requests per model call
+        queue_delay_ms: Histogram of time requests wait before their batch runs
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[[np.ndarray], np.ndarray],
+        window_ms: float = PREDICT_BATCH_WINDOW_MS,
+        max_rows: int = PREDICT_BATCH_MAX_ROWS,
+    ):
+        """
+        Start the batching thread.
+
+        Args:
+            predict_fn: Scores a 2-D feature matrix, returning one score per row
+            window_ms: Batch window, measured from the first request in a batch
+            max_rows: Row count that dispatches a batch before the window closes
+        """
+        self._predict_fn = predict_fn
+        self.window_seconds = window_ms / 1000.0
+        self.max_rows = max_rows
+
+        self.batch_rows = Histogram(exponential_buckets(16, 2, 12))
+        self.batch_requests = Histogram(exponential_buckets(1, 2, 10))
+        self.queue_delay_ms = Histogram(exponential_buckets(0.05, 2, 14))
+
+        self._queue: "queue.Queue[Optional[_Pending]]" = queue.Queue()
+        self._carry: Optional[_Pending] = None
+        self._thread = threading.Thread(
+            target=self._run, name="prediction-batcher", daemon=True
+        )
+        self._thread.start()
+
+        logger.info(
+            f"📦 Prediction batching enabled: window {window_ms:.1f}ms, "
+            f"max {max_rows} rows"
+        )
+
+    def submit(self, features: np.ndarray) -> Future:
+        """
+        Queue a feature matrix for scoring.
+
+        Args:
+            features: 2-D feature matrix
+
+        Returns:
+            Future resolving to the scores of the matrix rows
+        """
+        pending = _Pending(features)
+        self._queue.put(pending)
+        return pending.future
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """
+        Score a feature matrix, waiting for the batch it joins.
+
+        Args:
+            features: 2-D feature matrix
+
+        Returns:
+            One score per row
+        """
+        return self.submit(features).result()
+
+    def close(self) -> None:
+        """Score anything still queued and stop the batching thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _next(self, timeout: Optional[float]) -> Optional[_Pending]:
+        if self._carry is not None:
+            pending, self._carry = self._carry, None
+            return pending
+        if timeout is not None and timeout <= 0:
+            return self._queue.get_nowait()
+        return self._queue.get(timeout=timeout)
+
+    def _run(self) -> None:
+        while True:
+            first = self._next(timeout=None)
+            if first is None:
+                return
+
+            batch = [first]
+            rows = len(first.features)
+            deadline = first.enqueued_at + self.window_seconds
+            stopping = False
+
+            while rows < self.max_rows:
+                # Once the window has closed, only take what is already queued
+                try:
+                    pending = self._next(timeout=deadline - time.monotonic())
+                except queue.Empty:
+                    break
+                if pending is None:
+                    stopping = True
+                    break
+                if rows + len(pending.features) > self.max_rows:
+                    # Start the next batch with it rather than exceed the limit
+                    self._carry = pending
+                    break
+                batch.append(pending)
+                rows += len(pending.features)
+
+            self._run_batch(batch, rows)
+            if stopping:
+                if self._carry is not None:
+                    self._run_batch([self._carry], len(self._carry.features))
+                return
+
+    def _run_batch(self, batch: List[_Pending], rows: int) -> None:
+        started_at = time.monotonic()
+        for pending in batch:
+            self.queue_delay_ms.observe((started_at - pending.enqueued_at) * 1000.0)
+        self.batch_rows.observe(rows)
+        self.batch_requests.observe(len(batch))
+
+        try:
+            if len(batch) == 1:
+                features = batch[0].features
+            else:
+                features = np.concatenate([pending.features for pending in batch])
+            scores = self._predict_fn(features)
+        except Exception as e:
+            logger.error(
+                f"❌ Batched prediction failed for {len(batch)} requests: "
+                f"{type(e).__name__}: {str(e)}",
+                exc_info=True,
+            )
+            for pending in batch:
+                pending.future.set_exception(e)
+            return
+
+        start = 0
+        for pending in batch:
+            end = start + len(pending.features)
+            pending.future.set_result(scores[start:end])
+            start = end
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report the batching configuration and histograms.
+
+        Returns:
+            Dictionary of settings, batch size histograms and queueing delay
+        """
+        return {
+            "window_ms": self.window_seconds * 1000.0,
+            "max_rows": self.max_rows,
+            "queued": self._queue.qsize(),
+            "batch_rows": self.batch_rows.snapshot(),
+            "batch_requests": self.batch_requests.snapshot(),
+            "queue_delay_ms": self.queue_delay_ms.snapshot(),
+        }
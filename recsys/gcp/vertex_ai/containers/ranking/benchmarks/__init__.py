@@ -0,0 +1,4 @@
+"""
+Micro-benchmarks for the ranking container.
+Run from the container directory, e.g. `python -m benchmarks.retrieval`.
+"""
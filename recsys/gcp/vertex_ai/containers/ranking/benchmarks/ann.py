@@ -0,0 +1,88 @@
+"""
+Benchmark IVF-PQ recall@k and latency against brute-force retrieval.
+
+Usage (from the container directory):
+    python -m benchmarks.ann --articles 105000 --nprobe 1 4 16 64
+"""
+
+import argparse
+import itertools
+import numpy as np
+from benchmarks.common import latency_summary, print_table, time_calls
+from benchmarks.synthetic import make_candidate_catalog, make_queries
+from config import TOP_K_CANDIDATES
+from ivfpq import IVFPQIndex
+from retrieval import top_k
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--articles", type=int, default=105_000)
+    parser.add_argument("--dim", type=int, default=16)
+    parser.add_argument("--k", type=int, default=TOP_K_CANDIDATES)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--subquantizers", type=int, default=8)
+    parser.add_argument(
+        "--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64]
+    )
+    args = parser.parse_args()
+
+    article_ids, embeddings = make_candidate_catalog(args.articles, args.dim)
+    queries = make_queries(args.queries, args.dim)
+
+    index = IVFPQIndex.build(
+        article_ids,
+        embeddings,
+        n_lists=args.lists,
+        n_subquantizers=args.subquantizers,
+    )
+
+    # Ground truth and baseline latency from a brute-force scan
+    truth = [set(top_k(embeddings @ query, args.k)[0].tolist()) for query in queries]
+    query_iter = itertools.cycle(queries)
+    rows = [
+        {
+            "engine": "brute_force",
+            "nprobe": "-",
+            "recall": 1.0,
+            **latency_summary(
+                time_calls(
+                    lambda: top_k(embeddings @ next(query_iter), args.k),
+                    repeats=args.queries,
+                )
+            ),
+        }
+    ]
+
+    for nprobe in args.nprobe:
+        recall = np.mean(
+            [
+                len(truth[i] & set(index.search(query, args.k, nprobe)[0].tolist()))
+                / args.k
+                for i, query in enumerate(queries)
+            ]
+        )
+        query_iter = itertools.cycle(queries)
+        durations = time_calls(
+            lambda: index.search(next(query_iter), args.k, nprobe),
+            repeats=args.queries,
+        )
+        rows.append(
+            {
+                "engine": "ivfpq",
+                "nprobe": nprobe,
+                "recall": float(recall),
+                **latency_summary(durations),
+            }
+        )
+
+    print(
+        f"\nRecall@{args.k} over {args.articles} articles "
+        f"(dim={args.dim}, lists={index.n_lists}, subquantizers={args.subquantizers})"
+    )
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
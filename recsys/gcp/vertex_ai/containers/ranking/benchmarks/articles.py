@@ -0,0 +1,71 @@
+"""
+Benchmark per-request article feature assembly from the resident article table.
+
+Usage (from the container directory):
+    python -m benchmarks.articles --articles 105000 --candidates 100
+"""
+
+import argparse
+import itertools
+import os
+import tempfile
+import numpy as np
+from benchmarks.common import latency_summary, print_table, time_calls
+from benchmarks.synthetic import make_article_frame, make_candidate_catalog
+from article_store import ArticleStore, ArticleTable
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--articles", type=int, default=105_000)
+    parser.add_argument("--candidates", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=1_000)
+    args = parser.parse_args()
+
+    article_ids, _ = make_candidate_catalog(args.articles)
+    df = make_article_frame(article_ids)
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "articles.npz")
+        ArticleTable.from_dataframe(df).save(path)
+
+        store = ArticleStore(path, refresh_seconds=0)
+        table = store.table
+        requests = [
+            article_ids[rng.choice(args.articles, args.candidates, replace=False)]
+            for _ in range(args.requests)
+        ]
+        request_iter = itertools.cycle(requests)
+
+        lookup_durations = time_calls(
+            lambda: table.lookup(next(request_iter)), repeats=args.requests
+        )
+        indices = table.lookup(requests[0])
+        gather_durations = time_calls(
+            lambda: table.gather(indices), repeats=args.requests
+        )
+        request_iter = itertools.cycle(requests)
+        total_durations = time_calls(
+            lambda: table.gather(table.lookup(next(request_iter))),
+            repeats=args.requests,
+        )
+
+        object_columns = table.gather(indices).select_dtypes("object").columns
+        print(f"\nObject columns in gathered frame: {list(object_columns)}")
+
+    print(
+        f"Article features for {args.candidates} candidates "
+        f"from a {args.articles}-article table"
+    )
+    print_table(
+        [
+            {"stage": "lookup", **latency_summary(lookup_durations)},
+            {"stage": "gather", **latency_summary(gather_durations)},
+            {"stage": "lookup+gather", **latency_summary(total_durations)},
+        ]
+    )
+
+
+if __name__ == "__main__":
+    main()
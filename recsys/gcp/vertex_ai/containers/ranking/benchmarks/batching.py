@@ -0,0 +1,135 @@
+"""
+Compare one N-instance /predict pipeline call against N single-instance calls.
+
+Runs preprocess, predict and postprocess with exact retrieval and a resident
+article table over a synthetic catalog, in-memory stand-ins for the other
+backends and a small XGBoost model trained on random data. Also checks that
+both paths return the same rankings.
+
+Usage (from the container directory):
+    python -m benchmarks.batching --batch-sizes 1 10 100 --bought-ms 0
+"""
+
+import argparse
+import logging
+import tempfile
+import numpy as np
+from benchmarks.common import latency_summary, print_table, time_calls
+from benchmarks.fanout import StandInTransformer
+from benchmarks.synthetic import (
+    make_article_frame,
+    make_candidate_catalog,
+    make_queries,
+    make_ranking_model,
+    write_candidates_snapshot,
+)
+from article_store import ArticleTable
+from feature_matrix import ArticleFeatureMatrix
+from logger import logger
+from ranking_predictor import RankingPredictor
+from retrieval import ExactRetriever
+
+
+class StandInPredictor(RankingPredictor):
+    """RankingPredictor with a small model trained on random features."""
+
+    def __init__(self, n_trees: int, seed: int = 27, engine: str = "dmatrix"):
+        self.model = make_ranking_model(n_trees, seed)
+        self.encoder = None
+        self.batcher = None
+        self.engine = engine
+        self.forest = None
+        self._prepare_engine()
+
+
+class TableStandInTransformer(StandInTransformer):
+    """Stand-in transformer reading article features from an ArticleTable."""
+
+    def use_article_table(self, table: ArticleTable) -> None:
+        """Serve article features from the feature matrix of a table."""
+        self.feature_matrix = ArticleFeatureMatrix(
+            table, self.ranking_model_feature_names
+        )
+
+
+def make_request(queries: np.ndarray) -> dict:
+    """Build a /predict request body with one instance per query."""
+    return {
+        "instances": [
+            {
+                "customer_id": f"{i:064d}",
+                "month_sin": float(np.sin(2 * np.pi * (i % 12) / 12)),
+                "month_cos": float(np.cos(2 * np.pi * (i % 12) / 12)),
+                "query_emb": query.tolist(),
+            }
+            for i, query in enumerate(queries)
+        ]
+    }
+
+
+def run(transformer, predictor, request) -> dict:
+    """Run the /predict pipeline without the HTTP layer."""
+    transformed = transformer.preprocess(request)
+    return transformer.postprocess(predictor.predict(transformed["inputs"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--articles", type=int, default=100_000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--retrieval-ms", type=float, default=0)
+    parser.add_argument("--bought-ms", type=float, default=0)
+    parser.add_argument("--customer-ms", type=float, default=0)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+
+    article_ids, embeddings = make_candidate_catalog(args.articles)
+    snapshot_dir = write_candidates_snapshot(
+        tempfile.mkdtemp(), article_ids, embeddings
+    )
+
+    transformer = TableStandInTransformer(args, max_workers=8)
+    transformer.retriever = ExactRetriever(snapshot_dir)
+    transformer.use_article_table(
+        ArticleTable.from_dataframe(make_article_frame(article_ids))
+    )
+    predictor = StandInPredictor(args.trees)
+
+    rows = []
+    for batch_size in args.batch_sizes:
+        queries = make_queries(batch_size, embeddings.shape[1])
+        batched = make_request(queries)
+        singles = [{"instances": [instance]} for instance in batched["instances"]]
+
+        batched_rankings = run(transformer, predictor, batched)["rankings"]
+        single_rankings = [
+            run(transformer, predictor, single)["ranking"] for single in singles
+        ]
+        matches = all(
+            [article for _, article in a] == [article for _, article in b]
+            for a, b in zip(batched_rankings, single_rankings)
+        )
+
+        for mode, fn in [
+            ("per-instance", lambda: [run(transformer, predictor, r) for r in singles]),
+            ("batched", lambda: run(transformer, predictor, batched)),
+        ]:
+            summary = latency_summary(time_calls(fn, args.repeats, warmup=1))
+            rows.append(
+                {
+                    "instances": batch_size,
+                    "mode": mode,
+                    **summary,
+                    "ms_per_instance": summary["mean_ms"] / batch_size,
+                    "rankings_match": matches,
+                }
+            )
+
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
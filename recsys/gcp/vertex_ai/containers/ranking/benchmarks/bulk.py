@@ -0,0 +1,170 @@
+"""
+Compare bulk scoring on /predict/stream with one /predict call per customer.
+
+A server is started on a local dataset written by benchmarks/synthetic.py
+(see benchmarks/load.py). The baseline loops over /predict with one instance
+per call on a kept-alive connection, as a campaign job does today. The stream
+uploads the same instances with chunked encoding from one thread while the
+main thread reads the rankings, since the server only reads more input once
+its output is consumed.
+
+The server's resident memory is read after each stream: it stays flat as the
+stream grows, since only one block is held at a time.
+
+Usage (from the container directory):
+    python -m benchmarks.synthetic --output /tmp/hm
+    python -m benchmarks.bulk --data-dir /tmp/hm --rows 2000 20000
+"""
+
+import argparse
+import json
+import logging
+import socket
+import tempfile
+import threading
+import time
+import http.client
+from typing import Iterable, Iterator
+from urllib.parse import urlparse
+import numpy as np
+from benchmarks.common import print_table
+from benchmarks.load import call, start_server
+from logger import logger
+from query_table import QueryEmbeddingTable
+
+
+def make_instances(data_dir: str, n_rows: int, seed: int = 27) -> Iterator[bytes]:
+    """NDJSON lines of instances for random customers of the dataset."""
+    rng = np.random.default_rng(seed)
+    table = QueryEmbeddingTable(f"{data_dir}/query_embeddings")
+    for index in rng.integers(len(table), size=n_rows):
+        instance = {
+            "customer_id": str(table.customer_ids[index]),
+            "date": f"2020-{int(rng.integers(1, 13)):02d}-15",
+        }
+        yield json.dumps(instance).encode() + b"\n"
+
+
+def stream_lines(url: str, path: str, lines: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    POST lines with chunked encoding while reading the response lines.
+
+    Sending runs in its own thread, so neither side waits for the other's
+    buffers to drain.
+    """
+    parsed = urlparse(url)
+    sock = socket.create_connection((parsed.hostname, parsed.port))
+    sock.sendall(
+        f"POST {path} HTTP/1.1\r\nHost: {parsed.netloc}\r\n"
+        "Content-Type: application/x-ndjson\r\n"
+        "Transfer-Encoding: chunked\r\n\r\n".encode()
+    )
+
+    def send() -> None:
+        batch = []
+        for line in lines:
+            batch.append(line)
+            if len(batch) == 64:
+                chunk = b"".join(batch)
+                sock.sendall(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                batch = []
+        if batch:
+            chunk = b"".join(batch)
+            sock.sendall(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        sock.sendall(b"0\r\n\r\n")
+
+    sender = threading.Thread(target=send, daemon=True)
+    sender.start()
+    response = http.client.HTTPResponse(sock)
+    response.begin()
+    try:
+        for line in response:
+            yield line
+    finally:
+        sender.join()
+        sock.close()
+
+
+def resident_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--data-dir", required=True)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--rows", type=int, nargs="+", default=[2000, 20000])
+    parser.add_argument("--single-rows", type=int, default=500)
+    parser.add_argument("--server-env", nargs="*", default=[])
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    args = parser.parse_args()
+    args.url = f"http://127.0.0.1:{args.port}"
+    args.workers = 1
+    logger.setLevel(logging.WARNING)
+
+    log_file = tempfile.NamedTemporaryFile("w", suffix=".log", delete=False)
+    print(f"Starting server on {args.url}, log in {log_file.name}")
+    server = start_server(args, log_file)
+
+    rows = []
+    try:
+        parsed = urlparse(args.url)
+        connection = http.client.HTTPConnection(parsed.hostname, parsed.port)
+        start = time.perf_counter()
+        for line in make_instances(args.data_dir, args.single_rows):
+            status, _ = call(
+                args.url,
+                "POST",
+                "/predict",
+                b'{"instances": [' + line.strip() + b"]}",
+                connection,
+            )
+            assert status == 200, status
+        seconds = time.perf_counter() - start
+        rows.append(
+            {
+                "mode": "/predict per customer",
+                "rows": args.single_rows,
+                "errors": 0,
+                "rows_per_s": args.single_rows / seconds,
+                "first_row_ms": float("nan"),
+                "server_rss_mb": resident_mb(server.pid),
+            }
+        )
+
+        for n_rows in args.rows:
+            start = time.perf_counter()
+            first_row = None
+            summary = None
+            for line in stream_lines(
+                args.url, "/predict/stream", make_instances(args.data_dir, n_rows)
+            ):
+                if first_row is None:
+                    first_row = time.perf_counter() - start
+                record = json.loads(line)
+                summary = record.get("summary", summary)
+            seconds = time.perf_counter() - start
+            rows.append(
+                {
+                    "mode": "/predict/stream",
+                    "rows": summary["rows"],
+                    "errors": summary["errors"],
+                    "rows_per_s": summary["rows"] / seconds,
+                    "first_row_ms": 1000 * first_row,
+                    "server_rss_mb": resident_mb(server.pid),
+                }
+            )
+    finally:
+        server.terminate()
+        server.wait()
+        log_file.close()
+
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
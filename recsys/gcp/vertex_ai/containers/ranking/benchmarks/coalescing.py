@@ -0,0 +1,114 @@
+"""
+Load test of cross-request prediction batching.
+
+Client threads call RankingPredictor.predict in a closed loop with
+candidate-sized feature blocks, first with a direct model call per request
+and then through PredictionBatcher with each configured window.
+
+Usage (from the container directory):
+    python -m benchmarks.coalescing --clients 1 8 32 --windows-ms 1 2
+"""
+
+import argparse
+import logging
+import threading
+import time
+import numpy as np
+import pandas as pd
+from batcher import PredictionBatcher
+from benchmarks.batching import StandInPredictor
+from benchmarks.common import latency_summary, print_table
+from config import RANKING_MODEL_FEATURES
+from logger import logger
+
+
+def load_test(predictor, features: pd.DataFrame, clients: int, seconds: float):
+    """
+    Run closed-loop clients against the predictor.
+
+    Args:
+        predictor: RankingPredictor to call
+        features: Feature block sent by every request
+        clients: Number of concurrent client threads
+        seconds: Duration of the test
+
+    Returns:
+        Tuple of (requests per second, per-request durations in seconds)
+    """
+    article_ids = [str(i) for i in range(len(features))]
+    durations: list = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + seconds
+
+    def client():
+        local = []
+        while time.perf_counter() < stop_at:
+            inputs = [{"ranking_features": features, "article_ids": article_ids}]
+            start = time.perf_counter()
+            predictor.predict(inputs)
+            local.append(time.perf_counter() - start)
+        with lock:
+            durations.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return len(durations) / (time.perf_counter() - started), durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--windows-ms", type=float, nargs="+", default=[1.0, 2.0])
+    parser.add_argument("--max-rows", type=int, default=4096)
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.ERROR)
+
+    predictor = StandInPredictor(args.trees)
+    rng = np.random.default_rng(27)
+    features = pd.DataFrame(
+        rng.random((args.rows, len(RANKING_MODEL_FEATURES)), dtype=np.float32),
+        columns=list(RANKING_MODEL_FEATURES),
+    )
+
+    rows = []
+    for clients in args.clients:
+        for window_ms in [None, *args.windows_ms]:
+            predictor.batcher = (
+                PredictionBatcher(predictor._predict_matrix, window_ms, args.max_rows)
+                if window_ms is not None
+                else None
+            )
+            throughput, durations = load_test(
+                predictor, features, clients, args.seconds
+            )
+
+            row = {
+                "clients": clients,
+                "mode": "direct" if window_ms is None else f"batched {window_ms:g}ms",
+                "req_per_s": throughput,
+                **latency_summary(durations),
+            }
+            if predictor.batcher is not None:
+                stats = predictor.batcher.stats()
+                predictor.batcher.close()
+                row["mean_batch_rows"] = stats["batch_rows"]["mean"]
+                row["queue_p95_ms"] = stats["queue_delay_ms"]["p95"]
+            else:
+                row["mean_batch_rows"] = float(args.rows)
+                row["queue_p95_ms"] = 0.0
+            rows.append(row)
+
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Shared helpers for ranking container benchmarks.
+"""
+
+import time
+import numpy as np
+from typing import Callable, Dict, List
+
+
+def time_calls(fn: Callable[[], object], repeats: int, warmup: int = 5) -> List[float]:
+    """
+    Time repeated calls of a function.
+
+    Args:
+        fn: Zero-argument callable to time
+        repeats: Number of timed calls
+        warmup: Number of untimed calls made first
+
+    Returns:
+        List of call durations in seconds
+    """
+    for _ in range(warmup):
+        fn()
+
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def latency_summary(durations: List[float]) -> Dict[str, float]:
+    """
+    Summarize call durations as milliseconds.
+
+    Args:
+        durations: Durations in seconds
+
+    Returns:
+        Dictionary with mean, p50, p95 and p99 latencies in milliseconds
+    """
+    samples = np.asarray(durations) * 1000.0
+    return {
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+    }
+
+
+def print_table(rows: List[Dict[str, object]]) -> None:
+    """
+    Print a list of result dictionaries as an aligned table.
+
+    Args:
+        rows: Result rows sharing the same keys
+    """
+    if not rows:
+        return
+
+    columns = list(rows[0].keys())
+    cells = [
+        [
+            f"{row[col]:.4f}" if isinstance(row[col], float) else str(row[col])
+            for col in columns
+        ]
+        for row in rows
+    ]
+    widths = [
+        max(len(col), *(len(line[i]) for line in cells))
+        for i, col in enumerate(columns)
+    ]
+
+    print("  ".join(col.rjust(width) for col, width in zip(columns, widths)))
+    for line in cells:
+        print("  ".join(cell.rjust(width) for cell, width in zip(line, widths)))
@@ -0,0 +1,139 @@
+"""
+Measure the customer feature cache in front of a slow online store.
+
+Lookups go through the transformer's customer feature path, for customers
+drawn from a Zipf distribution plus a fraction --unknown-fraction of IDs the
+store does not have, like cold-start or bogus IDs. The stand-in store answers
+after a lognormal delay around --read-ms. The same lookup sequence runs with
+the cache disabled and enabled; with a TTL shorter than the run, the hot
+customers are refreshed ahead of expiry in the background instead of being
+read on the lookup path.
+
+Usage (from the container directory):
+    python -m benchmarks.customer_cache --read-ms 5 --ttl-seconds 2 --seconds 10
+"""
+
+import argparse
+import logging
+import time
+import numpy as np
+from benchmarks.common import latency_summary, print_table
+from benchmarks.deadlines import make_transformer
+from customer_cache import CustomerFeatureCache
+from data_access import DataAccess
+from deadlines import begin_deadline
+from logger import logger
+
+
+class SlowCustomerStore(DataAccess):
+    """Stand-in store of customer features with a lognormal read delay."""
+
+    def __init__(self, n_customers: int, read_ms: float, seed: int = 7):
+        self.customers = {f"{i:064d}" for i in range(n_customers)}
+        self.read_ms = read_ms
+        self.rng = np.random.default_rng(seed)
+        self.reads = 0
+
+    def customer_features(self, customer_id, timeout=None):
+        self.reads += 1
+        time.sleep(self.read_ms * self.rng.lognormal(0.0, 0.25) / 1000)
+        if customer_id not in self.customers:
+            raise KeyError(f"Customer {customer_id} not found")
+        return [
+            {"name": "customer_id", "value": {"string_value": customer_id}},
+            {"name": "age", "value": {"int64_value": 20 + int(customer_id) % 50}},
+        ]
+
+    def execute_query(self, query, query_name="query", timeout=None):
+        raise RuntimeError("not read by this benchmark")
+
+    def bought_items(self, customer_ids, timeout=None):
+        raise RuntimeError("not read by this benchmark")
+
+    def articles_data(self, articles, timeout=None):
+        raise RuntimeError("not read by this benchmark")
+
+    def rankings_data(self, customer_id):
+        raise RuntimeError("not read by this benchmark")
+
+
+def make_lookups(n_customers: int, n_lookups: int, zipf: float, unknown: float):
+    """Zipf-distributed known customers mixed with 1000 recurring unknown IDs."""
+    rng = np.random.default_rng(27)
+    ranks = np.minimum(rng.zipf(zipf, size=n_lookups), n_customers) - 1
+    known = rng.permutation(n_customers)[ranks]
+    return [
+        f"{n_customers + int(rng.integers(1000)):064d}"
+        if rng.random() < unknown
+        else f"{index:064d}"
+        for index in known
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--customers", type=int, default=100000)
+    parser.add_argument("--zipf", type=float, default=1.3)
+    parser.add_argument("--unknown-fraction", type=float, default=0.05)
+    parser.add_argument("--read-ms", type=float, default=5)
+    parser.add_argument("--ttl-seconds", type=float, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.ERROR)
+    lookups = make_lookups(args.customers, 200000, args.zipf, args.unknown_fraction)
+
+    rows = []
+    for mode, cache_size in [("no cache", 0), ("cache", args.customers)]:
+        store = SlowCustomerStore(args.customers, args.read_ms)
+        transformer = make_transformer(store, hedge=False)
+        transformer.customer_cache = CustomerFeatureCache(
+            transformer._read_customer_features,
+            max_size=cache_size,
+            ttl_seconds=args.ttl_seconds,
+            negative_ttl_seconds=args.ttl_seconds,
+        )
+        transformer.customer_cache.start()
+
+        durations = []
+        unknown = 0
+        end = time.perf_counter() + args.seconds
+        for customer_id in lookups:
+            begin_deadline(None)
+            start = time.perf_counter()
+            if start > end:
+                break
+            try:
+                transformer._get_customer_features(customer_id)
+            except KeyError:
+                unknown += 1
+            durations.append(time.perf_counter() - start)
+        stats = transformer.customer_cache.stats()
+        transformer.customer_cache.close()
+        transformer.hedger.close()
+
+        rows.append(
+            {
+                "mode": mode,
+                "lookups_per_s": len(durations) / args.seconds,
+                **latency_summary(durations),
+                "unknown": unknown,
+                "store_reads": store.reads,
+                "hit_ratio": stats["hit_ratio"],
+                "negative_hits": stats["negative_hits"],
+                "refreshes": stats["refreshes"],
+                "refresh_p99_ms": stats["refresh_latency_ms"]["p99"],
+                "stale_p99_s": stats["staleness_s"]["p99"],
+            }
+        )
+
+    print(
+        f"\nZipf {args.zipf:g} over {args.customers} customers, "
+        f"{args.unknown_fraction:.0%} unknown, {args.read_ms:g}ms reads, "
+        f"TTL {args.ttl_seconds:g}s"
+    )
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Show the effect of hedged reads and request budgets on heavy-tailed backends.
+
+The stand-in backend answers after a lognormal delay around --base-ms, and a
+fraction --tail-fraction of its reads take --tail-ms instead, like a feature
+store read that hits a slow replica. Reads go through the transformer's
+customer feature and purchase lookups, with hedging off and on; hedges are
+capped at HEDGE_MAX_RATIO of the reads.
+
+The second table runs the same reads under decreasing request budgets and
+counts how the requests were degraded instead of failed.
+
+Usage (from the container directory):
+    python -m benchmarks.deadlines --base-ms 5 --tail-ms 200 --tail-fraction 0.03
+"""
+
+import argparse
+import logging
+import time
+import numpy as np
+from benchmarks.common import latency_summary, print_table
+from customer_cache import CustomerFeatureCache
+from data_access import DataAccess
+from deadlines import Hedger, begin_deadline, degradations
+from logger import logger
+from ranking_transformer import RankingTransformer
+
+
+class HeavyTailDataAccess(DataAccess):
+    """Stand-in backend whose reads take a lognormal delay with a slow tail."""
+
+    def __init__(self, base_ms: float, tail_ms: float, tail_fraction: float, seed=7):
+        self.base_ms = base_ms
+        self.tail_ms = tail_ms
+        self.tail_fraction = tail_fraction
+        self.rng = np.random.default_rng(seed)
+
+    def _wait(self, timeout):
+        if self.rng.random() < self.tail_fraction:
+            delay = self.tail_ms / 1000
+        else:
+            delay = self.base_ms * self.rng.lognormal(0.0, 0.25) / 1000
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("stand-in read timed out")
+        time.sleep(delay)
+
+    def execute_query(self, query, query_name="query", timeout=None):
+        raise RuntimeError("not read by this benchmark")
+
+    def bought_items(self, customer_ids, timeout=None):
+        self._wait(timeout)
+        return {customer_id: ["0108775015"] for customer_id in customer_ids}
+
+    def customer_features(self, customer_id, timeout=None):
+        self._wait(timeout)
+        return [
+            {"name": "customer_id", "value": {"string_value": customer_id}},
+            {"name": "age", "value": {"double_value": 31.0}},
+        ]
+
+    def articles_data(self, articles, timeout=None):
+        raise RuntimeError("not read by this benchmark")
+
+    def rankings_data(self, customer_id):
+        raise RuntimeError("not read by this benchmark")
+
+
+def make_transformer(data_access: DataAccess, hedge: bool) -> RankingTransformer:
+    """Transformer reading only through data_access, without its other backends."""
+    transformer = RankingTransformer.__new__(RankingTransformer)
+    transformer.data_access = data_access
+    # Features expire at once, so every lookup reads the backend, and reads
+    # that time out are served the last features
+    transformer.customer_cache = CustomerFeatureCache(
+        transformer._read_customer_features, ttl_seconds=0
+    )
+    transformer.hedger = Hedger(enabled=hedge)
+    return transformer
+
+
+def read_customer(transformer: RankingTransformer, customer_id: str) -> None:
+    transformer._get_already_bought_items([customer_id])
+    transformer._get_customer_features(customer_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-ms", type=float, default=5)
+    parser.add_argument("--tail-ms", type=float, default=200)
+    parser.add_argument("--tail-fraction", type=float, default=0.03)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--customers", type=int, default=100)
+    parser.add_argument(
+        "--budgets-ms", type=float, nargs="+", default=[1000, 100, 20, 5]
+    )
+    args = parser.parse_args()
+
+    logger.setLevel(logging.ERROR)
+    customer_ids = [f"{i:064d}" for i in range(args.customers)]
+
+    rows = []
+    for mode, hedge in [("no hedging", False), ("hedged", True)]:
+        data_access = HeavyTailDataAccess(
+            args.base_ms, args.tail_ms, args.tail_fraction
+        )
+        transformer = make_transformer(data_access, hedge)
+        durations = []
+        for i in range(args.requests):
+            begin_deadline(None)
+            start = time.perf_counter()
+            read_customer(transformer, customer_ids[i % len(customer_ids)])
+            durations.append(time.perf_counter() - start)
+        stats = transformer.hedger.stats()
+        transformer.hedger.close()
+
+        reads = sum(name["reads"] for name in stats.values())
+        hedged = sum(name["hedged"] for name in stats.values())
+        rows.append(
+            {
+                "mode": mode,
+                **latency_summary(durations[len(durations) // 10 :]),
+                "hedged_pct": 100 * hedged / reads,
+                "hedge_wins": sum(name["hedge_wins"] for name in stats.values()),
+            }
+        )
+    print(
+        f"\nTwo reads per request, {args.base_ms:g}ms typical, "
+        f"{args.tail_fraction:.0%} take {args.tail_ms:g}ms "
+        "(first 10% of requests, used to learn the hedge delay, excluded)"
+    )
+    print_table(rows)
+
+    rows = []
+    transformer = make_transformer(
+        HeavyTailDataAccess(args.base_ms, args.tail_ms, args.tail_fraction), True
+    )
+    for budget_ms in args.budgets_ms:
+        before = degradations.snapshot()
+        durations = []
+        for i in range(args.requests):
+            begin_deadline(budget_ms / 1000)
+            start = time.perf_counter()
+            read_customer(transformer, customer_ids[i % len(customer_ids)])
+            durations.append(time.perf_counter() - start)
+        after = degradations.snapshot()
+        rows.append(
+            {
+                "budget_ms": budget_ms,
+                **latency_summary(durations),
+                **{kind: after[kind] - before.get(kind, 0) for kind in sorted(after)},
+            }
+        )
+    transformer.hedger.close()
+    print("\nHedged reads under a request budget, degradations per kind:")
+    print_table([{**dict.fromkeys(rows[-1], 0), **row} for row in rows])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Compare per-request categorical mapping with the fitted CategoricalEncoder.
+
+The per-request path builds a value-to-int dictionary from the values in the
+batch and applies it with Series.map. The encoder path looks values up in the
+training vocabularies; for categorical columns gathered from the article
+table it translates codes through a table cached per column.
+
+Usage (from the container directory):
+    python -m benchmarks.encoding --rows 100 1000 10000
+"""
+
+import argparse
+import json
+import tempfile
+import numpy as np
+from benchmarks.common import latency_summary, print_table, time_calls
+from benchmarks.synthetic import ARTICLE_CATEGORICAL_CARDINALITIES, make_article_frame
+from article_store import ArticleTable
+from categorical_encoder import CategoricalEncoder
+
+
+def per_request_mapping(df):
+    for col in ARTICLE_CATEGORICAL_CARDINALITIES:
+        unique_values = df[col].unique()
+        value_map = {val: idx for idx, val in enumerate(unique_values)}
+        df[col] = df[col].map(value_map)
+    return df
+
+
+def fitted_encoding(encoder, df):
+    for col in encoder.columns:
+        df[col] = encoder.encode(col, df[col])
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    article_ids = np.array([f"{i:010d}" for i in range(50_000)])
+    articles = make_article_frame(article_ids)
+    table = ArticleTable.from_dataframe(articles)
+
+    vocabularies = {
+        col: articles[col].value_counts().index.tolist()
+        for col in ARTICLE_CATEGORICAL_CARDINALITIES
+    }
+    encoder_path = tempfile.mktemp(suffix=".json")
+    with open(encoder_path, "w") as f:
+        json.dump({"unknown_code": -1, "vocabularies": vocabularies}, f)
+    encoder = CategoricalEncoder.load(encoder_path)
+
+    rng = np.random.default_rng(27)
+    rows = []
+    for n_rows in args.rows:
+        indices = rng.integers(0, len(table), n_rows)
+        strings = articles.iloc[indices].astype(
+            {col: object for col in ARTICLE_CATEGORICAL_CARDINALITIES}
+        )
+        categoricals = table.gather(indices)
+
+        for name, fn in [
+            ("per-request map", lambda: per_request_mapping(strings.copy())),
+            ("encoder, strings", lambda: fitted_encoding(encoder, strings.copy())),
+            (
+                "encoder, categorical",
+                lambda: fitted_encoding(encoder, categoricals.copy()),
+            ),
+        ]:
+            durations = time_calls(fn, args.repeats)
+            rows.append({"rows": n_rows, "method": name, **latency_summary(durations)})
+
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Compare the prediction engines of RankingPredictor across batch sizes.
+
+Each engine scores the same float32 feature matrices with a stand-in model
+trained on random data: "dmatrix" builds an xgb.DMatrix per call, "inplace"
+predicts from the array directly and "numpy" walks the compiled trees. Scores
+are checked against the DMatrix path.
+
+Usage (from the container directory):
+    python -m benchmarks.engines --rows 1 10 100 1000 10000 --trees 100
+"""
+
+import argparse
+import logging
+import numpy as np
+from benchmarks.batching import StandInPredictor
+from benchmarks.common import latency_summary, print_table, time_calls
+from config import PREDICT_THREADS, RANKING_MODEL_FEATURES
+from logger import logger
+from ranking_predictor import PREDICT_ENGINES
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[1, 10, 100, 1000, 10000]
+    )
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--missing", type=float, default=0.05)
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+
+    predictors = {
+        engine: StandInPredictor(args.trees, engine=engine)
+        for engine in PREDICT_ENGINES
+    }
+
+    rng = np.random.default_rng(27)
+    rows = []
+    for n_rows in args.rows:
+        features = rng.random((n_rows, len(RANKING_MODEL_FEATURES)), dtype=np.float32)
+        features[rng.random(features.shape) < args.missing] = np.nan
+        expected = predictors["dmatrix"]._predict_matrix(features)
+
+        for engine, predictor in predictors.items():
+            scores = predictor._predict_matrix(features)
+            summary = latency_summary(
+                time_calls(lambda: predictor._predict_matrix(features), args.repeats)
+            )
+            rows.append(
+                {
+                    "rows": n_rows,
+                    "engine": engine,
+                    **summary,
+                    "us_per_row": summary["mean_ms"] * 1000 / n_rows,
+                    "max_abs_diff": float(np.abs(scores - expected).max()),
+                }
+            )
+
+    print(f"Trees: {args.trees}, XGBoost threads: {PREDICT_THREADS}")
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Compare post-filtering purchased items with excluding them inside retrieval.
+
+Customers get purchase histories of increasing length, half drawn from the
+neighbourhood of their query as a heavy buyer's history would be, and half
+at random. "post-filter" retrieves k candidates and drops the purchased ones,
+as preprocess did before; "exclude" passes the purchases to retrieval. The
+table reports how many candidates are left per request and the latency of
+retrieval plus filtering.
+
+Usage (from the container directory):
+    python -m benchmarks.exclusion --history 0 50 200 1000 --customers 200
+"""
+
+import argparse
+import itertools
+import logging
+import tempfile
+import numpy as np
+from benchmarks.common import latency_summary, print_table, time_calls
+from benchmarks.synthetic import (
+    make_candidate_catalog,
+    make_queries,
+    write_candidates_snapshot,
+)
+from config import TOP_K_CANDIDATES
+from ivfpq import IVFPQIndex
+from logger import logger
+from purchase_index import PurchaseIndex
+from retrieval import ExactRetriever, top_k
+
+
+def make_histories(embeddings, queries, history, rng) -> list:
+    """Dense article indices bought by each customer, half near their query."""
+    histories = []
+    for query in queries:
+        near, _ = top_k(embeddings @ query, 2 * history)
+        n_near = history // 2
+        bought = np.concatenate(
+            [
+                rng.choice(near, n_near, replace=False),
+                rng.choice(len(embeddings), history - n_near, replace=False),
+            ]
+        )
+        histories.append(np.unique(bought))
+    return histories
+
+
+def post_filter(retriever, index, customer_id, query, k):
+    candidates = retriever.find_similar_items_batch([query], k)[0]
+    bought = index.purchased_mask(customer_id, candidates)
+    return [c for c, b in zip(candidates, bought) if not b]
+
+
+def exclude(retriever, index, customer_id, query, k):
+    purchased = index.purchased_ids(customer_id)
+    return retriever.find_similar_items_batch([query], k, [purchased])[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--articles", type=int, default=105_000)
+    parser.add_argument("--k", type=int, default=TOP_K_CANDIDATES)
+    parser.add_argument("--history", type=int, nargs="+", default=[0, 50, 200, 1000])
+    parser.add_argument("--customers", type=int, default=200)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+
+    rng = np.random.default_rng(27)
+    article_ids, embeddings = make_candidate_catalog(args.articles)
+    vocabulary = np.sort(article_ids)
+
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        write_candidates_snapshot(snapshot_dir, article_ids, embeddings)
+        retrievers = {
+            "exact": ExactRetriever(snapshot_dir),
+            "ivfpq": IVFPQIndex.build(article_ids, embeddings),
+        }
+
+        rows = []
+        for history in args.history:
+            queries = make_queries(args.customers, seed=history)
+            customer_ids = np.array([f"{i:064x}" for i in range(args.customers)])
+            histories = make_histories(embeddings, queries, history, rng)
+            index = PurchaseIndex.from_codes(
+                customer_ids,
+                np.repeat(np.arange(args.customers), [len(h) for h in histories]),
+                np.searchsorted(vocabulary, article_ids[np.concatenate(histories)]),
+                vocabulary,
+            )
+
+            for (backend, retriever), (mode, fn) in itertools.product(
+                retrievers.items(), [("post-filter", post_filter), ("exclude", exclude)]
+            ):
+                results = [
+                    fn(retriever, index, customer_id, query, args.k)
+                    for customer_id, query in zip(customer_ids, queries)
+                ]
+                counts = np.array([len(result) for result in results])
+                leaked = sum(
+                    int(index.purchased_mask(customer_id, result).sum())
+                    for customer_id, result in zip(customer_ids, results)
+                )
+
+                requests = itertools.cycle(zip(customer_ids, queries))
+                durations = time_calls(
+                    lambda: fn(retriever, index, *next(requests), args.k),
+                    repeats=args.customers,
+                )
+                summary = latency_summary(durations)
+                rows.append(
+                    {
+                        "history": history,
+                        "backend": backend,
+                        "mode": mode,
+                        "min_candidates": int(counts.min()),
+                        "p5_candidates": float(np.percentile(counts, 5)),
+                        "mean_candidates": float(counts.mean()),
+                        "purchased_returned": leaked,
+                        "mean_ms": summary["mean_ms"],
+                        "p95_ms": summary["p95_ms"],
+                    }
+                )
+
+    print(f"Articles: {args.articles}, k: {args.k}")
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Show the overlap of preprocessing branches using slow local stand-in backends.
+
+Each backend sleeps for a fixed delay, so with one worker preprocess takes the
+sum of the delays and with the fan-out it approaches the slowest branch.
+Retrieval excludes the purchased items, so without a purchase index it waits
+for them and both sit on the same branch.
+
+Usage (from the container directory):
+    python -m benchmarks.fanout --retrieval-ms 40 --bought-ms 30 --customer-ms 50
+"""
+
+import argparse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.common import latency_summary, print_table, time_calls
+from benchmarks.synthetic import make_article_frame, make_candidate_catalog
+from config import RANKING_MODEL_FEATURES, TOP_K_CANDIDATES
+from customer_cache import CustomerFeatures
+from logger import logger
+from ranking_transformer import RankingTransformer
+
+
+class SlowRetriever:
+    """Stand-in retriever returning the first k unexcluded articles after a delay."""
+
+    def __init__(self, article_ids, delay: float):
+        self.article_ids = article_ids
+        self.delay = delay
+
+    def find_similar_items_batch(self, query_embeddings, k, exclude=None):
+        time.sleep(self.delay)
+        if exclude is None:
+            exclude = [[] for _ in query_embeddings]
+        return [
+            [article_id for article_id in self.article_ids if article_id not in ids][:k]
+            for ids in exclude
+        ]
+
+
+class StandInTransformer(RankingTransformer):
+    """RankingTransformer whose backends are local stand-ins with fixed delays."""
+
+    def __init__(self, args, max_workers: int):
+        article_ids, _ = make_candidate_catalog(TOP_K_CANDIDATES * 10)
+        self.articles_df = make_article_frame(article_ids).set_index("article_id")
+        self.delays = args
+
+        self.retriever = SlowRetriever(article_ids, args.retrieval_ms / 1000)
+        self.article_store = None
+        self.feature_matrix = None
+        self.purchase_index = None
+        self.query_table = None
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.ranking_model_feature_names = list(RANKING_MODEL_FEATURES.keys())
+
+    def _get_already_bought_items(self, customer_ids):
+        time.sleep(self.delays.bought_ms / 1000)
+        return {
+            customer_id: self.articles_df.index[:5].tolist()
+            for customer_id in customer_ids
+        }
+
+    def _get_customer_features(self, customer_id):
+        time.sleep(self.delays.customer_ms / 1000)
+        return CustomerFeatures(age=31.0)
+
+    def _get_articles_data(self, articles):
+        time.sleep(self.delays.articles_ms / 1000)
+        positions = self.articles_df.index.get_indexer(articles)
+        found = positions >= 0
+        return self.articles_df.iloc[positions[found]].reset_index(drop=True), found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--retrieval-ms", type=float, default=40)
+    parser.add_argument("--bought-ms", type=float, default=30)
+    parser.add_argument("--customer-ms", type=float, default=50)
+    parser.add_argument("--articles-ms", type=float, default=20)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    request = {
+        "instances": [
+            {
+                "customer_id": "0" * 64,
+                "month_sin": 0.5,
+                "month_cos": 0.866025,
+                "query_emb": [0.0] * 16,
+            }
+        ]
+    }
+
+    rows = []
+    for mode, max_workers in [("sequential", 1), ("fan-out", 3)]:
+        transformer = StandInTransformer(args, max_workers)
+        durations = time_calls(
+            lambda: transformer.preprocess(request), repeats=args.requests, warmup=2
+        )
+        rows.append({"mode": mode, **latency_summary(durations)})
+
+    serial = args.retrieval_ms + args.bought_ms + args.customer_ms + args.articles_ms
+    critical = max(
+        args.bought_ms + args.retrieval_ms + args.articles_ms, args.customer_ms
+    )
+    print(f"\nSum of stage delays: {serial:.0f}ms, critical path: {critical:.0f}ms")
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Compare building model input from candidate IDs with and without pandas.
+
+The DataFrame path gathers categorical columns from the article table, adds
+the customer and time columns, selects the model features, encodes them with
+the fitted encoder and converts to float32, as before the article feature
+matrix. The matrix path looks up the same IDs, gathers rows of the
+pre-encoded matrix into a reused buffer and fills the per-request columns.
+Both must produce the same model input. Peak memory traced during one call is
+reported next to the latency.
+
+Usage (from the container directory):
+    python -m benchmarks.feature_assembly --candidates 100 1000 10000
+"""
+
+import argparse
+import json
+import logging
+import tempfile
+import tracemalloc
+from types import SimpleNamespace
+import numpy as np
+from benchmarks.common import latency_summary, print_table, time_calls
+from benchmarks.synthetic import ARTICLE_CATEGORICAL_CARDINALITIES, make_article_frame
+from article_store import ArticleTable
+from categorical_encoder import CategoricalEncoder
+from config import RANKING_MODEL_FEATURES
+from feature_matrix import ArticleFeatureMatrix
+from logger import logger
+from ranking_transformer import RankingTransformer
+
+
+def make_encoder(articles) -> CategoricalEncoder:
+    """Fit vocabularies on the catalog as the trainer would."""
+    vocabularies = {
+        col: articles[col].value_counts().index.tolist()
+        for col in ARTICLE_CATEGORICAL_CARDINALITIES
+    }
+    vocabularies["colour_group_name_right"] = vocabularies["colour_group_name"]
+    path = tempfile.mktemp(suffix=".json")
+    with open(path, "w") as f:
+        json.dump({"unknown_code": -1, "vocabularies": vocabularies}, f)
+    return CategoricalEncoder.load(path)
+
+
+def dataframe_path(table, encoder, ids, groups, request_features):
+    stand_in = SimpleNamespace(ranking_model_feature_names=list(RANKING_MODEL_FEATURES))
+    df = table.gather(table.lookup(ids))
+    df = RankingTransformer._select_model_features(
+        stand_in, df, groups, request_features
+    )
+    for col in encoder.columns:
+        if col in df.columns:
+            df[col] = encoder.encode(col, df[col])
+    return np.asarray(df, dtype=np.float32)
+
+
+def matrix_path(feature_matrix, ids, groups, request_features):
+    features = feature_matrix.gather(feature_matrix.table.lookup(ids))
+    return feature_matrix.fill(features, groups, request_features)
+
+
+def peak_kb(fn) -> float:
+    """Peak traced memory of one call, in kB."""
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--articles", type=int, default=100_000)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--instances", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+
+    article_ids = np.array([f"{i:010d}" for i in range(args.articles)])
+    articles = make_article_frame(article_ids)
+    table = ArticleTable.from_dataframe(articles)
+    encoder = make_encoder(articles)
+    feature_matrix = ArticleFeatureMatrix(table, list(RANKING_MODEL_FEATURES), encoder)
+
+    rng = np.random.default_rng(27)
+    request_features = {
+        "age": rng.uniform(18, 80, args.instances),
+        "month_sin": rng.uniform(-1, 1, args.instances),
+        "month_cos": rng.uniform(-1, 1, args.instances),
+    }
+
+    rows = []
+    for n_candidates in args.candidates:
+        ids = article_ids[rng.integers(0, len(article_ids), n_candidates)]
+        groups = np.sort(rng.integers(0, args.instances, n_candidates))
+
+        expected = dataframe_path(table, encoder, ids, groups, request_features)
+        actual = matrix_path(feature_matrix, ids, groups, request_features)
+        matches = np.array_equal(expected, actual)
+
+        for name, fn in [
+            (
+                "dataframe",
+                lambda: dataframe_path(table, encoder, ids, groups, request_features),
+            ),
+            (
+                "matrix",
+                lambda: matrix_path(feature_matrix, ids, groups, request_features),
+            ),
+        ]:
+            durations = time_calls(fn, args.repeats)
+            rows.append(
+                {
+                    "candidates": n_candidates,
+                    "method": name,
+                    **latency_summary(durations),
+                    "peak_alloc_kb": peak_kb(fn),
+                    "inputs_match": matches,
+                }
+            )
+
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Measure request latency while a new model version and index are swapped in.
+
+Client threads send single-instance requests back to back through
+preprocess, predict and postprocess with the version pinned per request, as
+/predict does. Partway through, a second model and candidate snapshot are
+loaded through the artifact cache from a local GCS stand-in, smoke-scored and
+swapped in. The table splits requests by when they started: before the load,
+while it ran, and after the swap. Every ranking is then checked against the
+candidates of the version that served it, and the old version must be
+released once its requests drain.
+
+Usage (from the container directory):
+    python -m benchmarks.hot_swap --clients 4 --seconds 6
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+from benchmarks.batching import TableStandInTransformer, make_request
+from benchmarks.common import latency_summary, print_table
+from benchmarks.startup import BUCKET, LocalStorageClient
+from benchmarks.synthetic import (
+    make_article_frame,
+    make_candidate_catalog,
+    make_queries,
+    make_ranking_model,
+    write_candidates_snapshot,
+)
+from article_store import ArticleTable
+from artifact_cache import MODEL_FILE, ArtifactCache, model_ref_name
+from config import TOP_K_CANDIDATES
+from logger import logger
+from model_versions import ModelVersion, ModelVersions
+from ranking_predictor import RankingPredictor
+from retrieval import ExactRetriever
+
+
+def write_version(bucket_dir, version, article_ids, embeddings, n_trees) -> None:
+    """Write the model and candidate snapshot of a version into the bucket."""
+    model_dir = os.path.join(bucket_dir, "models", version)
+    os.makedirs(model_dir)
+    make_ranking_model(n_trees, seed=int(version)).save_model(
+        os.path.join(model_dir, MODEL_FILE)
+    )
+    write_candidates_snapshot(
+        os.path.join(bucket_dir, "snapshots", version, "candidates"),
+        article_ids,
+        embeddings,
+    )
+
+
+def serve(versions, transformer, request):
+    """Serve a request with the version current when it starts."""
+    with versions.pin() as version:
+        transformed = transformer.preprocess(request, version)
+        outputs = version.predictor.predict(transformed["inputs"])
+        return version.name, transformer.postprocess(outputs)["ranking"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--articles", type=int, default=105_000)
+    parser.add_argument("--trees", type=int, default=300)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=6)
+    parser.add_argument("--load-at", type=float, default=2)
+    parser.add_argument("--retrieval-ms", type=float, default=0)
+    parser.add_argument("--bought-ms", type=float, default=0)
+    parser.add_argument("--customer-ms", type=float, default=2)
+    parser.add_argument("--articles-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    work_dir = tempfile.mkdtemp()
+    bucket_dir = os.path.join(work_dir, "gcs", BUCKET)
+
+    # Same articles in both versions, embedded differently
+    article_ids, embeddings = make_candidate_catalog(args.articles)
+    _, new_embeddings = make_candidate_catalog(args.articles, seed=28)
+    write_version(bucket_dir, "1", article_ids, embeddings, args.trees)
+    write_version(bucket_dir, "2", article_ids, new_embeddings, args.trees)
+
+    cache = ArtifactCache(
+        os.path.join(work_dir, "cache"),
+        LocalStorageClient(os.path.join(work_dir, "gcs"), 0.05, 50e6),
+    )
+    for version in ["1", "2"]:
+        cache.resolve(
+            model_ref_name(version=version),
+            lambda version=version: f"gs://{BUCKET}/models/{version}",
+        )
+    initial_dir = cache.fetch_tree(
+        f"gs://{BUCKET}/snapshots/1", os.path.join(work_dir, "snapshots-1")
+    )
+
+    transformer = TableStandInTransformer(args, max_workers=8)
+    transformer.retriever = ExactRetriever(os.path.join(initial_dir, "candidates"))
+    transformer.use_article_table(
+        ArticleTable.from_dataframe(make_article_frame(article_ids))
+    )
+    predictor = RankingPredictor(start=False, artifact_cache=cache, model_version="1")
+    old_version = ModelVersion(
+        "1", predictor, transformer.retriever, transformer.feature_matrix
+    )
+    versions = ModelVersions(
+        transformer, old_version, cache, poll_seconds=0, retrieval_backend="exact"
+    )
+
+    queries = make_queries(1000, embeddings.shape[1])
+    results = []
+    errors = []
+    stop = threading.Event()
+
+    def client(offset):
+        i = offset
+        while not stop.is_set():
+            query = queries[i % len(queries)]
+            start = time.perf_counter()
+            try:
+                name, ranking = serve(versions, transformer, make_request(query[None]))
+                results.append((start, time.perf_counter() - start, name, i, ranking))
+            except Exception as e:
+                errors.append(e)
+            i += args.clients
+
+    threads = [
+        threading.Thread(target=client, args=(offset,))
+        for offset in range(args.clients)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    time.sleep(args.load_at)
+    load_started = time.perf_counter()
+    versions.load_async("2", f"gs://{BUCKET}/snapshots/2")
+    while versions.current is old_version and versions.last_load is None:
+        time.sleep(0.001)
+    swapped = time.perf_counter()
+    while versions.current is not old_version and not old_version.closed:
+        time.sleep(0.001)
+    released = time.perf_counter()
+
+    time.sleep(max(0.0, started + args.seconds - time.perf_counter()))
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    # Every ranking must come from the candidates of the version that served it
+    retrievers = {"1": old_version.retriever, "2": versions.current.retriever}
+    mismatched = 0
+    for _, _, name, i, ranking in results:
+        candidates = retrievers[name].find_similar_items(
+            queries[i % len(queries)], TOP_K_CANDIDATES
+        )
+        mismatched += not {article for _, article in ranking} <= set(candidates)
+
+    rows = []
+    for phase, low, high in [
+        ("before load", started, load_started),
+        ("loading", load_started, swapped),
+        ("after swap", swapped, float("inf")),
+    ]:
+        phase_results = [r for r in results if low <= r[0] < high]
+        if not phase_results:
+            continue
+        rows.append(
+            {
+                "phase": phase,
+                "requests": len(phase_results),
+                "versions": ",".join(sorted({r[2] for r in phase_results})),
+                **latency_summary([r[1] for r in phase_results]),
+            }
+        )
+
+    print(
+        f"Articles: {args.articles}, trees: {args.trees}, clients: {args.clients}\n"
+        f"Load outcome: {versions.last_load['status']} after "
+        f"{versions.last_load['seconds']:.2f}s (swap at "
+        f"{swapped - load_started:.2f}s, old version released "
+        f"{(released - swapped) * 1000:.1f}ms after the swap)\n"
+        f"Failed requests: {len(errors)}, rankings not from their version's "
+        f"candidates: {mismatched} of {len(results)}"
+    )
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
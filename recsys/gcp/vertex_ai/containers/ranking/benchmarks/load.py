@@ -0,0 +1,374 @@
+"""
+Drive /predict at fixed concurrency and report throughput and latency.
+
+Each client thread sends requests back to back over its own connection, so
+the concurrency is the number of requests in flight. Request bodies are drawn
+from the customers of a local dataset written by benchmarks/synthetic.py,
+with a date in 2020 and, with --query-emb, the customer's query embedding.
+
+Without --url, a server is started on the dataset with the local data
+backend and every snapshot backend, so it runs with no cloud access, and
+with the response cache off, so repeated customers are ranked every time;
+--server-env overrides its settings, e.g. ARTICLES_BACKEND=bigquery to read
+article features through the data backend instead of the article table, or
+RESPONSE_CACHE_SIZE=100000 to measure with the cache.
+
+Client latency is measured around each HTTP call. The per-stage breakdown is
+the difference of the server's /metrics histograms before and after each
+level, for 200 responses, merged over the workers. On a shared machine the
+clients take CPU from the server, so compare runs made on the same host.
+
+Usage (from the container directory):
+    python -m benchmarks.synthetic --output /tmp/hm
+    python -m benchmarks.load --data-dir /tmp/hm --concurrency 1 4 16 --seconds 10
+"""
+
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+import numpy as np
+from benchmarks.common import latency_summary, print_table
+from config import QUERY_EMBEDDINGS_SNAPSHOT_DIR
+from metrics import Histogram
+from query_table import QueryEmbeddingTable
+
+CONTAINER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def local_server_env(data_dir: str, port: int, cache_dir: str) -> Dict[str, str]:
+    """Settings of a server reading only the local dataset in data_dir."""
+    return {
+        "AIP_HTTP_PORT": str(port),
+        "DATA_BACKEND": "local",
+        "SNAPSHOT_DIR": data_dir,
+        "MODEL_DIR": os.path.join(data_dir, "model"),
+        "ARTIFACT_CACHE_DIR": cache_dir,
+        "RETRIEVAL_BACKEND": "exact",
+        "ARTICLES_BACKEND": "snapshot",
+        "PURCHASES_BACKEND": "snapshot",
+        "QUERY_EMBEDDINGS_BACKEND": "snapshot",
+        "LOG_LEVEL": "WARNING",
+        # Measure the ranking path, not cache hits on repeated customers
+        "RESPONSE_CACHE_SIZE": "0",
+    }
+
+
+def start_server(args, log_file) -> subprocess.Popen:
+    """Start server.py on the local dataset and wait until it reports ready."""
+    env = {
+        **os.environ,
+        **local_server_env(args.data_dir, args.port, tempfile.mkdtemp()),
+        "WORKERS": str(args.workers),
+    }
+    for setting in args.server_env:
+        key, _, value = setting.partition("=")
+        env[key] = value
+
+    process = subprocess.Popen(
+        [sys.executable, "server.py"],
+        cwd=CONTAINER_DIR,
+        env=env,
+        stdout=log_file,
+        stderr=subprocess.STDOUT,
+    )
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with {process.returncode}")
+        try:
+            status, _ = call(args.url, "GET", "/health")
+            if status == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.5)
+
+    process.terminate()
+    raise TimeoutError(f"Server not ready after {args.startup_timeout:.0f}s")
+
+
+def call(
+    url: str,
+    method: str,
+    path: str,
+    body: Optional[bytes] = None,
+    connection: Optional[http.client.HTTPConnection] = None,
+) -> Tuple[int, bytes]:
+    """
+    Make one HTTP call.
+
+    Args:
+        url: Base URL of the server
+        method: HTTP method
+        path: Request path
+        body: JSON request body
+        connection: Connection to reuse (default: a new one)
+
+    Returns:
+        Tuple of (status code, response body)
+    """
+    if connection is None:
+        parsed = urlparse(url)
+        connection = http.client.HTTPConnection(
+            parsed.hostname, parsed.port, timeout=60
+        )
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    return response.status, response.read()
+
+
+def make_bodies(args) -> List[bytes]:
+    """Encode a pool of /predict request bodies for the dataset's customers."""
+    rng = np.random.default_rng(args.seed)
+    table = QueryEmbeddingTable(
+        os.path.join(args.data_dir, os.path.basename(QUERY_EMBEDDINGS_SNAPSHOT_DIR))
+    )
+    bodies = []
+    for _ in range(args.pool):
+        instances = []
+        for index in rng.integers(len(table), size=args.instances):
+            month = int(rng.integers(1, 13))
+            instance: Dict[str, Any] = {
+                "customer_id": str(table.customer_ids[index]),
+                "date": f"2020-{month:02d}-{int(rng.integers(1, 29)):02d}",
+            }
+            if args.query_emb:
+                instance["query_emb"] = table.embeddings[index, month - 1].tolist()
+            instances.append(instance)
+        bodies.append(json.dumps({"instances": instances}).encode())
+    return bodies
+
+
+def scrape_metrics(url: str, workers: int) -> Dict[int, Dict[str, Any]]:
+    """
+    Get the /metrics body of every worker.
+
+    Calls land on any worker, so /metrics is called until each has answered.
+
+    Returns:
+        Dictionary of worker pid to /metrics body
+    """
+    bodies: Dict[int, Dict[str, Any]] = {}
+    for _ in range(50 * workers):
+        _, body = call(url, "GET", "/metrics")
+        metrics = json.loads(body)
+        bodies[metrics["pid"]] = metrics
+        if len(bodies) >= workers:
+            break
+    return bodies
+
+
+def stage_breakdown(
+    before: Dict[int, Dict[str, Any]], after: Dict[int, Dict[str, Any]]
+) -> Dict[str, Dict[str, float]]:
+    """
+    Summarize the stage latencies of 200 responses recorded between two scrapes.
+
+    Args:
+        before: Worker /metrics bodies before the run
+        after: Worker /metrics bodies after the run
+
+    Returns:
+        Dictionary of stage to count and latency summary in milliseconds
+    """
+    totals: Dict[str, Dict[str, Any]] = {}
+    for pid, metrics in after.items():
+        for stage, by_status in metrics["stages"].items():
+            end = by_status.get("200")
+            if end is None:
+                continue
+            start = before.get(pid, {}).get("stages", {}).get(stage, {}).get("200")
+            start_counts = start["buckets"] if start else {}
+            counts = {
+                label: count - start_counts.get(label, 0)
+                for label, count in end["buckets"].items()
+            }
+            total_sum = end["mean"] * end["count"] - (
+                start["mean"] * start["count"] if start else 0.0
+            )
+
+            merged = totals.setdefault(
+                stage,
+                {"buckets": dict.fromkeys(counts, 0), "sum": 0.0, "max": 0.0},
+            )
+            for label, count in counts.items():
+                merged["buckets"][label] += count
+            merged["sum"] += total_sum
+            # Only the max since the start is known, which bounds the run's
+            merged["max"] = max(merged["max"], end["max"])
+
+    stages = {}
+    for stage, merged in totals.items():
+        count = sum(merged["buckets"].values())
+        if count == 0:
+            continue
+        summary = Histogram.from_snapshot(
+            {
+                "count": count,
+                "mean": merged["sum"] / count,
+                "max": merged["max"],
+                "buckets": merged["buckets"],
+            }
+        ).snapshot()
+        stages[stage] = {
+            "count": count,
+            "mean_ms": summary["mean"],
+            "p50_ms": summary["p50"],
+            "p95_ms": summary["p95"],
+            "p99_ms": summary["p99"],
+        }
+    return stages
+
+
+def run_level(
+    url: str, bodies: List[bytes], concurrency: int, seconds: float
+) -> Dict[str, Any]:
+    """
+    Send requests from concurrent clients for a fixed time.
+
+    Args:
+        url: Base URL of the server
+        bodies: Request bodies, used round robin
+        concurrency: Number of client threads
+        seconds: Duration
+
+    Returns:
+        Dictionary with request and error counts, status codes and the
+        latencies of successful requests in seconds
+    """
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client(offset: int) -> None:
+        parsed = urlparse(url)
+        connection = http.client.HTTPConnection(
+            parsed.hostname, parsed.port, timeout=60
+        )
+        i = offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status, _ = call(
+                    url, "POST", "/predict", bodies[i % len(bodies)], connection
+                )
+                key = str(status)
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                key = type(e).__name__
+                status = None
+            duration = time.perf_counter() - start
+            with lock:
+                statuses[key] = statuses.get(key, 0) + 1
+                if status == 200:
+                    latencies.append(duration)
+            i += concurrency
+        connection.close()
+
+    started = time.perf_counter()
+    threads = [
+        threading.Thread(target=client, args=(offset,)) for offset in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return {
+        "requests": sum(statuses.values()),
+        "errors": sum(statuses.values()) - len(latencies),
+        "statuses": statuses,
+        "seconds": time.perf_counter() - started,
+        "latencies": latencies,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--data-dir", required=True)
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--server-env", nargs="*", default=[])
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--warmup-seconds", type=float, default=2)
+    parser.add_argument("--instances", type=int, default=1)
+    parser.add_argument("--query-emb", action="store_true")
+    parser.add_argument("--pool", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=27)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    bodies = make_bodies(args)
+    server = None
+    log_file = None
+    if args.url is None:
+        args.url = f"http://127.0.0.1:{args.port}"
+        log_file = tempfile.NamedTemporaryFile("w", suffix=".log", delete=False)
+        print(f"Starting server on {args.url}, log in {log_file.name}")
+        server = start_server(args, log_file)
+
+    try:
+        run_level(args.url, bodies, max(args.concurrency), args.warmup_seconds)
+
+        rows = []
+        stage_rows = []
+        for concurrency in args.concurrency:
+            before = scrape_metrics(args.url, args.workers)
+            result = run_level(args.url, bodies, concurrency, args.seconds)
+            stages = stage_breakdown(before, scrape_metrics(args.url, args.workers))
+
+            rows.append(
+                {
+                    "concurrency": concurrency,
+                    "requests": result["requests"],
+                    "errors": result["errors"],
+                    "qps": len(result["latencies"]) / result["seconds"],
+                    **(
+                        latency_summary(result["latencies"])
+                        if result["latencies"]
+                        else {}
+                    ),
+                }
+            )
+            if result["errors"]:
+                print(f"Concurrency {concurrency} statuses: {result['statuses']}")
+            stage_rows += [
+                {"concurrency": concurrency, "stage": stage, **summary}
+                for stage, summary in stages.items()
+            ]
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+            log_file.close()
+
+    print(
+        f"Instances per request: {args.instances}, {args.seconds:.0f}s per level"
+        f"{', server settings: ' + ' '.join(args.server_env) if args.server_env else ''}"
+    )
+    print_table(rows)
+    print("\nServer stages (200 responses):")
+    print_table(stage_rows)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {"args": vars(args), "levels": rows, "stages": stage_rows}, f, indent=2
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Measure the cost of logging on the request thread for each logging mode.
+
+Each simulated request logs the lines preprocess, predict and postprocess
+emit at INFO level. Records are written to /dev/null, optionally with a delay
+per write standing in for a log pipe that applies back-pressure, and the
+table shows the time the request thread spends per request. For the queued
+modes the drop count shows how many records a queue of the given size lost
+while requests were logged back to back.
+
+Usage (from the container directory):
+    python -m benchmarks.logging_pipeline --requests 2000 --write-delay-us 50
+"""
+
+import argparse
+import os
+import sys
+import time
+from benchmarks.common import latency_summary, print_table, time_calls
+from logger import RequestContext, log_stats, setup_logger
+
+
+class SlowSink:
+    """Stream discarding writes after a fixed delay."""
+
+    def __init__(self, stream, delay: float):
+        self.stream = stream
+        self.delay = delay
+
+    def write(self, text: str) -> int:
+        if self.delay:
+            time.sleep(self.delay)
+        return self.stream.write(text)
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+
+def log_request(logger) -> None:
+    """Log the lines of one prediction request."""
+    RequestContext.set_request_id()
+    logger.info("📥 Received request: POST /predict")
+    logger.info("🧩 Processing prediction for 1 instances")
+    logger.info("🔄 Preprocessing 1 instances")
+    logger.info("🔍 Finding top 100 similar items for 1 queries")
+    logger.info("✨ Found 100 similar items")
+    logger.timer_start("retrieval")
+    logger.timer_end("retrieval")
+    logger.data("Generated 100 candidates for ranking")
+    logger.success("Preprocessing complete with 100 candidates for 1 instances")
+    logger.model("Making predictions for 100 candidates in one batch")
+    logger.info("📊 Returning top 10 recommendations for 1 instances")
+    logger.info("📈 Score range: 0.4100 to 0.9800")
+    logger.info("📤 Response sent: 200 (took 0.012s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--queue-size", type=int, default=10_000)
+    parser.add_argument("--write-delay-us", type=float, default=0)
+    args = parser.parse_args()
+
+    sampled = {"data": 0.01, "timer": 0.01, "model": 0.01, "success": 0.01}
+    modes = [
+        ("pretty", False, {}),
+        ("json", False, {}),
+        ("pretty", True, {}),
+        ("json", True, {}),
+        ("json", True, sampled),
+    ]
+
+    stdout = sys.stdout
+    rows = []
+    with open(os.devnull, "w") as devnull:
+        for log_format, use_queue, sample_rates in modes:
+            sys.stdout = SlowSink(devnull, args.write_delay_us / 1e6)
+            try:
+                logger = setup_logger(
+                    name=f"benchmark-{log_format}-{use_queue}-{bool(sample_rates)}",
+                    log_format=log_format,
+                    use_queue=use_queue,
+                    queue_size=args.queue_size,
+                    sample_rates=sample_rates,
+                )
+                durations = time_calls(lambda: log_request(logger), args.requests)
+                stats = log_stats(logger)
+                for handler in logger.handlers:
+                    if hasattr(handler, "stop"):
+                        handler.stop()
+            finally:
+                sys.stdout = stdout
+
+            rows.append(
+                {
+                    "format": log_format,
+                    "queued": use_queue,
+                    "sampling": bool(sample_rates),
+                    **latency_summary(durations),
+                    "dropped": stats.get("dropped", 0),
+                    "sampled_out": sum(stats.get("sampled_out", {}).values()),
+                }
+            )
+
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Measure the materialization job and serving from its snapshot.
+
+materialize.py ranks the customers of a local dataset written by
+benchmarks/synthetic.py for June, once per --workers count, and reports
+customers/s and wall time. A server is then driven with single-instance
+/predict calls for Zipf-distributed customers in June (see
+benchmarks/response_cache.py), first ranking every request online and then
+serving from the snapshot; the response cache is off in both, so only the
+snapshot differs. Rankings served from the snapshot are checked against the
+online ones.
+
+Usage (from the container directory):
+    python -m benchmarks.synthetic --output /tmp/hm
+    python -m benchmarks.materialize --data-dir /tmp/hm --workers 1 2
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import tempfile
+import subprocess
+from benchmarks.common import latency_summary, print_table
+from benchmarks.load import (
+    CONTAINER_DIR,
+    call,
+    local_server_env,
+    run_level,
+    start_server,
+)
+from benchmarks.response_cache import make_bodies
+from logger import logger
+
+
+def run_job(args, workers: int, output: str) -> dict:
+    """Run materialize.py on the local dataset, returning its job summary."""
+    env = {
+        **os.environ,
+        **local_server_env(args.data_dir, args.port, tempfile.mkdtemp()),
+    }
+    start = time.perf_counter()
+    subprocess.run(
+        [
+            sys.executable,
+            "materialize.py",
+            "--date",
+            "2020-06-15",
+            "--output",
+            output,
+            "--workers",
+            str(workers),
+            "--block-size",
+            str(args.block_size),
+        ]
+        + (["--limit", str(args.limit)] if args.limit else []),
+        cwd=CONTAINER_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+    wall_seconds = time.perf_counter() - start
+    with open(os.path.join(output, "manifest.json")) as f:
+        manifest = json.load(f)
+    return {**manifest["job"], "wall_seconds": wall_seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--data-dir", required=True)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--block-size", type=int, default=1024)
+    parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--bodies", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    args = parser.parse_args()
+    args.url = f"http://127.0.0.1:{args.port}"
+    args.workers_counts, args.workers = args.workers, 1
+    logger.setLevel(logging.WARNING)
+
+    output = tempfile.mkdtemp(prefix="recommendations-")
+    rows = []
+    for workers in args.workers_counts:
+        job = run_job(args, workers, output)
+        rows.append(
+            {
+                "workers": workers,
+                "customers": job["rows"],
+                "skipped": job["skipped"],
+                "customers_per_s": job["customers_per_second"],
+                "ranking_s": job["ranking_seconds"],
+                "wall_s": job["wall_seconds"],
+            }
+        )
+    print(f"\nMaterialization, blocks of {args.block_size} customers")
+    print_table(rows)
+
+    bodies = make_bodies(args.data_dir, args.bodies, args.zipf)
+    rows = []
+    online_rankings = []
+    for mode, backend in [("online", "online"), ("snapshot", "snapshot")]:
+        args.server_env = [
+            "RESPONSE_CACHE_SIZE=0",
+            f"RECOMMENDATIONS_BACKEND={backend}",
+            f"RECOMMENDATIONS_SNAPSHOT_DIR={output}",
+        ]
+        log_file = tempfile.NamedTemporaryFile("w", suffix=".log", delete=False)
+        server = start_server(args, log_file)
+        try:
+            rankings = [
+                json.loads(call(args.url, "POST", "/predict", body)[1])["rankings"]
+                for body in bodies[:50]
+            ]
+            if backend == "online":
+                online_rankings = rankings
+            else:
+                same = sum(a == b for a, b in zip(rankings, online_rankings))
+                print(f"\nSnapshot rankings equal to online ones: {same} of 50")
+
+            result = run_level(args.url, bodies, args.concurrency, args.seconds)
+            stats = json.loads(call(args.url, "GET", "/metrics")[1]).get(
+                "recommendations", {}
+            )
+            rows.append(
+                {
+                    "mode": mode,
+                    "requests": result["requests"],
+                    "errors": result["errors"],
+                    "qps": len(result["latencies"]) / result["seconds"],
+                    **latency_summary(result["latencies"]),
+                    "hit_ratio": stats.get("hit_ratio", 0.0),
+                    "snapshot_mb": stats.get("bytes", 0) / 2**20,
+                }
+            )
+        finally:
+            server.terminate()
+            server.wait()
+            log_file.close()
+
+    print(f"\n/predict for Zipf {args.zipf:g} customers, response cache off")
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Throughput and per-worker memory of the pre-fork server as workers are added.
+
+For each worker count, a server process loads a synthetic candidate snapshot,
+a resident article table and a stand-in XGBoost model, then forks workers
+with PreforkServer. Client threads post single-instance /predict requests in a
+closed loop. Memory is read from /proc for each worker: RSS counts shared
+pages in every worker, PSS splits them between the workers that map them and
+private is what a worker does not share.
+
+Usage (from the container directory, Linux only):
+    python -m benchmarks.prefork --workers 1 2 4 --clients 16
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from benchmarks.batching import (
+    StandInPredictor,
+    TableStandInTransformer,
+    make_request,
+    run,
+)
+from benchmarks.common import print_table
+from benchmarks.synthetic import (
+    make_article_frame,
+    make_candidate_catalog,
+    make_queries,
+    write_candidates_snapshot,
+)
+from article_store import ArticleTable
+from logger import logger
+from retrieval import ExactRetriever
+
+
+def build_app(args):
+    """Load the stand-in serving state and build the Flask app around it."""
+    from flask import Flask, jsonify, request
+
+    article_ids, embeddings = make_candidate_catalog(args.articles, dim=args.dim)
+    snapshot_dir = write_candidates_snapshot(
+        tempfile.mkdtemp(), article_ids, embeddings
+    )
+    delays = SimpleNamespace(retrieval_ms=0, bought_ms=0, customer_ms=0)
+
+    transformer = TableStandInTransformer(delays, max_workers=4)
+    transformer.retriever = ExactRetriever(snapshot_dir)
+    transformer.use_article_table(
+        ArticleTable.from_dataframe(make_article_frame(article_ids))
+    )
+    predictor = StandInPredictor(args.trees)
+
+    app = Flask(__name__)
+
+    @app.route("/health")
+    def health():
+        return jsonify({"status": "healthy"})
+
+    @app.route("/predict", methods=["POST"])
+    def predict():
+        return jsonify(run(transformer, predictor, request.get_json()))
+
+    def start_worker():
+        transformer.executor = ThreadPoolExecutor(max_workers=4)
+
+    return app, start_worker
+
+
+def serve(args):
+    from prefork import PreforkServer
+
+    logger.setLevel(logging.ERROR)
+    app, start_worker = build_app(args)
+    PreforkServer(
+        app,
+        start_worker,
+        workers=args.serve_workers,
+        threads=args.threads,
+        bind=f"127.0.0.1:{args.port}",
+    ).run()
+
+
+def wait_until_healthy(port: int, timeout: float = 300.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/health")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"Server on port {port} did not become healthy")
+
+
+def load_test(port: int, body: bytes, clients: int, seconds: float) -> float:
+    """Post requests from closed-loop clients, returning requests per second."""
+    completed = []
+    stop_at = time.perf_counter() + seconds
+
+    def client():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        count = 0
+        while time.perf_counter() < stop_at:
+            connection.request(
+                "POST", "/predict", body, {"Content-Type": "application/json"}
+            )
+            response = connection.getresponse()
+            response.read()
+            if response.status == 200:
+                count += 1
+        completed.append(count)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(completed) / (time.perf_counter() - started)
+
+
+def memory_kb(pid: int) -> dict:
+    """Read RSS, PSS and private memory of a process from /proc."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss": values["Rss"],
+        "pss": values["Pss"],
+        "private": values["Private_Clean"] + values["Private_Dirty"],
+    }
+
+
+def child_pids(pid: int) -> list:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--articles", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--trees", type=int, default=500)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--serve-workers", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_workers:
+        serve(args)
+        return
+
+    query = make_queries(1, args.dim)
+    body = json.dumps(make_request(query)).encode()
+
+    rows = []
+    for workers in args.workers:
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.prefork",
+                *sys.argv[1:],
+                "--serve-workers",
+                str(workers),
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_until_healthy(args.port)
+            throughput = load_test(args.port, body, args.clients, args.seconds)
+
+            worker_memory = [memory_kb(pid) for pid in child_pids(server.pid)]
+            parent_memory = memory_kb(server.pid)
+            rows.append(
+                {
+                    "workers": workers,
+                    "req_per_s": throughput,
+                    "rss_mb_per_worker": sum(m["rss"] for m in worker_memory)
+                    / len(worker_memory)
+                    / 1024,
+                    "pss_mb_per_worker": sum(m["pss"] for m in worker_memory)
+                    / len(worker_memory)
+                    / 1024,
+                    "private_mb_per_worker": sum(m["private"] for m in worker_memory)
+                    / len(worker_memory)
+                    / 1024,
+                    "total_pss_mb": (
+                        parent_memory["pss"] + sum(m["pss"] for m in worker_memory)
+                    )
+                    / 1024,
+                }
+            )
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+
+    print(f"CPU cores: {os.cpu_count()}")
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
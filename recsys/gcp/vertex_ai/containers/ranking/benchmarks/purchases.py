@@ -0,0 +1,100 @@
+"""
+Benchmark the purchase-history index: size, build time and filter latency.
+
+Usage (from the container directory):
+    python -m benchmarks.purchases --customers 1300000 --mean-purchases 23
+"""
+
+import argparse
+import itertools
+import os
+import tempfile
+import time
+import numpy as np
+from benchmarks.common import latency_summary, print_table, time_calls
+from benchmarks.synthetic import make_candidate_catalog
+from purchase_index import PurchaseIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--customers", type=int, default=1_300_000)
+    parser.add_argument("--articles", type=int, default=105_000)
+    parser.add_argument("--mean-purchases", type=float, default=23.0)
+    parser.add_argument("--candidates", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=1_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(27)
+    article_ids, _ = make_candidate_catalog(args.articles)
+    vocabulary = np.sort(article_ids)
+    customer_ids = np.array([f"{i:064x}" for i in range(args.customers)])
+
+    # Long-tailed purchase counts, as in the H&M transactions
+    counts = rng.geometric(1.0 / args.mean_purchases, size=args.customers)
+    customer_codes = np.repeat(np.arange(args.customers), counts)
+    article_codes = rng.integers(args.articles, size=len(customer_codes))
+
+    start = time.perf_counter()
+    index = PurchaseIndex.from_codes(
+        customer_ids, customer_codes, article_codes, vocabulary
+    )
+    build_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        index.save(index_dir)
+        disk_bytes = sum(
+            os.path.getsize(os.path.join(index_dir, f)) for f in os.listdir(index_dir)
+        )
+        index = PurchaseIndex.load(index_dir)
+
+        print(f"\nPurchase index for {args.customers} customers")
+        print(f"  transactions:      {len(customer_codes)}")
+        print(f"  unique purchases:  {len(index.articles)}")
+        print(f"  build time:        {build_seconds:.2f}s")
+        print(f"  index size:        {index.nbytes / 2**20:.1f} MiB")
+        print(f"  on disk:           {disk_bytes / 2**20:.1f} MiB")
+        print(f"  bytes per customer {index.nbytes / args.customers:.1f}")
+
+        # Heaviest buyers exercise the filter hardest
+        heavy = np.argsort(counts)[-args.requests :]
+        requests = [
+            (
+                customer_ids[c],
+                article_ids[rng.choice(args.articles, args.candidates)].tolist(),
+            )
+            for c in heavy
+        ]
+        history = {
+            customer_ids[c]: index.article_ids[
+                index.purchased(customer_ids[c])
+            ].tolist()
+            for c in heavy
+        }
+
+        request_iter = itertools.cycle(requests)
+        mask_durations = time_calls(
+            lambda: index.purchased_mask(*next(request_iter)),
+            repeats=args.requests,
+        )
+
+        def list_scan(customer_id, candidates):
+            bought = history[customer_id]
+            return [c for c in candidates if c not in bought]
+
+        request_iter = itertools.cycle(requests)
+        scan_durations = time_calls(
+            lambda: list_scan(*next(request_iter)), repeats=args.requests
+        )
+
+    print(f"\nFilter latency for {args.candidates} candidates (heaviest buyers)")
+    print_table(
+        [
+            {"filter": "list_scan", **latency_summary(scan_durations)},
+            {"filter": "index_mask", **latency_summary(mask_durations)},
+        ]
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Compare sending query embeddings with looking them up by customer and date.
+
+With query_emb in the request, the server decodes a JSON list of floats per
+instance; the client first computed it with a query model call, which this
+benchmark does not include. With a date, the server decodes a short instance
+and looks the embedding up in a QueryEmbeddingTable. Body sizes are reported
+next to decode and lookup latency.
+
+Usage (from the container directory):
+    python -m benchmarks.query_lookup --customers 100000 --instances 1 10 100
+"""
+
+import argparse
+import json
+import logging
+import tempfile
+import numpy as np
+from benchmarks.common import latency_summary, print_table, time_calls
+from benchmarks.synthetic import write_query_embeddings_snapshot
+from logger import logger
+from query_table import MONTHS, QueryEmbeddingTable, month_encoding, month_of
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--customers", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=16)
+    parser.add_argument("--instances", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--repeats", type=int, default=500)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+
+    rng = np.random.default_rng(27)
+    customer_ids = np.array([f"{i:064x}" for i in range(args.customers)])
+    embeddings = rng.standard_normal((args.customers, MONTHS, args.dim))
+    table = QueryEmbeddingTable(
+        write_query_embeddings_snapshot(tempfile.mkdtemp(), customer_ids, embeddings)
+    )
+
+    rows = []
+    for n_instances in args.instances:
+        customers = customer_ids[rng.integers(0, args.customers, n_instances)]
+        months = rng.integers(1, MONTHS + 1, n_instances)
+        dates = [f"2024-{month:02d}-15" for month in months]
+        queries, _ = table.lookup(customers, months)
+
+        with_embedding = json.dumps(
+            {
+                "instances": [
+                    {
+                        "customer_id": customer_id,
+                        "month_sin": month_encoding(month)[0],
+                        "month_cos": month_encoding(month)[1],
+                        "query_emb": query.tolist(),
+                    }
+                    for customer_id, month, query in zip(customers, months, queries)
+                ]
+            }
+        )
+        with_date = json.dumps(
+            {
+                "instances": [
+                    {"customer_id": customer_id, "date": date}
+                    for customer_id, date in zip(customers, dates)
+                ]
+            }
+        )
+
+        def decode_embeddings():
+            instances = json.loads(with_embedding)["instances"]
+            return np.asarray(
+                [instance["query_emb"] for instance in instances], dtype=np.float32
+            )
+
+        def look_up_embeddings():
+            instances = json.loads(with_date)["instances"]
+            return table.lookup(
+                [instance["customer_id"] for instance in instances],
+                [month_of(instance["date"]) for instance in instances],
+            )[0]
+
+        for mode, body, fn in [
+            ("query_emb", with_embedding, decode_embeddings),
+            ("date lookup", with_date, look_up_embeddings),
+        ]:
+            rows.append(
+                {
+                    "instances": n_instances,
+                    "mode": mode,
+                    "body_bytes": len(body),
+                    **latency_summary(time_calls(fn, args.repeats)),
+                }
+            )
+
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
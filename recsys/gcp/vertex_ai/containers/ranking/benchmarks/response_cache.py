@@ -0,0 +1,114 @@
+"""
+Measure the response cache under traffic that repeats customers.
+
+Requests are single-instance /predict calls for customers drawn from a Zipf
+distribution over a local dataset written by benchmarks/synthetic.py, so a
+few customers come back often and most rarely, as with page reloads and
+several widgets per page. The same request sequence is sent to a server with
+the cache disabled and to one with it enabled; the hit ratio and memory of
+the cache are read from /metrics.
+
+The enabled server is then checked for invalidation: a ranking served from
+the cache must equal the one computed after /admin/cache/invalidate.
+
+Usage (from the container directory):
+    python -m benchmarks.synthetic --output /tmp/hm
+    python -m benchmarks.response_cache --data-dir /tmp/hm --zipf 1.3
+"""
+
+import argparse
+import json
+import logging
+import tempfile
+import numpy as np
+from benchmarks.common import latency_summary, print_table
+from benchmarks.load import call, run_level, start_server
+from logger import logger
+from query_table import QueryEmbeddingTable
+
+
+def make_bodies(data_dir: str, n_bodies: int, zipf: float, seed: int = 27):
+    """Single-instance request bodies for Zipf-distributed customers."""
+    rng = np.random.default_rng(seed)
+    table = QueryEmbeddingTable(f"{data_dir}/query_embeddings")
+    ranks = np.minimum(rng.zipf(zipf, size=n_bodies), len(table)) - 1
+    customers = rng.permutation(len(table))[ranks]
+    return [
+        json.dumps(
+            {
+                "instances": [
+                    {
+                        "customer_id": str(table.customer_ids[index]),
+                        "date": "2020-06-15",
+                    }
+                ]
+            }
+        ).encode()
+        for index in customers
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--data-dir", required=True)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--zipf", type=float, default=1.3)
+    parser.add_argument("--bodies", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    args = parser.parse_args()
+    args.url = f"http://127.0.0.1:{args.port}"
+    args.workers = 1
+    logger.setLevel(logging.WARNING)
+
+    bodies = make_bodies(args.data_dir, args.bodies, args.zipf)
+    print(
+        f"{len(bodies)} requests over {len(set(bodies))} distinct customers "
+        f"(Zipf {args.zipf:g})"
+    )
+
+    rows = []
+    for mode, cache_size in [("no cache", 0), ("cache", 100000)]:
+        args.server_env = [f"RESPONSE_CACHE_SIZE={cache_size}"]
+        log_file = tempfile.NamedTemporaryFile("w", suffix=".log", delete=False)
+        server = start_server(args, log_file)
+        try:
+            result = run_level(args.url, bodies, args.concurrency, args.seconds)
+            cache = json.loads(call(args.url, "GET", "/metrics")[1]).get(
+                "response_cache", {}
+            )
+            rows.append(
+                {
+                    "mode": mode,
+                    "requests": result["requests"],
+                    "errors": result["errors"],
+                    "qps": len(result["latencies"]) / result["seconds"],
+                    **latency_summary(result["latencies"]),
+                    "hit_ratio": cache.get("hit_ratio", 0.0),
+                    "entries": cache.get("entries", 0),
+                    "cache_mb": cache.get("bytes", 0) / 2**20,
+                }
+            )
+
+            if cache_size:
+                _, cached = call(args.url, "POST", "/predict", bodies[0])
+                _, invalidated = call(args.url, "POST", "/admin/cache/invalidate", b"")
+                _, computed = call(args.url, "POST", "/predict", bodies[0])
+                same = (
+                    json.loads(cached)["rankings"] == json.loads(computed)["rankings"]
+                )
+                print(
+                    f"Invalidation: {json.loads(invalidated)['invalidated']} rankings "
+                    f"dropped, recomputed ranking equals the cached one: {same}"
+                )
+        finally:
+            server.terminate()
+            server.wait()
+            log_file.close()
+
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark in-process exact retrieval against the BigQuery similarity search.
+
+Usage (from the container directory):
+    python -m benchmarks.retrieval --articles 100000
+    python -m benchmarks.retrieval --bigquery-table project.dataset.bench_candidates
+"""
+
+import argparse
+import itertools
+import tempfile
+from benchmarks.common import latency_summary, print_table, time_calls
+from benchmarks.synthetic import (
+    make_candidate_catalog,
+    make_queries,
+    write_candidates_snapshot,
+)
+from config import TOP_K_CANDIDATES
+from retrieval import BigQueryRetriever, ExactRetriever
+
+
+def _upload_catalog(table: str, article_ids, embeddings):
+    """Upload the synthetic catalog to BigQuery and return a query runner."""
+    import pandas as pd
+    from google.cloud import bigquery
+
+    client = bigquery.Client()
+    df = pd.DataFrame(
+        {"article_id": article_ids, "embeddings": embeddings.astype(float).tolist()}
+    )
+    job_config = bigquery.LoadJobConfig(write_disposition="WRITE_TRUNCATE")
+    client.load_table_from_dataframe(df, table, job_config=job_config).result()
+
+    def execute_query(query: str, query_name: str):
+        return client.query(query).result()
+
+    return execute_query
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--articles", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=16)
+    parser.add_argument("--k", type=int, default=TOP_K_CANDIDATES)
+    parser.add_argument("--queries", type=int, default=1_000)
+    parser.add_argument("--bigquery-queries", type=int, default=20)
+    parser.add_argument(
+        "--bigquery-table",
+        default=None,
+        help="Table to upload the synthetic catalog to for the BigQuery path",
+    )
+    args = parser.parse_args()
+
+    article_ids, embeddings = make_candidate_catalog(args.articles, args.dim)
+    queries = make_queries(args.queries, args.dim)
+    rows = []
+
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        write_candidates_snapshot(snapshot_dir, article_ids, embeddings)
+        retriever = ExactRetriever(snapshot_dir)
+
+        query_iter = itertools.cycle(queries.tolist())
+        durations = time_calls(
+            lambda: retriever.find_similar_items(next(query_iter), args.k),
+            repeats=args.queries,
+        )
+        rows.append({"backend": "exact", **latency_summary(durations)})
+
+    if args.bigquery_table:
+        execute_query = _upload_catalog(args.bigquery_table, article_ids, embeddings)
+        bq_retriever = BigQueryRetriever(execute_query, table=args.bigquery_table)
+
+        query_iter = itertools.cycle(queries.tolist())
+        durations = time_calls(
+            lambda: bq_retriever.find_similar_items(next(query_iter), args.k),
+            repeats=args.bigquery_queries,
+            warmup=1,
+        )
+        rows.append({"backend": "bigquery", **latency_summary(durations)})
+
+    print(f"\nTop-{args.k} retrieval over {args.articles} articles (dim={args.dim})")
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+Measure time to the first successful prediction of a fresh process.
+
+Each run starts a new Python process that resolves the model in the registry,
+mirrors the snapshots, loads the model, exact retrieval and the article table
+through the artifact cache, optionally warms up, and then serves one request.
+GCS is a local directory served with a latency per request and a bandwidth,
+and the registry lookup imports the Vertex AI SDK and waits the registry
+latency. The other backends are the in-memory stand-ins of the batching
+benchmark; customer feature reads pay a connection setup on first use, as a
+fresh feature store client does.
+
+"cold" runs start from an empty cache and "warm" runs from one filled by a
+previous process. Times are medians over the runs and count from the start
+of the process; ttfp_s is the time to the first successful prediction.
+
+Usage (from the container directory):
+    python -m benchmarks.startup --runs 3 --latency-ms 50 --bandwidth-mbps 50
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+from google.api_core.exceptions import NotFound
+from benchmarks.batching import (
+    StandInPredictor,
+    TableStandInTransformer,
+    make_request,
+    run,
+)
+from benchmarks.common import print_table
+from benchmarks.synthetic import (
+    make_article_frame,
+    make_candidate_catalog,
+    make_queries,
+    write_candidates_snapshot,
+)
+from article_store import ArticleTable
+from artifact_cache import MODEL_FILE, ArtifactCache, model_ref_name
+from logger import logger
+from model_versions import ModelVersion
+from ranking_predictor import RankingPredictor
+from retrieval import ExactRetriever
+from warmup import warm_up
+
+BUCKET = "benchmark"
+MODEL_PREFIX = "models/ranking/1"
+SNAPSHOT_PREFIX = "snapshots/2024-06-01"
+
+# Options passed on to every started process
+DELAY_OPTIONS = [
+    "latency_ms",
+    "bandwidth_mbps",
+    "registry_ms",
+    "connect_ms",
+    "retrieval_ms",
+    "bought_ms",
+    "customer_ms",
+    "articles_ms",
+]
+
+
+class LocalBlob:
+    """Stand-in for a Cloud Storage blob backed by a local file."""
+
+    def __init__(self, client, bucket_name: str, name: str):
+        self.client = client
+        self.name = name
+        self.path = os.path.join(client.root, bucket_name, name)
+
+    def download_to_filename(self, filename: str) -> None:
+        time.sleep(self.client.latency)
+        if not os.path.isfile(self.path):
+            raise NotFound(f"No such object: {self.name}")
+        time.sleep(os.path.getsize(self.path) / self.client.bandwidth)
+        shutil.copyfile(self.path, filename)
+
+
+class LocalBucket:
+    def __init__(self, client, name: str):
+        self.client = client
+        self.name = name
+
+    def blob(self, name: str) -> LocalBlob:
+        return LocalBlob(self.client, self.name, name)
+
+
+class LocalStorageClient:
+    """Stand-in Cloud Storage client serving a local directory."""
+
+    def __init__(self, root: str, latency: float, bandwidth: float):
+        """
+        Args:
+            root: Directory with one subdirectory per bucket
+            latency: Seconds per request
+            bandwidth: Bytes per second of a download
+        """
+        self.root = root
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+    def bucket(self, name: str) -> LocalBucket:
+        return LocalBucket(self, name)
+
+    def list_blobs(self, bucket_name: str, prefix: str = ""):
+        time.sleep(self.latency)
+        bucket_dir = os.path.join(self.root, bucket_name)
+        blobs = []
+        for directory, _, files in os.walk(os.path.join(bucket_dir, prefix)):
+            for file in files:
+                name = os.path.relpath(os.path.join(directory, file), bucket_dir)
+                blobs.append(LocalBlob(self, bucket_name, name))
+        return blobs
+
+
+class ConnectingTransformer(TableStandInTransformer):
+    """Stand-in transformer whose first customer feature read sets up a connection."""
+
+    def __init__(self, args):
+        super().__init__(args, max_workers=8)
+        self._connect_lock = threading.Lock()
+        self._connected = False
+
+    def _get_customer_features(self, customer_id):
+        with self._connect_lock:
+            if not self._connected:
+                time.sleep(self.delays.connect_ms / 1000)
+                self._connected = True
+        return super()._get_customer_features(customer_id)
+
+
+def make_bucket(root: str, n_articles: int, n_trees: int) -> None:
+    """Write the model and snapshots of the benchmark into a local bucket."""
+    model_dir = os.path.join(root, BUCKET, MODEL_PREFIX)
+    os.makedirs(model_dir)
+    StandInPredictor(n_trees).model.save_model(os.path.join(model_dir, MODEL_FILE))
+
+    snapshot_dir = os.path.join(root, BUCKET, SNAPSHOT_PREFIX)
+    article_ids, embeddings = make_candidate_catalog(n_articles)
+    write_candidates_snapshot(
+        os.path.join(snapshot_dir, "candidates"), article_ids, embeddings
+    )
+    ArticleTable.from_dataframe(make_article_frame(article_ids)).save(
+        os.path.join(snapshot_dir, "articles.npz")
+    )
+
+
+def serve_first_request(args) -> dict:
+    """Start up like a worker and serve one request, returning timestamps."""
+    loaded_modules = time.time()
+    logger.setLevel(logging.WARNING)
+
+    storage_client = LocalStorageClient(
+        args.bucket_root, args.latency_ms / 1000, args.bandwidth_mbps * 1e6
+    )
+    cache = ArtifactCache(args.cache_dir, storage_client)
+
+    def registry_lookup() -> str:
+        # The real lookup imports the SDK, which takes seconds
+        from google.cloud import aiplatform  # noqa: F401
+
+        time.sleep(args.registry_ms / 1000)
+        return f"gs://{BUCKET}/{MODEL_PREFIX}"
+
+    # Pinned by version ID, whose artifact URI is cached; an alias would be
+    # asked of the registry on every start
+    cache.resolve(model_ref_name(version="1"), registry_lookup)
+    snapshot_dir = cache.fetch_tree(
+        f"gs://{BUCKET}/{SNAPSHOT_PREFIX}", args.snapshot_dir
+    )
+    predictor = RankingPredictor(start=False, artifact_cache=cache, model_version="1")
+    transformer = ConnectingTransformer(args)
+    transformer.retriever = ExactRetriever(os.path.join(snapshot_dir, "candidates"))
+    transformer.use_article_table(
+        ArticleTable.load(os.path.join(snapshot_dir, "articles.npz"))
+    )
+    loaded = time.time()
+
+    if args.warmup:
+        version = ModelVersion(
+            "1", predictor, transformer.retriever, transformer.feature_matrix
+        )
+        warm_up(transformer, version, args.warmup)
+    ready = time.time()
+
+    queries = make_queries(2, transformer.retriever.dim, seed=1)
+    first = run(transformer, predictor, make_request(queries[:1]))
+    first_ok = time.time()
+    assert first["ranking"], "first request returned no ranking"
+    run(transformer, predictor, make_request(queries[1:]))
+    second_ok = time.time()
+
+    return {
+        "imports": loaded_modules,
+        "loaded": loaded,
+        "ready": ready,
+        "first_ok": first_ok,
+        "second_ok": second_ok,
+        "cache_misses": cache.misses,
+    }
+
+
+def start_process(args, cache_dir: str, warmup: int) -> dict:
+    """Run serve_first_request() in a new process, with times from its start."""
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.startup",
+        "--child",
+        "--bucket-root",
+        args.bucket_root,
+        "--cache-dir",
+        cache_dir,
+        "--snapshot-dir",
+        tempfile.mkdtemp(dir=args.work_dir),
+        "--warmup",
+        str(warmup),
+    ]
+    for option in DELAY_OPTIONS:
+        command += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+
+    started = time.time()
+    output = subprocess.run(command, check=True, capture_output=True, text=True)
+    times = json.loads(output.stdout.strip().splitlines()[-1])
+    return {
+        "imports_s": times["imports"] - started,
+        "loaded_s": times["loaded"] - started,
+        "ready_s": times["ready"] - started,
+        "first_request_ms": (times["first_ok"] - times["ready"]) * 1000,
+        "ttfp_s": times["first_ok"] - started,
+        "second_request_ms": (times["second_ok"] - times["first_ok"]) * 1000,
+        "cache_misses": times["cache_misses"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--articles", type=int, default=105_000)
+    parser.add_argument("--trees", type=int, default=300)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--bandwidth-mbps", type=float, default=50)
+    parser.add_argument("--registry-ms", type=float, default=300)
+    parser.add_argument("--connect-ms", type=float, default=150)
+    parser.add_argument("--retrieval-ms", type=float, default=0)
+    parser.add_argument("--bought-ms", type=float, default=0)
+    parser.add_argument("--customer-ms", type=float, default=5)
+    parser.add_argument("--articles-ms", type=float, default=0)
+    # Internal: run one worker start in this process
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--bucket-root", help=argparse.SUPPRESS)
+    parser.add_argument("--cache-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--snapshot-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(serve_first_request(args)))
+        return
+
+    logger.setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as work_dir:
+        args.work_dir = work_dir
+        args.bucket_root = os.path.join(work_dir, "gcs")
+        make_bucket(args.bucket_root, args.articles, args.trees)
+
+        # Filled by an untimed first start
+        warm_cache = os.path.join(work_dir, "warm-cache")
+        start_process(args, warm_cache, warmup=0)
+
+        rows = []
+        for cache in ["cold", "warm"]:
+            for warmup in [0, args.warmup]:
+                runs = [
+                    start_process(
+                        args,
+                        warm_cache
+                        if cache == "warm"
+                        else tempfile.mkdtemp(dir=work_dir),
+                        warmup,
+                    )
+                    for _ in range(args.runs)
+                ]
+                rows.append(
+                    {
+                        "cache": cache,
+                        "warmup": warmup,
+                        **{
+                            key: float(np.median([r[key] for r in runs]))
+                            for key in runs[0]
+                        },
+                    }
+                )
+
+    print(
+        f"Articles: {args.articles}, trees: {args.trees}, GCS latency: "
+        f"{args.latency_ms:.0f}ms at {args.bandwidth_mbps:.0f}MB/s, registry: "
+        f"{args.registry_ms:.0f}ms, feature store connect: {args.connect_ms:.0f}ms"
+    )
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+"""
+Synthetic H&M-shaped data for benchmarks.
+
+Also writes a complete local dataset to run the service against with no cloud
+access: Parquet tables for the local data backend, the retrieval, article,
+purchase and query embedding snapshots, and a model trained on random
+features. Serve it with DATA_BACKEND=local, SNAPSHOT_DIR and MODEL_DIR pointing
+at it and the snapshot backends selected, as benchmarks/load.py does.
+
+Usage (from the container directory):
+    python -m benchmarks.synthetic --output /tmp/hm --customers 50000
+"""
+
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from typing import Tuple
+
+
+def make_candidate_catalog(
+    n_articles: int = 100_000, dim: int = 16, n_clusters: int = 250, seed: int = 27
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Generate a synthetic candidate catalog.
+
+    Embeddings are drawn around cluster centres, mimicking the product-type
+    structure of real item tower embeddings.
+
+    Args:
+        n_articles: Number of articles
+        dim: Embedding dimension (ItemTower default is 16)
+        n_clusters: Number of embedding clusters
+        seed: Random seed
+
+    Returns:
+        Tuple of (article IDs, float32 embeddings of shape (n_articles, dim))
+    """
+    rng = np.random.default_rng(seed)
+    # H&M article IDs are 10-digit zero-padded numbers
+    article_ids = np.char.zfill(
+        rng.choice(10**9, size=n_articles, replace=False).astype(str), 10
+    )
+    centres = rng.standard_normal((n_clusters, dim), dtype=np.float32)
+    embeddings = centres[rng.integers(n_clusters, size=n_articles)]
+    embeddings += 0.5 * rng.standard_normal((n_articles, dim), dtype=np.float32)
+    return article_ids, embeddings
+
+
+def write_candidates_snapshot(
+    snapshot_dir: str, article_ids: np.ndarray, embeddings: np.ndarray
+) -> str:
+    """
+    Write a synthetic catalog in the layout read by ExactRetriever.
+
+    The pipeline writes real snapshots with
+    recsys.core.embeddings.save_embeddings_snapshot, which the container
+    does not ship.
+
+    Args:
+        snapshot_dir: Directory to write the snapshot to
+        article_ids: Article IDs, one per embedding row
+        embeddings: Candidate embeddings of shape (n_articles, dim)
+
+    Returns:
+        Path of the snapshot directory
+    """
+    from retrieval import ARTICLE_IDS_FILE, EMBEDDINGS_FILE
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    np.save(
+        os.path.join(snapshot_dir, ARTICLE_IDS_FILE),
+        np.asarray(article_ids, dtype=str),
+    )
+    np.save(
+        os.path.join(snapshot_dir, EMBEDDINGS_FILE),
+        np.ascontiguousarray(embeddings, dtype=np.float32),
+    )
+    return snapshot_dir
+
+
+def make_queries(n_queries: int, dim: int = 16, seed: int = 72) -> np.ndarray:
+    """
+    Generate synthetic query embeddings.
+
+    Args:
+        n_queries: Number of queries
+        dim: Embedding dimension
+        seed: Random seed
+
+    Returns:
+        float32 array of shape (n_queries, dim)
+    """
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((n_queries, dim), dtype=np.float32)
+
+
+# Approximate vocabulary sizes of the H&M article attributes
+ARTICLE_CATEGORICAL_CARDINALITIES = {
+    "product_type_name": 131,
+    "product_group_name": 19,
+    "graphical_appearance_name": 30,
+    "colour_group_name": 50,
+    "perceived_colour_value_name": 8,
+    "perceived_colour_master_name": 20,
+    "department_name": 250,
+    "index_name": 10,
+    "index_group_name": 5,
+    "section_name": 56,
+    "garment_group_name": 21,
+}
+
+
+def make_article_frame(article_ids: np.ndarray, seed: int = 27) -> pd.DataFrame:
+    """
+    Generate an H&M-shaped articles table.
+
+    Args:
+        article_ids: Article IDs, one row per ID
+        seed: Random seed
+
+    Returns:
+        DataFrame with article_id, categorical name columns and numeric columns
+    """
+    rng = np.random.default_rng(seed)
+    n_articles = len(article_ids)
+
+    columns = {"article_id": article_ids}
+    for col, cardinality in ARTICLE_CATEGORICAL_CARDINALITIES.items():
+        vocabulary = np.array([f"{col}_{i}" for i in range(cardinality)])
+        columns[col] = vocabulary[rng.integers(cardinality, size=n_articles)]
+
+    columns["product_code"] = rng.integers(100_000, 1_000_000, size=n_articles)
+    columns["prod_name_length"] = rng.integers(3, 40, size=n_articles)
+    return pd.DataFrame(columns)
+
+
+def make_customer_frame(n_customers: int, seed: int = 27) -> pd.DataFrame:
+    """
+    Generate an H&M-shaped customers table.
+
+    Columns are in the order of the customers feature view, customer_id then
+    age first.
+
+    Args:
+        n_customers: Number of customers
+        seed: Random seed
+
+    Returns:
+        DataFrame with one row per customer
+    """
+    rng = np.random.default_rng(seed)
+    # H&M customer IDs are 64-character hex digests
+    customer_ids = [
+        row.tobytes().hex() for row in rng.integers(0, 256, (n_customers, 32), np.uint8)
+    ]
+    # Ages skew young with a second mode around 50, as in the H&M data
+    age = np.where(
+        rng.random(n_customers) < 0.7,
+        rng.normal(26, 5, n_customers),
+        rng.normal(50, 9, n_customers),
+    )
+    return pd.DataFrame(
+        {
+            "customer_id": customer_ids,
+            "age": np.clip(np.round(age), 16, 99),
+            "club_member_status": rng.choice(
+                ["ACTIVE", "PRE-CREATE", "LEFT CLUB"],
+                n_customers,
+                p=[0.93, 0.068, 0.002],
+            ),
+            "fashion_news_frequency": rng.choice(
+                ["NONE", "Regularly", "Monthly"], n_customers, p=[0.65, 0.349, 0.001]
+            ),
+            "postal_code": [
+                row.tobytes().hex()
+                for row in rng.integers(0, 256, (n_customers, 32), np.uint8)
+            ],
+        }
+    )
+
+
+def make_transactions_frame(
+    customer_ids: np.ndarray,
+    article_ids: np.ndarray,
+    mean_purchases: float = 23.0,
+    seed: int = 27,
+) -> pd.DataFrame:
+    """
+    Generate an H&M-shaped transactions table.
+
+    Purchase counts per customer are long-tailed and article popularity
+    follows a power law, so a few customers and articles dominate.
+
+    Args:
+        customer_ids: Customer IDs
+        article_ids: Article IDs
+        mean_purchases: Mean number of transactions per customer
+        seed: Random seed
+
+    Returns:
+        DataFrame with t_dat, customer_id, article_id, price and
+        sales_channel_id columns
+    """
+    rng = np.random.default_rng(seed)
+    counts = rng.geometric(1.0 / mean_purchases, size=len(customer_ids))
+    n_transactions = int(counts.sum())
+
+    popularity = 1.0 / np.arange(1, len(article_ids) + 1) ** 0.8
+    popularity = rng.permutation(popularity / popularity.sum())
+    days = rng.integers(0, 734, n_transactions)
+    return pd.DataFrame(
+        {
+            "t_dat": np.datetime64("2018-09-20") + days.astype("timedelta64[D]"),
+            "customer_id": np.repeat(np.asarray(customer_ids), counts),
+            "article_id": article_ids[
+                rng.choice(len(article_ids), n_transactions, p=popularity)
+            ],
+            "price": rng.gamma(2.0, 0.014, n_transactions).astype(np.float32),
+            "sales_channel_id": rng.choice([1, 2], n_transactions, p=[0.3, 0.7]),
+        }
+    )
+
+
+def make_query_embeddings(
+    n_customers: int, embeddings: np.ndarray, seed: int = 27
+) -> np.ndarray:
+    """
+    Generate query embeddings for every customer and month.
+
+    Each customer's taste is near a random article, and drifts a little from
+    month to month.
+
+    Args:
+        n_customers: Number of customers
+        embeddings: Article embeddings of the catalog
+        seed: Random seed
+
+    Returns:
+        float32 array of shape (n_customers, 12, dim)
+    """
+    rng = np.random.default_rng(seed)
+    dim = embeddings.shape[1]
+    taste = embeddings[rng.integers(len(embeddings), size=n_customers)]
+    queries = taste[:, None, :] + 0.3 * rng.standard_normal(
+        (n_customers, 12, dim), dtype=np.float32
+    )
+    return queries.astype(np.float32)
+
+
+def write_query_embeddings_snapshot(
+    snapshot_dir: str, customer_ids: np.ndarray, embeddings: np.ndarray
+) -> str:
+    """
+    Write synthetic query embeddings in the layout read by QueryEmbeddingTable.
+
+    The pipeline writes real snapshots with
+    recsys.core.embeddings.storage.save_query_embeddings_snapshot, which the
+    container does not ship.
+
+    Args:
+        snapshot_dir: Directory to write the snapshot to
+        customer_ids: Customer IDs, one per embedding row
+        embeddings: Query embeddings of shape (n_customers, 12, dim), the
+            month axis ordered January to December
+
+    Returns:
+        Path of the snapshot directory
+    """
+    from query_table import CUSTOMER_IDS_FILE, QUERY_EMBEDDINGS_FILE
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    np.save(
+        os.path.join(snapshot_dir, CUSTOMER_IDS_FILE),
+        np.asarray(customer_ids, dtype=str),
+    )
+    np.save(
+        os.path.join(snapshot_dir, QUERY_EMBEDDINGS_FILE),
+        np.ascontiguousarray(embeddings, dtype=np.float32),
+    )
+    return snapshot_dir
+
+
+def make_ranking_model(
+    n_trees: int, seed: int = 27, n_rows: int = 5_000
+) -> xgb.Booster:
+    """
+    Train a ranking model stand-in on random features.
+
+    Args:
+        n_trees: Number of boosting rounds
+        seed: Random seed
+        n_rows: Number of training rows
+
+    Returns:
+        Booster taking the ranking model features
+    """
+    from config import RANKING_MODEL_FEATURES
+
+    rng = np.random.default_rng(seed)
+    x = rng.random((n_rows, len(RANKING_MODEL_FEATURES)), dtype=np.float32)
+    return xgb.train(
+        {"objective": "binary:logistic", "max_depth": 6},
+        xgb.DMatrix(x, label=rng.integers(0, 2, len(x))),
+        num_boost_round=n_trees,
+    )
+
+
+def write_local_dataset(
+    output_dir: str,
+    n_articles: int = 105_000,
+    n_customers: int = 50_000,
+    mean_purchases: float = 23.0,
+    n_trees: int = 300,
+    ivfpq: bool = False,
+) -> str:
+    """
+    Write everything the service reads, for the local data backend.
+
+    The layout is that of SNAPSHOT_DIR, plus Parquet tables read by
+    LocalDataAccess and the model files in model/.
+
+    Args:
+        output_dir: Directory to write to
+        n_articles: Number of articles
+        n_customers: Number of customers
+        mean_purchases: Mean number of transactions per customer
+        n_trees: Boosting rounds of the model
+        ivfpq: Also build an IVF-PQ index of the candidates
+
+    Returns:
+        output_dir
+    """
+    from artifact_cache import MODEL_FILE
+    from article_store import ArticleTable
+    from categorical_encoder import ENCODER_FILE
+    from config import (
+        ARTICLES_SNAPSHOT_PATH,
+        CANDIDATES_SNAPSHOT_DIR,
+        IVFPQ_INDEX_PATH,
+        PURCHASES_SNAPSHOT_DIR,
+        QUERY_EMBEDDINGS_SNAPSHOT_DIR,
+        RANKING_MODEL_FEATURES,
+    )
+    from data_access import ARTICLES_FILE, CUSTOMERS_FILE, TRANSACTIONS_FILE
+    from purchase_index import PurchaseIndex
+
+    def path(configured: str) -> str:
+        return os.path.join(output_dir, os.path.basename(configured))
+
+    os.makedirs(output_dir, exist_ok=True)
+    article_ids, embeddings = make_candidate_catalog(n_articles)
+    articles = make_article_frame(article_ids)
+    customers = make_customer_frame(n_customers)
+    transactions = make_transactions_frame(
+        customers["customer_id"].to_numpy(), article_ids, mean_purchases
+    )
+
+    # Tables of the local data backend
+    articles.to_parquet(os.path.join(output_dir, ARTICLES_FILE), index=False)
+    customers.to_parquet(os.path.join(output_dir, CUSTOMERS_FILE), index=False)
+    transactions.to_parquet(os.path.join(output_dir, TRANSACTIONS_FILE), index=False)
+
+    # Snapshots of the snapshot backends
+    write_candidates_snapshot(path(CANDIDATES_SNAPSHOT_DIR), article_ids, embeddings)
+    ArticleTable.from_dataframe(articles).save(path(ARTICLES_SNAPSHOT_PATH))
+    PurchaseIndex.build(
+        transactions["customer_id"], transactions["article_id"], article_ids
+    ).save(path(PURCHASES_SNAPSHOT_DIR))
+    write_query_embeddings_snapshot(
+        path(QUERY_EMBEDDINGS_SNAPSHOT_DIR),
+        customers["customer_id"].to_numpy(),
+        make_query_embeddings(n_customers, embeddings),
+    )
+    if ivfpq:
+        from ivfpq import IVFPQIndex
+
+        IVFPQIndex.build(article_ids, embeddings).save(path(IVFPQ_INDEX_PATH))
+
+    # Model files, with the vocabularies of the article columns it was fitted on
+    model_dir = os.path.join(output_dir, "model")
+    os.makedirs(model_dir, exist_ok=True)
+    make_ranking_model(n_trees).save_model(os.path.join(model_dir, MODEL_FILE))
+    vocabularies = {
+        col: [f"{col}_{i}" for i in range(cardinality)]
+        for col, cardinality in ARTICLE_CATEGORICAL_CARDINALITIES.items()
+        if col in RANKING_MODEL_FEATURES
+    }
+    vocabularies["colour_group_name_right"] = vocabularies["colour_group_name"]
+    with open(os.path.join(model_dir, ENCODER_FILE), "w") as f:
+        json.dump({"vocabularies": vocabularies, "unknown_code": -1}, f)
+
+    return output_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic local dataset")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--articles", type=int, default=105_000)
+    parser.add_argument("--customers", type=int, default=50_000)
+    parser.add_argument("--mean-purchases", type=float, default=23.0)
+    parser.add_argument("--trees", type=int, default=300)
+    parser.add_argument("--ivfpq", action="store_true")
+    args = parser.parse_args()
+
+    write_local_dataset(
+        args.output,
+        args.articles,
+        args.customers,
+        args.mean_purchases,
+        args.trees,
+        args.ivfpq,
+    )
+    print(f"Wrote local dataset to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
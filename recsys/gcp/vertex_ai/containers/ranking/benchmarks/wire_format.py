@@ -0,0 +1,132 @@
+"""
+Compare the parse and serialize cost of JSON and Arrow /predict bodies.
+
+Request parsing takes a body to the instances and a float32 query embedding
+matrix, as retrieval consumes them: for JSON that is json.loads, the type
+check of every query_emb, and np.asarray over the nested lists. Response
+serialization takes the model's scores to a body: for JSON, [score, id]
+pairs per instance and json.dumps as Flask's jsonify does; for Arrow, the
+columnar rankings and an IPC stream.
+
+Usage (from the container directory):
+    python -m benchmarks.wire_format --instances 1 10 100 1000 --dim 16
+"""
+
+import argparse
+import json
+import logging
+import numpy as np
+from benchmarks.common import print_table, time_calls
+from benchmarks.synthetic import make_candidate_catalog, make_query_embeddings
+from config import TOP_K_CANDIDATES
+from logger import logger
+from ranking_transformer import RankingTransformer
+from wire_format import (
+    decode_arrow_request,
+    encode_arrow_request,
+    encode_arrow_response,
+)
+
+
+def make_instances(n_instances: int):
+    return [
+        {"customer_id": f"{i:064x}", "date": f"2020-{i % 12 + 1:02d}-15"}
+        for i in range(n_instances)
+    ]
+
+
+def parse_json(body: bytes) -> np.ndarray:
+    instances = json.loads(body)["instances"]
+    for instance in instances:
+        if not isinstance(instance["query_emb"], list):
+            raise ValueError("query_emb must be a list of floats")
+    return np.asarray(
+        [instance["query_emb"] for instance in instances], dtype=np.float32
+    )
+
+
+def parse_arrow(body: bytes) -> np.ndarray:
+    instances = decode_arrow_request(body)["instances"]
+    return np.asarray(
+        [instance["query_emb"] for instance in instances], dtype=np.float32
+    )
+
+
+def serialize_json(transformer, outputs) -> bytes:
+    response = transformer.postprocess(outputs)
+    response["model_version"] = "1"
+    return json.dumps(response, separators=(",", ":"), sort_keys=True).encode()
+
+
+def serialize_arrow(transformer, outputs) -> bytes:
+    response = transformer.postprocess(outputs, columnar=True)
+    response["model_version"] = "1"
+    return encode_arrow_response(response)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--instances", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--dim", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    transformer = RankingTransformer.__new__(RankingTransformer)
+    article_ids, article_embeddings = make_candidate_catalog(
+        TOP_K_CANDIDATES * 10, dim=args.dim
+    )
+    rng = np.random.default_rng(27)
+
+    rows = []
+    for n_instances in args.instances:
+        instances = make_instances(n_instances)
+        embeddings = make_query_embeddings(n_instances, article_embeddings)[:, 0]
+        json_body = json.dumps(
+            {
+                "instances": [
+                    {**instance, "query_emb": embedding.tolist()}
+                    for instance, embedding in zip(instances, embeddings)
+                ]
+            }
+        ).encode()
+        arrow_body = encode_arrow_request(instances, embeddings)
+        assert np.array_equal(parse_json(json_body), parse_arrow(arrow_body))
+
+        n_rows = n_instances * TOP_K_CANDIDATES
+        outputs = {
+            "scores": rng.random(n_rows, dtype=np.float32).tolist(),
+            "article_ids": [
+                article_ids[i] for i in rng.integers(len(article_ids), size=n_rows)
+            ],
+            "group_offsets": np.arange(n_instances + 1) * TOP_K_CANDIDATES,
+        }
+
+        for encoding, body, parse, serialize in [
+            ("json", json_body, parse_json, serialize_json),
+            ("arrow", arrow_body, parse_arrow, serialize_arrow),
+        ]:
+            parse_ms = time_calls(lambda: parse(body), args.repeats)
+            serialize_ms = time_calls(
+                lambda: serialize(transformer, outputs), args.repeats
+            )
+            rows.append(
+                {
+                    "instances": n_instances,
+                    "encoding": encoding,
+                    "request_kb": len(body) / 1024,
+                    "parse_ms": 1000 * float(np.mean(parse_ms)),
+                    "response_kb": len(serialize(transformer, outputs)) / 1024,
+                    "serialize_ms": 1000 * float(np.mean(serialize_ms)),
+                }
+            )
+
+    print(
+        f"\nQuery embeddings of {args.dim} floats, {TOP_K_CANDIDATES} scored "
+        f"candidates per instance, mean of {args.repeats} calls"
+    )
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+Bulk scoring of newline-delimited JSON (NDJSON) instance streams.
+
+Offline callers, such as campaign jobs ranking millions of customers, send
+one /predict instance per line. Lines are read a block at a time, each block
+goes through retrieval, filtering, feature assembly and prediction as one
+request, and its results are written before the next block is read. Memory
+is bounded by one block, and a slow reader stalls the writes of the stream,
+which stalls the reads of the input: the backpressure of the connection
+reaches the caller.
+
+Each input line gets one output line, in input order:
+    {"line": 1, "customer_id": "d327...", "ranking": [[0.98, "0108775015"], ...],
+     "model_version": "3"}
+    {"line": 2, "error": "Missing required field: customer_id"}
+The stream ends with a summary line, so a truncated stream can be told apart:
+    {"summary": {"rows": 2, "errors": 1, "seconds": 0.05, "rows_per_second": 40.0}}
+
+Usage (from the container directory; the endpoint takes the same stream):
+    python bulk.py --input instances.ndjson --output rankings.ndjson
+    curl -T instances.ndjson -H "Content-Type: application/x-ndjson" \\
+        http://localhost:8080/predict/stream > rankings.ndjson
+"""
+
+import argparse
+import json
+import sys
+import time
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+from config import BULK_BLOCK_SIZE, BULK_MAX_LINE_BYTES, BULK_PROGRESS_SECONDS
+from logger import logger
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+class BulkProgress:
+    """Counts the rows of a bulk stream and logs their rate periodically."""
+
+    def __init__(self, interval: float = BULK_PROGRESS_SECONDS):
+        self.interval = interval
+        self.rows = 0
+        self.errors = 0
+        self.start_time = time.perf_counter()
+        self._last_report = self.start_time
+
+    def add(self, rows: int, errors: int) -> None:
+        """Count a block's rows, logging the rate if the interval has passed."""
+        self.rows += rows
+        self.errors += errors
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            logger.info(
+                f"📦 Bulk scoring: {self.rows} rows, {self.errors} errors, "
+                f"{self.rows / (now - self.start_time):.0f} rows/s"
+            )
+
+    def summary(self) -> Dict[str, Any]:
+        seconds = time.perf_counter() - self.start_time
+        return {
+            "rows": self.rows,
+            "errors": self.errors,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(self.rows / seconds, 1) if seconds else 0.0,
+        }
+
+
+def read_lines(
+    stream: BinaryIO, max_line_bytes: int = BULK_MAX_LINE_BYTES
+) -> Iterator[Optional[bytes]]:
+    """
+    Read lines without holding more than max_line_bytes of one.
+
+    Yields:
+        Each line, or None for a line longer than max_line_bytes (which is
+        skipped)
+    """
+    while True:
+        line = stream.readline(max_line_bytes + 1)
+        if not line:
+            return
+        if len(line) <= max_line_bytes or line.endswith(b"\n"):
+            yield line
+            continue
+
+        # Skip the rest of the line
+        while line and not line.endswith(b"\n"):
+            line = stream.readline(max_line_bytes + 1)
+        yield None
+
+
+def read_blocks(
+    stream: BinaryIO,
+    validate: Callable[[Any], str],
+    block_size: int = BULK_BLOCK_SIZE,
+    max_line_bytes: int = BULK_MAX_LINE_BYTES,
+) -> Iterator[List[Tuple[int, Any, str]]]:
+    """
+    Parse and validate instances, a block at a time.
+
+    Args:
+        stream: Binary NDJSON input
+        validate: Instance check returning an error message, empty if valid
+        block_size: Lines per block, invalid ones included, so a run of bad
+            lines is not held in memory
+        max_line_bytes: Longest line accepted
+
+    Yields:
+        Lists of (line number, instance, error); blank lines are skipped
+    """
+    block: List[Tuple[int, Any, str]] = []
+    for number, line in enumerate(read_lines(stream, max_line_bytes), start=1):
+        if line is None:
+            block.append((number, None, f"Line longer than {max_line_bytes} bytes"))
+        elif line.strip():
+            try:
+                instance = json.loads(line)
+                error = validate(instance)
+            except ValueError as e:
+                instance, error = None, f"Invalid JSON: {e}"
+            block.append((number, instance, error))
+
+        if len(block) == block_size:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def score_block(
+    block: List[Tuple[int, Any, str]],
+    rank_block: Callable[[List[Dict[str, Any]]], Dict[str, Any]],
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Rank the valid instances of a block.
+
+    A block that fails is ranked again one instance at a time, so a single
+    bad instance does not fail the others.
+
+    Args:
+        block: (line number, instance, error) of the block's lines
+        rank_block: Ranks instances, returning columnar rankings (see
+            RankingTransformer.postprocess) with model_version and degraded
+
+    Returns:
+        Tuple of (output records in line order, number of errors)
+    """
+    instances = [instance for _, instance, error in block if not error]
+    rankings: Dict[str, Any] = {}
+    block_error = ""
+    if instances:
+        try:
+            rankings = rank_block(instances)
+        except Exception as e:
+            block_error = f"{type(e).__name__}: {str(e)}"
+            if len(instances) == 1:
+                logger.error(f"❌ Bulk instance failed: {block_error}", exc_info=True)
+
+    if block_error and len(instances) > 1:
+        logger.warning(
+            f"⚠️ Bulk block of {len(instances)} instances failed ({block_error}), "
+            "ranking them one at a time"
+        )
+        records, n_errors = [], 0
+        for line in block:
+            line_records, line_errors = score_block([line], rank_block)
+            records.extend(line_records)
+            n_errors += line_errors
+        return records, n_errors
+
+    records = []
+    n_errors = 0
+    position = 0
+    for number, instance, error in block:
+        if error or block_error:
+            records.append({"line": number, "error": error or block_error})
+            n_errors += 1
+            continue
+
+        start, end = rankings["ranking_offsets"][position : position + 2]
+        position += 1
+        record = {
+            "line": number,
+            "customer_id": instance["customer_id"],
+            "ranking": [
+                [float(score), article_id]
+                for score, article_id in zip(
+                    rankings["scores"][start:end], rankings["article_ids"][start:end]
+                )
+            ],
+            "model_version": rankings["model_version"],
+        }
+        if rankings.get("degraded"):
+            record["degraded"] = rankings["degraded"]
+        records.append(record)
+    return records, n_errors
+
+
+def score_stream(
+    stream: BinaryIO,
+    rank_block: Callable[[List[Dict[str, Any]]], Dict[str, Any]],
+    validate: Callable[[Any], str],
+    block_size: int = BULK_BLOCK_SIZE,
+) -> Iterator[bytes]:
+    """
+    Score an NDJSON instance stream block by block.
+
+    The input is only read when the output of the previous block has been
+    consumed, so a caller that writes each chunk to a socket or file before
+    asking for the next gets backpressure for free.
+
+    Args:
+        stream: Binary NDJSON input
+        rank_block: Ranks a list of valid instances, see score_block()
+        validate: Instance check returning an error message, empty if valid
+        block_size: Lines per block
+
+    Yields:
+        NDJSON output, one chunk per block, then the summary line
+    """
+    progress = BulkProgress()
+    logger.info(f"📦 Bulk scoring started, {block_size} instances per block")
+
+    for block in read_blocks(stream, validate, block_size):
+        records, n_errors = score_block(block, rank_block)
+        progress.add(len(records), n_errors)
+        yield b"".join(
+            json.dumps(record, separators=(",", ":")).encode() + b"\n"
+            for record in records
+        )
+
+    summary = progress.summary()
+    logger.success(
+        f"Bulk scoring done: {summary['rows']} rows, {summary['errors']} errors "
+        f"in {summary['seconds']:.1f}s ({summary['rows_per_second']:.0f} rows/s)"
+    )
+    yield json.dumps({"summary": summary}).encode() + b"\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--input", default="-", help="NDJSON instances (-: stdin)")
+    parser.add_argument("--output", required=True, help="NDJSON rankings")
+    parser.add_argument("--block-size", type=int, default=BULK_BLOCK_SIZE)
+    args = parser.parse_args()
+
+    # Load the serving components exactly as a server worker does; logs go to
+    # stdout, so results never do
+    import server
+
+    server.start_worker()
+    server.ready.wait()
+
+    source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    try:
+        with open(args.output, "wb") as output:
+            for chunk in score_stream(
+                source, server.rank_block, server.validate_instance, args.block_size
+            ):
+                output.write(chunk)
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Categorical feature encoder fitted at training time.
+
+RankingModelTrainer saves the vocabulary of each categorical column, in code
+order, as categorical_encoder.json next to model.bst. Serving encodes values
+with the same codes, and values not seen in training get the unknown code.
+"""
+
+import json
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Tuple
+
+# File name of the encoder next to model.bst
+ENCODER_FILE = "categorical_encoder.json"
+
+
+class CategoricalEncoder:
+    """
+    Maps categorical values to the integer codes used in training.
+
+    Attributes:
+        vocabularies: Index of each column's training values, in code order
+        unknown_code: Code for values not seen in training
+    """
+
+    def __init__(self, vocabularies: Dict[str, List[str]], unknown_code: int = -1):
+        self.vocabularies = {
+            col: pd.Index(values, dtype=object) for col, values in vocabularies.items()
+        }
+        self.unknown_code = unknown_code
+
+        # Code translation per column for categorical inputs, keyed by the
+        # input's categories so a shared dtype is translated only once
+        self._category_codes: Dict[str, Tuple[pd.Index, np.ndarray]] = {}
+
+    @property
+    def columns(self) -> List[str]:
+        """Names of the encoded columns."""
+        return list(self.vocabularies.keys())
+
+    @classmethod
+    def load(cls, path: str) -> "CategoricalEncoder":
+        """
+        Load an encoder saved at training time.
+
+        Args:
+            path: Encoder file path
+
+        Returns:
+            Loaded encoder
+        """
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["vocabularies"], data.get("unknown_code", -1))
+
+    def encode(self, col: str, values: pd.Series) -> np.ndarray:
+        """
+        Encode a column's values.
+
+        Categorical inputs, such as columns gathered from the article table,
+        are encoded by translating their codes through a table built once per
+        set of categories. Other inputs are looked up in a hash index.
+
+        Args:
+            col: Column name
+            values: Values to encode
+
+        Returns:
+            int32 codes, unknown_code for values not seen in training
+        """
+        vocabulary = self.vocabularies[col]
+
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            categories = values.cat.categories
+            cached = self._category_codes.get(col)
+            if cached is None or cached[0] is not categories:
+                translation = vocabulary.get_indexer(categories.astype(str))
+                # Missing values have code -1, which selects the last entry
+                translation = np.append(translation, -1)
+                translation[translation < 0] = self.unknown_code
+                cached = (categories, translation.astype(np.int32))
+                self._category_codes[col] = cached
+            return cached[1][values.cat.codes.to_numpy()]
+
+        codes = vocabulary.get_indexer(values.astype(object))
+        codes[codes < 0] = self.unknown_code
+        return codes.astype(np.int32)
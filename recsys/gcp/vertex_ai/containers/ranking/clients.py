@@ -0,0 +1,40 @@
+"""
+Lazily created Google Cloud clients for the ranking container.
+
+Nothing here runs at import time: importing the Vertex AI SDK alone takes
+seconds, and creating a client resolves credentials. Each client is created
+on first use and shared by the process. Clients do not survive fork, so
+pre-fork workers call reset_clients() before using them.
+"""
+
+from functools import lru_cache
+from google.cloud import bigquery
+from config import LOCATION, PROJECT_ID
+
+
+@lru_cache(maxsize=None)
+def init_aiplatform() -> None:
+    """Import and initialize the Vertex AI SDK, once per process."""
+    from google.cloud import aiplatform
+
+    aiplatform.init(project=PROJECT_ID, location=LOCATION)
+
+
+@lru_cache(maxsize=None)
+def get_bigquery_client() -> bigquery.Client:
+    """Get the shared BigQuery client, creating it on first use."""
+    return bigquery.Client(project=PROJECT_ID)
+
+
+@lru_cache(maxsize=None)
+def get_storage_client():
+    """Get the shared Cloud Storage client, creating it on first use."""
+    from google.cloud import storage
+
+    return storage.Client(project=PROJECT_ID)
+
+
+def reset_clients() -> None:
+    """Drop the clients of this process, e.g. ones inherited from a parent."""
+    get_bigquery_client.cache_clear()
+    get_storage_client.cache_clear()
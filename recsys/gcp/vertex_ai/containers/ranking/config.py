@@ -19,10 +19,28 @@ LOG_LEVEL_MAP = {
 }
 LOG_LEVEL_INT = LOG_LEVEL_MAP.get(LOG_LEVEL, logging.INFO)
 
+# Log output ("pretty" or "json"), optionally written by a background thread
+# through a bounded queue that drops records when full
+LOG_FORMAT = os.getenv("LOG_FORMAT", "pretty")
+LOG_ASYNC = os.getenv("LOG_ASYNC", "False").lower() == "true"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Fraction of records kept per category, e.g. "data=0.01,query=0.01,timer=0.1";
+# warnings and errors are always kept
+LOG_SAMPLE_RATES = {
+    category.strip(): float(rate)
+    for category, rate in (
+        item.split("=")
+        for item in os.getenv("LOG_SAMPLE_RATES", "").split(",")
+        if item.strip()
+    )
+}
+
 # Server settings
 PORT = int(os.getenv("AIP_HTTP_PORT", "8080"))
 HOST = os.getenv("HOST", "0.0.0.0")
 WORKERS = int(os.getenv("WORKERS", "1"))
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "8"))
+WORKER_TIMEOUT_SECONDS = int(os.getenv("WORKER_TIMEOUT_SECONDS", "120"))
 
 # Vertex AI Feature Store
 FEATURE_STORE_ID = os.getenv("FEATURE_STORE_ID", "recsys_dev_feature_store")
@@ -30,14 +48,174 @@ PROJECT_ID = os.getenv("PROJECT_ID", "recsys-dev-gonzo-1")
 LOCATION = os.getenv("LOCATION", "us-central1")
 DATASET_ID = os.getenv("DATASET_ID", "recsys_dev_retail_dataset")
 
+# Feature view syncing
+FEATURE_VIEW_SYNC_INTERVAL_SECONDS = float(
+    os.getenv("FEATURE_VIEW_SYNC_INTERVAL_SECONDS", "300")
+)
+FEATURE_VIEW_STALENESS_BUDGET_SECONDS = float(
+    os.getenv("FEATURE_VIEW_STALENESS_BUDGET_SECONDS", "900")
+)
+FEATURE_VIEW_SYNC_RETRY_SECONDS = float(
+    os.getenv("FEATURE_VIEW_SYNC_RETRY_SECONDS", "60")
+)
+
 # Model Registry
 MODEL_ID = os.getenv("MODEL_ID", "2239024588082118656")
 MODEL_VERSION = os.getenv("MODEL_VERSION", "default")
+# Local directory with the model files, loaded instead of the registry's
+# (empty: use the registry)
+MODEL_DIR = os.getenv("MODEL_DIR", "")
+
+# Hot model swaps: seconds between checks of the version MODEL_VERSION points
+# to in the registry (0 disables polling), synthetic requests a new version is
+# smoke-scored with before it is swapped in, and the token the admin endpoint
+# requires in X-Admin-Token (empty: no token)
+MODEL_POLL_SECONDS = float(os.getenv("MODEL_POLL_SECONDS", "0"))
+MODEL_SMOKE_REQUESTS = int(os.getenv("MODEL_SMOKE_REQUESTS", "3"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Startup: local content-addressed cache of GCS artifacts, and the synthetic
+# requests run through every stage before the worker reports ready
+ARTIFACT_CACHE_DIR = os.getenv("ARTIFACT_CACHE_DIR", "/app/cache")
+WARMUP_REQUESTS = int(os.getenv("WARMUP_REQUESTS", "3"))
+# Customer of the warm-up requests; it must exist in the feature store for the
+# requests to reach the model (empty: a customer from the query embedding table)
+WARMUP_CUSTOMER_ID = os.getenv("WARMUP_CUSTOMER_ID", "")
 
 # Recommendation settings
 TOP_K_CANDIDATES = int(os.getenv("TOP_K_CANDIDATES", "100"))
 MAX_RECOMMENDATIONS = int(os.getenv("MAX_RECOMMENDATIONS", "10"))
 
+# Cache of per-instance rankings: rankings kept (0, the default, disables the
+# cache; opt in where rankings up to the TTL old may be served) and seconds
+# each is served for
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "0"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "300"))
+
+# Cache of customer features: customers kept, known or not (0 disables the
+# cache), seconds features and unknown customers are served for, fraction of
+# the TTL after which served features are read again in the background, and
+# threads doing those reads
+CUSTOMER_CACHE_SIZE = int(os.getenv("CUSTOMER_CACHE_SIZE", "100000"))
+CUSTOMER_CACHE_TTL_SECONDS = float(os.getenv("CUSTOMER_CACHE_TTL_SECONDS", "300"))
+CUSTOMER_CACHE_NEGATIVE_TTL_SECONDS = float(
+    os.getenv("CUSTOMER_CACHE_NEGATIVE_TTL_SECONDS", "60")
+)
+CUSTOMER_CACHE_REFRESH_FRACTION = float(
+    os.getenv("CUSTOMER_CACHE_REFRESH_FRACTION", "0.8")
+)
+CUSTOMER_CACHE_REFRESH_WORKERS = int(os.getenv("CUSTOMER_CACHE_REFRESH_WORKERS", "2"))
+
+# Cross-request micro-batching of model predictions
+PREDICT_BATCHING = os.getenv("PREDICT_BATCHING", "False").lower() == "true"
+PREDICT_BATCH_WINDOW_MS = float(os.getenv("PREDICT_BATCH_WINDOW_MS", "2"))
+PREDICT_BATCH_MAX_ROWS = int(os.getenv("PREDICT_BATCH_MAX_ROWS", "4096"))
+
+# Model evaluation ("dmatrix", "inplace" or "numpy") and XGBoost threads per call
+PREDICT_ENGINE = os.getenv("PREDICT_ENGINE", "dmatrix")
+PREDICT_THREADS = int(os.getenv("PREDICT_THREADS", "1"))
+
+# Threads shared by all requests for concurrent preprocessing lookups
+PREPROCESS_MAX_WORKERS = int(os.getenv("PREPROCESS_MAX_WORKERS", "8"))
+
+# Request deadlines: latency budget of a /predict request unless the caller
+# sends X-Request-Budget-Ms (0: no deadline), and the fraction of the budget
+# left that each backend read may use, e.g. "bought_items=0.3"
+REQUEST_BUDGET_MS = float(os.getenv("REQUEST_BUDGET_MS", "5000"))
+STAGE_BUDGET_FRACTIONS = {
+    stage.strip(): float(fraction)
+    for stage, fraction in (
+        item.split("=")
+        for item in os.getenv(
+            "STAGE_BUDGET_FRACTIONS",
+            "bought_items=0.3,customer_features=0.5,article_features=0.5",
+        ).split(",")
+        if item.strip()
+    )
+}
+
+# Hedged reads: a backend read still running at this percentile of its
+# latency gets a duplicate, once it has enough samples and the percentile is
+# at least the minimum delay; hedges are capped at a fraction of the reads
+HEDGE_READS = os.getenv("HEDGE_READS", "True").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "50"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "5"))
+HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", "0.05"))
+HEDGE_MAX_WORKERS = int(os.getenv("HEDGE_MAX_WORKERS", "16"))
+
+# Bulk scoring of NDJSON streams (/predict/stream and bulk.py): input lines
+# per block, latency budget of a block (0: no deadline), longest input
+# line accepted and seconds between progress logs
+BULK_BLOCK_SIZE = int(os.getenv("BULK_BLOCK_SIZE", "256"))
+BULK_BLOCK_BUDGET_MS = float(os.getenv("BULK_BLOCK_BUDGET_MS", "60000"))
+BULK_MAX_LINE_BYTES = int(os.getenv("BULK_MAX_LINE_BYTES", "1048576"))
+BULK_PROGRESS_SECONDS = float(os.getenv("BULK_PROGRESS_SECONDS", "10"))
+
+# Retrieval settings ("bigquery", "exact" or "ivfpq")
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "bigquery")
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "/app/snapshots")
+# Versioned GCS prefix mirrored into SNAPSHOT_DIR through the artifact cache
+# at startup (empty: use the files already in SNAPSHOT_DIR)
+SNAPSHOT_GCS_URI = os.getenv("SNAPSHOT_GCS_URI", "")
+CANDIDATES_SNAPSHOT_DIR = os.getenv(
+    "CANDIDATES_SNAPSHOT_DIR", os.path.join(SNAPSHOT_DIR, "candidates")
+)
+IVFPQ_INDEX_PATH = os.getenv(
+    "IVFPQ_INDEX_PATH", os.path.join(SNAPSHOT_DIR, "candidates_ivfpq.npz")
+)
+IVFPQ_NPROBE = int(os.getenv("IVFPQ_NPROBE", "16"))
+# Times a query is rescanned with twice the lists when exclusions leave < k
+IVFPQ_MAX_PROBE_RETRIES = int(os.getenv("IVFPQ_MAX_PROBE_RETRIES", "2"))
+
+# Article features ("bigquery" or "snapshot")
+ARTICLES_BACKEND = os.getenv("ARTICLES_BACKEND", "bigquery")
+ARTICLES_SNAPSHOT_PATH = os.getenv(
+    "ARTICLES_SNAPSHOT_PATH", os.path.join(SNAPSHOT_DIR, "articles.npz")
+)
+ARTICLES_REFRESH_SECONDS = float(os.getenv("ARTICLES_REFRESH_SECONDS", "3600"))
+# gs:// object holding the dated snapshot prefix to serve articles from; each
+# refresh re-reads it and fetches articles.npz of a new prefix (empty: only
+# reload ARTICLES_SNAPSHOT_PATH when it changes on disk)
+ARTICLES_SNAPSHOT_POINTER_URI = os.getenv("ARTICLES_SNAPSHOT_POINTER_URI", "")
+
+# Purchase history for the "already bought" filter ("bigquery" or "snapshot")
+PURCHASES_BACKEND = os.getenv("PURCHASES_BACKEND", "bigquery")
+PURCHASES_SNAPSHOT_DIR = os.getenv(
+    "PURCHASES_SNAPSHOT_DIR", os.path.join(SNAPSHOT_DIR, "purchases")
+)
+
+# Query embeddings ("request" takes query_emb from the request, "snapshot" looks
+# them up by customer_id and date)
+QUERY_EMBEDDINGS_BACKEND = os.getenv("QUERY_EMBEDDINGS_BACKEND", "request")
+QUERY_EMBEDDINGS_SNAPSHOT_DIR = os.getenv(
+    "QUERY_EMBEDDINGS_SNAPSHOT_DIR", os.path.join(SNAPSHOT_DIR, "query_embeddings")
+)
+
+# Recommendations materialized by materialize.py ("online" ranks every
+# request, "snapshot" serves instances from the snapshot while it is fresh and
+# ranks the rest online), the snapshot age after which it is no longer served
+# and seconds between checks for a new snapshot
+RECOMMENDATIONS_BACKEND = os.getenv("RECOMMENDATIONS_BACKEND", "online")
+RECOMMENDATIONS_SNAPSHOT_DIR = os.getenv(
+    "RECOMMENDATIONS_SNAPSHOT_DIR", os.path.join(SNAPSHOT_DIR, "recommendations")
+)
+RECOMMENDATIONS_MAX_AGE_SECONDS = float(
+    os.getenv("RECOMMENDATIONS_MAX_AGE_SECONDS", "129600")
+)
+RECOMMENDATIONS_REFRESH_SECONDS = float(
+    os.getenv("RECOMMENDATIONS_REFRESH_SECONDS", "300")
+)
+# Batch materialization: customers ranked per block and worker processes
+MATERIALIZE_BLOCK_SIZE = int(os.getenv("MATERIALIZE_BLOCK_SIZE", "1024"))
+MATERIALIZE_WORKERS = int(os.getenv("MATERIALIZE_WORKERS", str(os.cpu_count() or 1)))
+
+# Store behind the "bigquery" lookups above and customer features ("cloud" reads
+# BigQuery and the Feature Store, "local" reads the Parquet files of a dataset
+# generated by benchmarks/synthetic.py from LOCAL_DATA_DIR)
+DATA_BACKEND = os.getenv("DATA_BACKEND", "cloud")
+LOCAL_DATA_DIR = os.getenv("LOCAL_DATA_DIR", SNAPSHOT_DIR)
+
 # BigQuery settings
 MAX_QUERY_RETRIES = int(os.getenv("MAX_QUERY_RETRIES", "3"))
 QUERY_TIMEOUT_SECONDS = int(os.getenv("QUERY_TIMEOUT_SECONDS", "30"))
@@ -0,0 +1,288 @@
+"""
+In-process cache of customer features in front of the online store.
+
+A feature row is decoded by feature name into a CustomerFeatures record once,
+when it is read, instead of by position on every request. Records are served
+for CUSTOMER_CACHE_TTL_SECONDS; one that is past CUSTOMER_CACHE_REFRESH_FRACTION
+of its TTL when it is served is read again in the background (refresh-ahead),
+so customers that keep coming back rarely wait for the store. Unknown
+customers are remembered for CUSTOMER_CACHE_NEGATIVE_TTL_SECONDS, so cold or
+bogus IDs do not pay a remote miss on every request.
+
+Expired records are kept until they are evicted, and are served stale when a
+read does not finish in time, see RankingTransformer._get_customer_features.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+from config import (
+    CUSTOMER_CACHE_NEGATIVE_TTL_SECONDS,
+    CUSTOMER_CACHE_REFRESH_FRACTION,
+    CUSTOMER_CACHE_REFRESH_WORKERS,
+    CUSTOMER_CACHE_SIZE,
+    CUSTOMER_CACHE_TTL_SECONDS,
+)
+from logger import logger
+from metrics import Histogram, STAGE_LATENCY_BUCKETS_MS, exponential_buckets
+
+# Staleness bucket bounds in seconds, from 1s to about 9 hours
+STALENESS_BUCKETS_S = exponential_buckets(1.0, 1.5, 32)
+
+
+class CustomerFeatures(NamedTuple):
+    """Customer features the ranking model uses."""
+
+    age: float
+
+
+# Features of a customer whose read did not finish and who has no record
+DEFAULT_CUSTOMER_FEATURES = CustomerFeatures(age=0.0)
+
+
+def _numeric(value: Dict[str, Any], default: float = 0.0) -> float:
+    """Number in a feature value of any numeric type, default if it has none."""
+    for kind in ("double_value", "int64_value", "float_value", "int_value"):
+        if kind in value:
+            return float(value[kind])
+    return default
+
+
+def decode_customer_features(features: List[Dict[str, Any]]) -> CustomerFeatures:
+    """
+    Decode a feature row read from the customers feature view.
+
+    Args:
+        features: List of feature dictionaries with name and value
+
+    Returns:
+        CustomerFeatures, with 0 for a feature that has no value
+    """
+    values = {feature["name"]: feature.get("value") or {} for feature in features}
+    return CustomerFeatures(age=_numeric(values.get("age", {})))
+
+
+class CustomerFeatureCache:
+    """
+    LRU cache of customer feature records with refresh-ahead and negative
+    entries.
+
+    Attributes:
+        read: Reads and decodes a customer's features, raising KeyError for
+            an unknown customer
+        max_size: Maximum number of cached customers, known or not
+        ttl_seconds: Time a record is served for
+        negative_ttl_seconds: Time an unknown customer is remembered for
+        refresh_fraction: Fraction of the TTL after which a served record is
+            read again in the background
+    """
+
+    # Background refreshes waiting beyond this are skipped; their records
+    # then expire and are read on the request path
+    MAX_PENDING_REFRESHES = 1024
+
+    def __init__(
+        self,
+        read: Callable[[str], CustomerFeatures],
+        max_size: int = CUSTOMER_CACHE_SIZE,
+        ttl_seconds: float = CUSTOMER_CACHE_TTL_SECONDS,
+        negative_ttl_seconds: float = CUSTOMER_CACHE_NEGATIVE_TTL_SECONDS,
+        refresh_fraction: float = CUSTOMER_CACHE_REFRESH_FRACTION,
+    ):
+        """
+        Args:
+            read: Reads and decodes a customer's features, raising KeyError
+                for an unknown customer
+            max_size: Maximum number of cached customers (0 disables caching)
+            ttl_seconds: Time a record is served for
+            negative_ttl_seconds: Time an unknown customer is remembered for
+            refresh_fraction: Fraction of the TTL after which a served record
+                is read again in the background
+        """
+        self.read = read
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.refresh_fraction = refresh_fraction
+
+        # customer_id -> (record, None for an unknown customer; monotonic read time)
+        self._entries: "OrderedDict[str, Tuple[Optional[CustomerFeatures], float]]" = (
+            OrderedDict()
+        )
+        self._refreshing: Set[str] = set()
+        self._counts = {
+            "hits": 0,
+            "misses": 0,
+            "negative_hits": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "evictions": 0,
+        }
+        self._refresh_latency = Histogram(STAGE_LATENCY_BUCKETS_MS)
+        self._staleness = Histogram(STALENESS_BUCKETS_S)
+        self._lock = threading.Lock()
+
+        # Refresh threads are per process, see start()
+        self.executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self, max_workers: int = CUSTOMER_CACHE_REFRESH_WORKERS) -> None:
+        """Start the background refresh threads."""
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="customer-refresh"
+        )
+
+    def get(self, customer_id: str) -> CustomerFeatures:
+        """
+        Get a customer's features, reading them on a miss.
+
+        Args:
+            customer_id: ID of the customer
+
+        Returns:
+            The customer's features
+
+        Raises:
+            KeyError: If the customer is unknown, now or recently
+            TimeoutError: If the read did not finish in time
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(customer_id)
+            if entry is not None:
+                record, read_at = entry
+                age = now - read_at
+                ttl = (
+                    self.ttl_seconds
+                    if record is not None
+                    else self.negative_ttl_seconds
+                )
+                if age < ttl:
+                    self._entries.move_to_end(customer_id)
+                    if record is None:
+                        self._counts["negative_hits"] += 1
+                    else:
+                        self._counts["hits"] += 1
+                        refresh = age >= ttl * self.refresh_fraction
+                else:
+                    entry = None
+            if entry is None:
+                self._counts["misses"] += 1
+
+        if entry is not None:
+            if record is None:
+                raise KeyError(f"Customer {customer_id} not found (cached)")
+            self._staleness.observe(age)
+            if refresh:
+                self._refresh_async(customer_id)
+            return record
+
+        return self._read(customer_id)
+
+    def stale(self, customer_id: str) -> Optional[CustomerFeatures]:
+        """
+        Get a customer's last record, however old, without reading.
+
+        Args:
+            customer_id: ID of the customer
+
+        Returns:
+            The record, or None if the customer has none
+        """
+        with self._lock:
+            entry = self._entries.get(customer_id)
+        return entry[0] if entry is not None else None
+
+    def _read(self, customer_id: str) -> CustomerFeatures:
+        try:
+            record = self.read(customer_id)
+        except KeyError:
+            self._put(customer_id, None)
+            raise
+        self._put(customer_id, record)
+        return record
+
+    def _put(self, customer_id: str, record: Optional[CustomerFeatures]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[customer_id] = (record, time.monotonic())
+            self._entries.move_to_end(customer_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._counts["evictions"] += 1
+
+    def _refresh_async(self, customer_id: str) -> None:
+        if self.executor is None:
+            return
+        with self._lock:
+            if (
+                customer_id in self._refreshing
+                or len(self._refreshing) >= self.MAX_PENDING_REFRESHES
+            ):
+                return
+            self._refreshing.add(customer_id)
+        self.executor.submit(self._refresh, customer_id)
+
+    def _refresh(self, customer_id: str) -> None:
+        start = time.perf_counter()
+        try:
+            self._read(customer_id)
+            with self._lock:
+                self._counts["refreshes"] += 1
+        except KeyError:
+            # Now unknown; the negative entry is in place
+            with self._lock:
+                self._counts["refreshes"] += 1
+        except Exception as e:
+            # The record is kept and read again once it expires
+            with self._lock:
+                self._counts["refresh_errors"] += 1
+            logger.warning(
+                f"⚠️ Refreshing features of customer {customer_id[:8]} failed: "
+                f"{type(e).__name__}: {str(e)}"
+            )
+        finally:
+            self._refresh_latency.observe((time.perf_counter() - start) * 1000)
+            with self._lock:
+                self._refreshing.discard(customer_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Cache counters, refresh latency and staleness of served records.
+
+        Returns:
+            Dictionary with hit, negative hit, miss, refresh and eviction
+            counts, the hit ratio (negative hits included), the number of
+            cached and unknown customers, refresh latency percentiles in
+            milliseconds and the age of served records in seconds
+        """
+        with self._lock:
+            counts = dict(self._counts)
+            entries = len(self._entries)
+            negative = sum(record is None for record, _ in self._entries.values())
+            pending = len(self._refreshing)
+        lookups = counts["hits"] + counts["negative_hits"] + counts["misses"]
+        refresh = self._refresh_latency.snapshot()
+        staleness = self._staleness.snapshot()
+        return {
+            **counts,
+            "hit_ratio": (counts["hits"] + counts["negative_hits"]) / lookups
+            if lookups
+            else 0.0,
+            "entries": entries,
+            "negative_entries": negative,
+            "pending_refreshes": pending,
+            "refresh_latency_ms": {
+                key: refresh[key] for key in ("p50", "p95", "p99", "max")
+            },
+            "staleness_s": {
+                key: staleness[key] for key in ("p50", "p95", "p99", "max")
+            },
+        }
+
+    def close(self) -> None:
+        """Stop the refresh threads, abandoning refreshes still waiting."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
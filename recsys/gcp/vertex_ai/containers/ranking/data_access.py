@@ -0,0 +1,562 @@
+"""
+Data access of the ranking transformer.
+
+Lookups that are not served from resident snapshots go through a DataAccess:
+purchase history, customer features, article features, previous rankings and
+SQL queries for BigQuery retrieval. CloudDataAccess reads BigQuery and the
+Vertex AI Feature Store; LocalDataAccess reads Parquet files, so the service
+can run and be load-tested with no cloud access (see benchmarks/synthetic.py
+to generate a dataset and benchmarks/load.py to drive it).
+"""
+
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+import requests
+from google.cloud import bigquery
+from google.api_core.exceptions import (
+    DeadlineExceeded,
+    InternalServerError,
+    NotFound,
+    ServiceUnavailable,
+    TooManyRequests,
+)
+from google.cloud.exceptions import GoogleCloudError
+from config import (
+    ARTICLES_TABLE,
+    DATA_BACKEND,
+    FEATURE_STORE_ID,
+    LOCAL_DATA_DIR,
+    LOCATION,
+    MAX_QUERY_RETRIES,
+    QUERY_TIMEOUT_SECONDS,
+    RANKINGS_TABLE,
+    RETRIEVAL_BACKEND,
+    TRANSACTIONS_TABLE,
+)
+from logger import logger
+from clients import get_bigquery_client, init_aiplatform
+from view_sync import FeatureViewSyncScheduler
+
+# Files of a local dataset, laid out like the BigQuery tables
+ARTICLES_FILE = "articles.parquet"
+CUSTOMERS_FILE = "customers.parquet"
+TRANSACTIONS_FILE = "transactions.parquet"
+RANKINGS_FILE = "rankings.parquet"
+
+# Errors after which a BigQuery query is retried while time remains
+RETRYABLE_ERRORS = (InternalServerError, ServiceUnavailable, TooManyRequests)
+
+# Errors of a call that ran out of its timeout: gRPC deadlines of the Feature
+# Store and HTTP transport timeouts of BigQuery; raised on as TimeoutError so
+# callers degrade instead of failing the request
+TIMEOUT_ERRORS = (DeadlineExceeded, requests.exceptions.Timeout)
+
+
+class DataAccess(ABC):
+    """
+    Reads of the ranking transformer that go to a backing store.
+
+    Attributes:
+        view_sync: Feature view sync scheduler once connected, None if the
+            store has no feature views
+    """
+
+    view_sync: Optional[FeatureViewSyncScheduler] = None
+
+    def connect(self) -> None:
+        """Open per-process connections; called on a background thread."""
+
+    @abstractmethod
+    def execute_query(
+        self, query: str, query_name: str = "query", timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Run a SQL query.
+
+        Args:
+            query: The SQL query to execute
+            query_name: Name of the query for logging
+            timeout: Seconds the query may take (None: QUERY_TIMEOUT_SECONDS)
+
+        Returns:
+            Result of the query
+
+        Raises:
+            TimeoutError: If the query did not finish in time
+        """
+        pass
+
+    @abstractmethod
+    def bought_items(
+        self, customer_ids: List[str], timeout: Optional[float] = None
+    ) -> Dict[str, List[str]]:
+        """
+        Get lists of items already bought by customers.
+
+        Args:
+            customer_ids: IDs of the customers
+            timeout: Seconds the read may take (None: no limit of its own)
+
+        Returns:
+            Dictionary of customer ID to article IDs already purchased
+        """
+        pass
+
+    @abstractmethod
+    def customer_features(
+        self, customer_id: str, timeout: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Read a customer's features.
+
+        Args:
+            customer_id: ID of the customer
+            timeout: Seconds the read may take (None: no limit of its own)
+
+        Returns:
+            List of feature dictionaries with name and value
+
+        Raises:
+            KeyError: If the customer is not in the store
+            TimeoutError: If the read did not finish in time
+        """
+        pass
+
+    @abstractmethod
+    def articles_data(
+        self, articles: List[str], timeout: Optional[float] = None
+    ) -> Tuple[pd.DataFrame, np.ndarray]:
+        """
+        Get features for a list of articles.
+
+        Args:
+            articles: List of article IDs, possibly with repeats
+            timeout: Seconds the read may take (None: no limit of its own)
+
+        Returns:
+            Tuple of (DataFrame with one row per found article in input order,
+            boolean mask of the input articles that were found)
+        """
+        pass
+
+    @abstractmethod
+    def rankings_data(self, customer_id: str) -> pd.DataFrame:
+        """
+        Get previous rankings data for a customer.
+
+        Args:
+            customer_id: ID of the customer
+
+        Returns:
+            DataFrame with ranking data
+        """
+        pass
+
+
+def _expand_articles(
+    df: pd.DataFrame, articles: List[str]
+) -> Tuple[pd.DataFrame, np.ndarray]:
+    """Expand an article_id-indexed frame to one row per requested article."""
+    positions = df.index.get_indexer(articles)
+    found = positions >= 0
+    return df.iloc[positions[found]].reset_index(), found
+
+
+class CloudDataAccess(DataAccess):
+    """Reads BigQuery tables and Vertex AI Feature Store views."""
+
+    def __init__(self):
+        self.feature_store = None
+        self.view_sync = None
+
+    def connect(self) -> None:
+        """
+        Connect to the feature store and keep its views synced.
+
+        Raises:
+            Exception: If the feature store or a view cannot be opened
+        """
+        # Importing the Vertex AI SDK takes seconds, so it happens here rather
+        # than when the module is imported
+        init_aiplatform()
+        from vertexai.resources.preview.feature_store import (
+            FeatureOnlineStore,
+            FeatureView,
+        )
+
+        # Initialize feature store
+        self.feature_store = FeatureOnlineStore(name=FEATURE_STORE_ID)
+        logger.info(f"📦 Connected to feature store: {FEATURE_STORE_ID}")
+
+        # Initialize feature views
+        self.articles_view = FeatureView(
+            name="articles",
+            feature_online_store_id=self.feature_store.name,
+            location=LOCATION,
+        )
+        self.customers_view = FeatureView(
+            name="customers",
+            feature_online_store_id=self.feature_store.name,
+            location=LOCATION,
+        )
+        self.transactions_view = FeatureView(
+            name="transactions",
+            feature_online_store_id=self.feature_store.name,
+            location=LOCATION,
+        )
+        self.candidates_view = FeatureView(
+            name="candidates",
+            feature_online_store_id=self.feature_store.name,
+            location=LOCATION,
+        )
+
+        # Keep feature views synced in the background
+        view_sync = FeatureViewSyncScheduler(
+            {
+                "articles": self.articles_view,
+                "customers": self.customers_view,
+                "transactions": self.transactions_view,
+                "candidates": self.candidates_view,
+            }
+        )
+        view_sync.start()
+        self.view_sync = view_sync
+
+    def _run_query(
+        self,
+        query: str,
+        job_config: Optional[bigquery.QueryJobConfig] = None,
+        timeout: Optional[float] = None,
+    ) -> bigquery.table.RowIterator:
+        """
+        Run a query and wait for its result, retrying transient errors.
+
+        Each attempt may use the time left; BigQuery cancels the job when
+        that runs out, so an abandoned query stops using slots.
+
+        Args:
+            query: The SQL query to execute
+            job_config: Query parameters and settings
+            timeout: Seconds for all attempts (None: QUERY_TIMEOUT_SECONDS)
+
+        Returns:
+            Result of the query
+
+        Raises:
+            TimeoutError: If no attempt finished in time
+        """
+        job_config = job_config or bigquery.QueryJobConfig()
+        deadline = time.monotonic() + (
+            QUERY_TIMEOUT_SECONDS if timeout is None else timeout
+        )
+        for attempt in range(1, MAX_QUERY_RETRIES + 1):
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            job_config.job_timeout_ms = max(1, int(left * 1000))
+            try:
+                query_job = get_bigquery_client().query(
+                    query, job_config=job_config, timeout=left
+                )
+                return query_job.result(timeout=max(0.0, deadline - time.monotonic()))
+            except TIMEOUT_ERRORS as e:
+                raise TimeoutError(
+                    f"Query did not finish within {timeout}s: {type(e).__name__}"
+                ) from e
+            except RETRYABLE_ERRORS as e:
+                if attempt == MAX_QUERY_RETRIES:
+                    raise
+                logger.warning(
+                    f"⚠️ Retrying query after {type(e).__name__} "
+                    f"(attempt {attempt} of {MAX_QUERY_RETRIES})"
+                )
+        raise TimeoutError(f"Query did not finish within {timeout}s")
+
+    def execute_query(
+        self, query: str, query_name: str = "query", timeout: Optional[float] = None
+    ) -> bigquery.table.RowIterator:
+        """
+        Execute a BigQuery query safely.
+
+        Args:
+            query: The SQL query to execute
+            query_name: Name of the query for logging
+            timeout: Seconds the query may take (None: QUERY_TIMEOUT_SECONDS)
+
+        Returns:
+            Result of the query
+
+        Raises:
+            GoogleCloudError: If query execution fails
+            TimeoutError: If the query did not finish in time
+        """
+        try:
+            # Log the query (truncated for readability)
+            truncated_query = query[:300] + "..." if len(query) > 300 else query
+            logger.query(f"Executing {query_name}: {truncated_query}")
+
+            # Time the query execution
+            start_time = time.time()
+
+            # Execute the query
+            results = self._run_query(query, timeout=timeout)
+
+            # Log query completion time
+            duration = time.time() - start_time
+            row_count = (
+                results.total_rows if hasattr(results, "total_rows") else "unknown"
+            )
+            logger.info(
+                f"🔍 {query_name} completed in {duration:.3f}s, rows: {row_count}"
+            )
+
+            return results
+
+        except GoogleCloudError as e:
+            logger.error(
+                f"❌ BigQuery error executing {query_name}: {str(e)}", exc_info=True
+            )
+            raise
+        except TimeoutError:
+            logger.warning(f"⚠️ {query_name} timed out")
+            raise
+        except Exception as e:
+            logger.error(
+                f"❌ Unexpected error executing {query_name}: {str(e)}", exc_info=True
+            )
+            raise
+
+    def bought_items(
+        self, customer_ids: List[str], timeout: Optional[float] = None
+    ) -> Dict[str, List[str]]:
+        # Use parameterized query to prevent SQL injection
+        query = f"""
+            SELECT
+                customer_id,
+                article_id
+            FROM
+                {TRANSACTIONS_TABLE}
+            WHERE
+                customer_id IN UNNEST(@customer_ids)
+        """
+
+        # Set query parameters
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ArrayQueryParameter(
+                    "customer_ids", "STRING", list(dict.fromkeys(customer_ids))
+                )
+            ]
+        )
+
+        # Execute query
+        results = self._run_query(query, job_config, timeout)
+
+        # Group article IDs by customer
+        bought_items = {customer_id: [] for customer_id in customer_ids}
+        for row in results:
+            bought_items[row.customer_id].append(str(row.article_id))
+        return bought_items
+
+    def customer_features(
+        self, customer_id: str, timeout: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        self.view_sync.ensure_fresh("customers")
+        try:
+            customer_result = self.customers_view.read(
+                key=[customer_id], request_timeout=timeout
+            )
+        except NotFound:
+            raise KeyError(f"Customer {customer_id} not in the customers view")
+        except TIMEOUT_ERRORS as e:
+            raise TimeoutError(
+                f"Customer {customer_id} not read within {timeout}s: {type(e).__name__}"
+            ) from e
+        return customer_result.to_dict()["features"]
+
+    def articles_data(
+        self, articles: List[str], timeout: Optional[float] = None
+    ) -> Tuple[pd.DataFrame, np.ndarray]:
+        # Format article list for SQL IN clause
+        articles_formatted = ", ".join(
+            [f"'{article}'" for article in dict.fromkeys(articles)]
+        )
+
+        query = f"""
+            SELECT
+                *
+            FROM
+                {ARTICLES_TABLE}
+            WHERE
+                article_id IN ({articles_formatted})
+        """
+
+        # Execute query
+        results = self.execute_query(query, "articles_data", timeout)
+
+        # Convert to DataFrame
+        df = results.to_dataframe()
+        logger.info(f"📊 Retrieved features for {len(df)} articles")
+
+        df["article_id"] = df["article_id"].astype(str)
+        return _expand_articles(
+            df.drop_duplicates("article_id").set_index("article_id"), articles
+        )
+
+    def rankings_data(self, customer_id: str) -> pd.DataFrame:
+        # Use parameterized query to prevent SQL injection
+        query = f"""
+            SELECT
+                *
+            FROM
+                {RANKINGS_TABLE}
+            WHERE
+                customer_id = @customer_id
+        """
+
+        # Set query parameters
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ScalarQueryParameter("customer_id", "STRING", customer_id)
+            ]
+        )
+
+        # Execute query
+        return self._run_query(query, job_config).to_dataframe()
+
+
+def _feature_value(value: Any) -> Dict[str, Any]:
+    """Feature value in the shape returned by a feature view read."""
+    if isinstance(value, (bool, np.bool_)):
+        return {"bool_value": bool(value)}
+    if isinstance(value, (int, np.integer)):
+        return {"int64_value": int(value)}
+    if isinstance(value, (float, np.floating)):
+        return {"double_value": float(value)}
+    return {"string_value": str(value)}
+
+
+class LocalDataAccess(DataAccess):
+    """
+    Reads a local dataset of Parquet files laid out like the BigQuery tables.
+
+    The directory holds articles.parquet, customers.parquet and
+    transactions.parquet, and optionally rankings.parquet. All are loaded into
+    memory and indexed once, so lookups cost no I/O and ignore their timeout.
+    """
+
+    def __init__(self, data_dir: str = LOCAL_DATA_DIR):
+        """
+        Load and index the dataset.
+
+        Args:
+            data_dir: Directory with the Parquet files
+
+        Raises:
+            FileNotFoundError: If a required file is missing
+        """
+        self.data_dir = data_dir
+
+        articles = pd.read_parquet(os.path.join(data_dir, ARTICLES_FILE))
+        articles["article_id"] = articles["article_id"].astype(str)
+        self.articles = articles.drop_duplicates("article_id").set_index("article_id")
+
+        # Feature dictionaries are built once; a read returns the same list
+        customers = pd.read_parquet(os.path.join(data_dir, CUSTOMERS_FILE))
+        columns = customers.columns.tolist()
+        self.customers = {
+            str(row[0]): [
+                {"name": name, "value": _feature_value(value)}
+                for name, value in zip(columns, row)
+            ]
+            for row in customers.itertuples(index=False, name=None)
+        }
+
+        transactions = pd.read_parquet(
+            os.path.join(data_dir, TRANSACTIONS_FILE),
+            columns=["customer_id", "article_id"],
+        )
+        self.purchases = {
+            customer_id: group.astype(str).tolist()
+            for customer_id, group in transactions.groupby("customer_id")["article_id"]
+        }
+
+        rankings_path = os.path.join(data_dir, RANKINGS_FILE)
+        self.rankings = (
+            pd.read_parquet(rankings_path)
+            if os.path.exists(rankings_path)
+            else pd.DataFrame(columns=["customer_id"])
+        )
+
+        logger.data(
+            f"Loaded local dataset from {data_dir}: {len(self.articles)} articles, "
+            f"{len(self.customers)} customers, {len(transactions)} transactions"
+        )
+
+    def execute_query(
+        self, query: str, query_name: str = "query", timeout: Optional[float] = None
+    ) -> Any:
+        raise RuntimeError(
+            f"{query_name} needs BigQuery; use a snapshot retrieval backend with "
+            "the local data backend"
+        )
+
+    def bought_items(
+        self, customer_ids: List[str], timeout: Optional[float] = None
+    ) -> Dict[str, List[str]]:
+        return {
+            customer_id: self.purchases.get(customer_id, [])
+            for customer_id in customer_ids
+        }
+
+    def customer_features(
+        self, customer_id: str, timeout: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        features = self.customers.get(customer_id)
+        if features is None:
+            raise KeyError(f"Customer {customer_id} not in {CUSTOMERS_FILE}")
+        return features
+
+    def articles_data(
+        self, articles: List[str], timeout: Optional[float] = None
+    ) -> Tuple[pd.DataFrame, np.ndarray]:
+        return _expand_articles(self.articles, articles)
+
+    def rankings_data(self, customer_id: str) -> pd.DataFrame:
+        return self.rankings[self.rankings["customer_id"] == customer_id]
+
+
+def create_data_access(
+    backend: str = DATA_BACKEND, retrieval_backend: str = RETRIEVAL_BACKEND
+) -> DataAccess:
+    """
+    Build the data access backend selected by configuration.
+
+    Args:
+        backend: "cloud" or "local"
+        retrieval_backend: Retrieval backend the data access will serve
+
+    Returns:
+        Data access backend
+
+    Raises:
+        ValueError: If the backend is unknown, or is "local" with BigQuery
+            retrieval, which needs SQL queries the local backend cannot run
+    """
+    logger.info(f"🗄️ Using '{backend}' data backend")
+
+    if backend == "cloud":
+        return CloudDataAccess()
+    if backend == "local":
+        if retrieval_backend == "bigquery":
+            raise ValueError(
+                "RETRIEVAL_BACKEND=bigquery needs DATA_BACKEND=cloud; with "
+                "DATA_BACKEND=local set RETRIEVAL_BACKEND to exact or ivfpq"
+            )
+        return LocalDataAccess()
+
+    raise ValueError(f"Unknown data backend: {backend}")
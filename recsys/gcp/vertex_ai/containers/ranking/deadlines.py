@@ -0,0 +1,244 @@
+"""
+Request deadlines, hedged backend reads and degradation counts.
+
+A /predict request gets a latency budget when it starts. The deadline is kept
+in a context variable, so it follows the request into executor threads that
+run in a copy of its context (see metrics.run_in_context). Each backend read
+may use a configured fraction of the budget left when it starts.
+
+Idempotent reads go through a Hedger: a read still running at the configured
+percentile of its recent latency gets a duplicate, and the first result wins.
+A read that runs out of time raises TimeoutError, and the caller degrades the
+request in a fixed way, e.g. by skipping the purchase filter. Degradations are
+counted per process and listed per request.
+"""
+
+import time
+import threading
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+from config import (
+    HEDGE_MAX_RATIO,
+    HEDGE_MAX_WORKERS,
+    HEDGE_MIN_DELAY_MS,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_PERCENTILE,
+    HEDGE_READS,
+    STAGE_BUDGET_FRACTIONS,
+)
+from logger import logger
+from metrics import Histogram, STAGE_LATENCY_BUCKETS_MS, run_in_context
+
+# Monotonic time the current request must finish by
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "deadline", default=None
+)
+# Degradations applied to the current request
+_request_degradations: contextvars.ContextVar[Optional[List[str]]] = (
+    contextvars.ContextVar("request_degradations", default=None)
+)
+
+
+def begin_deadline(budget_seconds: Optional[float]) -> None:
+    """
+    Start the deadline of a new request in the current context.
+
+    Args:
+        budget_seconds: Latency budget of the request (None or <= 0: none)
+    """
+    _deadline.set(
+        time.monotonic() + budget_seconds
+        if budget_seconds is not None and budget_seconds > 0
+        else None
+    )
+    _request_degradations.set([])
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current request's deadline, None without one."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def stage_timeout(stage: str) -> Optional[float]:
+    """
+    Time a backend read of a stage may take, carved out of the remaining budget.
+
+    Args:
+        stage: Stage name, a key of STAGE_BUDGET_FRACTIONS
+
+    Returns:
+        Seconds, or None if the request has no deadline
+    """
+    left = remaining()
+    if left is None:
+        return None
+    return left * STAGE_BUDGET_FRACTIONS.get(stage, 1.0)
+
+
+class Degradations:
+    """Counts of the ways requests were degraded, per process."""
+
+    def __init__(self):
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, reason: str) -> None:
+        """
+        Count a degradation and add it to the current request's.
+
+        Args:
+            kind: What was degraded, e.g. "purchase_filter_skipped"
+            reason: Why, for the log
+        """
+        with self._lock:
+            self._counts[kind] = self._counts.get(kind, 0) + 1
+        degradations = _request_degradations.get()
+        if degradations is not None and kind not in degradations:
+            degradations.append(kind)
+        logger.warning(f"⚠️ Degraded request: {kind} ({reason})")
+
+    def snapshot(self) -> Dict[str, int]:
+        """Counts per kind of degradation."""
+        with self._lock:
+            return dict(self._counts)
+
+
+degradations = Degradations()
+
+
+def request_degradations() -> List[str]:
+    """Degradations applied to the current request, in order."""
+    return list(_request_degradations.get() or [])
+
+
+class Hedger:
+    """
+    Runs idempotent reads with a timeout, sending a duplicate of slow ones.
+
+    Reads are timed per name. Once a name has HEDGE_MIN_SAMPLES reads and its
+    HEDGE_PERCENTILE latency is at least HEDGE_MIN_DELAY_MS, its reads run on
+    the hedge pool: one still running after that delay gets a duplicate, as
+    long as hedges stay below HEDGE_MAX_RATIO of the reads. Faster reads, such
+    as in-memory lookups, run inline and rely on the backend's own timeout.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = HEDGE_READS,
+        max_workers: int = HEDGE_MAX_WORKERS,
+    ):
+        """
+        Args:
+            enabled: Send hedges; reads are timed and time out either way
+            max_workers: Threads of the hedge pool
+        """
+        self.enabled = enabled
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="hedge"
+        )
+        self._latency: Dict[str, Histogram] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, name: str):
+        with self._lock:
+            if name not in self._latency:
+                self._latency[name] = Histogram(STAGE_LATENCY_BUCKETS_MS)
+                self._counts[name] = {"reads": 0, "hedged": 0, "hedge_wins": 0}
+            return self._latency[name], self._counts[name]
+
+    def _hedge_delay(self, latency: Histogram) -> Optional[float]:
+        if latency.count < HEDGE_MIN_SAMPLES:
+            return None
+        delay_ms = latency.percentile(HEDGE_PERCENTILE)
+        return delay_ms / 1000 if delay_ms >= HEDGE_MIN_DELAY_MS else None
+
+    @staticmethod
+    def _timed(latency: Histogram, fn: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            latency.observe((time.perf_counter() - start) * 1000)
+
+    def call(
+        self, name: str, fn: Callable[[], Any], timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Run a read, hedging it if it is slow.
+
+        Args:
+            name: Name the read's latency is tracked under
+            fn: Zero-argument read, safe to run twice
+            timeout: Seconds to wait for a result (None: no limit)
+
+        Returns:
+            Result of the first read to succeed
+
+        Raises:
+            TimeoutError: If no read succeeded within the timeout
+            Exception: Whatever the reads raised, if all of them failed
+        """
+        latency, counts = self._stats(name)
+        with self._lock:
+            counts["reads"] += 1
+
+        delay = self._hedge_delay(latency)
+        if delay is None:
+            return self._timed(latency, fn)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        primary = run_in_context(self.executor, self._timed, latency, fn)
+        done, _ = wait(
+            [primary], timeout=delay if timeout is None else min(delay, timeout)
+        )
+        pending = {primary}
+        if not done and self.enabled:
+            with self._lock:
+                may_hedge = counts["hedged"] < HEDGE_MAX_RATIO * counts["reads"]
+                if may_hedge:
+                    counts["hedged"] += 1
+            if may_hedge:
+                pending.add(run_in_context(self.executor, self._timed, latency, fn))
+
+        error: Optional[BaseException] = None
+        while pending:
+            left = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"{name} read timed out after {timeout:.3f}s")
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        with self._lock:
+                            counts["hedge_wins"] += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Reads, hedges and latency per read name.
+
+        Returns:
+            Dictionary of name to counts and the hedge delay in milliseconds
+            (None while reads run inline)
+        """
+        with self._lock:
+            items = [(name, dict(self._counts[name])) for name in self._counts]
+        stats = {}
+        for name, counts in items:
+            delay = self._hedge_delay(self._latency[name])
+            stats[name] = {
+                **counts,
+                "hedge_delay_ms": round(delay * 1000, 3) if delay else None,
+            }
+        return stats
+
+    def close(self) -> None:
+        """Stop the hedge pool, abandoning reads still running."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,156 @@
+"""
+Pre-encoded article feature matrix for the ranking model.
+
+The article table is encoded once into a float32 matrix with one row per
+article and one column per model feature, in RANKING_MODEL_FEATURES order.
+Categorical columns hold the codes the model was trained with, and the
+per-request customer and time columns are left as slots. Building a request's
+model input is then one row gather into a reusable buffer plus filling the
+slots, with no pandas calls.
+"""
+
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterable, List, Optional
+from article_store import ArticleTable
+from categorical_encoder import CategoricalEncoder
+from logger import logger
+
+# Model features set per request rather than per article
+REQUEST_FEATURES = ("age", "month_sin", "month_cos")
+
+# Model features read from a differently named article column
+SOURCE_COLUMNS = {"colour_group_name_right": "colour_group_name"}
+
+
+class ArticleFeatureMatrix:
+    """
+    Model-ready float32 features of every article in an ArticleTable.
+
+    Attributes:
+        table: Article table the matrix was built from, used for ID lookups
+        encoder: Categorical encoder the matrix was encoded with
+        feature_names: Model feature names, one per matrix column
+        matrix: float32 array of shape (n_articles, n_features)
+    """
+
+    def __init__(
+        self,
+        table: ArticleTable,
+        feature_names: List[str],
+        encoder: Optional[CategoricalEncoder] = None,
+        request_features: Iterable[str] = REQUEST_FEATURES,
+    ):
+        """
+        Encode the article table.
+
+        Args:
+            table: Article table to encode
+            feature_names: Model feature names in model input order
+            encoder: Training-time categorical encoder; without one, columns
+                keep the table's dictionary codes
+            request_features: Features filled per request by fill()
+        """
+        self.table = table
+        self.encoder = encoder
+        self.feature_names = list(feature_names)
+        self._request_columns = {
+            name: self.feature_names.index(name)
+            for name in request_features
+            if name in self.feature_names
+        }
+
+        self.matrix = np.zeros((len(table), len(self.feature_names)), dtype=np.float32)
+        for col, feature in enumerate(self.feature_names):
+            if feature in self._request_columns:
+                continue
+            column = self._encode_column(feature, encoder)
+            if column is None:
+                logger.warning(f"⚠️ Adding missing feature {feature} with zeros")
+            else:
+                self.matrix[:, col] = column
+
+        # Gather buffers are reused by the requests of each thread
+        self._local = threading.local()
+
+        logger.data(
+            f"Encoded {len(table)} articles into a "
+            f"{self.matrix.shape[0]}x{self.matrix.shape[1]} feature matrix"
+        )
+
+    def _encode_column(
+        self, feature: str, encoder: Optional[CategoricalEncoder]
+    ) -> Optional[np.ndarray]:
+        source = SOURCE_COLUMNS.get(feature, feature)
+        if feature not in self.table.columns and source in self.table.columns:
+            logger.info(f"🎨 Using {source} for {feature}")
+        else:
+            source = feature
+
+        if source in self.table.values:
+            return self.table.values[source]
+        if source not in self.table.codes:
+            return None
+
+        # Translate the table's codes to the model's codes once per vocabulary
+        vocabulary = self.table.vocabularies[source]
+        if encoder is not None and feature in encoder.vocabularies:
+            translation = encoder.encode(feature, pd.Series(vocabulary, dtype=object))
+            unknown_code = encoder.unknown_code
+        else:
+            translation = np.arange(len(vocabulary), dtype=np.int32)
+            unknown_code = -1
+        # Missing values have code -1, which selects the last entry
+        translation = np.append(translation, unknown_code)
+        return translation[self.table.codes[source]]
+
+    def gather(self, indices: np.ndarray) -> np.ndarray:
+        """
+        Gather the feature rows of articles into this thread's buffer.
+
+        The returned array is a view of a buffer that is reused by the next
+        gather on the same thread, so it must be consumed before then.
+
+        Args:
+            indices: Dense article indices from table.lookup(), all found
+
+        Returns:
+            float32 array of shape (len(indices), n_features)
+        """
+        out = self._buffer(len(indices))
+        np.take(self.matrix, indices, axis=0, out=out, mode="clip")
+        return out
+
+    def fill(
+        self,
+        features: np.ndarray,
+        groups: np.ndarray,
+        values: Dict[str, np.ndarray],
+    ) -> np.ndarray:
+        """
+        Broadcast per-request features into their columns in place.
+
+        Args:
+            features: Rows returned by gather()
+            groups: Instance index of each row
+            values: Per-instance values of each request feature
+
+        Returns:
+            The filled features
+        """
+        for name, col in self._request_columns.items():
+            instance_values = np.asarray(values[name], dtype=np.float32)
+            if len(instance_values) == 1:
+                features[:, col] = instance_values[0]
+            else:
+                np.take(instance_values, groups, out=features[:, col], mode="clip")
+        return features
+
+    def _buffer(self, n_rows: int) -> np.ndarray:
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or len(buffer) < n_rows:
+            capacity = max(n_rows, 2 * len(buffer) if buffer is not None else 0)
+            buffer = np.empty((capacity, len(self.feature_names)), dtype=np.float32)
+            self._local.buffer = buffer
+        return buffer[:n_rows]
@@ -0,0 +1,218 @@
+"""
+Pure-NumPy evaluation of an XGBoost tree ensemble.
+
+The booster's trees are compiled into flat node arrays in which the children
+of a node are adjacent, so a node's next node is its left child plus one when
+the row goes right. Prediction walks all rows through all trees together, one
+tree level per step, with leaves pointing to themselves so rows that reach a
+leaf early stay there.
+"""
+
+import json
+import numpy as np
+import xgboost as xgb
+from collections import deque
+from typing import Callable, Dict, List, Tuple
+
+
+def _sigmoid(margin: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-margin))
+
+
+def _identity(margin: np.ndarray) -> np.ndarray:
+    return margin
+
+
+def _logit(probability: float) -> float:
+    return float(np.log(probability / (1.0 - probability)))
+
+
+# Objective -> (base_score to margin, margin to prediction)
+OBJECTIVES: Dict[str, Tuple[Callable, Callable]] = {
+    "binary:logistic": (_logit, _sigmoid),
+    "reg:logistic": (_logit, _sigmoid),
+    "binary:logitraw": (float, _identity),
+    "reg:squarederror": (float, _identity),
+    "rank:pairwise": (float, _identity),
+    "rank:ndcg": (float, _identity),
+    "rank:map": (float, _identity),
+}
+
+
+class CompiledForest:
+    """
+    Flat-array form of a gbtree booster with a single output.
+
+    Attributes:
+        roots: Root node of each tree
+        left: Left child of each node, with the right child next to it;
+            leaves point to themselves
+        feature: Split feature of each node
+        threshold: Split threshold of each node; rows go left below it
+        default_left: Whether rows with a missing value go left
+        leaf_value: Leaf value of each node, 0 for inner nodes
+        depth: Splits on the longest root-to-leaf path of any tree
+        base_margin: Margin every prediction starts from
+    """
+
+    def __init__(
+        self,
+        roots: np.ndarray,
+        left: np.ndarray,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        default_left: np.ndarray,
+        leaf_value: np.ndarray,
+        depth: int,
+        base_margin: float,
+        transform: Callable[[np.ndarray], np.ndarray],
+    ):
+        self.roots = roots
+        self.left = left
+        self.feature = feature
+        self.threshold = threshold
+        self.default_left = default_left
+        self.leaf_value = leaf_value
+        self.depth = depth
+        self.base_margin = np.float32(base_margin)
+        self._transform = transform
+
+    @property
+    def n_trees(self) -> int:
+        """Number of trees."""
+        return len(self.roots)
+
+    @classmethod
+    def from_booster(cls, booster: xgb.Booster) -> "CompiledForest":
+        """
+        Compile a booster's trees.
+
+        Args:
+            booster: Trained gbtree booster with numerical splits
+
+        Returns:
+            Compiled forest
+
+        Raises:
+            ValueError: If the booster uses a feature this evaluator lacks
+        """
+        learner = json.loads(booster.save_raw(raw_format="json"))["learner"]
+
+        booster_name = learner["gradient_booster"]["name"]
+        if booster_name != "gbtree":
+            raise ValueError(f"Unsupported booster: {booster_name}")
+        objective = learner["objective"]["name"]
+        if objective not in OBJECTIVES:
+            raise ValueError(f"Unsupported objective: {objective}")
+        model_param = learner["learner_model_param"]
+        if int(model_param.get("num_class", "0")) > 1 or (
+            int(model_param.get("num_target", "1")) > 1
+        ):
+            raise ValueError("Only single-output models are supported")
+
+        to_margin, transform = OBJECTIVES[objective]
+        base_score = float(model_param["base_score"].strip("[]"))
+
+        roots: List[int] = []
+        left: List[int] = []
+        feature: List[int] = []
+        threshold: List[float] = []
+        default_left: List[bool] = []
+        leaf_value: List[float] = []
+        depth = 0
+
+        for tree in learner["gradient_booster"]["model"]["trees"]:
+            if any(tree["split_type"]):
+                raise ValueError("Categorical splits are not supported")
+            tree_left = tree["left_children"]
+            tree_right = tree["right_children"]
+
+            # Breadth-first relabeling, allocating the two children together
+            root = len(left)
+            roots.append(root)
+            new_ids = {0: root}
+            queue = deque([(0, 1)])
+            _append_node(left, feature, threshold, default_left, leaf_value)
+            while queue:
+                node, level = queue.popleft()
+                new_id = new_ids[node]
+                depth = max(depth, level)
+                if tree_left[node] == -1:
+                    # Every value, missing or not, goes left back to the leaf
+                    left[new_id] = new_id
+                    threshold[new_id] = np.inf
+                    default_left[new_id] = True
+                    leaf_value[new_id] = tree["split_conditions"][node]
+                    continue
+
+                left[new_id] = len(left)
+                feature[new_id] = tree["split_indices"][node]
+                threshold[new_id] = tree["split_conditions"][node]
+                default_left[new_id] = bool(tree["default_left"][node])
+                for child in (tree_left[node], tree_right[node]):
+                    new_ids[child] = len(left)
+                    _append_node(left, feature, threshold, default_left, leaf_value)
+                    queue.append((child, level + 1))
+
+        return cls(
+            roots=np.asarray(roots, dtype=np.int32),
+            left=np.asarray(left, dtype=np.int32),
+            feature=np.asarray(feature, dtype=np.int32),
+            threshold=np.asarray(threshold, dtype=np.float32),
+            default_left=np.asarray(default_left, dtype=bool),
+            leaf_value=np.asarray(leaf_value, dtype=np.float32),
+            # The last level holds only leaves and needs no step
+            depth=depth - 1,
+            base_margin=to_margin(base_score),
+            transform=transform,
+        )
+
+    def predict_margin(self, features: np.ndarray) -> np.ndarray:
+        """
+        Sum the leaf values reached by each row, plus the base margin.
+
+        Args:
+            features: float32 matrix of shape (n_rows, n_features), NaN for
+                missing values
+
+        Returns:
+            float32 margin per row
+        """
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        n_rows, n_features = features.shape
+        flat_features = features.ravel()
+        row_offsets = (np.arange(n_rows, dtype=np.int32) * n_features)[:, None]
+        has_missing = bool(np.isnan(flat_features).any())
+
+        nodes = np.broadcast_to(self.roots, (n_rows, self.n_trees)).copy()
+        for _ in range(self.depth):
+            values = flat_features.take(row_offsets + self.feature.take(nodes))
+            go_left = values < self.threshold.take(nodes)
+            if has_missing:
+                # NaN fails the comparison; those rows follow the default branch
+                go_left |= np.isnan(values) & self.default_left.take(nodes)
+            nodes = self.left.take(nodes) + ~go_left
+
+        return (
+            self.leaf_value.take(nodes).sum(axis=1, dtype=np.float32) + self.base_margin
+        )
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """
+        Score rows as Booster.predict does.
+
+        Args:
+            features: float32 matrix of shape (n_rows, n_features)
+
+        Returns:
+            float32 prediction per row
+        """
+        return self._transform(self.predict_margin(features)).astype(np.float32)
+
+
+def _append_node(left, feature, threshold, default_left, leaf_value) -> None:
+    left.append(0)
+    feature.append(0)
+    threshold.append(0.0)
+    default_left.append(False)
+    leaf_value.append(0.0)
@@ -0,0 +1,489 @@
+"""
+IVF-PQ approximate nearest neighbour index for candidate retrieval.
+
+Candidates are assigned to coarse k-means lists, and their residuals to the
+list centroid are compressed with product quantization (one uint8 code per
+sub-vector). Queries scan only the `nprobe` best lists and score candidates by
+inner product using a per-query lookup table. Excluded candidates are dropped
+while scanning; when the scanned lists leave fewer than k candidates, the query
+is scanned again with twice as many lists, a bounded number of times.
+
+Build an index from a candidate snapshot (from the container directory):
+    python ivfpq.py --snapshot /app/snapshots/candidates --output index.npz
+"""
+
+import argparse
+import numpy as np
+from typing import Iterable, List, Optional, Sequence, Tuple
+from config import IVFPQ_INDEX_PATH, IVFPQ_MAX_PROBE_RETRIES, IVFPQ_NPROBE
+from logger import logger
+from retrieval import ArticleIdIndex, load_candidates_snapshot, top_k, top_k_rows
+
+# Rows per chunk when computing distances to centroids
+_CHUNK_SIZE = 16_384
+
+# Codewords per PQ sub-vector codebook, the most a uint8 code can address
+_MAX_CODEWORDS = 256
+
+
+def _nearest_centroid(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Assign each row of x to its nearest centroid by squared L2 distance."""
+    centroid_norms = (centroids**2).sum(axis=1)
+    assignments = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), _CHUNK_SIZE):
+        chunk = x[start : start + _CHUNK_SIZE]
+        # ||x||^2 is constant per row and does not change the argmin
+        distances = centroid_norms[None, :] - 2.0 * (chunk @ centroids.T)
+        assignments[start : start + _CHUNK_SIZE] = distances.argmin(axis=1)
+    return assignments
+
+
+def _kmeans(x: np.ndarray, k: int, n_iter: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Train k-means centroids with Lloyd's algorithm.
+
+    Args:
+        x: Training vectors of shape (n, d)
+        k: Number of centroids
+        n_iter: Number of iterations
+        rng: Random generator used for initialization
+
+    Returns:
+        float32 centroids of shape (k, d)
+    """
+    if len(x) < k:
+        raise ValueError(f"Need at least {k} training vectors, got {len(x)}")
+
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = _nearest_centroid(x, centroids)
+        counts = np.bincount(assignments, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, x)
+
+        non_empty = counts > 0
+        centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+
+        # Re-seed empty clusters with random training vectors
+        n_empty = int((~non_empty).sum())
+        if n_empty:
+            centroids[~non_empty] = x[rng.choice(len(x), size=n_empty)]
+
+    return centroids.astype(np.float32)
+
+
+class IVFPQIndex:
+    """
+    Inverted-file index with product-quantized residuals.
+
+    Attributes:
+        centroids: Coarse centroids of shape (n_lists, dim)
+        codebooks: PQ codebooks of shape (n_subquantizers, n_codewords,
+            dim / n_subquantizers), with at most 256 codewords
+        codes: PQ codes of shape (n_articles, n_subquantizers), grouped by list
+        ids: Dense candidate index of each code row
+        list_offsets: Start of each inverted list in codes, length n_lists + 1
+        article_ids: Article IDs indexed by dense candidate index
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        codebooks: np.ndarray,
+        codes: np.ndarray,
+        ids: np.ndarray,
+        list_offsets: np.ndarray,
+        article_ids: np.ndarray,
+        nprobe: int = IVFPQ_NPROBE,
+        max_probe_retries: int = IVFPQ_MAX_PROBE_RETRIES,
+    ):
+        self.centroids = centroids
+        self.codebooks = codebooks
+        self.codes = codes
+        self.ids = ids
+        self.list_offsets = list_offsets
+        self.article_ids = article_ids
+        self.nprobe = nprobe
+        self.max_probe_retries = max_probe_retries
+        self.id_index = ArticleIdIndex(article_ids)
+
+        self._sub_dim = codebooks.shape[2]
+        self._subquantizer_range = np.arange(codebooks.shape[0])
+
+    @property
+    def dim(self) -> int:
+        """Dimension of the indexed embeddings."""
+        return self.centroids.shape[1]
+
+    @property
+    def n_lists(self) -> int:
+        """Number of inverted lists."""
+        return len(self.centroids)
+
+    def __len__(self) -> int:
+        return len(self.article_ids)
+
+    @classmethod
+    def build(
+        cls,
+        article_ids: np.ndarray,
+        embeddings: np.ndarray,
+        n_lists: Optional[int] = None,
+        n_subquantizers: int = 8,
+        n_iter: int = 20,
+        max_training_vectors: int = 100_000,
+        seed: int = 27,
+    ) -> "IVFPQIndex":
+        """
+        Train coarse centroids and PQ codebooks, then encode all candidates.
+
+        Args:
+            article_ids: Article IDs, one per embedding row
+            embeddings: Candidate embeddings of shape (n_articles, dim)
+            n_lists: Number of inverted lists (default: 4 * sqrt(n_articles))
+            n_subquantizers: Number of PQ sub-vectors; must divide dim
+            n_iter: k-means iterations
+            max_training_vectors: Sample size used for training
+            seed: Random seed
+
+        Returns:
+            Trained and populated index
+        """
+        x = np.ascontiguousarray(embeddings, dtype=np.float32)
+        n, dim = x.shape
+        if dim % n_subquantizers != 0:
+            raise ValueError(
+                f"Embedding dim {dim} is not divisible by {n_subquantizers} subquantizers"
+            )
+        if n_lists is None:
+            n_lists = max(1, min(n // 39, int(4 * np.sqrt(n))))
+
+        rng = np.random.default_rng(seed)
+        train = x[rng.choice(n, size=min(n, max_training_vectors), replace=False)]
+
+        # Small catalogs cannot train a full codebook
+        n_codewords = min(_MAX_CODEWORDS, len(train))
+        if n_codewords < _MAX_CODEWORDS:
+            logger.warning(
+                f"⚠️ Only {len(train)} training vectors, using {n_codewords} "
+                f"PQ codewords instead of {_MAX_CODEWORDS}"
+            )
+
+        logger.timer_start("ivfpq_build")
+        logger.info(
+            f"🏗️ Building IVF-PQ index: {n} vectors, {n_lists} lists, "
+            f"{n_subquantizers} subquantizers"
+        )
+
+        # Coarse quantizer
+        centroids = _kmeans(train, n_lists, n_iter, rng)
+
+        # Product quantizer trained on residuals to the coarse centroid
+        sub_dim = dim // n_subquantizers
+        train_residuals = train - centroids[_nearest_centroid(train, centroids)]
+        codebooks = np.stack(
+            [
+                _kmeans(
+                    np.ascontiguousarray(
+                        train_residuals[:, j * sub_dim : (j + 1) * sub_dim]
+                    ),
+                    n_codewords,
+                    n_iter,
+                    rng,
+                )
+                for j in range(n_subquantizers)
+            ]
+        )
+
+        # Encode all candidates
+        assignments = _nearest_centroid(x, centroids)
+        residuals = x - centroids[assignments]
+        codes = np.empty((n, n_subquantizers), dtype=np.uint8)
+        for j in range(n_subquantizers):
+            codes[:, j] = _nearest_centroid(
+                np.ascontiguousarray(residuals[:, j * sub_dim : (j + 1) * sub_dim]),
+                codebooks[j],
+            )
+
+        # Group codes by inverted list
+        order = np.argsort(assignments, kind="stable")
+        list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=n_lists), out=list_offsets[1:])
+
+        logger.timer_end("ivfpq_build")
+
+        return cls(
+            centroids=centroids,
+            codebooks=codebooks,
+            codes=np.ascontiguousarray(codes[order]),
+            ids=order.astype(np.int32),
+            list_offsets=list_offsets,
+            article_ids=np.asarray(article_ids, dtype=str),
+        )
+
+    def save(self, path: str) -> str:
+        """
+        Persist the index to a single .npz file.
+
+        Args:
+            path: Output file path
+
+        Returns:
+            Path the index was written to
+        """
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                codebooks=self.codebooks,
+                codes=self.codes,
+                ids=self.ids,
+                list_offsets=self.list_offsets,
+                article_ids=self.article_ids,
+            )
+        logger.info(f"💾 Saved IVF-PQ index with {len(self)} vectors to {path}")
+        return path
+
+    @classmethod
+    def load(cls, path: str = IVFPQ_INDEX_PATH, nprobe: int = IVFPQ_NPROBE):
+        """
+        Load an index written by save().
+
+        Args:
+            path: Index file path
+            nprobe: Default number of lists scanned per query
+
+        Returns:
+            Loaded index
+        """
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(
+                centroids=data["centroids"],
+                codebooks=data["codebooks"],
+                codes=data["codes"],
+                ids=data["ids"],
+                list_offsets=data["list_offsets"],
+                article_ids=data["article_ids"],
+                nprobe=nprobe,
+            )
+        logger.data(
+            f"Loaded IVF-PQ index: {len(index)} vectors, {index.n_lists} lists, "
+            f"nprobe={nprobe}"
+        )
+        return index
+
+    def search(
+        self,
+        query_embedding,
+        k: int,
+        nprobe: Optional[int] = None,
+        exclude: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k inner product search.
+
+        Args:
+            query_embedding: Query vector of length dim
+            k: Number of candidates to return
+            nprobe: Number of inverted lists to scan (default: self.nprobe)
+            exclude: Dense candidate indices that must not be returned
+
+        Returns:
+            Tuple of (dense candidate indices, approximate scores), best first
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if query.shape != (self.dim,):
+            raise ValueError(
+                f"Query embedding must have shape ({self.dim},), got {query.shape}"
+            )
+
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+
+        # Select the lists whose centroids score highest
+        coarse_scores = self.centroids @ query
+        lists, _ = top_k(coarse_scores, nprobe)
+
+        # Inner product of each sub-vector of the query with every codeword
+        lut = np.einsum(
+            "mcs,ms->mc",
+            self.codebooks,
+            query.reshape(-1, self._sub_dim),
+        )
+
+        return self._probe(lists, coarse_scores, lut, k, exclude)
+
+    def search_batch(
+        self,
+        query_embeddings,
+        k: int,
+        nprobe: Optional[int] = None,
+        exclude: Optional[Sequence[np.ndarray]] = None,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Approximate top-k inner product search for a batch of queries.
+
+        Coarse scores and lookup tables for all queries are computed with
+        matrix products; the inverted lists are then scanned per query.
+
+        Args:
+            query_embeddings: Query vectors of shape (n_queries, dim)
+            k: Number of candidates to return per query
+            nprobe: Number of inverted lists to scan (default: self.nprobe)
+            exclude: Dense candidate indices that must not be returned, one
+                array per query
+
+        Returns:
+            List of (dense candidate indices, approximate scores), one per query
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim != 2 or queries.shape[1] != self.dim:
+            raise ValueError(
+                f"Query embeddings must have shape (n, {self.dim}), got {queries.shape}"
+            )
+
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        if exclude is None:
+            exclude = [None] * len(queries)
+
+        coarse_scores = queries @ self.centroids.T
+        all_lists, _ = top_k_rows(coarse_scores, nprobe)
+        luts = np.einsum(
+            "mcs,nms->nmc",
+            self.codebooks,
+            queries.reshape(len(queries), -1, self._sub_dim),
+        )
+
+        return [
+            self._probe(lists, query_coarse_scores, lut, k, excluded)
+            for lists, query_coarse_scores, lut, excluded in zip(
+                all_lists, coarse_scores, luts, exclude
+            )
+        ]
+
+    def _probe(
+        self,
+        lists: np.ndarray,
+        coarse_scores: np.ndarray,
+        lut: np.ndarray,
+        k: int,
+        exclude: Optional[np.ndarray],
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Scan the selected lists for one query, doubling the number of lists
+        while fewer than k candidates are found, at most max_probe_retries
+        times.
+        """
+        if exclude is not None and len(exclude):
+            excluded = np.zeros(len(self), dtype=bool)
+            excluded[exclude] = True
+        else:
+            excluded = None
+
+        indices, scores = self._scan(lists, coarse_scores, lut, k, excluded)
+        for _ in range(self.max_probe_retries):
+            if len(indices) >= k or len(lists) >= self.n_lists:
+                break
+            lists, _ = top_k(coarse_scores, min(2 * len(lists), self.n_lists))
+            indices, scores = self._scan(lists, coarse_scores, lut, k, excluded)
+        return indices, scores
+
+    def _scan(
+        self,
+        lists: np.ndarray,
+        coarse_scores: np.ndarray,
+        lut: np.ndarray,
+        k: int,
+        excluded: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Score the codes of the selected lists for one query and keep the top-k."""
+        starts = self.list_offsets[lists]
+        ends = self.list_offsets[lists + 1]
+        rows = np.concatenate(
+            [np.arange(start, end) for start, end in zip(starts, ends)]
+        )
+        list_scores = np.repeat(coarse_scores[lists], ends - starts)
+        if excluded is not None:
+            # Drop excluded candidates before scoring so the top-k skips them
+            keep = ~excluded[self.ids[rows]]
+            rows, list_scores = rows[keep], list_scores[keep]
+        if len(rows) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # score(q, x) ~= q . centroid + q . decoded residual
+        scores = list_scores + lut[self._subquantizer_range, self.codes[rows]].sum(
+            axis=1
+        )
+
+        best, best_scores = top_k(scores, k)
+        return self.ids[rows[best]].astype(np.int64), best_scores
+
+    def find_similar_items(
+        self,
+        query_embedding: List[float],
+        k: int,
+        exclude: Optional[Iterable[str]] = None,
+    ) -> List[str]:
+        """
+        Find the article IDs of the approximate top-k candidates.
+
+        Args:
+            query_embedding: Vector embedding for similarity search
+            k: Number of similar items to return
+            exclude: Article IDs that must not be returned
+
+        Returns:
+            List of article IDs similar to the query
+        """
+        if exclude is not None:
+            exclude = self.id_index.dense_indices(exclude)
+        indices, _ = self.search(query_embedding, k, exclude=exclude)
+        return self.article_ids[indices].tolist()
+
+    def find_similar_items_batch(
+        self,
+        query_embeddings: List[List[float]],
+        k: int,
+        exclude: Optional[Sequence[Iterable[str]]] = None,
+    ) -> List[List[str]]:
+        """
+        Find the article IDs of the approximate top-k candidates per query.
+
+        Args:
+            query_embeddings: Vector embeddings for similarity search
+            k: Number of similar items to return per query
+            exclude: Article IDs that must not be returned, one collection
+                per query
+
+        Returns:
+            List of article ID lists, one per query
+        """
+        if exclude is not None:
+            exclude = [self.id_index.dense_indices(ids) for ids in exclude]
+        return [
+            self.article_ids[indices].tolist()
+            for indices, _ in self.search_batch(query_embeddings, k, exclude=exclude)
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build an IVF-PQ candidate index")
+    parser.add_argument("--snapshot", required=True, help="Candidate snapshot dir")
+    parser.add_argument("--output", default=IVFPQ_INDEX_PATH)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--subquantizers", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    article_ids, embeddings = load_candidates_snapshot(args.snapshot)
+    index = IVFPQIndex.build(
+        article_ids,
+        embeddings,
+        n_lists=args.lists,
+        n_subquantizers=args.subquantizers,
+        n_iter=args.iterations,
+    )
+    index.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
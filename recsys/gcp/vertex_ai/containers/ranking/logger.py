@@ -1,12 +1,32 @@
 """
 Custom logger configuration for ranking container.
+
+Records go to stdout with the pretty formatter by default. For production,
+LOG_FORMAT=json emits one compact JSON object per record, LOG_ASYNC=true moves
+formatting and writing to a background thread behind a bounded queue, and
+LOG_SAMPLE_RATES keeps only a fraction of the records of chatty categories.
 """
 
-import logging
+import os
 import sys
+import json
+import atexit
 import time
 import uuid
-from typing import Optional
+import queue
+import random
+import logging
+import threading
+import contextvars
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+from config import (
+    LOG_ASYNC,
+    LOG_FORMAT,
+    LOG_LEVEL_INT,
+    LOG_QUEUE_SIZE,
+    LOG_SAMPLE_RATES,
+)
 
 # Emoji mapping for log levels
 EMOJI_MAP = {
@@ -34,32 +54,57 @@ COLORS = {
 }
 
 
-class RequestContext:
-    """Thread-local storage for request-specific data."""
+# Request data is kept in context variables, so each thread and asyncio task
+# sees its own request
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "request_id", default=None
+)
+_start_time: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "request_start_time", default=None
+)
+_timers: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "timers", default=None
+)
 
-    _request_id = None
-    _start_time = None
+
+class RequestContext:
+    """Context-local storage for request-specific data."""
 
     @classmethod
     def set_request_id(cls, request_id: Optional[str] = None):
-        """Set request ID for the current thread."""
-        cls._request_id = request_id or str(uuid.uuid4())
-        cls._start_time = time.time()
-        return cls._request_id
+        """Set request ID for the current context."""
+        request_id = request_id or str(uuid.uuid4())
+        _request_id.set(request_id)
+        _start_time.set(time.time())
+        _timers.set({})
+        return request_id
 
     @classmethod
     def get_request_id(cls):
-        """Get request ID for the current thread."""
-        if cls._request_id is None:
-            cls.set_request_id()
-        return cls._request_id
+        """Get request ID for the current context."""
+        request_id = _request_id.get()
+        if request_id is None:
+            # Name the context without resetting timers already running in it
+            request_id = str(uuid.uuid4())
+            _request_id.set(request_id)
+        return request_id
 
     @classmethod
     def get_elapsed_time(cls):
         """Get elapsed time since the request started."""
-        if cls._start_time is None:
+        start_time = _start_time.get()
+        if start_time is None:
             return 0
-        return time.time() - cls._start_time
+        return time.time() - start_time
+
+    @classmethod
+    def get_timers(cls) -> Dict[str, float]:
+        """Get the start times of the timers running in the current context."""
+        timers = _timers.get()
+        if timers is None:
+            timers = {}
+            _timers.set(timers)
+        return timers
 
 
 class CustomFormatter(logging.Formatter):
@@ -98,61 +143,277 @@ class CustomFormatter(logging.Formatter):
         )
 
         # Add exception info if present
-        if record.exc_info:
-            # Cache the traceback text to avoid converting it multiple times
-            if not record.exc_text:
-                record.exc_text = self.formatException(record.exc_info)
-            if record.exc_text:
-                log_message = f"{log_message}\n{record.exc_text}"
+        # Cache the traceback text to avoid converting it multiple times
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            log_message = f"{log_message}\n{record.exc_text}"
 
         return log_message
 
 
-def setup_logger(name="ranking-service", level=logging.INFO):
-    """Set up and configure logger with custom formatting."""
+# JSON string escaping, implemented in C
+_json_string = json.encoder.encode_basestring
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as compact single-line JSON.
+
+    Field names follow Cloud Logging's structured logging conventions, and
+    the timestamp is passed as seconds and nanos so no date formatting is
+    needed. The line is assembled directly rather than through json.dumps,
+    which costs several times more per record.
+    """
+
+    def format(self, record):
+        request_id = getattr(record, "request_id", None)
+        if request_id is None:
+            request_id = RequestContext.get_request_id()
+
+        seconds = int(record.created)
+        nanos = int((record.created - seconds) * 1e9)
+        line = (
+            f'{{"severity":"{record.levelname}",'
+            f'"message":{_json_string(record.getMessage())},'
+            f'"timestamp":{{"seconds":{seconds},"nanos":{nanos}}},'
+            f'"request_id":{_json_string(request_id)},'
+            f'"category":{_json_string(record_category(record))}'
+        )
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line += f',"exception":{_json_string(record.exc_text)}'
+
+        return line + "}"
+
+
+def record_category(record: logging.LogRecord) -> str:
+    """
+    Category of a record, used for sampling.
+
+    Args:
+        record: Log record
+
+    Returns:
+        The category given by the logging method (e.g. "data", "query",
+        "timer"), or the lowercase level name for plain records
+    """
+    return getattr(record, "category", None) or record.levelname.lower()
+
+
+class CategorySampler(logging.Filter):
+    """
+    Keeps a fraction of the records of each category.
+
+    Warnings and errors are always kept. Categories without a rate are kept.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        """
+        Args:
+            rates: Fraction of records kept per category
+        """
+        super().__init__()
+        self.rates = dict(rates)
+        self.sampled_out: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        category = record_category(record)
+        rate = self.rates.get(category, 1.0)
+        if rate >= 1.0 or record.levelno >= logging.WARNING:
+            return True
+        if random.random() < rate:
+            return True
+
+        with self._lock:
+            self.sampled_out[category] = self.sampled_out.get(category, 0) + 1
+        return False
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room rather than fail when stopping with a full queue
+        self.queue.put(self._sentinel)
+
+
+class AsyncQueueHandler(QueueHandler):
+    """
+    Hands records to a background thread through a bounded queue.
+
+    The calling thread only resolves the request context and the message;
+    formatting and writing happen on the listener thread. When the queue is
+    full the record is dropped and counted instead of blocking the request.
+    Forked workers get a fresh queue and listener thread.
+    """
+
+    def __init__(self, target: logging.Handler, maxsize: int):
+        """
+        Args:
+            target: Handler that formats and writes records
+            maxsize: Records the queue holds before dropping
+        """
+        self.target = target
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self.listener: Optional[QueueListener] = None
+        super().__init__(queue.Queue(maxsize))
+        self._start_listener()
+        atexit.register(self.stop)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._restart_after_fork)
+
+    def _start_listener(self) -> None:
+        self.queue = queue.Queue(self.maxsize)
+        self.listener = _Listener(self.queue, self.target)
+        self.listener.start()
+
+    def _restart_after_fork(self) -> None:
+        # The listener thread does not survive fork, and the queue's lock may
+        # have been held by another thread at the time
+        if self.listener is not None:
+            self.dropped = 0
+            self._dropped_lock = threading.Lock()
+            self._start_listener()
+
+    def prepare(self, record):
+        # Context variables are not visible on the listener thread
+        record.request_id = RequestContext.get_request_id()
+        record.elapsed_time = RequestContext.get_elapsed_time()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def stop(self) -> None:
+        """Write the queued records and stop the listener thread."""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+
+def setup_logger(
+    name="ranking-service",
+    level=LOG_LEVEL_INT,
+    log_format=LOG_FORMAT,
+    use_queue=LOG_ASYNC,
+    queue_size=LOG_QUEUE_SIZE,
+    sample_rates=LOG_SAMPLE_RATES,
+):
+    """
+    Set up and configure logger with custom formatting.
+
+    Args:
+        name: Logger name
+        level: Minimum level logged
+        log_format: "pretty" for colored text or "json" for compact JSON
+        use_queue: Write records from a background thread
+        queue_size: Records queued before dropping, when use_queue is set
+        sample_rates: Fraction of records kept per category
+
+    Returns:
+        Configured logger
+    """
     # Create logger
     logger = logging.getLogger(name)
     logger.setLevel(level)
 
-    # Remove existing handlers
+    # Remove existing handlers and filters
     for handler in logger.handlers[:]:
         logger.removeHandler(handler)
+        if isinstance(handler, AsyncQueueHandler):
+            handler.stop()
+    for log_filter in logger.filters[:]:
+        logger.removeFilter(log_filter)
 
     # Create console handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(level)
 
     # Create formatter
-    formatter = CustomFormatter()
+    if log_format == "json":
+        formatter = JsonFormatter()
+    elif log_format == "pretty":
+        formatter = CustomFormatter()
+    else:
+        raise ValueError(f"Unknown log format: {log_format}")
 
     # Add formatter to handler
     console_handler.setFormatter(formatter)
 
-    # Add handler to logger
-    logger.addHandler(console_handler)
+    # Add handler to logger, behind a queue if requested
+    if use_queue:
+        logger.addHandler(AsyncQueueHandler(console_handler, queue_size))
+    else:
+        logger.addHandler(console_handler)
+
+    # Sample before a record reaches any handler
+    if sample_rates:
+        logger.addFilter(CategorySampler(sample_rates))
 
     return logger
 
 
+def log_stats(logger: logging.Logger) -> Dict[str, Any]:
+    """
+    Report the logging pipeline counters of a logger.
+
+    Args:
+        logger: Logger configured by setup_logger
+
+    Returns:
+        Dictionary with the queue size and dropped records when records are
+        queued, and the records sampled out per category when sampling
+    """
+    stats: Dict[str, Any] = {}
+    for handler in logger.handlers:
+        if isinstance(handler, AsyncQueueHandler):
+            stats["queued"] = handler.queue.qsize()
+            stats["dropped"] = handler.dropped
+    for log_filter in logger.filters:
+        if isinstance(log_filter, CategorySampler):
+            stats["sampled_out"] = dict(log_filter.sampled_out)
+    return stats
+
+
 # Custom log levels and methods
 def success(self, message, *args, **kwargs):
     """Log a success message."""
-    self.info(f"✅ {message}", *args, **kwargs)
+    self.info(
+        f"✅ {message}",
+        *args,
+        extra={**kwargs.pop("extra", {}), "category": "success"},
+        **kwargs,
+    )
 
 
 def timer_start(self, operation_name):
-    """Start timing an operation."""
-    setattr(self, f"_timer_{operation_name}", time.time())
+    """Start timing an operation in the current context."""
+    RequestContext.get_timers()[operation_name] = time.time()
     self.debug(f"⏱️ Started {operation_name}")
 
 
 def timer_end(self, operation_name):
     """End timing an operation and log the duration."""
-    start_time = getattr(self, f"_timer_{operation_name}", None)
+    start_time = RequestContext.get_timers().pop(operation_name, None)
     if start_time:
         duration = time.time() - start_time
-        self.info(f"⏱️ {operation_name} completed in {duration:.3f}s")
-        delattr(self, f"_timer_{operation_name}")
+        self.info(
+            f"⏱️ {operation_name} completed in {duration:.3f}s",
+            extra={"category": "timer"},
+        )
     else:
         self.warning(f"⏱️ No start time found for {operation_name}")
 
@@ -162,17 +423,32 @@ def query(self, query_text, *args, **kwargs):
     # Truncate long queries for readability
     if len(query_text) > 300:
         query_text = query_text[:300] + "..."
-    self.debug(f"🔎 Executing query: {query_text}", *args, **kwargs)
+    self.debug(
+        f"🔎 Executing query: {query_text}",
+        *args,
+        extra={**kwargs.pop("extra", {}), "category": "query"},
+        **kwargs,
+    )
 
 
 def model(self, message, *args, **kwargs):
     """Log model-related information."""
-    self.info(f"🤖 {message}", *args, **kwargs)
+    self.info(
+        f"🤖 {message}",
+        *args,
+        extra={**kwargs.pop("extra", {}), "category": "model"},
+        **kwargs,
+    )
 
 
 def data(self, message, *args, **kwargs):
     """Log data-related information."""
-    self.info(f"📊 {message}", *args, **kwargs)
+    self.info(
+        f"📊 {message}",
+        *args,
+        extra={**kwargs.pop("extra", {}), "category": "data"},
+        **kwargs,
+    )
 
 
 # Add custom methods to the Logger class
@@ -0,0 +1,317 @@
+"""
+Batch materialization of recommendations for every customer.
+
+Every customer of the query embedding snapshot is ranked for the month of
+--date with the serving pipeline: the two-tower query embeddings, candidate
+retrieval, the purchase filter, the article feature matrix and the ranking
+booster, a block of customers at a time, so each block is one vectorized
+retrieval and one model call. The serving components are loaded once and
+forked into worker processes that share them copy-on-write, each ranking a
+contiguous shard of the customers; the shards are merged into one snapshot
+that the server memory-maps (see recommendation_store).
+
+Customers whose block was degraded, who fail on their own (e.g. unknown to
+the customer store) or who get no candidates are left out of the snapshot,
+so the server ranks them online.
+
+Usage (from the container directory):
+    QUERY_EMBEDDINGS_BACKEND=snapshot python materialize.py --date 2024-06-15 \\
+        --output /app/snapshots/recommendations --workers 8
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import datetime
+import tempfile
+import multiprocessing
+import numpy as np
+from typing import Any, Dict, List, Optional
+from bulk import BulkProgress
+from config import (
+    MATERIALIZE_BLOCK_SIZE,
+    MATERIALIZE_WORKERS,
+    MAX_RECOMMENDATIONS,
+    RECOMMENDATIONS_SNAPSHOT_DIR,
+)
+from deadlines import begin_deadline, request_degradations
+from logger import logger
+from metrics import begin_request
+from query_table import month_of
+from recommendation_store import (
+    Ranking,
+    RecommendationTable,
+    customer_keys,
+    merge_vocabularies,
+)
+
+
+def rank_customers(
+    server, customer_ids: List[str], date: str, version
+) -> List[Optional[Ranking]]:
+    """
+    Rank a block of customers with the online pipeline.
+
+    A block that fails is ranked again one customer at a time, so a single
+    bad customer does not lose the others.
+
+    Args:
+        server: Loaded server module
+        customer_ids: Customers of the block
+        date: Date whose month the rankings are for
+        version: ModelVersion to rank with
+
+    Returns:
+        Ranking of each customer, None for those left to the online path
+    """
+    begin_request()
+    begin_deadline(None)
+    instances = [
+        {"customer_id": customer_id, "date": date} for customer_id in customer_ids
+    ]
+    try:
+        scored = server.score({"instances": instances}, version, columnar=True)
+    except Exception as e:
+        if len(customer_ids) == 1:
+            logger.warning(
+                f"⚠️ Customer {customer_ids[0][:8]} not materialized: "
+                f"{type(e).__name__}: {str(e)}"
+            )
+            return [None]
+        return [
+            ranking
+            for customer_id in customer_ids
+            for ranking in rank_customers(server, [customer_id], date, version)
+        ]
+
+    degraded = request_degradations()
+    if degraded:
+        logger.warning(
+            f"⚠️ Block of {len(customer_ids)} customers not materialized: "
+            f"degraded by {', '.join(degraded)}"
+        )
+        return [None] * len(customer_ids)
+
+    offsets = scored["ranking_offsets"]
+    return [
+        (scored["scores"][start:end], scored["article_ids"][start:end])
+        if end > start
+        else None
+        for start, end in zip(offsets[:-1], offsets[1:])
+    ]
+
+
+def materialize_shard(
+    server,
+    customer_ids: np.ndarray,
+    date: str,
+    block_size: int,
+    manifest: Dict[str, Any],
+) -> RecommendationTable:
+    """
+    Rank a shard of customers block by block.
+
+    Args:
+        server: Loaded and started server module
+        customer_ids: Customers of the shard
+        date: Date whose month the rankings are for
+        block_size: Customers ranked per block
+        manifest: Manifest of the table, see RecommendationTable
+
+    Returns:
+        Table of the shard, with rows (customers ranked) and skipped
+        (customers left out) in its manifest
+    """
+    progress = BulkProgress()
+    kept: List[str] = []
+    lengths: List[int] = []
+    scores: List[np.ndarray] = []
+    parts = []
+
+    version = server.model_versions.current
+    for start in range(0, len(customer_ids), block_size):
+        block = [
+            str(customer_id) for customer_id in customer_ids[start : start + block_size]
+        ]
+        rankings = rank_customers(server, block, date, version)
+
+        block_ids: List[str] = []
+        block_scores = [np.empty(0, dtype=np.float32)]
+        for customer_id, ranking in zip(block, rankings):
+            if ranking is None:
+                continue
+            kept.append(customer_id)
+            lengths.append(len(ranking[0]))
+            block_scores.append(ranking[0])
+            block_ids.extend(ranking[1])
+        vocabulary, indices = np.unique(
+            np.asarray(block_ids, dtype=str), return_inverse=True
+        )
+        parts.append((vocabulary, indices.astype(np.int32)))
+        scores.append(np.concatenate(block_scores))
+        progress.add(len(block), sum(ranking is None for ranking in rankings))
+
+    article_ids, articles = merge_vocabularies(parts)
+    offsets = np.zeros(len(kept) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    summary = progress.summary()
+    return RecommendationTable.from_rankings(
+        customer_keys(kept),
+        offsets,
+        np.concatenate([np.empty(0, dtype=np.int32)] + articles),
+        np.concatenate([np.empty(0, dtype=np.float32)] + scores),
+        article_ids,
+        {**manifest, "rows": summary["rows"], "skipped": summary["errors"]},
+    )
+
+
+def _run_worker(
+    customer_ids: np.ndarray,
+    date: str,
+    block_size: int,
+    manifest: Dict[str, Any],
+    part_dir: str,
+) -> None:
+    """Rank a shard in a forked worker and save it to part_dir."""
+    import server
+
+    # Threads and clients do not survive fork; the model version is not
+    # polled, so every shard is ranked with the one in the manifest
+    server.predictor.start()
+    server.transformer.start()
+    server.transformer.feature_store_connected.wait()
+
+    materialize_shard(server, customer_ids, date, block_size, manifest).save(part_dir)
+
+
+def merge_tables(
+    tables: List[RecommendationTable], manifest: Dict[str, Any]
+) -> RecommendationTable:
+    """
+    Merge the tables of the shards into one.
+
+    Args:
+        tables: Tables of the shards
+        manifest: Manifest of the merged table
+
+    Returns:
+        Merged table
+    """
+    article_ids, articles = merge_vocabularies(
+        [(table.article_ids, table.articles) for table in tables]
+    )
+    lengths = np.concatenate(
+        [np.empty(0, dtype=np.int64)] + [np.diff(table.offsets) for table in tables]
+    )
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return RecommendationTable.from_rankings(
+        np.concatenate(
+            [np.empty(0, dtype=np.uint64)] + [table.customer_keys for table in tables]
+        ),
+        offsets,
+        np.concatenate([np.empty(0, dtype=np.int32)] + articles),
+        np.concatenate(
+            [np.empty(0, dtype=np.float32)] + [table.scores for table in tables]
+        ),
+        article_ids,
+        manifest,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--date",
+        default=datetime.date.today().isoformat(),
+        help="Date whose month the rankings are for (default: today)",
+    )
+    parser.add_argument("--output", default=RECOMMENDATIONS_SNAPSHOT_DIR)
+    parser.add_argument("--workers", type=int, default=MATERIALIZE_WORKERS)
+    parser.add_argument("--block-size", type=int, default=MATERIALIZE_BLOCK_SIZE)
+    parser.add_argument(
+        "--limit", type=int, default=0, help="Rank only the first customers"
+    )
+    args = parser.parse_args()
+    start_time = time.time()
+
+    # Load the serving components once; the workers share them copy-on-write
+    import server
+
+    if server.transformer.query_table is None:
+        logger.error("❌ Materialization needs QUERY_EMBEDDINGS_BACKEND=snapshot")
+        sys.exit(1)
+    customer_ids = server.transformer.query_table.customer_ids
+    if args.limit:
+        customer_ids = customer_ids[: args.limit]
+
+    manifest = {
+        "model_version": server.model_versions.current.name,
+        "model_uri": server.model_versions.current.model_uri,
+        "date": args.date,
+        "month": month_of(args.date),
+        "top_n": MAX_RECOMMENDATIONS,
+        "created_at": start_time,
+    }
+    n_workers = max(1, min(args.workers, len(customer_ids)))
+    logger.info(
+        f"🏭 Materializing recommendations of {len(customer_ids)} customers for "
+        f"model {manifest['model_version']}, month {manifest['month']}, "
+        f"with {n_workers} workers"
+    )
+
+    parts_dir = tempfile.mkdtemp(prefix="recommendations-")
+    ranking_start = time.time()
+    try:
+        context = multiprocessing.get_context("fork")
+        workers = []
+        for i, shard in enumerate(np.array_split(customer_ids, n_workers)):
+            part_dir = os.path.join(parts_dir, f"part-{i}")
+            worker = context.Process(
+                target=_run_worker,
+                args=(shard, args.date, args.block_size, manifest, part_dir),
+                name=f"materialize-{i}",
+            )
+            worker.start()
+            workers.append((worker, part_dir))
+
+        failed = []
+        for worker, _ in workers:
+            worker.join()
+            if worker.exitcode != 0:
+                failed.append(worker.name)
+        if failed:
+            logger.error(f"❌ Materialization workers failed: {', '.join(failed)}")
+            sys.exit(1)
+
+        tables = [RecommendationTable.load(part_dir) for _, part_dir in workers]
+        ranking_seconds = time.time() - ranking_start
+        rows = sum(table.manifest["rows"] for table in tables)
+        job = {
+            "workers": n_workers,
+            "block_size": args.block_size,
+            "rows": rows,
+            "skipped": sum(table.manifest["skipped"] for table in tables),
+            "load_seconds": round(ranking_start - start_time, 1),
+            "ranking_seconds": round(ranking_seconds, 1),
+            "customers_per_second": round(rows / ranking_seconds, 1),
+        }
+        merge_tables(tables, {**manifest, "job": job}).save(args.output)
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+    logger.success(
+        f"Materialized {job['rows'] - job['skipped']} of {job['rows']} customers "
+        f"in {time.time() - start_time:.1f}s wall time: "
+        f"{job['customers_per_second']:.0f} customers/s over "
+        f"{job['ranking_seconds']:.1f}s of ranking with {n_workers} workers, "
+        f"{job['load_seconds']:.1f}s of loading"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+In-process metrics for the ranking container.
+Fixed-bucket histograms that are cheap to update from request threads, and
+request-scoped spans that time the stages of a request.
+
+Spans of a request are collected in a context variable, so they are kept
+apart per thread and per asyncio task. Work submitted to an executor must run
+in a copy of the request's context (see run_in_context) for its spans to
+count towards the request. When the request ends, its spans are recorded in
+per-stage histograms together with the response status.
+"""
+
+import time
+import functools
+import threading
+import contextvars
+import numpy as np
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from logger import logger
+
+
+def exponential_buckets(start: float, factor: float, count: int) -> List[float]:
+    """
+    Build histogram bucket upper bounds growing by a constant factor.
+
+    Args:
+        start: Upper bound of the first bucket
+        factor: Ratio between consecutive bounds
+        count: Number of bounds
+
+    Returns:
+        List of bucket upper bounds
+    """
+    return [start * factor**i for i in range(count)]
+
+
+class Histogram:
+    """
+    Histogram over fixed bucket upper bounds.
+
+    Values above the last bound fall into an overflow bucket. Percentiles are
+    estimated by linear interpolation inside the bucket that contains them.
+    """
+
+    def __init__(self, bounds: Sequence[float]):
+        """
+        Args:
+            bounds: Increasing bucket upper bounds
+        """
+        self.bounds = np.asarray(bounds, dtype=np.float64)
+        self._counts = np.zeros(len(self.bounds) + 1, dtype=np.int64)
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Dict[str, Any]) -> "Histogram":
+        """
+        Rebuild a histogram from its snapshot(), e.g. one served on /metrics.
+
+        Args:
+            snapshot: Dictionary with count, mean, max and bucket counts
+
+        Returns:
+            Histogram with the same buckets, counts, sum and max
+        """
+        # JSON encoders may sort the keys, so order buckets by their bound
+        buckets = sorted(
+            (float(label), count) for label, count in snapshot["buckets"].items()
+        )
+        histogram = cls([bound for bound, _ in buckets[:-1]])
+        histogram._counts[:] = [count for _, count in buckets]
+        histogram._sum = snapshot["mean"] * snapshot["count"]
+        histogram._max = snapshot["max"]
+        return histogram
+
+    def observe(self, value: float) -> None:
+        """
+        Record a value.
+
+        Args:
+            value: Observed value
+        """
+        bucket = int(np.searchsorted(self.bounds, value))
+        with self._lock:
+            self._counts[bucket] += 1
+            self._sum += value
+            self._max = max(self._max, value)
+
+    @property
+    def count(self) -> int:
+        """Number of recorded values."""
+        return int(self._counts.sum())
+
+    def percentile(self, q: float) -> float:
+        """
+        Estimate a percentile of the recorded values.
+
+        Args:
+            q: Percentile between 0 and 100
+
+        Returns:
+            Estimated value, 0.0 if nothing was recorded
+        """
+        with self._lock:
+            counts = self._counts.copy()
+            max_value = self._max
+
+        total = counts.sum()
+        if total == 0:
+            return 0.0
+
+        rank = q / 100.0 * total
+        cumulative = np.cumsum(counts)
+        bucket = int(np.searchsorted(cumulative, rank))
+
+        lower = self.bounds[bucket - 1] if bucket > 0 else 0.0
+        upper = self.bounds[bucket] if bucket < len(self.bounds) else max_value
+        below = cumulative[bucket - 1] if bucket > 0 else 0
+        fraction = (rank - below) / counts[bucket] if counts[bucket] else 1.0
+        return float(min(lower + (upper - lower) * fraction, max_value))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Summarize the histogram.
+
+        Returns:
+            Dictionary with count, mean, max, p50/p95/p99 and bucket counts
+        """
+        with self._lock:
+            counts = self._counts.tolist()
+            total_sum = self._sum
+            max_value = self._max
+
+        count = sum(counts)
+        labels = [f"{bound:g}" for bound in self.bounds] + ["+inf"]
+        return {
+            "count": count,
+            "mean": total_sum / count if count else 0.0,
+            "max": max_value,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "buckets": dict(zip(labels, counts)),
+        }
+
+
+# Stage latency bucket bounds in milliseconds, from 0.1ms to about 13s
+STAGE_LATENCY_BUCKETS_MS = exponential_buckets(0.1, 1.5, 30)
+
+# (stage, seconds) of the spans ended in the current request
+_request_spans: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = (
+    contextvars.ContextVar("request_spans", default=None)
+)
+
+
+def begin_request() -> None:
+    """Start collecting the spans of a new request in the current context."""
+    _request_spans.set([])
+
+
+def request_spans() -> List[Tuple[str, float]]:
+    """
+    Get the spans ended so far in the current request.
+
+    Returns:
+        List of (stage, seconds), empty outside a request
+    """
+    return list(_request_spans.get() or [])
+
+
+def run_in_context(executor: Executor, fn: Callable, *args) -> Future:
+    """
+    Submit a function to run in a copy of the caller's context.
+
+    Spans it ends are then recorded for the caller's request.
+
+    Args:
+        executor: Executor to submit to
+        fn: Function to run
+        *args: Arguments for fn
+
+    Returns:
+        Future of the result
+    """
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+class Span:
+    """
+    Times one stage of the current request, from creation until end().
+
+    Use it as a context manager, or call end() when the stage spans more than
+    one block.
+    """
+
+    def __init__(self, stage: str):
+        """
+        Args:
+            stage: Stage name, e.g. "retrieval"
+        """
+        self.stage = stage
+        self._start = time.perf_counter()
+
+    def end(self) -> float:
+        """
+        End the span and record it for the current request.
+
+        Returns:
+            Duration in seconds
+        """
+        duration = time.perf_counter() - self._start
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((self.stage, duration))
+        logger.info(
+            f"⏱️ {self.stage} completed in {duration:.3f}s",
+            extra={"category": "timer"},
+        )
+        return duration
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.end()
+
+
+def timed(stage: str) -> Callable[[Callable], Callable]:
+    """
+    Decorate a function so each call is recorded as a span.
+
+    Args:
+        stage: Stage name
+
+    Returns:
+        Decorator
+    """
+
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with Span(stage):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class StageLatency:
+    """
+    Latency histograms in milliseconds per request stage and response status.
+    """
+
+    # Stage under which the duration of the whole request is recorded
+    REQUEST_STAGE = "request"
+
+    def __init__(self, bounds: Sequence[float] = STAGE_LATENCY_BUCKETS_MS):
+        """
+        Args:
+            bounds: Increasing bucket upper bounds in milliseconds
+        """
+        self.bounds = bounds
+        self._histograms: Dict[Tuple[str, int], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, stage: str, status: int) -> Histogram:
+        histogram = self._histograms.get((stage, status))
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(
+                    (stage, status), Histogram(self.bounds)
+                )
+        return histogram
+
+    def observe(self, stage: str, status: int, seconds: float) -> None:
+        """
+        Record the duration of one stage.
+
+        Args:
+            stage: Stage name
+            status: HTTP status code of the response
+            seconds: Duration in seconds
+        """
+        self._histogram(stage, status).observe(seconds * 1000.0)
+
+    def observe_request(
+        self, spans: List[Tuple[str, float]], status: int, seconds: float
+    ) -> None:
+        """
+        Record a finished request and the spans of its stages.
+
+        Args:
+            spans: (stage, seconds) of the request's spans
+            status: HTTP status code of the response
+            seconds: Duration of the whole request in seconds
+        """
+        self.observe(self.REQUEST_STAGE, status, seconds)
+        for stage, stage_seconds in spans:
+            self.observe(stage, status, stage_seconds)
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        Summarize all histograms.
+
+        Returns:
+            Dictionary of stage to status code to histogram summary
+        """
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+
+        stages: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for (stage, status), histogram in histograms:
+            stages.setdefault(stage, {})[str(status)] = histogram.snapshot()
+        return stages
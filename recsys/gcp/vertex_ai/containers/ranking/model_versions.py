@@ -0,0 +1,495 @@
+"""
+Versioned model and candidate index, swapped without a restart.
+
+A ModelVersion bundles what must match within a request: the predictor with
+the booster and the categorical encoder it was trained with, the article
+feature matrix encoded with that encoder, and the candidate retriever.
+ModelVersions loads a new version on a background thread, smoke-scores it
+against the current one with the same synthetic requests and on random feature
+rows, and swaps the reference. Requests pin the version they start with, so a
+request in flight during a swap finishes on the old version, which is released
+once its last request is done.
+
+Loads are triggered through the admin endpoint or by polling the Model
+Registry for the version MODEL_VERSION points to, so a running worker follows
+the alias when it moves. Versions are per worker
+process: with WORKERS > 1 an admin call only reaches the worker serving it,
+so rely on polling there.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+import numpy as np
+from artifact_cache import ArtifactCache, model_ref_name, registry_version
+from config import (
+    MODEL_POLL_SECONDS,
+    MODEL_SMOKE_REQUESTS,
+    MODEL_VERSION,
+    RETRIEVAL_BACKEND,
+    SNAPSHOT_DIR,
+)
+from logger import logger
+from ranking_predictor import RankingPredictor
+from retrieval import create_retriever
+from warmup import warm_up
+
+# Seed of the synthetic requests both versions are smoke-scored with
+SMOKE_SEED = 1729
+
+# Random feature rows a new version's model is scored with
+SMOKE_ROWS = 64
+
+
+class ModelVersion:
+    """
+    Model and candidate index serving one model version.
+
+    Attributes:
+        name: Version ID in the Model Registry that the predictor resolved,
+            or MODEL_VERSION for a model loaded from MODEL_DIR
+        predictor: RankingPredictor of the version
+        retriever: Candidate retriever
+        feature_matrix: Article feature matrix encoded for the model, or None
+        index_uri: GCS prefix the candidate snapshot was loaded from, or None
+            for the one in SNAPSHOT_DIR
+        loaded_at: Wall time the version was loaded at
+        closed: Whether the version was retired and released
+    """
+
+    def __init__(
+        self,
+        name: str,
+        predictor: RankingPredictor,
+        retriever,
+        feature_matrix=None,
+        index_uri: Optional[str] = None,
+    ):
+        self.name = name
+        self.predictor = predictor
+        self.retriever = retriever
+        self.feature_matrix = feature_matrix
+        self.index_uri = index_uri
+        self.loaded_at = time.time()
+        self.closed = False
+
+        self._in_flight = 0
+        self._retired = False
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Count a request using this version."""
+        with self._lock:
+            self._in_flight += 1
+
+    def release(self) -> None:
+        """Count a request as done, closing the version if it was the last."""
+        with self._lock:
+            self._in_flight -= 1
+            close = self._retired and self._in_flight == 0
+        if close:
+            self._close()
+
+    def retire(self) -> None:
+        """Close the version once the requests using it are done."""
+        with self._lock:
+            self._retired = True
+            close = self._in_flight == 0
+        if close:
+            self._close()
+
+    def _close(self) -> None:
+        self.predictor.close()
+        self.closed = True
+        logger.info(f"♻️ Released model version {self.name}")
+
+    @property
+    def model_uri(self) -> Optional[str]:
+        """Location of the model files, the same whatever the version is named."""
+        return getattr(self.predictor, "model_uri", None)
+
+    def describe(self) -> Dict[str, Any]:
+        """Summarize the version for status endpoints."""
+        return {
+            "name": self.name,
+            "model_uri": self.model_uri,
+            "index_uri": self.index_uri,
+            "loaded_at": self.loaded_at,
+            "in_flight": self._in_flight,
+        }
+
+
+class ModelVersions:
+    """
+    Holds the model version being served and swaps in new ones.
+
+    Attributes:
+        transformer: RankingTransformer the versions serve through
+        artifact_cache: Cache the model files and snapshots are read through
+        poll_seconds: Interval between registry checks, 0 if not polling
+        smoke_requests: Synthetic requests a new version is scored with
+        retrieval_backend: Backend new candidate snapshots are served with
+        loading: Name of the version being loaded, if any
+        last_load: Outcome of the last load
+    """
+
+    def __init__(
+        self,
+        transformer,
+        initial: ModelVersion,
+        artifact_cache: Optional[ArtifactCache] = None,
+        poll_seconds: float = MODEL_POLL_SECONDS,
+        smoke_requests: int = MODEL_SMOKE_REQUESTS,
+        retrieval_backend: str = RETRIEVAL_BACKEND,
+    ):
+        """
+        Args:
+            transformer: RankingTransformer the versions serve through
+            initial: Version served until the first swap
+            artifact_cache: Cache of GCS artifacts, by default in ARTIFACT_CACHE_DIR
+            poll_seconds: Interval between registry checks (0 disables polling)
+            smoke_requests: Synthetic requests a new version is scored with
+            retrieval_backend: "exact" or "ivfpq" to serve new candidate
+                snapshots with; "bigquery" only allows model swaps
+        """
+        self.transformer = transformer
+        self.artifact_cache = artifact_cache or ArtifactCache()
+        self.poll_seconds = poll_seconds
+        self.smoke_requests = smoke_requests
+        self.retrieval_backend = retrieval_backend
+        self.loading: Optional[str] = None
+        self.last_load: Optional[Dict[str, Any]] = None
+
+        self._current = initial
+        self._retired: List[ModelVersion] = []
+        self._rejected_uris: Set[str] = set()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._listeners: List[Callable[[ModelVersion], None]] = []
+
+        # Re-encode the served version's features when the article table changes
+        if transformer.article_store is not None:
+            transformer.article_store.add_listener(self._refresh_feature_matrix)
+
+    @property
+    def current(self) -> ModelVersion:
+        """Version new requests are served with."""
+        return self._current
+
+    @contextmanager
+    def pin(self) -> Iterator[ModelVersion]:
+        """
+        Use the current version for the duration of a request.
+
+        Yields:
+            The version, which stays open until the block exits
+        """
+        with self._lock:
+            version = self._current
+            version.acquire()
+        try:
+            yield version
+        finally:
+            version.release()
+
+    def add_listener(self, listener: Callable[[ModelVersion], None]) -> None:
+        """
+        Call a function with every version swapped in.
+
+        Args:
+            listener: Function taking the new version, run by the loading thread
+        """
+        self._listeners.append(listener)
+
+    def start(self) -> None:
+        """Start polling the registry, if enabled."""
+        if self.poll_seconds > 0 and self._thread is None:
+            self._thread = threading.Thread(
+                target=self._poll_loop, name="model-registry-poll", daemon=True
+            )
+            self._thread.start()
+            logger.info(
+                f"🔄 Checking the registry for new versions of {MODEL_VERSION} "
+                f"every {self.poll_seconds:.0f}s"
+            )
+
+    def stop(self) -> None:
+        """Stop polling the registry."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def load(self, name: str, index_uri: Optional[str] = None) -> str:
+        """
+        Load a version, smoke-score it and swap it in if it passes.
+
+        Args:
+            name: Version ID or alias in the Model Registry
+            index_uri: GCS prefix laid out like SNAPSHOT_DIR to load the
+                candidate snapshot from; None keeps the current retriever
+
+        Returns:
+            "swapped", "rejected" or "failed"
+        """
+        with self._load_lock:
+            return self._load_locked(name, index_uri)
+
+    def load_async(self, name: str, index_uri: Optional[str] = None) -> bool:
+        """
+        Like load(), on a background thread.
+
+        Returns:
+            False if another load is already running
+        """
+        if not self._load_lock.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                self._load_locked(name, index_uri)
+            finally:
+                self._load_lock.release()
+
+        threading.Thread(target=run, name="model-load", daemon=True).start()
+        return True
+
+    def _load_locked(self, name: str, index_uri: Optional[str]) -> str:
+        self.loading = name
+        start_time = time.perf_counter()
+        outcome: Dict[str, Any] = {"name": name, "index_uri": index_uri}
+        try:
+            version = self._build(name, index_uri)
+            accepted, outcome["smoke"] = self._smoke_test(version)
+            if accepted:
+                self._swap(version)
+                outcome["status"] = "swapped"
+            else:
+                logger.error(
+                    f"❌ Model version {name} failed smoke scoring: {outcome['smoke']}"
+                )
+                version.retire()
+                outcome["status"] = "rejected"
+        except Exception as e:
+            logger.error(
+                f"❌ Error loading model version {name}: {type(e).__name__}: {str(e)}",
+                exc_info=True,
+            )
+            outcome["status"] = "failed"
+            outcome["error"] = f"{type(e).__name__}: {str(e)}"
+        finally:
+            self.loading = None
+
+        outcome["seconds"] = round(time.perf_counter() - start_time, 3)
+        self.last_load = outcome
+        return outcome["status"]
+
+    def _build(self, name: str, index_uri: Optional[str]) -> ModelVersion:
+        if index_uri and self.retrieval_backend == "bigquery":
+            raise ValueError("BigQuery retrieval has no candidate snapshot to swap")
+
+        logger.model(f"Loading model version {name} in the background")
+        # Versions come from the registry, even when MODEL_DIR is set
+        predictor = RankingPredictor(
+            start=False,
+            artifact_cache=self.artifact_cache,
+            model_version=name,
+            model_dir="",
+        )
+        predictor.start()
+
+        try:
+            current = self._current
+            if index_uri:
+                key = hashlib.sha256(index_uri.encode()).hexdigest()[:16]
+                snapshot_dir = self.artifact_cache.fetch_tree(
+                    index_uri, os.path.join(SNAPSHOT_DIR, "versions", key)
+                )
+                retriever = create_retriever(
+                    self.retrieval_backend,
+                    execute_query=self.transformer._execute_query,
+                    snapshot_dir=snapshot_dir,
+                )
+            else:
+                retriever, index_uri = current.retriever, current.index_uri
+
+            feature_matrix = None
+            table = self._article_table()
+            if table is not None:
+                feature_matrix = self.transformer.encode_articles(
+                    table, predictor.encoder
+                )
+        except Exception:
+            predictor.close()
+            raise
+
+        return ModelVersion(
+            predictor.version_id, predictor, retriever, feature_matrix, index_uri
+        )
+
+    def _article_table(self):
+        """Article table the features are encoded from, None if not resident."""
+        if self.transformer.article_store is not None:
+            return self.transformer.article_store.table
+        matrix = self._current.feature_matrix
+        return matrix.table if matrix is not None else None
+
+    def _smoke_test(self, version: ModelVersion) -> Tuple[bool, Dict[str, Any]]:
+        """
+        Score the same synthetic requests with the current and the new version.
+
+        The new version passes if it scores random feature rows finitely, and
+        if at least one of the requests, and at least as many as with the
+        current version, return a ranking with finite scores.
+        """
+        with self.pin() as current:
+            baseline = warm_up(
+                self.transformer, current, self.smoke_requests, seed=SMOKE_SEED
+            )
+        candidate = warm_up(
+            self.transformer, version, self.smoke_requests, seed=SMOKE_SEED
+        )
+        rows = self._score_synthetic_rows(version)
+        if candidate["succeeded"] == 0:
+            logger.warning(
+                f"⚠️ No smoke request reached the model of version {version.name}"
+            )
+        accepted = (
+            rows["finite"]
+            and candidate["succeeded"] > 0
+            and candidate["succeeded"] >= baseline["succeeded"]
+        )
+        return accepted, {"current": baseline, "candidate": candidate, "rows": rows}
+
+    def _score_synthetic_rows(self, version: ModelVersion) -> Dict[str, Any]:
+        """
+        Score random feature rows with the new version's model alone.
+
+        Unlike the synthetic requests, this does not depend on the feature
+        store or the candidate index. Values are small non-negative integers
+        so they are also valid categorical codes.
+        """
+        n_features = version.predictor.model.num_features()
+        rng = np.random.default_rng(SMOKE_SEED)
+        rows = rng.integers(0, 8, size=(SMOKE_ROWS, n_features)).astype(np.float32)
+        scores = version.predictor.predict(
+            [
+                {
+                    "ranking_features": rows,
+                    "article_ids": [""] * SMOKE_ROWS,
+                    "group_offsets": np.array([0, SMOKE_ROWS]),
+                }
+            ]
+        )["scores"]
+        finite = len(scores) == SMOKE_ROWS and bool(np.isfinite(scores).all())
+        return {"rows": SMOKE_ROWS, "finite": finite}
+
+    def _has_stale_features(self, version: ModelVersion) -> bool:
+        article_store = self.transformer.article_store
+        return (
+            article_store is not None
+            and version.feature_matrix.table is not article_store.table
+        )
+
+    def _swap(self, version: ModelVersion) -> None:
+        while True:
+            # The article table may have been refreshed since the version was built
+            if self._has_stale_features(version):
+                version.feature_matrix = self.transformer.encode_articles(
+                    self.transformer.article_store.table, version.predictor.encoder
+                )
+            with self._lock:
+                if self._has_stale_features(version):
+                    continue
+                old, self._current = self._current, version
+                self.transformer.use_model_version(version)
+                self._retired.append(old)
+                break
+
+        old.retire()
+        for listener in self._listeners:
+            listener(version)
+        logger.success(f"Swapped model version {old.name} for {version.name}")
+
+    def _refresh_feature_matrix(self, table) -> None:
+        # Runs after the transformer re-encoded the table with the encoder of
+        # the current version, so its matrix can usually be reused
+        with self._lock:
+            version = self._current
+            matrix = self.transformer.feature_matrix
+            if (
+                matrix is not None
+                and matrix.table is table
+                and matrix.encoder is version.predictor.encoder
+            ):
+                version.feature_matrix = matrix
+                return
+
+        matrix = self.transformer.encode_articles(table, version.predictor.encoder)
+        with self._lock:
+            version.feature_matrix = matrix
+
+    def _poll_loop(self) -> None:
+        while not self._stop.wait(self.poll_seconds):
+            self.poll_registry()
+
+    def poll_registry(self) -> Optional[str]:
+        """
+        Load the version MODEL_VERSION points to if it is not the one served.
+
+        Returns:
+            Outcome of the load as returned by load(), or None if nothing
+            was loaded
+        """
+        try:
+            name, model_uri = registry_version()
+        except Exception as e:
+            logger.error(
+                f"❌ Error checking the registry for {MODEL_VERSION}: "
+                f"{type(e).__name__}: {str(e)}"
+            )
+            return None
+
+        current = self._current
+        served_uri = current.model_uri or ""
+        if model_uri.rstrip("/") == served_uri.rstrip("/"):
+            return None
+        if model_uri in self._rejected_uris:
+            return None
+        if not self._load_lock.acquire(blocking=False):
+            return None
+
+        try:
+            logger.model(f"Registry points {MODEL_VERSION} to version {name}")
+            self.artifact_cache.resolve(model_ref_name(version=name), lambda: model_uri)
+            status = self._load_locked(name, None)
+        finally:
+            self._load_lock.release()
+
+        if status == "rejected":
+            # Do not load it again on every poll
+            self._rejected_uris.add(model_uri)
+        return status
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Report the served version, versions still draining and the last load.
+
+        Returns:
+            Dictionary for the admin endpoint
+        """
+        with self._lock:
+            current = self._current
+            self._retired = [version for version in self._retired if not version.closed]
+            draining = [version.describe() for version in self._retired]
+        return {
+            "current": current.describe(),
+            "draining": draining,
+            "loading": self.loading,
+            "last_load": self.last_load,
+            "poll_seconds": self.poll_seconds,
+        }
@@ -0,0 +1,72 @@
+"""
+Pre-fork serving mode for the ranking container.
+
+The parent process builds the app, loading the model, candidate embeddings
+and article table once. Gunicorn then forks the workers from it, so they share
+those pages copy-on-write. Each worker opens its own network clients and
+starts its own background threads, since neither survives fork.
+"""
+
+import gc
+from typing import Callable
+from flask import Flask
+from gunicorn.app.base import BaseApplication
+from config import HOST, PORT, WORKERS, WORKER_THREADS, WORKER_TIMEOUT_SECONDS
+from logger import logger
+
+
+def _freeze_parent_heap(server, worker) -> None:
+    # Move everything loaded so far out of the collector's reach, so garbage
+    # collection in a worker does not write to (and so copy) shared pages
+    gc.freeze()
+
+
+class PreforkServer(BaseApplication):
+    """
+    Gunicorn application serving an already-built Flask app.
+
+    Attributes:
+        application: Flask app shared by all workers
+        options: Gunicorn settings
+    """
+
+    def __init__(
+        self,
+        app: Flask,
+        on_worker_start: Callable[[], None],
+        workers: int = WORKERS,
+        threads: int = WORKER_THREADS,
+        bind: str = f"{HOST}:{PORT}",
+    ):
+        """
+        Args:
+            app: Flask app, fully loaded in the parent process
+            on_worker_start: Called in each worker right after it is forked
+            workers: Number of worker processes
+            threads: Request threads per worker
+            bind: Address to listen on
+        """
+        self.application = app
+
+        def post_fork(server, worker):
+            logger.info(f"👷 Starting worker {worker.pid}")
+            on_worker_start()
+
+        self.options = {
+            "bind": bind,
+            "workers": workers,
+            "worker_class": "gthread",
+            "threads": threads,
+            "timeout": WORKER_TIMEOUT_SECONDS,
+            "preload_app": True,
+            "pre_fork": _freeze_parent_heap,
+            "post_fork": post_fork,
+        }
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
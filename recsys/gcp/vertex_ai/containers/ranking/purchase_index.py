@@ -0,0 +1,414 @@
+"""
+Per-customer purchase-history index for the "already bought" filter.
+
+Purchases are stored in CSR form: a sorted array of 64-bit customer keys, an
+offsets table, and for each customer a sorted int32 array of dense article
+indices into a sorted article vocabulary. All arrays are .npy files that are
+memory-mapped at load time. New transactions go into an in-memory delta that
+is merged into the files on save(). The server never calls save(), so
+purchases appended while serving live in the worker that recorded them until
+it restarts or loads a rebuilt index, which picks them up from the
+transactions table.
+
+Build the index from BigQuery (from the container directory):
+    python purchase_index.py --output /app/snapshots/purchases
+"""
+
+import os
+import hashlib
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from config import (
+    ARTICLES_TABLE,
+    PROJECT_ID,
+    PURCHASES_SNAPSHOT_DIR,
+    TRANSACTIONS_TABLE,
+)
+from logger import logger
+
+CUSTOMER_KEYS_FILE = "customer_keys.npy"
+OFFSETS_FILE = "offsets.npy"
+ARTICLES_FILE = "articles.npy"
+ARTICLE_IDS_FILE = "article_ids.npy"
+
+
+def customer_key(customer_id: str) -> int:
+    """
+    Hash a customer ID to the 64-bit key used by the index.
+
+    Args:
+        customer_id: Customer ID
+
+    Returns:
+        Unsigned 64-bit key
+    """
+    digest = hashlib.blake2b(customer_id.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def _lookup_sorted(vocabulary: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """Find ids in a sorted vocabulary, returning -1 for missing ids."""
+    if len(ids) == 0 or len(vocabulary) == 0:
+        return np.full(len(ids), -1, dtype=np.int64)
+
+    positions = np.searchsorted(vocabulary, ids)
+    positions = np.minimum(positions, len(vocabulary) - 1)
+    found = vocabulary[positions] == ids
+    return np.where(found, positions, -1).astype(np.int64)
+
+
+def _from_pairs(
+    keys: np.ndarray, articles: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Build deduplicated CSR arrays from (customer key, article index) pairs."""
+    order = np.lexsort((articles, keys))
+    keys, articles = keys[order], articles[order]
+
+    # Drop repeated purchases of the same article
+    keep = np.ones(len(keys), dtype=bool)
+    keep[1:] = (keys[1:] != keys[:-1]) | (articles[1:] != articles[:-1])
+    keys, articles = keys[keep], articles[keep]
+
+    customer_keys, counts = np.unique(keys, return_counts=True)
+    offsets = np.zeros(len(customer_keys) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return customer_keys, offsets, articles.astype(np.int32)
+
+
+class PurchaseIndex:
+    """
+    Maps customers to the sorted dense article indices they have bought.
+
+    Attributes:
+        customer_keys: Sorted uint64 customer keys
+        offsets: Start of each customer's purchases, length n_customers + 1
+        articles: Concatenated sorted int32 article indices
+        article_ids: Sorted article vocabulary indexed by dense article index
+    """
+
+    def __init__(
+        self,
+        customer_keys: np.ndarray,
+        offsets: np.ndarray,
+        articles: np.ndarray,
+        article_ids: np.ndarray,
+    ):
+        self.customer_keys = customer_keys
+        self.offsets = offsets
+        self.articles = articles
+        self.article_ids = article_ids
+
+        self._delta: Dict[int, np.ndarray] = {}
+        self._delta_lock = threading.Lock()
+        self._listeners: List[Callable[[str], None]] = []
+
+    def __len__(self) -> int:
+        return len(self.customer_keys)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the index arrays in bytes."""
+        return (
+            self.customer_keys.nbytes
+            + self.offsets.nbytes
+            + self.articles.nbytes
+            + self.article_ids.nbytes
+        )
+
+    @classmethod
+    def build(
+        cls,
+        customer_ids: Iterable[str],
+        article_ids: Iterable[str],
+        article_vocabulary: Optional[Iterable[str]] = None,
+    ) -> "PurchaseIndex":
+        """
+        Build an index from transaction rows.
+
+        Args:
+            customer_ids: Customer ID of each transaction
+            article_ids: Article ID of each transaction
+            article_vocabulary: Known article IDs (default: articles in the
+                transactions)
+
+        Returns:
+            Populated index
+        """
+        customer_codes, unique_customers = pd.factorize(
+            np.asarray(customer_ids, dtype=object)
+        )
+
+        article_ids = np.asarray(article_ids, dtype=str)
+        if article_vocabulary is None:
+            article_vocabulary = article_ids
+        vocabulary = np.unique(np.asarray(article_vocabulary, dtype=str))
+
+        return cls.from_codes(
+            unique_customers,
+            customer_codes,
+            _lookup_sorted(vocabulary, article_ids),
+            vocabulary,
+        )
+
+    @classmethod
+    def from_codes(
+        cls,
+        unique_customers: Iterable[str],
+        customer_codes: np.ndarray,
+        article_codes: np.ndarray,
+        vocabulary: np.ndarray,
+    ) -> "PurchaseIndex":
+        """
+        Build an index from factorized transaction rows.
+
+        Args:
+            unique_customers: Distinct customer IDs
+            customer_codes: Position in unique_customers of each transaction
+            article_codes: Dense article index of each transaction (-1 to skip)
+            vocabulary: Sorted article IDs indexed by dense article index
+
+        Returns:
+            Populated index
+        """
+        logger.timer_start("purchase_index_build")
+
+        unique_keys = np.fromiter(
+            (customer_key(str(c)) for c in unique_customers),
+            dtype=np.uint64,
+        )
+        known = article_codes >= 0
+
+        customer_keys, offsets, articles = _from_pairs(
+            unique_keys[customer_codes[known]], article_codes[known]
+        )
+
+        logger.timer_end("purchase_index_build")
+        logger.data(
+            f"Built purchase index: {len(customer_keys)} customers, "
+            f"{len(articles)} purchases, {len(vocabulary)} articles"
+        )
+        return cls(customer_keys, offsets, articles, vocabulary)
+
+    def save(self, index_dir: str) -> str:
+        """
+        Write the index, merging appended transactions into the files.
+
+        Args:
+            index_dir: Directory to write the index to
+
+        Returns:
+            Path of the index directory
+        """
+        customer_keys = self.customer_keys
+        offsets = self.offsets
+        articles = self.articles
+
+        with self._delta_lock:
+            delta = dict(self._delta)
+        if delta:
+            base_keys = np.repeat(customer_keys, np.diff(offsets))
+            delta_keys = np.concatenate(
+                [np.full(len(a), k, dtype=np.uint64) for k, a in delta.items()]
+            )
+            customer_keys, offsets, articles = _from_pairs(
+                np.concatenate([base_keys, delta_keys]),
+                np.concatenate([articles, *delta.values()]),
+            )
+
+        os.makedirs(index_dir, exist_ok=True)
+        for file_name, array in [
+            (CUSTOMER_KEYS_FILE, customer_keys),
+            (OFFSETS_FILE, offsets),
+            (ARTICLES_FILE, articles),
+            (ARTICLE_IDS_FILE, self.article_ids),
+        ]:
+            # Replace files atomically so mapped readers keep the old inode
+            tmp_path = os.path.join(index_dir, f"{file_name}.tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.asarray(array))
+            os.replace(tmp_path, os.path.join(index_dir, file_name))
+
+        logger.info(f"💾 Saved purchase index for {len(customer_keys)} customers")
+        return index_dir
+
+    @classmethod
+    def load(cls, index_dir: str = PURCHASES_SNAPSHOT_DIR) -> "PurchaseIndex":
+        """
+        Memory-map an index written by save().
+
+        Args:
+            index_dir: Index directory
+
+        Returns:
+            Loaded index
+        """
+        arrays = [
+            np.load(os.path.join(index_dir, file_name), mmap_mode="r")
+            for file_name in (CUSTOMER_KEYS_FILE, OFFSETS_FILE, ARTICLES_FILE)
+        ]
+        article_ids = np.load(os.path.join(index_dir, ARTICLE_IDS_FILE))
+        index = cls(*arrays, article_ids)
+        logger.data(
+            f"Loaded purchase index: {len(index)} customers, "
+            f"{len(index.articles)} purchases from {index_dir}"
+        )
+        return index
+
+    def article_indices(self, article_ids: Iterable[str]) -> np.ndarray:
+        """
+        Map article IDs to dense article indices.
+
+        Args:
+            article_ids: Article IDs
+
+        Returns:
+            int64 array of dense indices, -1 for articles not in the vocabulary
+        """
+        ids = np.asarray(list(article_ids), dtype=str)
+        return _lookup_sorted(self.article_ids, ids)
+
+    def purchased(self, customer_id: str) -> np.ndarray:
+        """
+        Get the dense article indices a customer has bought.
+
+        Args:
+            customer_id: Customer ID
+
+        Returns:
+            Sorted int32 array of dense article indices
+        """
+        key = np.uint64(customer_key(customer_id))
+        position = np.searchsorted(self.customer_keys, key)
+
+        if position < len(self.customer_keys) and self.customer_keys[position] == key:
+            base = self.articles[self.offsets[position] : self.offsets[position + 1]]
+        else:
+            base = np.empty(0, dtype=np.int32)
+
+        delta = self._delta.get(int(key))
+        if delta is None:
+            return base
+        return np.union1d(base, delta).astype(np.int32)
+
+    def purchased_ids(self, customer_id: str) -> np.ndarray:
+        """
+        Get the article IDs a customer has bought.
+
+        Args:
+            customer_id: Customer ID
+
+        Returns:
+            Sorted array of article IDs
+        """
+        return self.article_ids[self.purchased(customer_id)]
+
+    def purchased_mask(
+        self, customer_id: str, candidate_article_ids: List[str]
+    ) -> np.ndarray:
+        """
+        Mark the candidates a customer has already bought.
+
+        Args:
+            customer_id: Customer ID
+            candidate_article_ids: Candidate article IDs
+
+        Returns:
+            Boolean array, True where the candidate was already bought
+        """
+        purchased = self.purchased(customer_id)
+        candidates = self.article_indices(candidate_article_ids)
+        if len(purchased) == 0:
+            return np.zeros(len(candidates), dtype=bool)
+
+        # Membership test against the sorted purchase array
+        positions = np.minimum(
+            np.searchsorted(purchased, candidates), len(purchased) - 1
+        )
+        return purchased[positions] == candidates
+
+    def append(self, customer_id: str, article_ids: Iterable[str]) -> int:
+        """
+        Record new transactions for a customer.
+
+        They are kept in memory only, in this process, until save() is called;
+        the purchases are not persisted otherwise, and are lost on restart
+        unless the next index build reads them from the transactions table.
+
+        Args:
+            customer_id: Customer ID
+            article_ids: Article IDs bought
+
+        Returns:
+            Number of articles recorded
+        """
+        indices = self.article_indices(article_ids)
+        unknown = int((indices < 0).sum())
+        if unknown:
+            logger.warning(f"⚠️ Skipping {unknown} articles not in the purchase index")
+        indices = indices[indices >= 0].astype(np.int32)
+
+        key = customer_key(customer_id)
+        with self._delta_lock:
+            current = self._delta.get(key, np.empty(0, dtype=np.int32))
+            # Replace rather than mutate so concurrent readers see a complete array
+            self._delta[key] = np.union1d(current, indices).astype(np.int32)
+
+        for listener in self._listeners:
+            listener(customer_id)
+        return len(indices)
+
+    def add_listener(self, listener: Callable[[str], None]) -> None:
+        """
+        Call a function after new transactions are recorded for a customer.
+
+        Args:
+            listener: Function taking the customer ID, run by append()
+        """
+        self._listeners.append(listener)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the purchase-history index")
+    parser.add_argument("--output", default=PURCHASES_SNAPSHOT_DIR)
+    parser.add_argument("--table", default=TRANSACTIONS_TABLE)
+    parser.add_argument("--articles-table", default=ARTICLES_TABLE)
+    args = parser.parse_args()
+
+    from google.cloud import bigquery
+
+    client = bigquery.Client(project=PROJECT_ID)
+    query = f"""
+        SELECT DISTINCT
+            customer_id,
+            article_id
+        FROM
+            {args.table}
+    """
+    logger.query(query)
+    df = client.query(query).result().to_dataframe()
+
+    # Index the whole catalog, so purchases of articles nobody had bought at
+    # build time can still be appended
+    query = f"""
+        SELECT DISTINCT
+            article_id
+        FROM
+            {args.articles_table}
+    """
+    logger.query(query)
+    catalog = client.query(query).result().to_dataframe()["article_id"].astype(str)
+
+    article_ids = df["article_id"].astype(str)
+    index = PurchaseIndex.build(
+        df["customer_id"],
+        article_ids,
+        np.concatenate([catalog.to_numpy(), article_ids.to_numpy()]),
+    )
+    index.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Precomputed query embeddings for the ranking container.
+
+The query tower depends only on customer_id, age and the month encoding, and
+the month takes 12 values, so an offline job evaluates it for every customer
+and month. The snapshot holds the customer IDs and a float32 array of shape
+(n_customers, 12, dim). A request can then send a customer_id and a date, and
+its query embedding is a row lookup instead of a call to the query model.
+"""
+
+import os
+import datetime
+import numpy as np
+from typing import Iterable, Tuple
+from config import QUERY_EMBEDDINGS_SNAPSHOT_DIR
+from logger import logger
+
+# Snapshot layout written by
+# recsys.core.embeddings.storage.save_query_embeddings_snapshot
+CUSTOMER_IDS_FILE = "customer_ids.npy"
+QUERY_EMBEDDINGS_FILE = "query_embeddings.npy"
+
+MONTHS = 12
+
+
+def month_of(date: str) -> int:
+    """
+    Month of an ISO date.
+
+    Args:
+        date: Date such as "2024-06-15"; anything after the day is ignored
+
+    Returns:
+        Month from 1 to 12
+    """
+    return datetime.date.fromisoformat(date[:10]).month
+
+
+def month_encoding(month: int) -> Tuple[float, float]:
+    """
+    Cyclical month encoding used in training.
+
+    Args:
+        month: Month from 1 to 12
+
+    Returns:
+        Tuple of (month_sin, month_cos)
+    """
+    angle = 2 * np.pi * month / MONTHS
+    return float(np.sin(angle)), float(np.cos(angle))
+
+
+class QueryEmbeddingTable:
+    """
+    Query embeddings by customer and month, memory-mapped from a snapshot.
+
+    Attributes:
+        customer_ids: Customer IDs indexed by dense customer index
+        embeddings: Read-only float32 array of shape (n_customers, 12, dim)
+    """
+
+    def __init__(self, snapshot_dir: str = QUERY_EMBEDDINGS_SNAPSHOT_DIR):
+        """
+        Load the query embedding snapshot.
+
+        Args:
+            snapshot_dir: Directory containing customer_ids.npy and
+                query_embeddings.npy
+
+        Raises:
+            ValueError: If the snapshot files are inconsistent
+        """
+        logger.timer_start("query_embeddings_snapshot_load")
+
+        self.customer_ids = np.load(
+            os.path.join(snapshot_dir, CUSTOMER_IDS_FILE), allow_pickle=False
+        )
+        self.embeddings = np.load(
+            os.path.join(snapshot_dir, QUERY_EMBEDDINGS_FILE),
+            mmap_mode="r",
+            allow_pickle=False,
+        )
+
+        if (
+            self.embeddings.dtype != np.float32
+            or self.embeddings.ndim != 3
+            or self.embeddings.shape[1] != MONTHS
+        ):
+            raise ValueError(
+                f"Expected float32 query embeddings of shape (n, {MONTHS}, dim), "
+                f"got {self.embeddings.dtype} with shape {self.embeddings.shape}"
+            )
+        if len(self.customer_ids) != len(self.embeddings):
+            raise ValueError(
+                f"Snapshot has {len(self.customer_ids)} customer IDs but "
+                f"{len(self.embeddings)} embedding rows"
+            )
+
+        # Sorted view of the IDs for vectorized lookups
+        self._order = np.argsort(self.customer_ids, kind="stable")
+        self._sorted_ids = self.customer_ids[self._order]
+
+        logger.timer_end("query_embeddings_snapshot_load")
+        logger.data(
+            f"Loaded query embeddings of {len(self)} customers "
+            f"(dim={self.dim}) from {snapshot_dir}"
+        )
+
+    def __len__(self) -> int:
+        return len(self.customer_ids)
+
+    @property
+    def dim(self) -> int:
+        """Dimension of the query embeddings."""
+        return self.embeddings.shape[2]
+
+    def lookup(
+        self, customer_ids: Iterable[str], months: Iterable[int]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Look up the query embeddings of customers for given months.
+
+        Args:
+            customer_ids: Customer IDs
+            months: Month from 1 to 12 for each customer
+
+        Returns:
+            Tuple of (float32 embeddings of shape (n_found, dim) in input
+            order, boolean mask of the input customers that were found)
+        """
+        ids = np.asarray(list(customer_ids), dtype=str)
+        months = np.asarray(list(months), dtype=np.int64)
+        if len(ids) == 0 or len(self) == 0:
+            return (
+                np.empty((0, self.dim), dtype=np.float32),
+                np.zeros(len(ids), dtype=bool),
+            )
+
+        positions = np.searchsorted(self._sorted_ids, ids)
+        positions = np.minimum(positions, len(self) - 1)
+        found = self._sorted_ids[positions] == ids
+        rows = self._order[positions[found]]
+        return np.asarray(self.embeddings[rows, months[found] - 1]), found
@@ -7,13 +7,25 @@ import os
 import time
 import xgboost as xgb
 import numpy as np
-import tempfile
 from typing import Dict, List, Any, Optional, Union
-from google.cloud import storage
-from google.cloud import aiplatform
 from google.cloud.exceptions import NotFound
-from config import PROJECT_ID, LOCATION, MODEL_ID, MODEL_VERSION
+from config import (
+    MODEL_DIR,
+    MODEL_ID,
+    MODEL_VERSION,
+    PREDICT_BATCHING,
+    PREDICT_ENGINE,
+    PREDICT_THREADS,
+)
 from logger import logger
+from metrics import timed
+from artifact_cache import MODEL_FILE, ArtifactCache, resolve_model_version
+from batcher import PredictionBatcher
+from categorical_encoder import ENCODER_FILE, CategoricalEncoder
+from forest import CompiledForest
+
+# Ways of evaluating the booster, see _predict_matrix()
+PREDICT_ENGINES = ("dmatrix", "inplace", "numpy")
 
 
 class RankingPredictor:
@@ -21,44 +33,82 @@ class RankingPredictor:
     Loads and runs an XGBoost model for ranking predictions.
 
     This class handles:
-    1. Loading the model from Vertex AI Model Registry
+    1. Loading the model from Vertex AI Model Registry, through a local cache
     2. Preparing features for prediction
-    3. Running predictions with XGBoost
+    3. Running predictions with XGBoost, optionally batched across requests
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        start: bool = True,
+        engine: str = PREDICT_ENGINE,
+        artifact_cache: Optional[ArtifactCache] = None,
+        model_version: str = MODEL_VERSION,
+        model_dir: str = MODEL_DIR,
+    ):
         """
         Initialize XGBoost model from Model Registry.
 
-        Loads the model from Vertex AI Model Registry and prepares it for predictions.
+        Loads the model from Vertex AI Model Registry and prepares it for
+        predictions. The model files, and the artifact URI of a version given
+        by ID, are read from the local artifact cache when present; an alias
+        is resolved to its version ID in the registry.
+
+        Args:
+            start: Call start() right away. Pre-fork servers pass False and call
+                start() in each worker.
+            engine: One of "dmatrix", "inplace" or "numpy"
+            artifact_cache: Cache of GCS artifacts, by default in ARTIFACT_CACHE_DIR
+            model_version: Version or alias in the Model Registry
+            model_dir: Local directory with the model files to load instead
+                of the registry's (empty: use the registry)
         """
         logger.info(f"🤖 Initializing RankingPredictor")
         self.model = None
+        self.encoder = None
+        self.batcher = None
+        self.engine = engine
+        self.forest = None
 
         try:
-            # Format model ID
-            self._model_id = (
-                f"projects/{PROJECT_ID}/locations/{LOCATION}/models/{MODEL_ID}"
-            )
-
-            # Load model metadata from Vertex AI
-            model = aiplatform.Model(model_name=self._model_id, version=MODEL_VERSION)
-            logger.model(f"Loading model: {MODEL_ID} (version: {MODEL_VERSION})")
-
-            # Get model URI
-            model_uri = model.uri
-            logger.info(f"📦 Model artifact location: {model_uri}")
-
-            # Download and load the model
-            self._load_model_from_gcs(model_uri)
+            self.artifact_cache = artifact_cache or ArtifactCache()
+            if model_dir:
+                logger.model(f"Loading model from {model_dir}")
+                self.model_uri = model_dir
+                self.version_id = model_version
+                encoder_path = os.path.join(model_dir, ENCODER_FILE)
+                self.load_model_files(
+                    os.path.join(model_dir, MODEL_FILE),
+                    encoder_path if os.path.exists(encoder_path) else None,
+                )
+            else:
+                # Resolve the version ID and artifact URI, from the cache if
+                # the version is given by ID
+                logger.model(f"Loading model: {MODEL_ID} (version: {model_version})")
+                self.version_id, self.model_uri = resolve_model_version(
+                    self.artifact_cache, version=model_version
+                )
+                logger.info(
+                    f"📦 Model version {self.version_id} artifact location: "
+                    f"{self.model_uri}"
+                )
+
+                # Load the model files, downloading them on a cache miss
+                self._load_model(self.model_uri)
 
             # Log model info
             logger.model(f"Model feature count: {self.model.num_features()}")
+            self._prepare_engine()
             logger.success("XGBoost model loaded successfully")
 
+            if start:
+                self.start()
+
         except NotFound as e:
             logger.error(f"❌ Model not found: {str(e)}", exc_info=True)
-            raise ValueError(f"Model {MODEL_ID} not found in registry")
+            raise ValueError(
+                f"Model {MODEL_ID} version {model_version} not found in registry"
+            )
 
         except Exception as e:
             logger.error(
@@ -67,12 +117,24 @@ class RankingPredictor:
             )
             raise
 
-    def _load_model_from_gcs(self, model_uri: str) -> None:
+    def start(self) -> None:
+        """Start per-process background work: the prediction batcher, if enabled."""
+        # Coalesce predictions from concurrent requests
+        if PREDICT_BATCHING:
+            self.batcher = PredictionBatcher(self._predict_matrix)
+
+    def close(self) -> None:
+        """Stop background work, scoring anything still queued."""
+        if self.batcher is not None:
+            self.batcher.close()
+            self.batcher = None
+
+    def _load_model(self, model_uri: str) -> None:
         """
-        Download and load model from GCS.
+        Load the model files, from the artifact cache or else from GCS.
 
         Args:
-            model_uri: GCS URI of the model
+            model_uri: GCS URI of the model directory
 
         Raises:
             IOError: If model download fails
@@ -81,27 +143,12 @@ class RankingPredictor:
             # Start timing model load
             logger.timer_start("model_load")
 
-            # Parse GCS path
-            gcs_path = model_uri.replace("gs://", "")
-            bucket_name = gcs_path.split("/")[0]
-            prefix = "/".join(gcs_path.split("/")[1:])
-
-            # Create temp directory and file path
-            temp_dir = tempfile.mkdtemp()
-            local_model_path = os.path.join(temp_dir, "model.bst")
-
-            # Download from GCS
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(bucket_name)
-            model_blob_path = os.path.join(prefix, "model.bst")
-            blob = bucket.blob(model_blob_path)
-
-            logger.info(f"📥 Downloading model: {model_blob_path}")
-            blob.download_to_filename(local_model_path)
-
-            # Load model
-            self.model = xgb.Booster()
-            self.model.load_model(local_model_path)
+            model_uri = model_uri.rstrip("/")
+            model_path = self.artifact_cache.fetch(f"{model_uri}/{MODEL_FILE}")
+            encoder_path = self.artifact_cache.fetch_optional(
+                f"{model_uri}/{ENCODER_FILE}"
+            )
+            self.load_model_files(model_path, encoder_path)
 
             # Log completion time
             logger.timer_end("model_load")
@@ -112,32 +159,88 @@ class RankingPredictor:
             )
             raise
 
-        finally:
-            # Cleanup temp files
-            try:
-                if os.path.exists(local_model_path):
-                    os.remove(local_model_path)
-                if os.path.exists(temp_dir):
-                    os.rmdir(temp_dir)
-            except Exception as e:
-                logger.warning(f"⚠️ Error cleaning up temp files: {str(e)}")
+    def load_model_files(self, model_path: str, encoder_path: Optional[str]) -> None:
+        """
+        Load the booster and the categorical encoder fitted with it.
 
+        Args:
+            model_path: Path of the XGBoost model file
+            encoder_path: Path of the encoder file, or None if the model has none
+        """
+        self.model = xgb.Booster()
+        self.model.load_model(model_path)
+
+        if encoder_path is not None:
+            self.encoder = CategoricalEncoder.load(encoder_path)
+            logger.model(
+                f"Loaded categorical encoder for {len(self.encoder.columns)} columns"
+            )
+        else:
+            logger.warning(
+                f"⚠️ No {ENCODER_FILE} next to the model; categorical codes "
+                "will be assigned per request and may not match training"
+            )
+
+    def _prepare_engine(self) -> None:
+        """
+        Set up the loaded model for the configured prediction engine.
+
+        Raises:
+            ValueError: If the engine is unknown or cannot evaluate the model
+        """
+        if self.engine not in PREDICT_ENGINES:
+            raise ValueError(f"Unknown prediction engine: {self.engine}")
+
+        # A fixed thread count keeps concurrent requests and workers from
+        # oversubscribing the cores
+        self.model.set_param({"nthread": PREDICT_THREADS})
+
+        if self.engine == "numpy":
+            self.forest = CompiledForest.from_booster(self.model)
+            logger.model(
+                f"Compiled {self.forest.n_trees} trees of depth up to "
+                f"{self.forest.depth} for NumPy evaluation"
+            )
+        logger.model(f"Prediction engine: {self.engine} with {PREDICT_THREADS} threads")
+
+    def _predict_matrix(self, features: np.ndarray) -> np.ndarray:
+        """
+        Score a float32 feature matrix with the model.
+
+        The "dmatrix" engine wraps the rows in a DMatrix, "inplace" predicts
+        directly from the contiguous array and "numpy" walks the compiled
+        trees without XGBoost.
+
+        Args:
+            features: 2-D feature matrix
+
+        Returns:
+            One score per row
+        """
+        if self.forest is not None:
+            return self.forest.predict(features)
+        if self.engine == "inplace":
+            return self.model.inplace_predict(
+                np.ascontiguousarray(features, dtype=np.float32),
+                validate_features=False,
+            )
+        return self.model.predict(xgb.DMatrix(features, nthread=PREDICT_THREADS))
+
+    @timed("predict")
     def predict(self, inputs: List[Dict[str, Any]]) -> Dict[str, List]:
         """
         Generate ranking predictions using XGBoost.
 
         Args:
-            inputs: List of dictionaries containing ranking_features and article_ids
+            inputs: List of dictionaries containing ranking_features, article_ids
+                and the group_offsets of each instance's rows
 
         Returns:
-            Dictionary with scores and article_ids
+            Dictionary with scores, article_ids and group_offsets
 
         Raises:
             ValueError: If model is not loaded or inputs are invalid
         """
-        # Start timing prediction
-        logger.timer_start("prediction")
-
         try:
             # Check if model is loaded
             if self.model is None:
@@ -146,49 +249,66 @@ class RankingPredictor:
             # Check inputs
             if not inputs or len(inputs) == 0:
                 logger.warning("⚠️ Empty inputs for prediction")
-                return {"scores": [], "article_ids": []}
+                return {"scores": [], "article_ids": [], "group_offsets": None}
 
             # Extract ranking features and article IDs from the inputs
             features_df = inputs[0].pop("ranking_features")
             article_ids = inputs[0].pop("article_ids")
+            group_offsets = inputs[0].pop("group_offsets", None)
 
             # Log prediction info
-            logger.model(f"Making predictions for {len(features_df)} candidates")
+            logger.model(
+                f"Making predictions for {len(features_df)} candidates in one batch"
+            )
 
             # Process categorical features
             if len(features_df) > 0:
-                # Identify categorical columns
-                categorical_cols = [
-                    col
-                    for col in features_df.columns
-                    if features_df[col].dtype == "object"
-                ]
-
-                # Convert categorical columns to numeric
-                for col in categorical_cols:
-                    logger.data(f"Encoding categorical feature: {col}")
-                    # Create mapping of unique values to integers
-                    unique_values = features_df[col].unique()
-                    value_map = {val: idx for idx, val in enumerate(unique_values)}
-
-                    # Apply the mapping
-                    features_df[col] = features_df[col].map(value_map)
+                if isinstance(features_df, np.ndarray):
+                    # Rows from the article feature matrix are already encoded
+                    pass
+                elif self.encoder is not None:
+                    # Encode with the vocabularies fitted at training time
+                    for col in self.encoder.columns:
+                        if col in features_df.columns:
+                            features_df[col] = self.encoder.encode(
+                                col, features_df[col]
+                            )
+                else:
+                    # Identify categorical columns
+                    categorical_cols = [
+                        col
+                        for col in features_df.columns
+                        if features_df[col].dtype == "object"
+                    ]
+
+                    # Convert categorical columns to numeric
+                    for col in categorical_cols:
+                        logger.data(f"Encoding categorical feature: {col}")
+                        # Create mapping of unique values to integers
+                        unique_values = features_df[col].unique()
+                        value_map = {val: idx for idx, val in enumerate(unique_values)}
+
+                        # Apply the mapping
+                        features_df[col] = features_df[col].map(value_map)
+
+                    # Dictionary-encoded columns from the article table carry their codes
+                    for col in features_df.select_dtypes("category").columns:
+                        features_df[col] = features_df[col].cat.codes
 
                 # Convert to numpy array
-                features_np = features_df.to_numpy()
-
-                # Convert to DMatrix for XGBoost
-                dmatrix = xgb.DMatrix(np.array(features_np, dtype=np.float32))
-
-                # Get prediction scores
-                scores = self.model.predict(dmatrix).tolist()
+                features_np = np.asarray(features_df, dtype=np.float32)
 
-                # Log prediction completion
-                logger.timer_end("prediction")
+                # Get prediction scores, sharing a model call with concurrent
+                # requests when batching is enabled
+                if self.batcher is not None:
+                    scores = self.batcher.predict(features_np).tolist()
+                else:
+                    scores = self._predict_matrix(features_np).tolist()
 
                 return {
                     "scores": scores,
                     "article_ids": article_ids,
+                    "group_offsets": group_offsets,
                 }
             else:
                 # No features to predict
@@ -196,6 +316,7 @@ class RankingPredictor:
                 return {
                     "scores": [],
                     "article_ids": article_ids,
+                    "group_offsets": group_offsets,
                 }
 
         except ValueError as e:
@@ -204,6 +325,7 @@ class RankingPredictor:
             return {
                 "scores": [],
                 "article_ids": article_ids if "article_ids" in locals() else [],
+                "group_offsets": group_offsets if "group_offsets" in locals() else None,
             }
 
         except Exception as e:
@@ -214,4 +336,5 @@ class RankingPredictor:
             return {
                 "scores": [],
                 "article_ids": article_ids if "article_ids" in locals() else [],
+                "group_offsets": group_offsets if "group_offsets" in locals() else None,
             }
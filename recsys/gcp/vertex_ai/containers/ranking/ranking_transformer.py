@@ -4,29 +4,50 @@ Handles preprocessing of inputs and postprocessing of outputs.
 """
 
 import time
+import threading
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Any, Optional, Tuple, Union
-from google.cloud import aiplatform, bigquery
-from google.cloud.exceptions import GoogleCloudError, NotFound
-from vertexai.resources.preview.feature_store import FeatureOnlineStore, FeatureView
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Optional, Sequence, Tuple, Union
 from config import (
     FEATURE_STORE_ID,
-    PROJECT_ID,
-    LOCATION,
     RANKING_MODEL_FEATURES,
     TOP_K_CANDIDATES,
-    TRANSACTIONS_TABLE,
-    ARTICLES_TABLE,
-    RANKINGS_TABLE,
-    CANDIDATES_TABLE
+    MAX_RECOMMENDATIONS,
+    ARTICLES_BACKEND,
+    PURCHASES_BACKEND,
+    QUERY_EMBEDDINGS_BACKEND,
+    PREPROCESS_MAX_WORKERS,
+    SNAPSHOT_DIR,
+    SNAPSHOT_GCS_URI,
 )
 from logger import logger
+from clients import reset_clients
+from metrics import Span, run_in_context, timed
+from article_store import ArticleStore, ArticleTable
+from artifact_cache import ArtifactCache
+from categorical_encoder import CategoricalEncoder
+from customer_cache import (
+    DEFAULT_CUSTOMER_FEATURES,
+    CustomerFeatureCache,
+    CustomerFeatures,
+    decode_customer_features,
+)
+from data_access import DataAccess, create_data_access
+from deadlines import (
+    Hedger,
+    degradations,
+    remaining,
+    stage_timeout,
+)
+from feature_matrix import ArticleFeatureMatrix
+from purchase_index import PurchaseIndex
+from query_table import QueryEmbeddingTable, month_encoding, month_of
+from retrieval import create_retriever, top_k
 
-
-# Initialize GCP clients
-aiplatform.init(project=PROJECT_ID, location=LOCATION)
-client = bigquery.Client(project=PROJECT_ID)
+# Seconds between attempts to connect to the feature store, doubling up to the max
+FEATURE_STORE_RETRY_SECONDS = 5.0
+FEATURE_STORE_MAX_RETRY_SECONDS = 60.0
 
 
 class RankingTransformer:
@@ -34,49 +55,91 @@ class RankingTransformer:
     Handles preprocessing and postprocessing for the ranking model.
 
     This transformer prepares data for the ranking model by:
-    1. Finding similar items using embedding similarity
-    2. Filtering out already purchased items
-    3. Retrieving article features
-    4. Combining with customer features
-    5. Preparing the features in the format needed by the model
+    1. Finding similar items not yet purchased using embedding similarity
+    2. Retrieving article features
+    3. Combining with customer features
+    4. Preparing the features in the format needed by the model
 
     After prediction, it formats the results into a ranked list.
     """
 
-    def __init__(self):
-        """Initialize feature store connections and views."""
+    def __init__(
+        self,
+        start: bool = True,
+        categorical_encoder: Optional[CategoricalEncoder] = None,
+        artifact_cache: Optional[ArtifactCache] = None,
+        data_access: Optional[DataAccess] = None,
+    ):
+        """
+        Load read-only serving data and, by default, connect to the feature store.
+
+        With SNAPSHOT_GCS_URI set, the snapshots are first mirrored into
+        SNAPSHOT_DIR through the artifact cache.
+
+        Args:
+            start: Call start() right away. Pre-fork servers pass False and call
+                start() in each worker.
+            categorical_encoder: Encoder of the served model, used to encode
+                the article feature matrix
+            artifact_cache: Cache of GCS artifacts, by default in ARTIFACT_CACHE_DIR
+            data_access: Store of the lookups not served from snapshots, by
+                default the one selected by DATA_BACKEND
+        """
         logger.info("🔄 Initializing RankingTransformer")
 
         try:
-            # Initialize feature store
-            self.feature_store = FeatureOnlineStore(name=FEATURE_STORE_ID)
-            logger.info(f"📦 Connected to feature store: {FEATURE_STORE_ID}")
-
-            # Initialize feature views
-            self.articles_view = FeatureView(
-                name="articles",
-                feature_online_store_id=self.feature_store.name,
-                location=LOCATION,
-            )
-            self.customers_view = FeatureView(
-                name="customers",
-                feature_online_store_id=self.feature_store.name,
-                location=LOCATION,
+            # Mirror versioned snapshots from GCS, downloading only on a miss
+            if SNAPSHOT_GCS_URI:
+                (artifact_cache or ArtifactCache()).fetch_tree(
+                    SNAPSHOT_GCS_URI, SNAPSHOT_DIR
+                )
+
+            # Store behind lookups that are not served from snapshots
+            self.data_access = data_access or create_data_access()
+
+            # Initialize candidate retrieval backend
+            self.retriever = create_retriever(execute_query=self._execute_query)
+
+            # Load resident article table
+            self.article_store = (
+                ArticleStore(artifact_cache=artifact_cache)
+                if ARTICLES_BACKEND == "snapshot"
+                else None
             )
-            self.transactions_view = FeatureView(
-                name="transactions",
-                feature_online_store_id=self.feature_store.name,
-                location=LOCATION,
+
+            # Load purchase-history index
+            self.purchase_index = (
+                PurchaseIndex.load() if PURCHASES_BACKEND == "snapshot" else None
             )
-            self.candidates_view = FeatureView(
-                name="candidates",
-                feature_online_store_id=self.feature_store.name,
-                location=LOCATION,
+
+            # Load precomputed query embeddings
+            self.query_table = (
+                QueryEmbeddingTable()
+                if QUERY_EMBEDDINGS_BACKEND == "snapshot"
+                else None
             )
 
             # Get feature names for the model
             self.ranking_model_feature_names = list(RANKING_MODEL_FEATURES.keys())
 
+            # Encode the article table into model-ready rows, again on refresh
+            self.categorical_encoder = categorical_encoder
+            self.feature_matrix = None
+            if self.article_store is not None:
+                self._build_feature_matrix(self.article_store.table)
+                self.article_store.add_listener(self._build_feature_matrix)
+
+            # Decoded customer features, also served stale when a read times out
+            self.customer_cache = CustomerFeatureCache(self._read_customer_features)
+
+            # Connections and threads are per process, see start()
+            self.view_sync = None
+            self.executor = None
+            self.hedger = None
+            self.feature_store_connected = threading.Event()
+            if start:
+                self.start()
+
             logger.success("RankingTransformer initialized successfully")
 
         except Exception as e:
@@ -85,11 +148,96 @@ class RankingTransformer:
             )
             raise
 
-    def _execute_query(
-        self, query: str, query_name: str = "query"
-    ) -> bigquery.table.RowIterator:
+    def start(self) -> None:
+        """
+        Start background work and connect to the feature store.
+
+        Network clients and threads do not survive fork, so a pre-fork server
+        runs this in every worker after loading the data in the parent. The
+        feature store connection is made on a background thread; wait for
+        feature_store_connected before serving.
+        """
+        # Drop any client inherited from a parent process
+        reset_clients()
+
+        # Refresh the article table in the background
+        if self.article_store is not None:
+            self.article_store.start()
+
+        # Bounded pool shared by all requests for the preprocessing fan-out
+        self.executor = ThreadPoolExecutor(
+            max_workers=PREPROCESS_MAX_WORKERS,
+            thread_name_prefix="preprocess",
+        )
+
+        # Timeouts and hedges of backend reads
+        self.hedger = Hedger()
+
+        # Refresh-ahead of cached customer features
+        self.customer_cache.start()
+
+        threading.Thread(
+            target=self._connect_feature_store,
+            name="feature-store-connect",
+            daemon=True,
+        ).start()
+
+    def _connect_feature_store(self) -> None:
+        """Connect the data access backend, retrying on errors."""
+        retry_seconds = FEATURE_STORE_RETRY_SECONDS
+        while True:
+            try:
+                self.data_access.connect()
+                self.view_sync = self.data_access.view_sync
+                self.feature_store_connected.set()
+                return
+            except Exception as e:
+                logger.error(
+                    f"❌ Error connecting to feature store {FEATURE_STORE_ID}: "
+                    f"{type(e).__name__}: {str(e)}, retrying in {retry_seconds:.0f}s",
+                    exc_info=True,
+                )
+                time.sleep(retry_seconds)
+                retry_seconds = min(2 * retry_seconds, FEATURE_STORE_MAX_RETRY_SECONDS)
+
+    def _build_feature_matrix(self, table: ArticleTable) -> None:
+        """
+        Encode an article table and swap it in as the feature matrix.
+
+        Args:
+            table: Article table to encode
+        """
+        self.feature_matrix = self.encode_articles(table, self.categorical_encoder)
+
+    def encode_articles(
+        self, table: ArticleTable, encoder: Optional[CategoricalEncoder]
+    ) -> ArticleFeatureMatrix:
+        """
+        Encode an article table into model-ready rows.
+
+        Args:
+            table: Article table to encode
+            encoder: Categorical encoder of the model the rows are for
+
+        Returns:
+            Feature matrix of the table
         """
-        Execute a BigQuery query safely.
+        return ArticleFeatureMatrix(table, self.ranking_model_feature_names, encoder)
+
+    def use_model_version(self, version) -> None:
+        """
+        Make a model version's retriever and features the defaults of preprocess().
+
+        Args:
+            version: ModelVersion now being served
+        """
+        self.retriever = version.retriever
+        self.categorical_encoder = version.predictor.encoder
+        self.feature_matrix = version.feature_matrix
+
+    def _execute_query(self, query: str, query_name: str = "query") -> Any:
+        """
+        Run a SQL query through the data access backend, within the request budget.
 
         Args:
             query: The SQL query to execute
@@ -97,190 +245,345 @@ class RankingTransformer:
 
         Returns:
             Result of the query
+        """
+        return self.data_access.execute_query(query, query_name, remaining())
+
+    def _read(self, stage: str, read: Callable[[Optional[float]], Any]) -> Any:
+        """
+        Run an idempotent backend read within its share of the request budget.
+
+        Args:
+            stage: Stage the read belongs to, see STAGE_BUDGET_FRACTIONS
+            read: Read taking its timeout in seconds (None: no deadline)
+
+        Returns:
+            Result of the read
 
         Raises:
-            GoogleCloudError: If query execution fails
+            TimeoutError: If the read did not finish in time
         """
-        try:
-            # Log the query (truncated for readability)
-            truncated_query = query[:300] + "..." if len(query) > 300 else query
-            logger.query(f"Executing {query_name}: {truncated_query}")
+        timeout = stage_timeout(stage)
+        if self.hedger is None:
+            return read(timeout)
+        return self.hedger.call(stage, lambda: read(timeout), timeout)
+
+    def _get_already_bought_items(
+        self, customer_ids: List[str]
+    ) -> Dict[str, List[str]]:
+        """
+        Get lists of items already bought by customers.
 
-            # Time the query execution
-            start_time = time.time()
+        Args:
+            customer_ids: IDs of the customers
 
-            # Execute the query
-            query_job = client.query(query)
-            results = query_job.result()
+        Returns:
+            Dictionary of customer ID to article IDs already purchased
+        """
+        logger.info(
+            f"🛒 Getting already purchased items for {len(customer_ids)} customers"
+        )
 
-            # Log query completion time
-            duration = time.time() - start_time
-            row_count = (
-                results.total_rows if hasattr(results, "total_rows") else "unknown"
-            )
-            logger.info(
-                f"🔍 {query_name} completed in {duration:.3f}s, rows: {row_count}"
+        try:
+            bought_items = self._read(
+                "bought_items",
+                lambda timeout: self.data_access.bought_items(customer_ids, timeout),
             )
 
-            return results
+            n_purchases = sum(len(items) for items in bought_items.values())
+            logger.info(f"🛍️ Found {n_purchases} previously purchased articles")
+            return bought_items
 
-        except GoogleCloudError as e:
-            logger.error(
-                f"❌ BigQuery error executing {query_name}: {str(e)}", exc_info=True
+        except TimeoutError:
+            degradations.record(
+                "purchase_filter_skipped", "transactions read timed out"
             )
-            raise
         except Exception as e:
             logger.error(
-                f"❌ Unexpected error executing {query_name}: {str(e)}", exc_info=True
+                f"❌ Error reading transactions: {type(e).__name__}: {str(e)}",
+                exc_info=True,
             )
-            raise
+            degradations.record("purchase_filter_skipped", type(e).__name__)
+
+        # Return no purchases rather than failing
+        return {customer_id: [] for customer_id in customer_ids}
 
-    def _get_already_bought_items(self, customer_id: str) -> List[str]:
+    def _read_customer_features(self, customer_id: str) -> CustomerFeatures:
         """
-        Get list of items already bought by customer.
+        Read and decode a customer's features from the online store.
 
         Args:
             customer_id: ID of the customer
 
         Returns:
-            List of article IDs already purchased
+            The customer's features
+
+        Raises:
+            KeyError: If the customer is not in the store
+            TimeoutError: If the read did not finish in time
         """
-        logger.info(
-            f"🛒 Getting already purchased items for customer: {customer_id[:8]}..."
+        return decode_customer_features(
+            self._read(
+                "customer_features",
+                lambda timeout: self.data_access.customer_features(
+                    customer_id, timeout
+                ),
+            )
         )
 
+    @timed("customer_features")
+    def _get_customer_features(self, customer_id: str) -> CustomerFeatures:
+        """
+        Get a customer's features through the customer feature cache.
+
+        Each call is a span of the request, so the stage times the lookup
+        alone, not the other branches it overlaps, and a request records one
+        per distinct customer. A read that times out is served the customer's
+        last features, see _fallback_customer_features().
+
+        Args:
+            customer_id: ID of the customer
+
+        Returns:
+            The customer's features
+
+        Raises:
+            KeyError: If the customer is not in the store
+        """
         try:
-            # Use parameterized query to prevent SQL injection
-            query = f"""
-                SELECT
-                    article_id
-                FROM
-                    {TRANSACTIONS_TABLE}
-                WHERE
-                    customer_id = @customer_id
-            """
-
-            # Set query parameters
-            job_config = bigquery.QueryJobConfig(
-                query_parameters=[
-                    bigquery.ScalarQueryParameter("customer_id", "STRING", customer_id)
-                ]
-            )
+            return self.customer_cache.get(customer_id)
+        except TimeoutError:
+            return self._fallback_customer_features(customer_id, "read timed out")
 
-            # Execute query
-            query_job = client.query(query, job_config=job_config)
-            results = query_job.result()
+    def _fallback_customer_features(
+        self, customer_id: str, reason: str
+    ) -> CustomerFeatures:
+        """
+        Customer features for a request whose read did not finish in time,
+        or whose customer is not in the store.
 
-            # Extract article IDs
-            article_ids = [str(row.article_id) for row in results]
+        Args:
+            customer_id: ID of the customer
+            reason: Why the read is not used, for the log
 
-            if article_ids:
-                logger.info(f"🛍️ Found {len(article_ids)} previously purchased articles")
-                return article_ids
+        Returns:
+            The last features read for the customer, however old, or else
+            features of 0
+        """
+        features = self.customer_cache.stale(customer_id)
+        if features is not None:
+            degradations.record("customer_features_stale", reason)
+            return features
 
-            logger.warning(f"⚠️ No transactions found for customer: {customer_id[:8]}")
-            return []
+        degradations.record("customer_features_default", reason)
+        return DEFAULT_CUSTOMER_FEATURES
 
-        except Exception as e:
-            logger.error(
-                f"❌ Error reading transactions: {type(e).__name__}: {str(e)}",
-                exc_info=True,
+    def _get_query_embeddings(
+        self, instances: List[Dict[str, Any]]
+    ) -> Tuple[List[Any], np.ndarray]:
+        """
+        Get the query embedding of each instance.
+
+        Instances with a query_emb use it; the others are looked up in the
+        query embedding table by customer_id and the month of their date.
+
+        Args:
+            instances: Request instances
+
+        Returns:
+            Tuple of (query embeddings of the instances that have one, boolean
+            mask of those instances)
+        """
+        queries: List[Any] = [instance.get("query_emb") for instance in instances]
+
+        missing = [i for i, query in enumerate(queries) if query is None]
+        if missing and self.query_table is not None:
+            embeddings, found = self.query_table.lookup(
+                [instances[i]["customer_id"] for i in missing],
+                [month_of(instances[i]["date"]) for i in missing],
             )
-            # Return empty list rather than failing
-            return []
+            if not found.all():
+                logger.warning(
+                    f"⚠️ {int((~found).sum())} customers missing from query "
+                    "embedding table"
+                )
+            for i, embedding in zip(np.asarray(missing)[found], embeddings):
+                queries[i] = embedding
+
+        has_query = np.array([query is not None for query in queries], dtype=bool)
+        return [query for query in queries if query is not None], has_query
+
+    @staticmethod
+    def _get_month_encoding(instance: Dict[str, Any]) -> Tuple[float, float]:
+        """Month features of an instance, derived from its date if not given."""
+        if "month_sin" in instance and "month_cos" in instance:
+            return instance["month_sin"], instance["month_cos"]
+        return month_encoding(month_of(instance["date"]))
+
+    def _run_timed(self, stage: str, fn: Callable, *args) -> Any:
+        """
+        Run a preprocessing branch as a span of the current request.
+
+        Args:
+            stage: Stage name of the span
+            fn: Branch function
+            *args: Arguments for fn
+
+        Returns:
+            Result of fn
+        """
+        with Span(stage):
+            return fn(*args)
 
     def _find_similar_items(
-        self, query_embedding: List[float], k: int = TOP_K_CANDIDATES
-    ) -> List[str]:
+        self,
+        query_embeddings: List[List[float]],
+        k: int = TOP_K_CANDIDATES,
+        exclude: Optional[List[Sequence[str]]] = None,
+        retriever=None,
+    ) -> List[List[str]]:
         """
-        Find similar items based on embedding similarity.
+        Find similar items for a batch of query embeddings.
 
         Args:
-            query_embedding: Vector embedding for similarity search
-            k: Number of similar items to return
+            query_embeddings: Vector embeddings for similarity search
+            k: Number of similar items to return per query
+            exclude: Article IDs that must not be returned, one collection
+                per query
+            retriever: Retriever to search, by default self.retriever
 
         Returns:
-            List of article IDs similar to the query
+            List of article ID lists, one per query
         """
-        logger.info(f"🔍 Finding top {k} similar items")
+        if len(query_embeddings) == 0:
+            return []
+
+        logger.info(
+            f"🔍 Finding top {k} similar items for {len(query_embeddings)} queries"
+        )
 
         try:
-            # Convert query embedding to string safely
-            query_vector_str = str(query_embedding)
-
-            query = f"""
-                SELECT
-                    article_id,
-                    ARRAY_LENGTH(embeddings) as emb_size,
-                    ML.DISTANCE(embeddings, {query_vector_str}) as similarity
-                FROM
-                    {CANDIDATES_TABLE}
-                ORDER BY
-                    similarity 
-                DESC
-                LIMIT {k}
-            """
-
-            # Execute query
-            results = self._execute_query(query, "similarity_search")
-
-            # Extract article IDs
-            article_ids = [str(row.article_id) for row in results]
-
-            logger.info(f"✨ Found {len(article_ids)} similar items")
+            article_ids = (retriever or self.retriever).find_similar_items_batch(
+                query_embeddings, k, exclude
+            )
+
+            logger.info(
+                f"✨ Found {sum(len(ids) for ids in article_ids)} similar items"
+            )
             return article_ids
 
+        except TimeoutError:
+            degradations.record("no_candidates", "similarity search timed out")
+            return [[] for _ in query_embeddings]
+
         except Exception as e:
             logger.error(
                 f"❌ Error in similarity search: {type(e).__name__}: {str(e)}",
                 exc_info=True,
             )
+            return [[] for _ in query_embeddings]
+
+    def _find_unpurchased_items(
+        self,
+        query_embeddings: List[List[float]],
+        customer_ids: List[str],
+        retriever=None,
+    ) -> List[List[str]]:
+        """
+        Find similar items that each customer has not bought yet.
+
+        Purchases come from the purchase index, or from BigQuery when there is
+        none, and are excluded inside retrieval rather than filtered out of
+        its results, so heavy buyers still get TOP_K_CANDIDATES candidates.
+
+        Args:
+            query_embeddings: Vector embeddings for similarity search
+            customer_ids: Customer of each query
+            retriever: Retriever to search, by default self.retriever
+
+        Returns:
+            List of article ID lists, one per query
+        """
+        if len(query_embeddings) == 0:
             return []
 
-    def _get_articles_data(self, articles: List[str]) -> pd.DataFrame:
+        if self.purchase_index is not None:
+            exclude = [
+                self.purchase_index.purchased_ids(customer_id)
+                for customer_id in customer_ids
+            ]
+        else:
+            bought_items = self._run_timed(
+                "bought_items", self._get_already_bought_items, customer_ids
+            )
+            exclude = [bought_items[customer_id] for customer_id in customer_ids]
+
+        logger.info(
+            f"🛍️ Excluding {sum(len(ids) for ids in exclude)} already purchased items"
+        )
+        return self._find_similar_items(
+            query_embeddings, exclude=exclude, retriever=retriever
+        )
+
+    def _get_articles_data(
+        self, articles: List[str]
+    ) -> Tuple[pd.DataFrame, np.ndarray]:
         """
         Get features for a list of articles.
 
         Args:
-            articles: List of article IDs
+            articles: List of article IDs, possibly with repeats
 
         Returns:
-            DataFrame with article features
+            Tuple of (DataFrame with one row per found article in input order,
+            boolean mask of the input articles that were found)
         """
         if not articles:
             logger.warning("⚠️ Empty article list for feature retrieval")
-            return pd.DataFrame()
+            return pd.DataFrame(), np.zeros(0, dtype=bool)
 
         logger.info(f"📊 Getting features for {len(articles)} articles")
 
         try:
-            # Format article list for SQL IN clause
-            articles_formatted = ", ".join([f"'{article}'" for article in articles])
-
-            query = f"""
-                SELECT
-                    *
-                FROM
-                    {ARTICLES_TABLE}
-                WHERE
-                    article_id IN ({articles_formatted})
-            """
-
-            # Execute query
-            results = self._execute_query(query, "articles_data")
-
-            # Convert to DataFrame
-            df = results.to_dataframe()
+            return self._read(
+                "article_features",
+                lambda timeout: self.data_access.articles_data(articles, timeout),
+            )
 
-            logger.info(f"📊 Retrieved features for {len(df)} articles")
-            return df
+        except TimeoutError:
+            degradations.record("article_features_missing", "articles read timed out")
+            return pd.DataFrame(), np.zeros(len(articles), dtype=bool)
 
         except Exception as e:
             logger.error(
                 f"❌ Error retrieving article features: {type(e).__name__}: {str(e)}",
                 exc_info=True,
             )
-            return pd.DataFrame()
+            return pd.DataFrame(), np.zeros(len(articles), dtype=bool)
+
+    def _gather_article_features(
+        self, feature_matrix: ArticleFeatureMatrix, articles: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Gather model-ready article rows from the article feature matrix.
+
+        Args:
+            feature_matrix: Matrix to gather from
+            articles: Array of article IDs, possibly with repeats
+
+        Returns:
+            Tuple of (float32 rows for the found articles in input order,
+            boolean mask of the input articles that were found)
+        """
+        indices = feature_matrix.table.lookup(articles)
+        found = indices >= 0
+        if not found.all():
+            logger.warning(
+                f"⚠️ {int((~found).sum())} articles missing from article table"
+            )
+
+        features = feature_matrix.gather(indices[found])
+        logger.info(f"📊 Gathered features for {len(features)} articles")
+        return features, found
 
     def _get_rankings_data(self, customer_id: str) -> pd.DataFrame:
         """
@@ -295,29 +598,7 @@ class RankingTransformer:
         logger.info(f"🏆 Getting previous rankings for customer: {customer_id[:8]}")
 
         try:
-            # Use parameterized query to prevent SQL injection
-            query = f"""
-                SELECT
-                    *
-                FROM
-                    {RANKINGS_TABLE}
-                WHERE
-                    customer_id = @customer_id
-            """
-
-            # Set query parameters
-            job_config = bigquery.QueryJobConfig(
-                query_parameters=[
-                    bigquery.ScalarQueryParameter("customer_id", "STRING", customer_id)
-                ]
-            )
-
-            # Execute query
-            query_job = client.query(query, job_config=job_config)
-            results = query_job.result()
-
-            # Convert to DataFrame
-            df = results.to_dataframe()
+            df = self.data_access.rankings_data(customer_id)
 
             logger.info(f"🏆 Retrieved {len(df)} previous rankings")
             return df
@@ -329,123 +610,227 @@ class RankingTransformer:
             )
             return pd.DataFrame()
 
-    def preprocess(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+    @staticmethod
+    def _empty_inputs(n_instances: int) -> Dict[str, Any]:
+        """Model inputs with no candidates for any of the instances."""
+        return {
+            "inputs": [
+                {
+                    "ranking_features": pd.DataFrame(),
+                    "article_ids": [],
+                    "group_offsets": np.zeros(n_instances + 1, dtype=np.int64),
+                }
+            ]
+        }
+
+    def _select_model_features(
+        self,
+        articles_data: pd.DataFrame,
+        groups: np.ndarray,
+        request_features: Dict[str, np.ndarray],
+    ) -> pd.DataFrame:
         """
-        Preprocess inputs for ranking prediction.
+        Build the model input DataFrame from queried article features.
 
         Args:
-            inputs: Dictionary with input data
+            articles_data: One row of article features per candidate
+            groups: Instance index of each candidate
+            request_features: Per-instance customer and temporal features
 
         Returns:
-            Dictionary with processed inputs ready for model prediction
+            DataFrame with the model features in model input order
         """
-        logger.timer_start("preprocess")
-
-        try:
-            # Extract the input instance
-            instance = inputs["instances"][0]
-            customer_id = instance["customer_id"]
-            query_embedding = instance["query_emb"]
+        ranking_model_inputs = articles_data
+        for feature, values in request_features.items():
+            ranking_model_inputs[feature] = values[groups]
+
+        # Handle special case for colour_group_name_right
+        if (
+            "colour_group_name_right" in self.ranking_model_feature_names
+            and "colour_group_name_right" not in ranking_model_inputs.columns
+        ):
+            if "colour_group_name" in ranking_model_inputs.columns:
+                logger.info("🎨 Copying colour_group_name to colour_group_name_right")
+                ranking_model_inputs["colour_group_name_right"] = ranking_model_inputs[
+                    "colour_group_name"
+                ]
 
-            logger.info(f"🔄 Preprocessing for customer: {customer_id[:8]}")
+        # Add missing features with zeros
+        for feature in self.ranking_model_feature_names:
+            if feature not in ranking_model_inputs.columns:
+                logger.warning(f"⚠️ Adding missing feature {feature} with zeros")
+                ranking_model_inputs[feature] = 0
 
-            # 1. Find similar items using vector search
-            neighbor_ids = self._find_similar_items(query_embedding)
+        # Select only the features needed by the model
+        try:
+            return ranking_model_inputs[self.ranking_model_feature_names]
+        except KeyError as e:
+            # Log detailed information about missing features
+            missing_features = set(self.ranking_model_feature_names) - set(
+                ranking_model_inputs.columns
+            )
+            logger.error(f"❌ Missing features: {missing_features}")
+            logger.error(
+                f"❌ Available features: {ranking_model_inputs.columns.tolist()}"
+            )
+            raise ValueError(f"Missing required features: {missing_features}")
 
-            if not neighbor_ids:
-                logger.warning("⚠️ No candidate items found via embedding similarity")
-                return {
-                    "inputs": [{"ranking_features": pd.DataFrame(), "article_ids": []}]
-                }
+    @timed("preprocess")
+    def preprocess(self, inputs: Dict[str, Any], version=None) -> Dict[str, Any]:
+        """
+        Preprocess inputs for ranking prediction.
 
-            # 2. Get items already bought by the customer
-            logger.timer_start("get_bought_items")
-            already_bought_items_ids = self._get_already_bought_items(customer_id)
-            logger.timer_end("get_bought_items")
+        Candidates of all instances are stacked into one feature block: a
+        float32 array gathered from the article feature matrix when the
+        article table is resident, otherwise a DataFrame. Rows of instance i
+        are group_offsets[i]:group_offsets[i + 1].
 
-            # 3. Filter out already bought items
-            article_entities = [
-                str(item_id)
-                for item_id in neighbor_ids
-                if str(item_id) not in already_bought_items_ids
-            ]
+        Args:
+            inputs: Dictionary with input data
+            version: ModelVersion whose retriever and feature matrix to use,
+                by default those of the transformer
 
-            if not article_entities:
-                logger.warning(
-                    "⚠️ No new items to recommend after filtering out purchased items"
+        Returns:
+            Dictionary with processed inputs ready for model prediction
+        """
+        try:
+            # Take one reference of each so a concurrent swap or refresh cannot
+            # change them during the request
+            if version is not None:
+                retriever, feature_matrix = version.retriever, version.feature_matrix
+            else:
+                retriever, feature_matrix = self.retriever, self.feature_matrix
+
+            # Extract the input instances
+            instances = inputs["instances"]
+            n_instances = len(instances)
+            customer_ids = [instance["customer_id"] for instance in instances]
+
+            logger.info(f"🔄 Preprocessing {n_instances} instances")
+
+            # Query embeddings sent with the request or looked up by date
+            query_embeddings, has_query = self._get_query_embeddings(instances)
+
+            # Branches that depend only on the request run concurrently:
+            # retrieval of unpurchased items and customer features
+            neighbors_future = run_in_context(
+                self.executor,
+                self._run_timed,
+                "retrieval",
+                self._find_unpurchased_items,
+                query_embeddings,
+                [
+                    customer_id
+                    for customer_id, has in zip(customer_ids, has_query)
+                    if has
+                ],
+                retriever,
+            )
+            customer_futures = {
+                customer_id: run_in_context(
+                    self.executor, self._get_customer_features, customer_id
                 )
-                return {
-                    "inputs": [{"ranking_features": pd.DataFrame(), "article_ids": []}]
-                }
-
-            # 4. Get article features
-            logger.timer_start("get_article_features")
-            articles_data = self._get_articles_data(article_entities)
-            logger.timer_end("get_article_features")
+                for customer_id in dict.fromkeys(customer_ids)
+            }
 
-            # 5. Get customer features
-            logger.timer_start("get_customer_features")
-            self.customers_view.sync()
-            customer_result = self.customers_view.read(key=[customer_id])
-            customer_features = customer_result.to_dict()["features"]
-            logger.timer_end("get_customer_features")
+            # 1. Find similar items not yet purchased using vector search
+            try:
+                candidates = neighbors_future.result(timeout=remaining())
+            except TimeoutError:
+                degradations.record("no_candidates", "retrieval exceeded the budget")
+                return self._empty_inputs(n_instances)
+            if not has_query.all():
+                # Instances without a query embedding get no candidates
+                found_candidates = iter(candidates)
+                candidates = [
+                    next(found_candidates) if has else [] for has in has_query
+                ]
 
-            # 6. Create feature DataFrame
-            ranking_model_inputs = articles_data.copy()
+            if not any(candidates):
+                logger.warning("⚠️ No new items to recommend via embedding similarity")
+                return self._empty_inputs(n_instances)
 
-            # 7. Add customer and temporal features
-            logger.data("Adding customer and temporal features")
-            ranking_model_inputs["age"] = customer_features[1]["value"].get(
-                "double_value", 0
+            # 2. Get article features for all candidates at once
+            article_entities = np.concatenate(
+                [np.asarray(ids, dtype=str) for ids in candidates]
             )
-            ranking_model_inputs["month_sin"] = instance["month_sin"]
-            ranking_model_inputs["month_cos"] = instance["month_cos"]
-
-            # 8. Handle special case for colour_group_name_right
-            if (
-                "colour_group_name_right" in self.ranking_model_feature_names
-                and "colour_group_name_right" not in ranking_model_inputs.columns
-            ):
-                if "colour_group_name" in ranking_model_inputs.columns:
-                    logger.info(
-                        "🎨 Copying colour_group_name to colour_group_name_right"
+            groups = np.repeat(np.arange(n_instances), [len(ids) for ids in candidates])
+
+            with Span("article_features"):
+                if feature_matrix is not None:
+                    articles_data, found = self._gather_article_features(
+                        feature_matrix, article_entities
+                    )
+                else:
+                    articles_data, found = self._get_articles_data(
+                        article_entities.tolist()
+                    )
+
+            if len(articles_data) == 0:
+                logger.warning("⚠️ No article features found for candidates")
+                return self._empty_inputs(n_instances)
+
+            article_entities = article_entities[found]
+            groups = groups[found]
+            group_offsets = np.zeros(n_instances + 1, dtype=np.int64)
+            np.cumsum(np.bincount(groups, minlength=n_instances), out=group_offsets[1:])
+
+            # 3. Get customer features, as last read for those past the budget
+            # and of 0 for customers not in the store, so one unknown customer
+            # does not fail the other instances
+            customer_features = {}
+            for customer_id, future in customer_futures.items():
+                try:
+                    customer_features[customer_id] = future.result(timeout=remaining())
+                except TimeoutError:
+                    customer_features[customer_id] = self._fallback_customer_features(
+                        customer_id, "read exceeded the budget"
                     )
-                    ranking_model_inputs["colour_group_name_right"] = (
-                        ranking_model_inputs["colour_group_name"]
+                except KeyError:
+                    customer_features[customer_id] = self._fallback_customer_features(
+                        customer_id, "customer not in the store"
                     )
 
-            # 9. Add missing features with zeros
-            for feature in self.ranking_model_feature_names:
-                if feature not in ranking_model_inputs.columns:
-                    logger.warning(f"⚠️ Adding missing feature {feature} with zeros")
-                    ranking_model_inputs[feature] = 0
+            # 4. Collect customer and temporal features of each instance
+            month_features = np.array(
+                [self._get_month_encoding(instance) for instance in instances],
+                dtype=np.float64,
+            )
+            request_features = {
+                "age": np.array(
+                    [
+                        customer_features[customer_id].age
+                        for customer_id in customer_ids
+                    ],
+                    dtype=np.float64,
+                ),
+                "month_sin": month_features[:, 0],
+                "month_cos": month_features[:, 1],
+            }
 
-            # 10. Select only the features needed by the model
-            try:
-                ranking_model_inputs = ranking_model_inputs[
-                    self.ranking_model_feature_names
-                ]
-            except KeyError as e:
-                # Log detailed information about missing features
-                missing_features = set(self.ranking_model_feature_names) - set(
-                    ranking_model_inputs.columns
+            # 5. Broadcast them to each candidate
+            logger.data("Adding customer and temporal features")
+            if feature_matrix is not None:
+                # Rows are already encoded and in model feature order
+                ranking_model_inputs = feature_matrix.fill(
+                    articles_data, groups, request_features
                 )
-                logger.error(f"❌ Missing features: {missing_features}")
-                logger.error(
-                    f"❌ Available features: {ranking_model_inputs.columns.tolist()}"
+            else:
+                ranking_model_inputs = self._select_model_features(
+                    articles_data, groups, request_features
                 )
-                raise ValueError(f"Missing required features: {missing_features}")
 
             logger.success(
-                f"Preprocessing complete with {len(ranking_model_inputs)} candidates"
+                f"Preprocessing complete with {len(ranking_model_inputs)} candidates "
+                f"for {n_instances} instances"
             )
-            logger.timer_end("preprocess")
 
             return {
                 "inputs": [
                     {
                         "ranking_features": ranking_model_inputs,
-                        "article_ids": article_entities,
+                        "article_ids": article_entities.tolist(),
+                        "group_offsets": group_offsets,
                     }
                 ]
             }
@@ -458,54 +843,110 @@ class RankingTransformer:
             # Re-raise with more context
             raise ValueError(f"Preprocessing failed: {type(e).__name__}: {str(e)}")
 
-    def postprocess(self, outputs: Dict[str, Any]) -> Dict[str, List]:
+    @timed("postprocess")
+    def postprocess(
+        self, outputs: Dict[str, Any], columnar: bool = False
+    ) -> Dict[str, Any]:
         """
-        Process model outputs into ranked list of recommendations.
+        Process model outputs into ranked lists of recommendations.
 
         Args:
             outputs: Dictionary with model prediction outputs
+            columnar: Return the rankings as flat arrays instead of lists of
+                [score, article_id] pairs, for binary response encodings
 
         Returns:
-            Dictionary with ranking results
+            Dictionary with one ranking per instance under "rankings"; a
+            single-instance request also gets its ranking under "ranking".
+            With columnar, a dictionary with float32 "scores", "article_ids"
+            and "ranking_offsets", where the ranking of instance i is rows
+            ranking_offsets[i]:ranking_offsets[i + 1]
         """
-        logger.timer_start("postprocess")
+        group_offsets = outputs.get("group_offsets")
+        n_instances = len(group_offsets) - 1 if group_offsets is not None else 1
+        scores = np.zeros(0, dtype=np.float32)
+        article_ids: List[str] = []
+        rows = [np.zeros(0, dtype=np.int64) for _ in range(n_instances)]
 
         try:
             # Validate outputs
-            if not outputs.get("scores") or not outputs.get("article_ids"):
+            if len(outputs.get("scores", [])) == 0 or not outputs.get("article_ids"):
                 logger.warning("⚠️ Empty prediction results")
-                return {"ranking": []}
+            else:
+                # Get scores and article IDs
+                scores = np.asarray(outputs["scores"], dtype=np.float32)
+                article_ids = outputs["article_ids"]
+                if group_offsets is None:
+                    group_offsets = [0, len(scores)]
+
+                # Take the top predictions of each instance
+                rows = [
+                    start + top_k(scores[start:end], MAX_RECOMMENDATIONS)[0]
+                    for start, end in zip(group_offsets[:-1], group_offsets[1:])
+                ]
 
-            # Get scores and article IDs
-            scores = outputs["scores"]
-            article_ids = outputs["article_ids"]
+                logger.info(
+                    f"📊 Returning top {MAX_RECOMMENDATIONS} recommendations "
+                    f"for {n_instances} instances"
+                )
 
-            # Create ranking pairs
-            ranking = list(zip(scores, article_ids))
+                # Log top scores for monitoring
+                if n_instances == 1 and len(rows[0]):
+                    top_score = scores[rows[0][0]]
+                    bottom_score = scores[rows[0][-1]]
+                    logger.info(
+                        f"📈 Score range: {bottom_score:.4f} to {top_score:.4f}"
+                    )
 
-            # Sort by score (descending)
-            ranking.sort(reverse=True)
+        except Exception as e:
+            logger.error(
+                f"❌ Error in postprocessing: {type(e).__name__}: {str(e)}",
+                exc_info=True,
+            )
+            # Return empty rankings rather than failing
+            rows = [np.zeros(0, dtype=np.int64) for _ in range(n_instances)]
 
-            # Take only the top 10 predictions
-            top_10_ranking = ranking[:10]
-            logger.info(f"📊 Returning top {len(top_10_ranking)} recommendations")
+        return self.format_rankings(
+            [(scores[top], [article_ids[i] for i in top]) for top in rows], columnar
+        )
 
-            # Log top scores for monitoring
-            if top_10_ranking:
-                top_score = top_10_ranking[0][0]
-                bottom_score = top_10_ranking[-1][0]
-                logger.info(f"📈 Score range: {bottom_score:.4f} to {top_score:.4f}")
+    @staticmethod
+    def format_rankings(
+        rankings: List[Tuple[np.ndarray, List[str]]], columnar: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Build the response body for per-instance rankings.
 
-            logger.timer_end("postprocess")
+        Args:
+            rankings: (float32 scores, article IDs) of each instance, by
+                descending score
+            columnar: Return flat arrays, see postprocess()
 
+        Returns:
+            Response body as returned by postprocess()
+        """
+        if columnar:
             return {
-                "ranking": top_10_ranking,
+                "scores": np.concatenate(
+                    [np.zeros(0, dtype=np.float32)] + [scores for scores, _ in rankings]
+                ),
+                "article_ids": [
+                    article_id
+                    for _, article_ids in rankings
+                    for article_id in article_ids
+                ],
+                "ranking_offsets": np.cumsum(
+                    [0] + [len(scores) for scores, _ in rankings], dtype=np.int64
+                ),
             }
 
-        except Exception as e:
-            logger.error(
-                f"❌ Error in postprocessing: {type(e).__name__}: {str(e)}",
-                exc_info=True,
-            )
-            # Return empty ranking rather than failing
-            return {"ranking": []}
+        response = {
+            "rankings": [
+                [[float(score), article_id] for score, article_id in zip(*ranking)]
+                for ranking in rankings
+            ]
+        }
+        if len(rankings) == 1:
+            # Single-instance callers keep reading the top-level ranking
+            response["ranking"] = response["rankings"][0]
+        return response
@@ -0,0 +1,493 @@
+"""
+Materialized recommendations for the ranking container.
+
+Most requests come from customers whose rankings only change when the models
+or the nightly features do. materialize.py ranks every customer with the
+serving pipeline and writes the rankings to a snapshot: sorted 64-bit
+customer keys (see purchase_index.customer_key), CSR offsets, int32 article
+indices into an article vocabulary and float32 scores, all .npy files that
+are memory-mapped at load time, plus a manifest of what they were computed
+from.
+
+A ranking is served from the snapshot while it is fresh: the snapshot is
+younger than RECOMMENDATIONS_MAX_AGE_SECONDS, was computed with the model
+version serving the request, for the month of the instance and after the
+article table was loaded, and the customer has no purchases recorded since.
+The model version is identified by the location of its model files, which
+stays the same whatever alias or ID it is loaded by.
+Any other instance goes through the online preprocess/predict path.
+"""
+
+import os
+import json
+import time
+import shutil
+import threading
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+from config import (
+    MAX_RECOMMENDATIONS,
+    RECOMMENDATIONS_MAX_AGE_SECONDS,
+    RECOMMENDATIONS_REFRESH_SECONDS,
+    RECOMMENDATIONS_SNAPSHOT_DIR,
+)
+from logger import logger
+from purchase_index import customer_key
+from query_table import month_encoding, month_of
+
+CUSTOMER_KEYS_FILE = "customer_keys.npy"
+OFFSETS_FILE = "offsets.npy"
+ARTICLES_FILE = "articles.npy"
+SCORES_FILE = "scores.npy"
+ARTICLE_IDS_FILE = "article_ids.npy"
+# Written last, so a directory with a manifest is complete
+MANIFEST_FILE = "manifest.json"
+
+# (scores, article IDs) of one instance, by descending score
+Ranking = Tuple[np.ndarray, List[str]]
+
+
+def customer_keys(customer_ids) -> np.ndarray:
+    """Hash customer IDs to the uint64 keys of the table."""
+    return np.fromiter(
+        (customer_key(str(customer_id)) for customer_id in customer_ids),
+        dtype=np.uint64,
+        count=len(customer_ids),
+    )
+
+
+def merge_vocabularies(
+    parts: List[Tuple[np.ndarray, np.ndarray]],
+) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """
+    Re-encode article indices of several vocabularies against their union.
+
+    Args:
+        parts: (article vocabulary, int32 indices into it) of each part
+
+    Returns:
+        Tuple of (sorted union vocabulary, indices of each part into it)
+    """
+    vocabulary = np.unique(
+        np.concatenate(
+            [np.empty(0, dtype=str)] + [np.asarray(ids, dtype=str) for ids, _ in parts]
+        )
+    )
+    return vocabulary, [
+        np.searchsorted(vocabulary, np.asarray(ids, dtype=str))[indices].astype(
+            np.int32
+        )
+        for ids, indices in parts
+    ]
+
+
+class RecommendationTable:
+    """
+    Immutable table of materialized rankings by customer.
+
+    Attributes:
+        customer_keys: Sorted uint64 customer keys
+        offsets: Start of each customer's ranking, length n_customers + 1
+        articles: Concatenated int32 article indices, by descending score
+        scores: Concatenated float32 scores
+        article_ids: Article vocabulary indexed by article index
+        manifest: model_version, model_uri (location of the model files),
+            month, top_n and created_at (Unix time the job started) of the
+            rankings
+    """
+
+    def __init__(
+        self,
+        customer_keys: np.ndarray,
+        offsets: np.ndarray,
+        articles: np.ndarray,
+        scores: np.ndarray,
+        article_ids: np.ndarray,
+        manifest: Dict[str, Any],
+    ):
+        self.customer_keys = customer_keys
+        self.offsets = offsets
+        self.articles = articles
+        self.scores = scores
+        self.article_ids = article_ids
+        self.manifest = manifest
+
+        # Month features of the rankings, to match instances that send them
+        self.month_encoding = tuple(
+            round(value, 6) for value in month_encoding(manifest["month"])
+        )
+
+    def __len__(self) -> int:
+        return len(self.customer_keys)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the table arrays in bytes."""
+        return (
+            self.customer_keys.nbytes
+            + self.offsets.nbytes
+            + self.articles.nbytes
+            + self.scores.nbytes
+            + self.article_ids.nbytes
+        )
+
+    @classmethod
+    def from_rankings(
+        cls,
+        keys: np.ndarray,
+        offsets: np.ndarray,
+        articles: np.ndarray,
+        scores: np.ndarray,
+        article_ids: np.ndarray,
+        manifest: Dict[str, Any],
+    ) -> "RecommendationTable":
+        """
+        Build a table from rankings in any customer order.
+
+        Args:
+            keys: uint64 key of the customer of each ranking (see
+                customer_keys()); repeats keep the last ranking
+            offsets: Start of each ranking, length len(keys) + 1
+            articles: Concatenated int32 article indices of the rankings
+            scores: Concatenated float32 scores of the rankings
+            article_ids: Article vocabulary indexed by article index
+            manifest: See the class attributes
+
+        Returns:
+            Table sorted by customer key
+        """
+        keys = np.asarray(keys, dtype=np.uint64)
+        # Repeats stay in input order, so the last of each run is kept
+        order = np.argsort(keys, kind="stable")
+        keep = np.ones(len(order), dtype=bool)
+        keep[:-1] = keys[order[1:]] != keys[order[:-1]]
+        order = order[keep]
+
+        starts, ends = offsets[:-1][order], offsets[1:][order]
+        lengths = ends - starts
+        sorted_offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=sorted_offsets[1:])
+        rows = np.repeat(starts - sorted_offsets[:-1], lengths) + np.arange(
+            sorted_offsets[-1]
+        )
+
+        return cls(
+            keys[order],
+            sorted_offsets,
+            np.asarray(articles, dtype=np.int32)[rows],
+            np.asarray(scores, dtype=np.float32)[rows],
+            np.asarray(article_ids, dtype=str),
+            {**manifest, "customers": int(len(order))},
+        )
+
+    def save(self, snapshot_dir: str) -> str:
+        """
+        Write the table, replacing any table in snapshot_dir.
+
+        The files go to a sibling directory that is renamed into place, so a
+        server loading the table never sees files of two tables; one that
+        already mapped the old files keeps reading them.
+
+        Args:
+            snapshot_dir: Directory to write the table to
+
+        Returns:
+            Path of the snapshot directory
+        """
+        snapshot_dir = os.path.normpath(snapshot_dir)
+        tmp_dir = f"{snapshot_dir}.tmp-{os.getpid()}"
+        old_dir = f"{snapshot_dir}.old-{os.getpid()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+        for file_name, array in [
+            (CUSTOMER_KEYS_FILE, self.customer_keys),
+            (OFFSETS_FILE, self.offsets),
+            (ARTICLES_FILE, self.articles),
+            (SCORES_FILE, self.scores),
+            (ARTICLE_IDS_FILE, self.article_ids),
+        ]:
+            np.save(os.path.join(tmp_dir, file_name), np.asarray(array))
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+            json.dump(self.manifest, f, indent=2)
+
+        if os.path.exists(snapshot_dir):
+            os.rename(snapshot_dir, old_dir)
+        os.rename(tmp_dir, snapshot_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+        logger.info(
+            f"💾 Saved recommendations of {len(self)} customers "
+            f"({self.nbytes / 2**20:.1f} MB) to {snapshot_dir}"
+        )
+        return snapshot_dir
+
+    @classmethod
+    def load(
+        cls, snapshot_dir: str = RECOMMENDATIONS_SNAPSHOT_DIR
+    ) -> "RecommendationTable":
+        """
+        Memory-map a table written by save().
+
+        Args:
+            snapshot_dir: Snapshot directory
+
+        Returns:
+            Loaded table
+
+        Raises:
+            ValueError: If the snapshot files are inconsistent
+        """
+        with open(os.path.join(snapshot_dir, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        arrays = [
+            np.load(os.path.join(snapshot_dir, file_name), mmap_mode="r")
+            for file_name in (CUSTOMER_KEYS_FILE, OFFSETS_FILE, ARTICLES_FILE)
+        ]
+        scores = np.load(os.path.join(snapshot_dir, SCORES_FILE), mmap_mode="r")
+        article_ids = np.load(os.path.join(snapshot_dir, ARTICLE_IDS_FILE))
+        table = cls(*arrays, scores, article_ids, manifest)
+
+        if len(table.offsets) != len(table) + 1 or not (
+            len(table.articles) == len(table.scores) == table.offsets[-1]
+        ):
+            raise ValueError(
+                f"Inconsistent recommendation snapshot in {snapshot_dir}: "
+                f"{len(table)} customers, {len(table.offsets)} offsets, "
+                f"{len(table.articles)} articles, {len(table.scores)} scores"
+            )
+
+        logger.data(
+            f"Loaded recommendations of {len(table)} customers for model "
+            f"{manifest['model_version']}, month {manifest['month']} "
+            f"from {snapshot_dir}"
+        )
+        return table
+
+    def lookup(self, customer_ids: List[str]) -> List[Optional[Ranking]]:
+        """
+        Get the rankings of customers.
+
+        Args:
+            customer_ids: Customer IDs
+
+        Returns:
+            Ranking of each customer, None for customers not in the table
+        """
+        if len(customer_ids) == 0 or len(self) == 0:
+            return [None] * len(customer_ids)
+
+        keys = customer_keys(customer_ids)
+        positions = np.minimum(np.searchsorted(self.customer_keys, keys), len(self) - 1)
+        found = self.customer_keys[positions] == keys
+
+        rankings: List[Optional[Ranking]] = []
+        for position, is_found in zip(positions, found):
+            if not is_found:
+                rankings.append(None)
+                continue
+            start, end = self.offsets[position], self.offsets[position + 1]
+            rankings.append(
+                (
+                    np.array(self.scores[start:end]),
+                    self.article_ids[self.articles[start:end]].tolist(),
+                )
+            )
+        return rankings
+
+
+class RecommendationStore:
+    """
+    Serves instances from the current RecommendationTable while it is fresh.
+
+    The table is reloaded in the background when a new snapshot appears; the
+    refresh thread runs once start() is called. Wire invalidate() to new
+    purchases and mark_stale() to article table refreshes.
+    """
+
+    def __init__(
+        self,
+        snapshot_dir: str = RECOMMENDATIONS_SNAPSHOT_DIR,
+        max_age_seconds: float = RECOMMENDATIONS_MAX_AGE_SECONDS,
+        refresh_seconds: float = RECOMMENDATIONS_REFRESH_SECONDS,
+    ):
+        """
+        Load the snapshot if there is one.
+
+        Args:
+            snapshot_dir: Snapshot directory written by materialize.py
+            max_age_seconds: Age after which the snapshot is not served
+            refresh_seconds: Interval between snapshot checks (0 disables refresh)
+        """
+        self.snapshot_dir = snapshot_dir
+        self.max_age_seconds = max_age_seconds
+        self.refresh_seconds = refresh_seconds
+        self.table: Optional[RecommendationTable] = None
+        self._loaded_mtime: Optional[float] = None
+
+        # Tables created before this Unix time are not served
+        self._stale_before = 0.0
+        # Customer ID -> Unix time of their last recorded purchase
+        self._purchased_at: Dict[str, float] = {}
+        self._counts = {"hits": 0, "misses": 0, "stale": 0}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.refresh()
+
+    def start(self) -> None:
+        """Start the background refresh thread, unless refresh is disabled."""
+        if self.refresh_seconds > 0 and self._thread is None:
+            self._thread = threading.Thread(
+                target=self._refresh_loop, name="recommendations-refresh", daemon=True
+            )
+            self._thread.start()
+
+    def refresh(self) -> bool:
+        """
+        Load the snapshot if it changed on disk.
+
+        Returns:
+            True if a new table was swapped in
+        """
+        manifest_path = os.path.join(self.snapshot_dir, MANIFEST_FILE)
+        try:
+            if not os.path.exists(manifest_path):
+                return False
+            mtime = os.path.getmtime(manifest_path)
+            if mtime == self._loaded_mtime:
+                return False
+            table = RecommendationTable.load(self.snapshot_dir)
+            self._loaded_mtime = mtime
+
+            # Purchases before the job started are in its rankings
+            created_at = table.manifest["created_at"]
+            with self._lock:
+                self._purchased_at = {
+                    customer_id: purchased_at
+                    for customer_id, purchased_at in self._purchased_at.items()
+                    if purchased_at >= created_at
+                }
+            self.table = table
+            return True
+        except Exception as e:
+            logger.error(
+                f"❌ Error loading recommendation snapshot: "
+                f"{type(e).__name__}: {str(e)}",
+                exc_info=True,
+            )
+            return False
+
+    def _refresh_loop(self) -> None:
+        while not self._stop.wait(self.refresh_seconds):
+            self.refresh()
+
+    def invalidate(self, customer_id: str) -> None:
+        """Stop serving a customer's ranking, e.g. after new purchases."""
+        with self._lock:
+            self._purchased_at[customer_id] = time.time()
+
+    def mark_stale(self, reason: str = "") -> None:
+        """Stop serving the current table, e.g. after the article table changed."""
+        self._stale_before = time.time()
+        logger.info(
+            f"🧹 Recommendation snapshot no longer served ({reason or 'on request'})"
+        )
+
+    def _is_fresh(self, table: RecommendationTable, model_uri: Optional[str]) -> bool:
+        manifest = table.manifest
+        return (
+            bool(model_uri and manifest.get("model_uri"))
+            and manifest["model_uri"].rstrip("/") == model_uri.rstrip("/")
+            and manifest["top_n"] == MAX_RECOMMENDATIONS
+            and manifest["created_at"] >= self._stale_before
+            and time.time() - manifest["created_at"] <= self.max_age_seconds
+        )
+
+    @staticmethod
+    def _month_matches(table: RecommendationTable, instance: Dict[str, Any]) -> bool:
+        if "month_sin" in instance and "month_cos" in instance:
+            return (
+                round(instance["month_sin"], 6),
+                round(instance["month_cos"], 6),
+            ) == table.month_encoding
+        return month_of(instance["date"]) == table.manifest["month"]
+
+    def lookup(
+        self, instances: List[Dict[str, Any]], model_uri: Optional[str]
+    ) -> List[Optional[Ranking]]:
+        """
+        Get the materialized rankings of validated instances.
+
+        Instances that send their own query embedding are always ranked
+        online.
+
+        Args:
+            instances: Instances of a /predict request
+            model_uri: Location of the model files of the version serving
+                the request
+
+        Returns:
+            Ranking of each instance, None where it must be ranked online
+        """
+        table = self.table
+        rankings: List[Optional[Ranking]] = [None] * len(instances)
+        if table is None:
+            return rankings
+        if not self._is_fresh(table, model_uri):
+            with self._lock:
+                self._counts["stale"] += len(instances)
+            return rankings
+
+        with self._lock:
+            eligible = [
+                i
+                for i, instance in enumerate(instances)
+                if "query_emb" not in instance
+                and self._month_matches(table, instance)
+                and instance["customer_id"] not in self._purchased_at
+            ]
+        found = table.lookup([instances[i]["customer_id"] for i in eligible])
+        for i, ranking in zip(eligible, found):
+            rankings[i] = ranking
+
+        hits = sum(ranking is not None for ranking in found)
+        with self._lock:
+            self._counts["hits"] += hits
+            self._counts["misses"] += len(eligible) - hits
+            self._counts["stale"] += len(instances) - len(eligible)
+        return rankings
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters and description of the served snapshot.
+
+        Returns:
+            Dictionary with instances served from the snapshot (hits), not in
+            it (misses) and ranked online because the snapshot or entry was
+            not fresh (stale), and the manifest, age and size of the table
+        """
+        with self._lock:
+            counts = dict(self._counts)
+            invalidated = len(self._purchased_at)
+        lookups = sum(counts.values())
+        stats = {
+            **counts,
+            "hit_ratio": counts["hits"] / lookups if lookups else 0.0,
+            "invalidated_customers": invalidated,
+        }
+        table = self.table
+        if table is not None:
+            stats.update(
+                {
+                    **table.manifest,
+                    "age_seconds": round(time.time() - table.manifest["created_at"], 1),
+                    "bytes": table.nbytes,
+                }
+            )
+        return stats
+
+    def close(self) -> None:
+        """Stop the background refresh thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,236 @@
+"""
+In-process cache of per-instance rankings.
+
+A customer often asks for recommendations several times within minutes (page
+reloads, several widgets on a page). The ranking of an instance depends on
+the customer, the month features, the query embedding and the model version,
+so rankings are cached under those and served until they expire, without
+retrieval, lookups or scoring.
+
+Entries are dropped when their TTL passes, least recently used first when
+the cache is full, and explicitly: all of them when a model version is
+swapped in or the article table is refreshed, and a customer's when new
+purchases are recorded for them.
+
+The cache is off unless RESPONSE_CACHE_SIZE is set.
+"""
+
+import sys
+import time
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+from config import RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL_SECONDS
+from logger import logger
+from query_table import month_encoding, month_of
+
+# (scores, article IDs) of one instance, by descending score
+Ranking = Tuple[np.ndarray, List[str]]
+
+
+def _entry_bytes(key: Tuple, ranking: Ranking) -> int:
+    """Approximate memory held by a cached ranking and its key."""
+    scores, article_ids = ranking
+    return (
+        sys.getsizeof(key)
+        + sum(sys.getsizeof(part) for part in key)
+        + sys.getsizeof(scores)
+        + sys.getsizeof(article_ids)
+        + sum(sys.getsizeof(article_id) for article_id in article_ids)
+    )
+
+
+class ResponseCache:
+    """
+    LRU cache of instance rankings with a TTL.
+
+    Attributes:
+        max_size: Maximum number of cached rankings
+        ttl_seconds: Time a ranking is served for
+    """
+
+    def __init__(
+        self,
+        max_size: int = RESPONSE_CACHE_SIZE,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+    ):
+        """
+        Args:
+            max_size: Maximum number of cached rankings
+            ttl_seconds: Time a ranking is served for
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+
+        # key -> (expiry, ranking, bytes)
+        self._entries: "OrderedDict[Tuple, Tuple[float, Ranking, int]]" = OrderedDict()
+        self._keys_by_customer: Dict[str, Set[Tuple]] = {}
+        self._bytes = 0
+        # Bumped by every invalidation, see put()
+        self._generation = 0
+        self._counts = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(instance: Dict[str, Any], model_version: str) -> Tuple:
+        """
+        Cache key of a validated instance.
+
+        Args:
+            instance: Instance of a /predict request
+            model_version: Name of the version serving the request
+
+        Returns:
+            Tuple of customer ID, month bucket, query embedding digest (None
+            if the embedding is looked up by date) and model version
+        """
+        if "month_sin" in instance and "month_cos" in instance:
+            month_sin, month_cos = instance["month_sin"], instance["month_cos"]
+        else:
+            month_sin, month_cos = month_encoding(month_of(instance["date"]))
+        month = (round(month_sin, 6), round(month_cos, 6))
+
+        query = instance.get("query_emb")
+        digest = (
+            hashlib.blake2b(
+                np.asarray(query, dtype=np.float32).tobytes(), digest_size=16
+            ).digest()
+            if query is not None
+            else None
+        )
+        return instance["customer_id"], month, digest, model_version
+
+    def get(self, key: Tuple) -> Optional[Ranking]:
+        """
+        Look up a ranking.
+
+        Args:
+            key: Key from key()
+
+        Returns:
+            The cached ranking, or None if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._remove(key)
+                self._counts["expirations"] += 1
+                entry = None
+            if entry is None:
+                self._counts["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._counts["hits"] += 1
+            return entry[1]
+
+    @property
+    def generation(self) -> int:
+        """Number of invalidations so far; read it before computing a ranking."""
+        return self._generation
+
+    def put(self, key: Tuple, ranking: Ranking, generation: int) -> None:
+        """
+        Cache a ranking, evicting the least recently used ones beyond max_size.
+
+        The ranking is not cached if an invalidation happened since generation
+        was read, since it may have been computed from the invalidated state.
+
+        Args:
+            key: Key from key()
+            ranking: Scores and article IDs of the instance
+            generation: Value of the generation property before the ranking
+                was computed
+        """
+        size = _entry_bytes(key, ranking)
+        with self._lock:
+            if generation != self._generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, ranking, size)
+            self._keys_by_customer.setdefault(key[0], set()).add(key)
+            self._bytes += size
+
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self._counts["evictions"] += 1
+
+    def _remove(self, key: Tuple) -> None:
+        # Caller holds the lock
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+        keys = self._keys_by_customer.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_customer[key[0]]
+
+    def invalidate(self, customer_id: str) -> int:
+        """
+        Drop the rankings of a customer, e.g. after new purchases.
+
+        Args:
+            customer_id: Customer ID
+
+        Returns:
+            Number of rankings dropped
+        """
+        with self._lock:
+            keys = list(self._keys_by_customer.get(customer_id, ()))
+            for key in keys:
+                self._remove(key)
+            self._counts["invalidations"] += len(keys)
+            self._generation += 1
+        return len(keys)
+
+    def clear(self, reason: str = "") -> int:
+        """
+        Drop every ranking, e.g. after a model swap.
+
+        Args:
+            reason: Why, for the log
+
+        Returns:
+            Number of rankings dropped
+        """
+        with self._lock:
+            n_entries = len(self._entries)
+            self._entries.clear()
+            self._keys_by_customer.clear()
+            self._bytes = 0
+            self._counts["invalidations"] += n_entries
+            self._generation += 1
+        logger.info(
+            f"🧹 Cleared {n_entries} cached rankings ({reason or 'on request'})"
+        )
+        return n_entries
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Cache counters and size.
+
+        Returns:
+            Dictionary with hit, miss, eviction, expiration and invalidation
+            counts, the hit ratio, and the number and approximate bytes of
+            cached rankings
+        """
+        with self._lock:
+            counts = dict(self._counts)
+            entries = len(self._entries)
+            size = self._bytes
+        lookups = counts["hits"] + counts["misses"]
+        return {
+            **counts,
+            "hit_ratio": counts["hits"] / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
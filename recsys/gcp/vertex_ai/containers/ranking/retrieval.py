@@ -0,0 +1,447 @@
+"""
+Candidate retrieval backends for the ranking container.
+Maps a query embedding to the article IDs of its nearest candidates.
+"""
+
+import os
+import numpy as np
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Tuple
+from config import (
+    CANDIDATES_TABLE,
+    CANDIDATES_SNAPSHOT_DIR,
+    IVFPQ_INDEX_PATH,
+    RETRIEVAL_BACKEND,
+)
+from logger import logger
+
+# Snapshot layout written by recsys.core.embeddings.storage.save_embeddings_snapshot
+ARTICLE_IDS_FILE = "article_ids.npy"
+EMBEDDINGS_FILE = "embeddings.npy"
+
+
+def load_candidates_snapshot(snapshot_dir: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Load a candidate snapshot, memory-mapping the embedding matrix.
+
+    Args:
+        snapshot_dir: Directory containing article_ids.npy and embeddings.npy
+
+    Returns:
+        Tuple of (article IDs, read-only float32 embeddings of shape (n, dim))
+
+    Raises:
+        ValueError: If the snapshot files are inconsistent
+    """
+    article_ids = np.load(
+        os.path.join(snapshot_dir, ARTICLE_IDS_FILE), allow_pickle=False
+    )
+    embeddings = np.load(
+        os.path.join(snapshot_dir, EMBEDDINGS_FILE),
+        mmap_mode="r",
+        allow_pickle=False,
+    )
+
+    if embeddings.dtype != np.float32 or embeddings.ndim != 2:
+        raise ValueError(
+            f"Expected a 2-D float32 embedding matrix, got "
+            f"{embeddings.dtype} with shape {embeddings.shape}"
+        )
+    if len(article_ids) != len(embeddings):
+        raise ValueError(
+            f"Snapshot has {len(article_ids)} article IDs but "
+            f"{len(embeddings)} embeddings"
+        )
+
+    return article_ids, embeddings
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Select the k highest scores via partial selection.
+
+    Args:
+        scores: 1-D array of candidate scores
+        k: Number of candidates to select
+
+    Returns:
+        Tuple of (row indices, scores), sorted by descending score
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=scores.dtype)
+
+    if k < len(scores):
+        indices = np.argpartition(scores, -k)[-k:]
+    else:
+        indices = np.arange(len(scores))
+
+    order = np.argsort(scores[indices])[::-1]
+    indices = indices[order]
+    return indices, scores[indices]
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Select the k highest scores of every row via partial selection.
+
+    Args:
+        scores: 2-D array of candidate scores, one row per query
+        k: Number of candidates to select per row
+
+    Returns:
+        Tuple of (column indices, scores), each of shape (n_rows, k) and
+        sorted by descending score within a row
+    """
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return (
+            np.empty((len(scores), 0), dtype=np.int64),
+            np.empty((len(scores), 0), dtype=scores.dtype),
+        )
+
+    if k < scores.shape[1]:
+        indices = np.argpartition(scores, -k, axis=1)[:, -k:]
+    else:
+        indices = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+
+    selected = np.take_along_axis(scores, indices, axis=1)
+    order = np.argsort(selected, axis=1)[:, ::-1]
+    return (
+        np.take_along_axis(indices, order, axis=1),
+        np.take_along_axis(selected, order, axis=1),
+    )
+
+
+def _drop_excluded(
+    indices: np.ndarray, scores: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Drop selected entries whose score was masked to -inf."""
+    keep = scores > -np.inf
+    if keep.all():
+        return indices, scores
+    return indices[keep], scores[keep]
+
+
+class ArticleIdIndex:
+    """
+    Sorted view of a candidate article ID array for vectorized lookups.
+    """
+
+    def __init__(self, article_ids: np.ndarray):
+        """
+        Args:
+            article_ids: Article IDs indexed by dense candidate index
+        """
+        self._order = np.argsort(article_ids, kind="stable")
+        self._sorted_ids = article_ids[self._order]
+
+    def dense_indices(self, article_ids: Sequence[str]) -> np.ndarray:
+        """
+        Map article IDs to dense candidate indices.
+
+        Args:
+            article_ids: Article IDs
+
+        Returns:
+            int64 array of the dense indices of the IDs that are candidates;
+            unknown IDs are skipped
+        """
+        ids = np.asarray(article_ids, dtype=str)
+        if len(ids) == 0 or len(self._sorted_ids) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        positions = np.searchsorted(self._sorted_ids, ids)
+        positions = np.minimum(positions, len(self._sorted_ids) - 1)
+        found = self._sorted_ids[positions] == ids
+        return self._order[positions[found]].astype(np.int64)
+
+
+class BigQueryRetriever:
+    """
+    Retrieves candidates with an ML.DISTANCE scan of the candidates table.
+
+    Every call runs a full scan of the table in BigQuery.
+    """
+
+    def __init__(
+        self,
+        execute_query: Callable[[str, str], Any],
+        table: str = CANDIDATES_TABLE,
+    ):
+        """
+        Args:
+            execute_query: Callable running (query, query_name) and returning rows
+            table: Fully qualified candidates table
+        """
+        self._execute_query = execute_query
+        self.table = table
+
+    def find_similar_items(
+        self,
+        query_embedding: List[float],
+        k: int,
+        exclude: Optional[Iterable[str]] = None,
+    ) -> List[str]:
+        """
+        Find the article IDs of the k candidates closest to the query.
+
+        The query fetches k more rows than there are excluded articles, so
+        k candidates remain after dropping the excluded ones.
+
+        Args:
+            query_embedding: Vector embedding for similarity search
+            k: Number of similar items to return
+            exclude: Article IDs that must not be returned
+
+        Returns:
+            List of article IDs similar to the query
+        """
+        excluded = set(exclude) if exclude is not None else set()
+
+        # Convert query embedding to string safely
+        query_vector_str = str([float(value) for value in query_embedding])
+
+        query = f"""
+            SELECT
+                article_id,
+                ARRAY_LENGTH(embeddings) as emb_size,
+                ML.DISTANCE(embeddings, {query_vector_str}) as similarity
+            FROM
+                {self.table}
+            ORDER BY
+                similarity
+            DESC
+            LIMIT {k + len(excluded)}
+        """
+
+        results = self._execute_query(query, "similarity_search")
+        article_ids = [str(row.article_id) for row in results]
+        return [article_id for article_id in article_ids if article_id not in excluded][
+            :k
+        ]
+
+    def find_similar_items_batch(
+        self,
+        query_embeddings: List[List[float]],
+        k: int,
+        exclude: Optional[Sequence[Iterable[str]]] = None,
+    ) -> List[List[str]]:
+        """
+        Find similar items for several queries, one table scan per query.
+
+        Args:
+            query_embeddings: Vector embeddings for similarity search
+            k: Number of similar items to return per query
+            exclude: Article IDs that must not be returned, one collection
+                per query
+
+        Returns:
+            List of article ID lists, one per query
+        """
+        if exclude is None:
+            exclude = [None] * len(query_embeddings)
+        return [
+            self.find_similar_items(query, k, excluded)
+            for query, excluded in zip(query_embeddings, exclude)
+        ]
+
+
+class ExactRetriever:
+    """
+    Exact top-k retrieval over a memory-mapped candidate embedding snapshot.
+
+    The candidate matrix is loaded once as a contiguous float32 array, so a
+    query is scored with a single matrix-vector product followed by a partial
+    selection of the top-k rows. A batch of queries is scored with one
+    matrix-matrix product per block of queries. Excluded candidates get a
+    score of -inf before the selection, so the top-k holds k other candidates
+    whenever the snapshot has that many.
+    """
+
+    # Queries scored per matrix-matrix product, bounding the score matrix size
+    QUERY_BLOCK_SIZE = 64
+
+    def __init__(self, snapshot_dir: str = CANDIDATES_SNAPSHOT_DIR):
+        """
+        Load the candidate snapshot.
+
+        Args:
+            snapshot_dir: Directory containing article_ids.npy and embeddings.npy
+        """
+        logger.timer_start("candidates_snapshot_load")
+
+        self.snapshot_dir = snapshot_dir
+        self.article_ids, self.embeddings = load_candidates_snapshot(snapshot_dir)
+        self.id_index = ArticleIdIndex(self.article_ids)
+
+        logger.timer_end("candidates_snapshot_load")
+        logger.data(
+            f"Loaded {len(self.article_ids)} candidates "
+            f"(dim={self.dim}) from {snapshot_dir}"
+        )
+
+    @property
+    def dim(self) -> int:
+        """Dimension of the candidate embeddings."""
+        return self.embeddings.shape[1]
+
+    def __len__(self) -> int:
+        return len(self.article_ids)
+
+    def search(
+        self, query_embedding, k: int, exclude: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score all candidates against a query and select the top-k.
+
+        Args:
+            query_embedding: Query vector of length dim
+            k: Number of candidates to return
+            exclude: Dense candidate indices that must not be returned
+
+        Returns:
+            Tuple of (dense candidate indices, scores), best first
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if query.shape != (self.dim,):
+            raise ValueError(
+                f"Query embedding must have shape ({self.dim},), got {query.shape}"
+            )
+
+        scores = self.embeddings @ query
+        if exclude is not None:
+            scores[exclude] = -np.inf
+        return _drop_excluded(*top_k(scores, k))
+
+    def find_similar_items(
+        self,
+        query_embedding: List[float],
+        k: int,
+        exclude: Optional[Iterable[str]] = None,
+    ) -> List[str]:
+        """
+        Find the article IDs of the k highest-scoring candidates.
+
+        Args:
+            query_embedding: Vector embedding for similarity search
+            k: Number of similar items to return
+            exclude: Article IDs that must not be returned
+
+        Returns:
+            List of article IDs similar to the query
+        """
+        if exclude is not None:
+            exclude = self.id_index.dense_indices(exclude)
+        indices, _ = self.search(query_embedding, k, exclude)
+        return self.article_ids[indices].tolist()
+
+    def search_batch(
+        self,
+        query_embeddings,
+        k: int,
+        exclude: Optional[Sequence[np.ndarray]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score all candidates against a batch of queries and select the top-k.
+
+        Args:
+            query_embeddings: Query vectors of shape (n_queries, dim)
+            k: Number of candidates to return per query
+            exclude: Dense candidate indices that must not be returned, one
+                array per query
+
+        Returns:
+            Tuple of (dense candidate indices, scores), each of shape
+            (n_queries, k) with the best candidate first. When a query has
+            fewer than k candidates left after exclusion, its trailing
+            entries have a score of -inf.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim != 2 or queries.shape[1] != self.dim:
+            raise ValueError(
+                f"Query embeddings must have shape (n, {self.dim}), got {queries.shape}"
+            )
+
+        k = min(k, len(self))
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        scores = np.empty((len(queries), k), dtype=np.float32)
+        for start in range(0, len(queries), self.QUERY_BLOCK_SIZE):
+            block = slice(start, start + self.QUERY_BLOCK_SIZE)
+            block_scores = queries[block] @ self.embeddings.T
+            if exclude is not None:
+                # Masked inside the scoring pass so the selection skips them
+                for row, excluded in enumerate(exclude[block]):
+                    block_scores[row, excluded] = -np.inf
+            indices[block], scores[block] = top_k_rows(block_scores, k)
+        return indices, scores
+
+    def find_similar_items_batch(
+        self,
+        query_embeddings: List[List[float]],
+        k: int,
+        exclude: Optional[Sequence[Iterable[str]]] = None,
+    ) -> List[List[str]]:
+        """
+        Find the article IDs of the k highest-scoring candidates per query.
+
+        Args:
+            query_embeddings: Vector embeddings for similarity search
+            k: Number of similar items to return per query
+            exclude: Article IDs that must not be returned, one collection
+                per query
+
+        Returns:
+            List of article ID lists, one per query
+        """
+        if exclude is not None:
+            exclude = [self.id_index.dense_indices(ids) for ids in exclude]
+        indices, scores = self.search_batch(query_embeddings, k, exclude)
+        return [
+            self.article_ids[_drop_excluded(row_indices, row_scores)[0]].tolist()
+            for row_indices, row_scores in zip(indices, scores)
+        ]
+
+
+def create_retriever(
+    backend: str = RETRIEVAL_BACKEND,
+    execute_query: Optional[Callable[[str, str], Any]] = None,
+    snapshot_dir: Optional[str] = None,
+):
+    """
+    Build the retrieval backend selected by configuration.
+
+    Args:
+        backend: One of "bigquery", "exact" or "ivfpq"
+        execute_query: Query runner used by the BigQuery backend
+        snapshot_dir: Directory laid out like SNAPSHOT_DIR to load the
+            candidate snapshot or index from, instead of the configured paths
+
+    Returns:
+        Retriever exposing find_similar_items(query_embedding, k, exclude)
+        and find_similar_items_batch(query_embeddings, k, exclude)
+
+    Raises:
+        ValueError: If the backend is unknown
+    """
+    logger.info(f"🔍 Using '{backend}' retrieval backend")
+
+    if backend == "bigquery":
+        if execute_query is None:
+            raise ValueError("BigQuery retrieval requires an execute_query callable")
+        return BigQueryRetriever(execute_query)
+    if backend == "exact":
+        if snapshot_dir is not None:
+            return ExactRetriever(
+                os.path.join(snapshot_dir, os.path.basename(CANDIDATES_SNAPSHOT_DIR))
+            )
+        return ExactRetriever()
+    if backend == "ivfpq":
+        from ivfpq import IVFPQIndex
+
+        if snapshot_dir is not None:
+            return IVFPQIndex.load(
+                os.path.join(snapshot_dir, os.path.basename(IVFPQ_INDEX_PATH))
+            )
+        return IVFPQIndex.load()
+
+    raise ValueError(f"Unknown retrieval backend: {backend}")
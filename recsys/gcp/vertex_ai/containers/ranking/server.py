@@ -5,19 +5,107 @@ Handles HTTP requests for ranking predictions.
 
 import os
 import time
-import pandas as pd
-from flask import Flask, request, jsonify, g
+import threading
+import numpy as np
+from flask import Flask, Response, request, jsonify, g, stream_with_context
 from ranking_transformer import RankingTransformer
 from ranking_predictor import RankingPredictor
-from logger import logger, RequestContext
+from bulk import NDJSON_MEDIA_TYPE, score_stream
+from config import (
+    ADMIN_TOKEN,
+    BULK_BLOCK_BUDGET_MS,
+    RECOMMENDATIONS_BACKEND,
+    REQUEST_BUDGET_MS,
+    RESPONSE_CACHE_SIZE,
+    SNAPSHOT_GCS_URI,
+    WORKERS,
+)
+from deadlines import begin_deadline, degradations, request_degradations
+from logger import logger, log_stats, RequestContext
+from metrics import StageLatency, begin_request, request_spans
+from model_versions import ModelVersion, ModelVersions
+from query_table import month_of
+from recommendation_store import RecommendationStore
+from response_cache import ResponseCache
+from warmup import warm_up
+from wire_format import (
+    ARROW_MEDIA_TYPE,
+    JSON_MEDIA_TYPE,
+    RESPONSE_MEDIA_TYPES,
+    decode_arrow_request,
+    encode_arrow_response,
+)
 
 # Initialize Flask app
 app = Flask(__name__)
+started_at = time.time()
 
-# Initialize transformer and predictor
+# Load read-only serving state; connections and threads start per process
 logger.info("🚀 Initializing ranking service components")
-predictor = RankingPredictor()
-transformer = RankingTransformer()
+predictor = RankingPredictor(start=False)
+transformer = RankingTransformer(start=False, categorical_encoder=predictor.encoder)
+model_versions = ModelVersions(
+    transformer,
+    ModelVersion(
+        predictor.version_id,
+        predictor,
+        transformer.retriever,
+        transformer.feature_matrix,
+        index_uri=SNAPSHOT_GCS_URI or None,
+    ),
+    artifact_cache=predictor.artifact_cache,
+)
+
+# Latency of prediction requests and their stages, per worker process
+stage_latency = StageLatency()
+
+# Rankings of recent instances, per worker process, dropped when what they
+# were computed from changes
+response_cache = ResponseCache() if RESPONSE_CACHE_SIZE > 0 else None
+if response_cache is not None:
+    model_versions.add_listener(
+        lambda version: response_cache.clear(f"model version {version.name}")
+    )
+    if transformer.article_store is not None:
+        transformer.article_store.add_listener(
+            lambda table: response_cache.clear("article table refreshed")
+        )
+    if transformer.purchase_index is not None:
+        transformer.purchase_index.add_listener(response_cache.invalidate)
+
+# Rankings materialized by materialize.py, served while fresh
+recommendations = (
+    RecommendationStore() if RECOMMENDATIONS_BACKEND == "snapshot" else None
+)
+if recommendations is not None:
+    if transformer.article_store is not None:
+        transformer.article_store.add_listener(
+            lambda table: recommendations.mark_stale("article table refreshed")
+        )
+    if transformer.purchase_index is not None:
+        transformer.purchase_index.add_listener(recommendations.invalidate)
+
+# Set once this worker is connected and warmed up, see prepare_worker()
+ready = threading.Event()
+warmup_stats = {}
+
+
+def start_worker() -> None:
+    """Open per-process connections and start background threads."""
+    predictor.start()
+    transformer.start()
+    model_versions.start()
+    if recommendations is not None:
+        recommendations.start()
+    threading.Thread(target=prepare_worker, name="warm-up", daemon=True).start()
+
+
+def prepare_worker() -> None:
+    """Wait for the feature store, warm up every stage, then report ready."""
+    transformer.feature_store_connected.wait()
+    warmup_stats.update(warm_up(transformer, model_versions.current))
+    ready.set()
+    logger.success(f"Worker ready {time.time() - started_at:.1f}s after start")
 
 
 @app.before_request
@@ -27,13 +115,24 @@ def before_request():
     request_id = request.headers.get("X-Request-ID")
     g.request_id = RequestContext.set_request_id(request_id)
 
-    # Track request start time
+    # Track request start time and collect the spans of its stages
     g.start_time = time.time()
+    begin_request()
+    begin_deadline(request_budget_seconds())
 
     # Log request details
     logger.info(f"📥 Received request: {request.method} {request.path}")
 
 
+def request_budget_seconds() -> float:
+    """Latency budget of the request: X-Request-Budget-Ms, else REQUEST_BUDGET_MS."""
+    budget_ms = request.headers.get("X-Request-Budget-Ms")
+    try:
+        return float(budget_ms) / 1000
+    except (TypeError, ValueError):
+        return REQUEST_BUDGET_MS / 1000
+
+
 @app.after_request
 def after_request(response):
     """Log after request is processed."""
@@ -43,14 +142,403 @@ def after_request(response):
     # Log response
     logger.info(f"📤 Response sent: {response.status_code} (took {duration:.3f}s)")
 
+    if request.endpoint == "predict":
+        stage_latency.observe_request(request_spans(), response.status_code, duration)
+
     return response
 
 
 @app.route("/health", methods=["GET"])
 def health():
-    """Health check endpoint."""
+    """
+    Readiness check: 200 once this worker is connected and warmed up, 503 before.
+
+    Response format:
+    {
+        "status": "ready",
+        "uptime_seconds": 42.0,
+        "warmup": {"requests": 3, "succeeded": 3, "seconds": 0.41},
+        "feature_views": {"customers": {"age_seconds": 12.5, "failures": 0}, ...}
+    }
+    """
     logger.debug("🏥 Health check requested")
-    return jsonify({"status": "healthy"})
+    status = {
+        "status": "ready" if ready.is_set() else "starting",
+        "uptime_seconds": round(time.time() - started_at, 3),
+        "warmup": warmup_stats or None,
+        "feature_views": transformer.view_sync.status()
+        if transformer.view_sync is not None
+        else None,
+    }
+    return jsonify(status), 200 if ready.is_set() else 503
+
+
+@app.route("/live", methods=["GET"])
+def live():
+    """Liveness check: 200 whenever the process answers, ready or not."""
+    return jsonify({"status": "alive"})
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Latency metrics of this worker process.
+
+    Response format (milliseconds; "request" is the whole /predict call and
+    the other stages are the spans recorded during it, counted per span:
+    "customer_features" has one per distinct customer of a request, so its
+    count is of customer lookups, not requests):
+    {
+        "pid": 12,
+        "stages": {
+            "request": {"200": {"count": 120, "p50": 41.2, "p95": 63.0, "p99": 88.1, ...}},
+            "retrieval": {"200": {...}, "500": {...}},
+            ...
+        },
+        "prediction_batching": {...},
+        "degradations": {"purchase_filter_skipped": 3, ...},
+        "hedging": {"customer_features": {"reads": 900, "hedged": 41, "hedge_wins": 30, "hedge_delay_ms": 12.4}, ...},
+        "response_cache": {"hits": 310, "misses": 820, "hit_ratio": 0.27, "entries": 790, "bytes": 1402250, ...},
+        "recommendations": {"hits": 950, "misses": 20, "stale": 30, "hit_ratio": 0.95, "model_version": "3", "month": 6, "age_seconds": 5400.0, ...},
+        "customer_cache": {"hits": 1050, "negative_hits": 12, "misses": 80, "hit_ratio": 0.93, "refresh_latency_ms": {"p99": 35.2, ...}, "staleness_s": {"p99": 271.0, ...}, ...},
+        "logging": {"queued": 0, "dropped": 0, "sampled_out": {"data": 512}}
+    }
+    """
+    body = {"pid": os.getpid(), "stages": stage_latency.snapshot()}
+    batcher = model_versions.current.predictor.batcher
+    if batcher is not None:
+        body["prediction_batching"] = batcher.stats()
+    body["degradations"] = degradations.snapshot()
+    if transformer.hedger is not None:
+        body["hedging"] = transformer.hedger.stats()
+    if response_cache is not None:
+        body["response_cache"] = response_cache.stats()
+    if recommendations is not None:
+        body["recommendations"] = recommendations.stats()
+    body["customer_cache"] = transformer.customer_cache.stats()
+    logging_stats = log_stats(logger)
+    if logging_stats:
+        body["logging"] = logging_stats
+    return jsonify(body)
+
+
+def admin_authorized() -> bool:
+    """Check the admin token of the current request, if one is configured."""
+    return not ADMIN_TOKEN or request.headers.get("X-Admin-Token") == ADMIN_TOKEN
+
+
+@app.route("/admin/model", methods=["GET"])
+def model_status():
+    """
+    Model version served by this worker, versions draining and the last load.
+
+    Response format:
+    {
+        "current": {"name": "3", "model_uri": "gs://...", "index_uri": null,
+                    "loaded_at": 1718000000.0, "in_flight": 2},
+        "draining": [{"name": "2", ..., "in_flight": 1}],
+        "loading": null,
+        "last_load": {"name": "3", "status": "swapped", "seconds": 4.2, ...},
+        "poll_seconds": 300.0
+    }
+    """
+    if not admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(model_versions.status())
+
+
+@app.route("/admin/cache/invalidate", methods=["POST"])
+def invalidate_cache():
+    """
+    Drop cached rankings of this worker: those of one customer, e.g. after a
+    purchase recorded elsewhere, or all of them.
+
+    Request format (without "customer_id", the whole cache is cleared):
+    {"customer_id": "d327d0ad..."}
+
+    Response format:
+    {"invalidated": 3}
+    """
+    if not admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    if response_cache is None:
+        return jsonify({"invalidated": 0})
+
+    customer_id = (request.get_json(silent=True) or {}).get("customer_id")
+    if customer_id is None:
+        return jsonify({"invalidated": response_cache.clear("admin request")})
+    if not isinstance(customer_id, str):
+        return jsonify({"error": "customer_id must be a string"}), 400
+    return jsonify({"invalidated": response_cache.invalidate(customer_id)})
+
+
+@app.route("/admin/purchases", methods=["POST"])
+def record_purchases():
+    """
+    Record new purchases of a customer on this worker, e.g. from the order
+    service, so the "already bought" filter excludes them and the customer's
+    cached and materialized rankings are dropped. Only the worker serving the
+    call records them, and only in memory: they are not written to
+    PURCHASES_SNAPSHOT_DIR and last until the worker restarts or the index is
+    rebuilt from the transactions table, which must then contain them.
+
+    With PURCHASES_BACKEND=bigquery the purchases are read from the
+    transactions table, so only the customer's rankings are dropped.
+
+    Request format:
+    {"customer_id": "d327d0ad...", "article_ids": ["0706016001", "0372860002"]}
+
+    Response format:
+    {"recorded": 2}
+    """
+    if not admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+
+    body = request.get_json(silent=True) or {}
+    customer_id = body.get("customer_id")
+    article_ids = body.get("article_ids")
+    if not isinstance(customer_id, str) or not customer_id:
+        return jsonify({"error": "Missing required field: customer_id"}), 400
+    if not isinstance(article_ids, list) or not all(
+        isinstance(article_id, str) for article_id in article_ids
+    ):
+        return jsonify({"error": "article_ids must be a list of strings"}), 400
+
+    if transformer.purchase_index is not None:
+        # Listeners added at load drop the customer's cached rankings
+        recorded = transformer.purchase_index.append(customer_id, article_ids)
+    else:
+        recorded = 0
+        if response_cache is not None:
+            response_cache.invalidate(customer_id)
+        if recommendations is not None:
+            recommendations.invalidate(customer_id)
+    return jsonify({"recorded": recorded})
+
+
+@app.route("/admin/model", methods=["POST"])
+def load_model():
+    """
+    Load a model version in the background and swap it in once it passes
+    smoke scoring. Only the worker serving the call swaps.
+
+    Request format ("index_uri" is optional: a GCS prefix laid out like
+    SNAPSHOT_DIR to load a new candidate snapshot from):
+    {"version": "4", "index_uri": "gs://bucket/snapshots/2024-07-01"}
+
+    Poll GET /admin/model for the outcome.
+    """
+    if not admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+
+    body = request.get_json(silent=True) or {}
+    version = body.get("version")
+    if not isinstance(version, str) or not version:
+        return jsonify({"error": "Missing required field: version"}), 400
+
+    if not model_versions.load_async(version, body.get("index_uri")):
+        return jsonify({"error": f"Already loading {model_versions.loading}"}), 409
+
+    logger.info(f"🔄 Loading model version {version} on request")
+    return jsonify({"loading": version}), 202
+
+
+REQUIRED_FIELDS = ["customer_id"]
+
+
+def validate_instance(instance) -> str:
+    """
+    Check a single prediction instance.
+
+    An instance needs a customer_id, the month as month_sin and month_cos or
+    as a date, and a query_emb unless query embeddings are looked up by date.
+
+    Args:
+        instance: Instance from the request's "instances" array
+
+    Returns:
+        Error message, or an empty string if the instance is valid
+    """
+    if not isinstance(instance, dict):
+        return "instance must be an object"
+
+    for field in REQUIRED_FIELDS:
+        if field not in instance:
+            return f"Missing required field: {field}"
+
+    # Additional validation for types
+    if not isinstance(instance["customer_id"], str):
+        return "customer_id must be a string"
+
+    if "date" in instance:
+        try:
+            month_of(instance["date"])
+        except (TypeError, ValueError):
+            return "date must be an ISO date string"
+    else:
+        for field in ["month_sin", "month_cos"]:
+            if field not in instance:
+                return f"Missing required field: {field} (or date)"
+
+    if "query_emb" in instance:
+        # Lists from JSON bodies, float32 rows from Arrow bodies
+        if not isinstance(instance["query_emb"], (list, np.ndarray)):
+            return "query_emb must be a list of floats"
+    elif transformer.query_table is None or "date" not in instance:
+        return "Missing required field: query_emb"
+
+    return ""
+
+
+def rank(
+    request_json, version: ModelVersion, columnar: bool = False, cached: bool = True
+) -> dict:
+    """
+    Rank candidates for a validated /predict request body, serving instances
+    from the recommendation snapshot and the response cache where they have
+    them.
+
+    Rankings of a request that was degraded, and empty rankings, are not
+    cached, so the next request computes them again.
+
+    Args:
+        request_json: Request body
+        version: Model version to serve the request with
+        columnar: Return flat ranking arrays, see RankingTransformer.postprocess
+        cached: Use the response cache, if enabled
+
+    Returns:
+        Response body
+    """
+    use_cache = response_cache is not None and cached
+    if recommendations is None and not use_cache:
+        return score(request_json, version, columnar)
+
+    instances = request_json["instances"]
+    rankings = [None] * len(instances)
+    if recommendations is not None:
+        rankings = recommendations.lookup(instances, version.model_uri)
+        materialized = sum(ranking is not None for ranking in rankings)
+        if materialized:
+            logger.info(f"📦 {materialized} rankings from the recommendation snapshot")
+
+    keys = [None] * len(instances)
+    generation = 0
+    if use_cache:
+        generation = response_cache.generation
+        hits = 0
+        for i, instance in enumerate(instances):
+            if rankings[i] is None:
+                keys[i] = response_cache.key(instance, version.name)
+                rankings[i] = response_cache.get(keys[i])
+                hits += rankings[i] is not None
+        if hits:
+            logger.info(f"♻️ {hits} rankings from the cache")
+
+    misses = [i for i, ranking in enumerate(rankings) if ranking is None]
+    if misses:
+        scored = score(
+            {"instances": [instances[i] for i in misses]}, version, columnar=True
+        )
+        offsets = scored["ranking_offsets"]
+        cacheable = use_cache and not request_degradations()
+        for j, i in enumerate(misses):
+            start, end = offsets[j], offsets[j + 1]
+            rankings[i] = (
+                scored["scores"][start:end],
+                scored["article_ids"][start:end],
+            )
+            if cacheable and end > start:
+                response_cache.put(keys[i], rankings[i], generation)
+
+    return transformer.format_rankings(rankings, columnar)
+
+
+def score(request_json, version: ModelVersion, columnar: bool = False) -> dict:
+    """
+    Run a validated /predict request body through the ranking pipeline.
+
+    Args:
+        request_json: Request body
+        version: Model version to serve the request with
+        columnar: Return flat ranking arrays, see RankingTransformer.postprocess
+
+    Returns:
+        Response body
+    """
+    # Preprocess inputs
+    transformed_inputs = transformer.preprocess(request_json, version)
+
+    # Check if we got candidates
+    model_inputs = transformed_inputs["inputs"][0]
+    features = model_inputs["ranking_features"]
+    if len(features) == 0:
+        logger.warning("⚠️ No candidate features generated")
+        return transformer.postprocess(
+            {
+                "scores": [],
+                "article_ids": [],
+                "group_offsets": model_inputs["group_offsets"],
+            },
+            columnar,
+        )
+
+    logger.data(f"Generated {len(features)} candidates for ranking")
+
+    # Generate predictions
+    prediction_result = version.predictor.predict(transformed_inputs["inputs"])
+
+    # Postprocess results
+    return transformer.postprocess(prediction_result, columnar)
+
+
+def rank_block(instances) -> dict:
+    """
+    Rank a block of validated bulk instances as one request.
+
+    Each block gets its own deadline and span list, so a long stream keeps
+    neither growing.
+
+    Args:
+        instances: Instances of the block
+
+    Returns:
+        Columnar rankings with model_version and, if any, degraded
+    """
+    begin_request()
+    begin_deadline(BULK_BLOCK_BUDGET_MS / 1000)
+    with model_versions.pin() as version:
+        # Campaign-sized streams would only evict the rankings of live traffic
+        response = rank({"instances": instances}, version, columnar=True, cached=False)
+        response["model_version"] = version.name
+    degraded = request_degradations()
+    if degraded:
+        response["degraded"] = degraded
+    return response
+
+
+@app.route("/predict/stream", methods=["POST"])
+def predict_stream():
+    """
+    Bulk scoring endpoint for offline callers.
+
+    The request body is an NDJSON stream of /predict instances, one per line,
+    ideally sent with chunked transfer encoding. Rankings are streamed back as
+    NDJSON, one line per input line, in blocks of BULK_BLOCK_SIZE instances;
+    see bulk.py for the output format. Instance errors are reported on their
+    line and do not end the stream.
+
+    Until the worker is ready (see /health) the response is a 503.
+    """
+    if not ready.is_set():
+        return jsonify({"error": "Service is starting"}), 503
+
+    return Response(
+        stream_with_context(
+            score_stream(request.stream, rank_block, validate_instance)
+        ),
+        mimetype=NDJSON_MEDIA_TYPE,
+    )
 
 
 @app.route("/predict", methods=["POST"])
@@ -66,21 +554,69 @@ def predict():
                 "month_sin": 1.2246467991473532e-16,
                 "month_cos": -1.0,
                 "query_emb": [0.214135289, 0.571055949, 0.330709577, ...]
-            }
+            },
+            ...
         ]
     }
 
-    Response format:
+    With QUERY_EMBEDDINGS_BACKEND=snapshot, an instance can send a date
+    instead of the month features and query embedding:
+    {"customer_id": "d327d0ad...", "date": "2024-06-15"}
+
+    Response format (one ranking per instance, in request order; a
+    single-instance request also gets its ranking under "ranking"):
     {
-        "ranking": [[0.98, "item_1"], [0.75, "item_2"], ...]
+        "rankings": [
+            [[0.98, "item_1"], [0.75, "item_2"], ...],
+            ...
+        ],
+        "model_version": "3",
+        "degraded": ["customer_features_stale"]
     }
+
+    Each request has a deadline of X-Request-Budget-Ms, or else
+    REQUEST_BUDGET_MS. Backend reads that do not finish in time degrade the
+    ranking rather than fail it, and "degraded" lists how (it is left out when
+    nothing was degraded): "purchase_filter_skipped" (already bought articles
+    may be ranked), "customer_features_stale" or "customer_features_default"
+    (features last read, or none, also for a customer not in the store),
+    "feature_view_stale" (a view past its staleness budget is read while its
+    sync is failing), "article_features_missing" (candidates without features
+    are dropped) and "no_candidates" (empty ranking).
+
+    With RESPONSE_CACHE_SIZE > 0, an instance asked for again within
+    RESPONSE_CACHE_TTL_SECONDS, with the same month and query embedding, is
+    served from the response cache until a model swap, an article refresh, a
+    new purchase (see /admin/purchases) or /admin/cache/invalidate drops it.
+
+    With RECOMMENDATIONS_BACKEND=snapshot, instances of customers ranked by
+    materialize.py are served from its snapshot while it is fresh (see
+    recommendation_store), without retrieval or scoring.
+
+    Batch callers can send and receive Arrow IPC streams instead (Content-Type
+    and Accept application/vnd.apache.arrow.stream), which carry query
+    embeddings as packed float32; see wire_format for the columns. Errors are
+    always JSON.
+
+    Until the worker is ready (see /health) the response is a 503.
     """
-    try:
-        # Start timing prediction process
-        logger.timer_start("prediction_process")
+    if not ready.is_set():
+        return jsonify({"error": "Service is starting", "ranking": []}), 503
 
+    response_type = request.accept_mimetypes.best_match(
+        RESPONSE_MEDIA_TYPES, default=JSON_MEDIA_TYPE
+    )
+    if request.mimetype != ARROW_MEDIA_TYPE and not request.is_json:
+        error = f"Unsupported Content-Type: {request.mimetype or 'none'}"
+        logger.error(f"❌ {error}")
+        return jsonify({"error": error, "ranking": []}), 415
+
+    try:
         # Get request data
-        request_json = request.get_json()
+        if request.mimetype == ARROW_MEDIA_TYPE:
+            request_json = decode_arrow_request(request.get_data())
+        else:
+            request_json = request.get_json()
 
         # Validate input format
         if not request_json:
@@ -95,64 +631,29 @@ def predict():
             logger.error("❌ Empty 'instances' array in request")
             return jsonify({"error": "Empty 'instances' array", "ranking": []}), 400
 
-        # Validate required fields
-        instance = request_json["instances"][0]
-        required_fields = ["customer_id", "month_sin", "month_cos", "query_emb"]
-
-        for field in required_fields:
-            if field not in instance:
-                logger.error(f"❌ Missing required field: {field}")
-                return jsonify(
-                    {"error": f"Missing required field: {field}", "ranking": []}
-                ), 400
-
-        # Additional validation for types
-        if not isinstance(instance["customer_id"], str):
-            logger.error("❌ customer_id must be a string")
-            return jsonify(
-                {"error": "customer_id must be a string", "ranking": []}
-            ), 400
-
-        if not isinstance(instance["query_emb"], list):
-            logger.error("❌ query_emb must be a list of floats")
-            return jsonify(
-                {"error": "query_emb must be a list of floats", "ranking": []}
-            ), 400
-
-        logger.info(
-            f"🧩 Processing prediction for customer: {instance['customer_id'][:8]}..."
-        )
-
-        # Start timing preprocessing
-        logger.timer_start("preprocessing")
-        # Preprocess inputs
-        transformed_inputs = transformer.preprocess(request_json)
-        logger.timer_end("preprocessing")
-
-        # Check if we got candidates
-        features = transformed_inputs["inputs"][0]["ranking_features"]
-        if isinstance(features, pd.DataFrame) and features.empty:
-            logger.warning("⚠️ No candidate features generated")
-            return jsonify({"ranking": []})
-
-        logger.data(f"Generated {len(features)} candidates for ranking")
-
-        # Start timing prediction
-        logger.timer_start("model_prediction")
-        # Generate predictions
-        prediction_result = predictor.predict(transformed_inputs["inputs"])
-        logger.timer_end("model_prediction")
-
-        # Start timing postprocessing
-        logger.timer_start("postprocessing")
-        # Postprocess results
-        response = transformer.postprocess(prediction_result)
-        logger.timer_end("postprocessing")
-
-        # End timing total prediction process
-        logger.timer_end("prediction_process")
+        # Validate every instance
+        instances = request_json["instances"]
+        for i, instance in enumerate(instances):
+            error = validate_instance(instance)
+            if error:
+                logger.error(f"❌ Instance {i}: {error}")
+                return jsonify({"error": f"Instance {i}: {error}", "ranking": []}), 400
+
+        logger.info(f"🧩 Processing prediction for {len(instances)} instances")
+
+        # Serve the whole request with one model version, even across a swap
+        with model_versions.pin() as version:
+            response = rank(
+                request_json, version, columnar=response_type == ARROW_MEDIA_TYPE
+            )
+            response["model_version"] = version.name
+            degraded = request_degradations()
+            if degraded:
+                response["degraded"] = degraded
 
         # Return response
+        if response_type == ARROW_MEDIA_TYPE:
+            return Response(encode_arrow_response(response), mimetype=ARROW_MEDIA_TYPE)
         return jsonify(response)
 
     except ValueError as e:
@@ -183,8 +684,18 @@ if __name__ == "__main__":
     # Set debug mode based on environment variable
     debug_mode = os.environ.get("DEBUG", "False").lower() == "true"
 
-    # Log startup information
-    logger.info(f"🚀 Starting ranking service on port {port} (debug={debug_mode})")
+    if WORKERS > 1 and not debug_mode:
+        from prefork import PreforkServer
 
-    # Run the Flask app
-    app.run(host="0.0.0.0", port=port, debug=debug_mode)
+        # Fork workers that share the state loaded above
+        logger.info(
+            f"🚀 Starting ranking service on port {port} with {WORKERS} workers"
+        )
+        PreforkServer(app, start_worker, bind=f"0.0.0.0:{port}").run()
+    else:
+        # Log startup information
+        logger.info(f"🚀 Starting ranking service on port {port} (debug={debug_mode})")
+
+        # Run the Flask app
+        start_worker()
+        app.run(host="0.0.0.0", port=port, debug=debug_mode)
@@ -0,0 +1,183 @@
+"""
+Background syncing of feature views for the ranking container.
+
+A scheduler thread syncs each feature view on a fixed interval. Requests call
+ensure_fresh() before reading a view, which returns immediately while the
+view's last sync is within the staleness budget and only syncs inline once the
+budget is exceeded. After a failed sync, requests read the stale view for
+FEATURE_VIEW_SYNC_RETRY_SECONDS instead of each retrying the sync inline.
+"""
+
+import time
+import threading
+from typing import Any, Dict, Optional
+from config import (
+    FEATURE_VIEW_SYNC_INTERVAL_SECONDS,
+    FEATURE_VIEW_STALENESS_BUDGET_SECONDS,
+    FEATURE_VIEW_SYNC_RETRY_SECONDS,
+)
+from deadlines import degradations
+from logger import logger
+
+
+class FeatureViewSyncScheduler:
+    """
+    Owns syncing of a set of feature views.
+
+    Attributes:
+        views: Feature views by name
+        interval_seconds: Time between background syncs of each view
+        staleness_budget_seconds: Maximum age a request accepts without syncing
+        retry_seconds: Time after a failed sync before a request syncs inline
+    """
+
+    def __init__(
+        self,
+        views: Dict[str, Any],
+        interval_seconds: float = FEATURE_VIEW_SYNC_INTERVAL_SECONDS,
+        staleness_budget_seconds: float = FEATURE_VIEW_STALENESS_BUDGET_SECONDS,
+        retry_seconds: float = FEATURE_VIEW_SYNC_RETRY_SECONDS,
+    ):
+        self.views = views
+        self.interval_seconds = interval_seconds
+        self.staleness_budget_seconds = staleness_budget_seconds
+        self.retry_seconds = retry_seconds
+
+        self._last_sync: Dict[str, Optional[float]] = {name: None for name in views}
+        self._last_failure: Dict[str, Optional[float]] = {name: None for name in views}
+        self._failures: Dict[str, int] = {name: 0 for name in views}
+        self._locks = {name: threading.Lock() for name in views}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Sync every view once, then keep them synced in the background."""
+        for name in self.views:
+            self.sync(name)
+
+        self._thread = threading.Thread(
+            target=self._run, name="feature-view-sync", daemon=True
+        )
+        self._thread.start()
+        logger.info(
+            f"🔄 Feature view sync scheduled every {self.interval_seconds:.0f}s "
+            f"(staleness budget {self.staleness_budget_seconds:.0f}s)"
+        )
+
+    def stop(self) -> None:
+        """Stop the background thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            for name in self.views:
+                if self._stop.is_set():
+                    return
+                self.sync(name)
+
+    def sync(self, name: str) -> bool:
+        """
+        Sync a view now.
+
+        Args:
+            name: View name
+
+        Returns:
+            True if the sync succeeded
+        """
+        with self._locks[name]:
+            return self._sync_locked(name)
+
+    def _sync_locked(self, name: str) -> bool:
+        start_time = time.monotonic()
+        try:
+            self.views[name].sync()
+        except Exception as e:
+            self._failures[name] += 1
+            self._last_failure[name] = time.monotonic()
+            logger.error(
+                f"❌ Error syncing feature view {name}: {type(e).__name__}: {str(e)}",
+                exc_info=True,
+            )
+            return False
+
+        self._last_sync[name] = time.monotonic()
+        self._last_failure[name] = None
+        logger.debug(
+            f"🔄 Synced feature view {name} in "
+            f"{self._last_sync[name] - start_time:.3f}s"
+        )
+        return True
+
+    def age(self, name: str) -> float:
+        """
+        Seconds since the view's last successful sync.
+
+        Args:
+            name: View name
+
+        Returns:
+            Age in seconds, infinite if the view was never synced
+        """
+        last_sync = self._last_sync[name]
+        if last_sync is None:
+            return float("inf")
+        return time.monotonic() - last_sync
+
+    def ensure_fresh(self, name: str) -> None:
+        """
+        Make sure a view is within the staleness budget before it is read.
+
+        Returns immediately when the view is fresh enough. Otherwise syncs the
+        view inline; concurrent callers wait for a single sync. Within
+        retry_seconds of a failed sync, the stale view is read without
+        syncing and the request is marked degraded.
+
+        Args:
+            name: View name
+        """
+        if self.age(name) <= self.staleness_budget_seconds:
+            return
+        if self._backing_off(name):
+            return
+
+        with self._locks[name]:
+            # Another request may have synced, or failed to, while we waited
+            # for the lock
+            if self.age(name) <= self.staleness_budget_seconds:
+                return
+            if self._backing_off(name):
+                return
+            logger.warning(
+                f"⚠️ Feature view {name} exceeded staleness budget, syncing inline"
+            )
+            self._sync_locked(name)
+
+    def _backing_off(self, name: str) -> bool:
+        last_failure = self._last_failure[name]
+        if last_failure is None or time.monotonic() - last_failure > self.retry_seconds:
+            return False
+        degradations.record(
+            "feature_view_stale",
+            f"{name} view past the staleness budget and its last sync failed",
+        )
+        return True
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Report the sync state of every view.
+
+        Returns:
+            Dictionary of view name to age in seconds and failure count
+        """
+        return {
+            name: {
+                "age_seconds": round(self.age(name), 3)
+                if self._last_sync[name] is not None
+                else None,
+                "failures": self._failures[name],
+            }
+            for name in self.views
+        }
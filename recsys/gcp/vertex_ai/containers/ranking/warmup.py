@@ -0,0 +1,115 @@
+"""
+Warm-up of the ranking pipeline before a worker reports ready.
+
+The first request through a fresh process pays one-time costs: client and
+connection setup for BigQuery and the feature store, first touches of the
+memory-mapped snapshots, and XGBoost's first prediction. warm_up() pays them
+with synthetic requests through preprocess, predict and postprocess, so the
+first real request does not.
+"""
+
+import time
+from datetime import date
+from typing import Any, Dict
+import numpy as np
+from config import WARMUP_CUSTOMER_ID, WARMUP_REQUESTS
+from logger import logger, RequestContext
+
+# Query embedding dimension when the retriever does not expose one
+DEFAULT_QUERY_DIM = 16
+
+
+def synthetic_request(
+    transformer, retriever, rng: np.random.Generator
+) -> Dict[str, Any]:
+    """
+    Build a single-instance /predict request body.
+
+    The customer is WARMUP_CUSTOMER_ID, or else a customer from the query
+    embedding table, whose embedding is then looked up by date. Otherwise the
+    instance gets a random unit query embedding, and its customer, not in the
+    store, is ranked with default customer features.
+
+    Args:
+        transformer: Transformer the request is meant for
+        retriever: Retriever the request is served with
+        rng: Random generator
+
+    Returns:
+        Request body
+    """
+    query_table = transformer.query_table
+    customer_id = WARMUP_CUSTOMER_ID
+    from_table = not customer_id and query_table is not None and len(query_table) > 0
+    if from_table:
+        customer_id = str(query_table.customer_ids[rng.integers(len(query_table))])
+
+    instance: Dict[str, Any] = {
+        "customer_id": customer_id or "0" * 64,
+        "date": date.today().isoformat(),
+    }
+    if not from_table:
+        dim = getattr(retriever, "dim", DEFAULT_QUERY_DIM)
+        query = rng.standard_normal(dim)
+        instance["query_emb"] = (query / np.linalg.norm(query)).tolist()
+    return {"instances": [instance]}
+
+
+def warm_up(
+    transformer, version, n_requests: int = WARMUP_REQUESTS, seed: int = 0
+) -> Dict[str, Any]:
+    """
+    Run synthetic requests through every stage of the pipeline.
+
+    Failures are logged and counted rather than raised: a warm-up request can
+    fail for reasons real traffic will not hit, such as a random query
+    embedding without candidates.
+
+    Args:
+        transformer: RankingTransformer to warm up
+        version: ModelVersion to serve the requests with
+        n_requests: Number of requests
+        seed: Seed of the synthetic requests
+
+    Returns:
+        Dictionary with the number of requests, those that returned a
+        ranking with finite scores, and the total duration in seconds
+    """
+    rng = np.random.default_rng(seed)
+    start_time = time.perf_counter()
+    succeeded = 0
+
+    for i in range(n_requests):
+        RequestContext.set_request_id(f"warmup-{i}")
+        try:
+            request = synthetic_request(transformer, version.retriever, rng)
+            inputs = transformer.preprocess(request, version)
+            model_inputs = inputs["inputs"][0]
+            if len(model_inputs["ranking_features"]) > 0:
+                outputs = version.predictor.predict(inputs["inputs"])
+            else:
+                outputs = {
+                    "scores": [],
+                    "article_ids": [],
+                    "group_offsets": model_inputs["group_offsets"],
+                }
+            ranking = transformer.postprocess(outputs)["rankings"][0]
+            if ranking and np.isfinite([score for score, _ in ranking]).all():
+                succeeded += 1
+        except Exception as e:
+            logger.warning(
+                f"⚠️ Warm-up request {i} failed: {type(e).__name__}: {str(e)}"
+            )
+
+    duration = time.perf_counter() - start_time
+    if succeeded < n_requests:
+        logger.warning(
+            f"⚠️ {n_requests - succeeded} of {n_requests} warm-up requests "
+            "returned no ranking"
+        )
+    logger.info(f"🔥 Warm-up ran {n_requests} requests in {duration:.3f}s")
+    return {
+        "requests": n_requests,
+        "succeeded": succeeded,
+        "seconds": round(duration, 3),
+    }
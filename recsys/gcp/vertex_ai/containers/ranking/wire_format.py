@@ -0,0 +1,163 @@
+"""
+Binary encoding of /predict requests and responses as Arrow IPC streams.
+
+JSON bodies carry each query embedding as an array of decimal floats, which
+is parsed into one Python float per element. An Arrow request carries the
+embeddings as a fixed-size list of little-endian float32, which is read
+straight into a NumPy array without a Python object per element.
+
+Request columns (one row per instance):
+    customer_id  string, required
+    date         string, ISO date (or month_sin and month_cos)
+    month_sin    float64
+    month_cos    float64
+    query_emb    fixed_size_list<float32>[dim], null where it is looked up
+
+Response columns (one row per ranked article, instances in request order and
+articles by descending score), with model_version and degraded (a JSON list)
+in the schema metadata:
+    instance     int32, position of the instance in the request
+    article_id   string
+    score        float32
+"""
+
+import json
+import numpy as np
+import pyarrow as pa
+from typing import Any, Dict, List, Optional
+
+JSON_MEDIA_TYPE = "application/json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Media types /predict can answer in, preferred first
+RESPONSE_MEDIA_TYPES = [JSON_MEDIA_TYPE, ARROW_MEDIA_TYPE]
+
+INSTANCE_COLUMNS = ["customer_id", "date", "month_sin", "month_cos"]
+
+
+def _query_embeddings(column: pa.ChunkedArray) -> List[Any]:
+    """
+    Read a query_emb column into float32 rows, None where it is null.
+
+    Raises:
+        ValueError: If the column is not a fixed-size list of floats
+    """
+    if not pa.types.is_fixed_size_list(column.type) or not pa.types.is_floating(
+        column.type.value_type
+    ):
+        raise ValueError("query_emb must be a fixed-size list of float32")
+
+    array = column.combine_chunks()
+    # values ignores the array's offset, so slice the rows of this array
+    dim = array.type.list_size
+    values = array.values.slice(array.offset * dim, len(array) * dim)
+    embeddings = (
+        values.to_numpy(zero_copy_only=False)
+        .astype(np.float32, copy=False)
+        .reshape(len(array), dim)
+    )
+
+    if array.null_count == 0:
+        return list(embeddings)
+    valid = array.is_valid().to_numpy(zero_copy_only=False)
+    return [row if has else None for row, has in zip(embeddings, valid)]
+
+
+def decode_arrow_request(body: bytes) -> Dict[str, Any]:
+    """
+    Decode an Arrow IPC stream request into a /predict request body.
+
+    Args:
+        body: Request body
+
+    Returns:
+        Dictionary with "instances", as decoded from a JSON request; query
+        embeddings are float32 NumPy rows of one array
+
+    Raises:
+        ValueError: If the body is not an Arrow stream or a column is invalid
+    """
+    try:
+        table = pa.ipc.open_stream(body).read_all()
+    except pa.ArrowInvalid as e:
+        raise ValueError(f"Invalid Arrow stream: {e}") from e
+
+    if "customer_id" not in table.column_names:
+        raise ValueError("Missing required column: customer_id")
+
+    columns = {
+        name: table.column(name).to_pylist()
+        for name in INSTANCE_COLUMNS
+        if name in table.column_names
+    }
+    if "query_emb" in table.column_names:
+        columns["query_emb"] = _query_embeddings(table.column("query_emb"))
+
+    instances = [
+        {name: value for name, value in zip(columns, values) if value is not None}
+        for values in zip(*columns.values())
+    ]
+    return {"instances": instances}
+
+
+def encode_arrow_response(response: Dict[str, Any]) -> bytes:
+    """
+    Encode a columnar /predict response as an Arrow IPC stream.
+
+    Args:
+        response: Columnar rankings from RankingTransformer.postprocess, with
+            model_version and, if any, degraded
+
+    Returns:
+        Response body
+    """
+    offsets = response["ranking_offsets"]
+    table = pa.table(
+        {
+            "instance": pa.array(
+                np.repeat(np.arange(len(offsets) - 1, dtype=np.int32), np.diff(offsets))
+            ),
+            "article_id": pa.array(response["article_ids"], type=pa.string()),
+            "score": pa.array(response["scores"], type=pa.float32()),
+        },
+        metadata={
+            "model_version": str(response.get("model_version", "")),
+            "degraded": json.dumps(response.get("degraded", [])),
+        },
+    )
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_arrow_request(
+    instances: List[Dict[str, Any]], query_embeddings: Optional[np.ndarray] = None
+) -> bytes:
+    """
+    Encode /predict instances as an Arrow IPC stream, as a client would.
+
+    Args:
+        instances: Instances without query_emb
+        query_embeddings: Optional (n_instances, dim) array of query embeddings
+
+    Returns:
+        Request body
+    """
+    columns = {
+        name: [instance.get(name) for instance in instances]
+        for name in INSTANCE_COLUMNS
+        if any(name in instance for instance in instances)
+    }
+    if query_embeddings is not None:
+        embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+        columns["query_emb"] = pa.FixedSizeListArray.from_arrays(
+            pa.array(embeddings.reshape(-1)), embeddings.shape[1]
+        )
+    table = pa.table(columns)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
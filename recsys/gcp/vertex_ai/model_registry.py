@@ -8,7 +8,7 @@ import tensorflow as tf
 import xgboost as xgb
 from xgboost import XGBModel
 from loguru import logger
-from typing import Union
+from typing import Any, Dict, Optional, Union
 from google.cloud.aiplatform import Model, init, Endpoint
 
 from recsys.config import settings
@@ -25,6 +25,7 @@ def upload_model_to_registry(
     model_display_name: str,
     description: str,
     serving_container_image_uri: str,
+    artifacts: Optional[Dict[str, Any]] = None,
 ) -> Model:
     """
     Upload a model to Vertex AI Model Registry.
@@ -35,6 +36,8 @@ def upload_model_to_registry(
         model_display_name: Display name in Vertex AI
         description: Model description
         serving_container_image_uri: URI for serving container
+        artifacts: Objects saved next to the model with their save(path)
+            method, keyed by file name
 
     Returns:
         Uploaded Vertex AI model
@@ -58,6 +61,10 @@ def upload_model_to_registry(
     else:
         raise ValueError(f"Unsupported model type: {type(model)}")
 
+    for file_name, artifact in (artifacts or {}).items():
+        logger.info(f"Saving artifact {file_name}")
+        artifact.save(os.path.join(model_dir, file_name))
+
     logger.info(f"Uploading model to {model_display_name} to Vertex AI")
     uploaded_model = Model.upload(
         display_name=model_display_name,
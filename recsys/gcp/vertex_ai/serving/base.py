@@ -3,7 +3,7 @@ Base class for model serving in Vertex AI.
 """
 
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Any, Dict, Optional
 from loguru import logger
 from google.cloud import aiplatform
 
@@ -34,6 +34,15 @@ class BaseGCPModel(ABC):
         """
         pass
 
+    def artifacts(self) -> Dict[str, Any]:
+        """
+        Objects uploaded next to the model, keyed by file name.
+
+        Returns:
+            Artifacts exposing save(path); none by default
+        """
+        return {}
+
     def upload_to_vertex_ai(
         self,
         model_name: str,
@@ -69,6 +78,7 @@ class BaseGCPModel(ABC):
             model_display_name=model_name,
             description=description,
             serving_container_image_uri=serving_container_image_uri,
+            artifacts=self.artifacts(),
         )
 
     def deploy_endpoint(
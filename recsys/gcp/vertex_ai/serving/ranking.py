@@ -4,12 +4,16 @@ Ranking model serving implementation.
 
 import joblib
 import pandas as pd
-from typing import Dict
+from typing import Any, Dict, Optional
 from loguru import logger
 from google.cloud import aiplatform
 from xgboost import XGBClassifier
 
 from recsys.config import settings
+from recsys.core.models.two_tower.ranking import (
+    CATEGORICAL_ENCODER_FILE,
+    CategoricalEncoder,
+)
 from recsys.gcp.vertex_ai.serving.base import BaseGCPModel
 from recsys.gcp.vertex_ai.model_registry import initialize_vertex_ai
 
@@ -17,8 +21,13 @@ from recsys.gcp.vertex_ai.model_registry import initialize_vertex_ai
 class GCPRankingModel(BaseGCPModel):
     """GCP integration for the ranking model."""
 
-    def __init__(self, model: XGBClassifier) -> None:
+    def __init__(
+        self,
+        model: XGBClassifier,
+        categorical_encoder: Optional[CategoricalEncoder] = None,
+    ) -> None:
         super().__init__(model)
+        self.categorical_encoder = categorical_encoder
 
     def save_to_local(self, output_path: str = "ranking_model") -> str:
         """
@@ -34,6 +43,18 @@ class GCPRankingModel(BaseGCPModel):
         self.local_model_path = output_path
         return output_path
 
+    def artifacts(self) -> Dict[str, Any]:
+        """
+        Upload the fitted categorical encoder next to model.bst.
+
+        Returns:
+            Encoder keyed by its file name, if one was given
+        """
+        if self.categorical_encoder is None:
+            logger.warning("No categorical encoder given; serving will not use one")
+            return {}
+        return {CATEGORICAL_ENCODER_FILE: self.categorical_encoder}
+
     @classmethod
     def deploy(cls, model):
         return
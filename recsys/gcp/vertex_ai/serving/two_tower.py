@@ -2,12 +2,15 @@
 Two-tower model serving implementation.
 """
 
+import numpy as np
+import polars as pl
 import tensorflow as tf
 from loguru import logger
 from typing import Tuple, Dict, Any
 from google.cloud import aiplatform
 
 from recsys.config import settings
+from recsys.core.embeddings.computation import compute_query_embedding_table
 from recsys.gcp.vertex_ai.serving.base import BaseGCPModel
 from recsys.gcp.vertex_ai.model_registry import initialize_vertex_ai
 
@@ -100,6 +103,25 @@ class GCPQueryModel(BaseGCPModel):
         self.local_model_path = output_path
         return output_path
 
+    def compute_embedding_table(
+        self, customers_df: pl.DataFrame, batch_size: int = 4096
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Precompute the query embedding of every customer for every month.
+
+        Args:
+            customers_df: DataFrame with customer_id and age, one row per customer
+            batch_size: Customers per model call
+
+        Returns:
+            Tuple of (customer IDs, float32 embeddings of shape
+            (n_customers, 12, dim))
+        """
+        logger.info(
+            f"Computing query embeddings of {len(customers_df)} customers for 12 months"
+        )
+        return compute_query_embedding_table(customers_df, self.model, batch_size)
+
 
 class GCPCandidateModel(BaseGCPModel):
     """GCP integration for the candidate tower."""